@@ -0,0 +1,28 @@
+import os
+import argparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.conf import settings
+from config.archivo import TAMANO_LOTE, archivar_historico
+
+
+# Pensado para correr periódicamente (cron). Cada lote es una transacción:
+# si se interrumpe, la próxima corrida sigue donde quedó.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mueve atenciones y rutas cerradas a las tablas de archivo')
+    parser.add_argument('--horizonte-dias', type=int, default=settings.ARCHIVO_HORIZONTE_DIAS,
+                        help=f'Archiva lo cerrado hace más de N días (por defecto {settings.ARCHIVO_HORIZONTE_DIAS})')
+    parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--max-lotes', type=int, default=None,
+                        help='Corta después de N lotes por tabla (ventanas de mantenimiento acotadas)')
+    args = parser.parse_args()
+
+    movidas = archivar_historico(
+        horizonte_dias=args.horizonte_dias, tamano_lote=args.tamano_lote, max_lotes=args.max_lotes
+    )
+    print(f"📦 Atenciones archivadas: {movidas['atenciones']}")
+    print(f"📦 Rutas clínicas archivadas: {movidas['rutas_clinicas']}")
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.utils import timezone
 from .models import Medico, Atencion
 
 
@@ -79,15 +78,17 @@ class MedicoAdmin(admin.ModelAdmin):
         )
     activo_badge.short_description = "Estado"
     
+    def get_queryset(self, request):
+        # Métricas anotadas: sin consultas por fila en el listado ni en el detalle
+        return super().get_queryset(request).con_metricas()
+    
     def atenciones_hoy(self, obj):
-        hoy = timezone.now().date()
-        count = obj.atenciones.filter(fecha_hora_inicio__date=hoy).count()
-        return f"{count} atenciones"
+        return f"{obj.total_atenciones_hoy} atenciones"
     atenciones_hoy.short_description = "Atenciones Hoy"
+    atenciones_hoy.admin_order_field = 'total_atenciones_hoy'
     
     def tiempo_promedio_display(self, obj):
-        tiempo = obj.calcular_tiempo_promedio_atencion()
-        return f"{tiempo:.1f} minutos"
+        return f"{obj.tiempo_promedio:.1f} minutos"
     tiempo_promedio_display.short_description = "Tiempo Promedio (30 días)"
     
     def metricas_eficiencia(self, obj):
@@ -146,6 +147,7 @@ class AtencionAdmin(admin.ModelAdmin):
         'medico__last_name',
         'box__numero'
     ]
+    list_select_related = ['paciente', 'medico', 'box']
     readonly_fields = [
         'fecha_creacion',
         'fecha_actualizacion',
@@ -154,13 +156,9 @@ class AtencionAdmin(admin.ModelAdmin):
         'metricas_atencion'
     ]
     date_hierarchy = 'fecha_hora_inicio'
-    
-    # Filtrar solo medicos
-    def formfield_for_foreignkey(self, db_field, request, **kwargs):
-        if db_field.name == "medico":
-            from users.models import User
-            kwargs["queryset"] = User.objects.filter(rol='MEDICO')
-        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+    # Búsqueda por AJAX en vez de un <select> con todas las filas; el
+    # limit_choices_to de medico (rol MEDICO) se aplica también a la búsqueda
+    autocomplete_fields = ['paciente', 'medico', 'box']
     
     fieldsets = (
         ('Información General', {
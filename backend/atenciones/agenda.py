@@ -0,0 +1,468 @@
+"""
+Agenda de atenciones: reservas sin solape y búsqueda de horas libres
+conjuntas médico + box.
+
+La búsqueda se resuelve en memoria para la ventana consultada: en pocas consultas se
+cargan los horarios y las atenciones/ocupaciones que se cruzan con la ventana,
+se arma la lista ordenada de tramos libres de cada médico y de cada box, y se
+intersectan con dos punteros. Los intervalos son semiabiertos [inicio, fin).
+
+Formato de horarios (Box.horarios_disponibles y Medico.horarios_atencion):
+    {"lunes": [["08:00", "13:00"], ["14:00", "18:00"]], "martes": "08:00-18:00", ...}
+Las claves aceptan el nombre del día (con o sin tilde) o su número (0 = lunes).
+Un horario vacío equivale a HORARIO_POR_DEFECTO.
+"""
+import json
+import logging
+import unicodedata
+from bisect import bisect_left, insort
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, NotSupportedError, transaction
+from django.db.models import CharField, Func, IntegerField, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from boxes.models import Box, OcupacionManual
+from users.models import User
+from .models import Atencion, Medico
+
+logger = logging.getLogger(__name__)
+
+
+ESTADOS_BOX_FUERA_DE_USO = ['MANTENIMIENTO', 'FUERA_SERVICIO']
+DIAS_SEMANA = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+HORARIO_POR_DEFECTO = {dia: [(time(8, 0), time(20, 0))] for dia in range(5)}
+PASO_MINUTOS = 5
+MAX_DIAS_VENTANA = 31
+# Primer tramo de la ventana que revisa buscar_huecos antes de ampliarla
+VENTANA_INICIAL = timedelta(days=1)
+
+# Especialidad del médico (User.ESPECIALIDAD_CHOICES) -> especialidad de box.
+# Las que no tienen box propio solo pueden usar boxes MULTIUSO.
+ESPECIALIDAD_BOX = {
+    'MEDICINA_GENERAL': 'GENERAL',
+    'MEDICINA_INTERNA': 'GENERAL',
+    'PEDIATRIA': 'PEDIATRIA',
+    'CARDIOLOGIA': 'CARDIOLOGIA',
+    'DERMATOLOGIA': 'DERMATOLOGIA',
+    'GINECOLOGIA': 'GINECOLOGIA',
+    'TRAUMATOLOGIA': 'TRAUMATOLOGIA',
+    'OFTALMOLOGIA': 'OFTALMOLOGIA',
+    'NEUROLOGIA': 'NEUROLOGIA',
+    'PSIQUIATRIA': 'PSIQUIATRIA',
+    'RADIOLOGIA': 'RADIOLOGIA',
+}
+
+
+def especialidades_de_box(especialidad_medico):
+    # Especialidades de box compatibles, de la más específica a la más general
+    propia = ESPECIALIDAD_BOX.get(especialidad_medico)
+    return [propia, 'MULTIUSO'] if propia else ['MULTIUSO']
+
+
+# ============================================
+# HORARIOS
+# ============================================
+
+def _indice_dia(clave):
+    texto = unicodedata.normalize('NFKD', str(clave)).encode('ascii', 'ignore').decode().strip().lower()
+    if texto.isdigit() and int(texto) < 7:
+        return int(texto)
+    return DIAS_SEMANA.index(texto) if texto in DIAS_SEMANA else None
+
+
+def _tramo(valor):
+    # "08:00-13:00", ["08:00", "13:00"] o {"inicio": "08:00", "fin": "13:00"} -> (time, time)
+    if isinstance(valor, str):
+        valor = valor.split('-')
+    elif isinstance(valor, dict):
+        valor = [valor.get('inicio'), valor.get('fin')]
+    inicio, fin = (time.fromisoformat(str(v).strip()) for v in valor)
+    if fin <= inicio:
+        raise ValueError('el tramo termina antes de empezar')
+    return inicio, fin
+
+
+def parsear_horario(horario):
+    """
+    Normaliza un horario JSON a {dia_semana: [(time, time), ...]}.
+    Retorna HORARIO_POR_DEFECTO si viene vacío; los tramos inválidos se omiten.
+    """
+    if not horario:
+        return HORARIO_POR_DEFECTO
+
+    resultado = {}
+    for clave, valores in horario.items():
+        dia = _indice_dia(clave)
+        if dia is None:
+            continue
+        if isinstance(valores, (str, dict)) or (
+            isinstance(valores, (list, tuple)) and len(valores) == 2
+            and all(isinstance(v, str) and '-' not in v for v in valores)
+        ):
+            valores = [valores]
+        for valor in valores or []:
+            try:
+                resultado.setdefault(dia, []).append(_tramo(valor))
+            except (TypeError, ValueError):
+                logger.warning('Tramo de horario inválido ignorado: %s=%r', clave, valor)
+    return {dia: sorted(tramos) for dia, tramos in resultado.items()}
+
+
+def tramos_en_ventana(horario, desde, hasta):
+    # Tramos del horario (hora local) que caen en [desde, hasta), en minutos epoch, ordenados
+    tz = timezone.get_current_timezone()
+    tramos = []
+    dia = timezone.localdate(desde, tz)
+    ultimo = timezone.localdate(hasta, tz)
+    while dia <= ultimo:
+        for inicio, fin in horario.get(dia.weekday(), ()):
+            inicio = max(timezone.make_aware(datetime.combine(dia, inicio), tz), desde)
+            fin = min(timezone.make_aware(datetime.combine(dia, fin), tz), hasta)
+            if inicio < fin:
+                tramos.append((a_minutos(inicio), a_minutos(fin)))
+        dia += timedelta(days=1)
+    return _unir(tramos)
+
+
+# ============================================
+# ARITMÉTICA DE INTERVALOS
+# ============================================
+# Internamente los intervalos son enteros (minutos desde epoch): comparar y
+# restar enteros es mucho más barato que operar con datetimes aware.
+
+def a_minutos(momento, hacia_arriba=False):
+    segundos = int(momento.timestamp())
+    return -(-segundos // 60) if hacia_arriba else segundos // 60
+
+
+def desde_minutos(minutos):
+    return datetime.fromtimestamp(minutos * 60, tz=dt_timezone.utc)
+
+
+def _unir(intervalos):
+    # Ordena y fusiona intervalos que se tocan o solapan
+    unidos = []
+    for inicio, fin in sorted(intervalos):
+        if unidos and inicio <= unidos[-1][1]:
+            if fin > unidos[-1][1]:
+                unidos[-1] = (unidos[-1][0], fin)
+        else:
+            unidos.append((inicio, fin))
+    return unidos
+
+
+def restar(libres, ocupados):
+    # libres - ocupados; `libres` ordenada y sin solapes internos
+    resultado = []
+    ocupados = _unir(ocupados)
+    j = 0
+    for inicio, fin in libres:
+        while j < len(ocupados) and ocupados[j][1] <= inicio:
+            j += 1
+        k = j
+        while k < len(ocupados) and ocupados[k][0] < fin:
+            if ocupados[k][0] > inicio:
+                resultado.append((inicio, ocupados[k][0]))
+            inicio = max(inicio, ocupados[k][1])
+            k += 1
+        if inicio < fin:
+            resultado.append((inicio, fin))
+    return resultado
+
+
+def huecos_comunes(a, b, duracion, paso=PASO_MINUTOS):
+    # Por cada tramo libre común a ambas listas (dos punteros), el primer inicio
+    # múltiplo de `paso` con `duracion` minutos disponibles; en orden cronológico
+    i = j = 0
+    while i < len(a) and j < len(b):
+        inicio = -(-max(a[i][0], b[j][0]) // paso) * paso
+        if inicio + duracion <= min(a[i][1], b[j][1]):
+            yield inicio
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+
+
+# ============================================
+# BÚSQUEDA
+# ============================================
+
+class SegundosEpoch(Func):
+    # Segundos desde epoch de una columna datetime, calculado en la base: evita
+    # convertir miles de datetimes aware en Python al cargar la ventana
+    arity = 1
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f"CAST(strftime('%%s', {sql}) AS INTEGER)", params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f'CAST(EXTRACT(EPOCH FROM {sql}) AS BIGINT)', params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'SegundosEpoch no está implementado para {connection.vendor}')
+
+
+def clave_box(campo):
+    # Id del box como texto de la base: sirve de clave sin construir un UUID por fila
+    return Cast(campo, output_field=CharField())
+
+
+def _ocupaciones(desde, hasta, medico_ids, box_ids, por_medico, por_box):
+    # Agrega a por_medico/por_box (minutos epoch por médico y por clave_box) las
+    # atenciones vigentes y ocupaciones manuales que cruzan [desde, hasta)
+    atenciones = Atencion.objects.vigentes().solapadas(desde, hasta).filter(
+        Q(medico_id__in=medico_ids) | Q(box_id__in=box_ids)
+    ).annotate(
+        box_clave=clave_box('box_id'),
+        inicio_s=SegundosEpoch('fecha_hora_inicio'),
+        fin_s=SegundosEpoch('fin_reserva'),
+    ).values_list('medico_id', 'box_clave', 'inicio_s', 'fin_s')
+
+    for medico_id, box_id, inicio, fin in atenciones:
+        intervalo = (inicio // 60, -(-fin // 60))
+        por_medico.setdefault(medico_id, []).append(intervalo)
+        por_box.setdefault(box_id, []).append(intervalo)
+
+    manuales = OcupacionManual.objects.filter(
+        activa=True,
+        box_id__in=box_ids,
+        fecha_inicio__lt=hasta,
+        fecha_fin_programada__gt=desde,
+    ).annotate(box_clave=clave_box('box_id')).values_list('box_clave', 'fecha_inicio', 'fecha_fin_programada')
+    for box_id, inicio, fin in manuales:
+        por_box.setdefault(box_id, []).append((a_minutos(inicio), a_minutos(fin, hacia_arriba=True)))
+
+
+def buscar_huecos(especialidad, duracion_minutos, desde, hasta, limite=10, medico_id=None):
+    """
+    Retorna los pares (médico, box) libres más tempranos para una atención de
+    `duracion_minutos` de la especialidad dada dentro de [desde, hasta).
+
+    Cada tramo libre común a un par aporta su primer inicio posible; un médico
+    aparece a lo sumo una vez por hora de inicio (con el box más específico).
+
+    El horario de cada médico sale del Medico (legacy) cuyo codigo_medico
+    coincide con su username; sin esa ficha se usa HORARIO_POR_DEFECTO.
+
+    La ventana se recorre creciendo desde VENTANA_INICIAL (duplicándose hasta
+    `hasta`): si [desde, fin) ya tiene `limite` huecos, son los más tempranos
+    de toda la ventana, porque un hueco que no cabe antes de `fin` empieza
+    después de fin - duración y cualquiera de los encontrados empieza antes.
+    Así lo habitual (hay horas libres en el primer día) carga y cruza un día
+    de reservas y no la semana completa.
+    """
+    desde = max(desde, timezone.now())
+    if desde + timedelta(minutes=duracion_minutos) > hasta:
+        return []
+
+    consulta_medicos = User.objects.filter(rol='MEDICO', is_active=True, especialidad=especialidad)
+    if medico_id is not None:
+        consulta_medicos = consulta_medicos.filter(id=medico_id)
+    medicos = list(consulta_medicos.values('id', 'username', 'first_name', 'last_name'))
+    if not medicos:
+        return []
+
+    horarios_medicos = dict(Medico.objects.filter(
+        codigo_medico__in=[m['username'] for m in medicos],
+        activo=True,
+    ).values_list('codigo_medico', 'horarios_atencion'))
+
+    especialidades = especialidades_de_box(especialidad)
+    consulta_boxes = Box.objects.filter(
+        activo=True,
+        especialidad__in=especialidades,
+    ).exclude(
+        estado__in=ESTADOS_BOX_FUERA_DE_USO
+    )
+    boxes = list(consulta_boxes.annotate(clave=clave_box('id')).values_list(
+        'id', 'numero', 'especialidad', 'horarios_disponibles', 'clave'
+    ))
+    if not boxes:
+        return []
+
+    # Cada vuelta carga solo las reservas del tramo nuevo [cargado, fin); las que
+    # cruzan `cargado` llegan dos veces y restar() las une. Las ocupaciones se
+    # filtran con subconsultas, sin listas de cientos de ids como parámetros.
+    # Cada tramo extra cuesta dos consultas: a lo sumo 1 + log2(días de la ventana).
+    por_medico, por_box = {}, {}
+    cargado, tramo = desde, VENTANA_INICIAL
+    while True:
+        fin = min(hasta, desde + tramo)
+        _ocupaciones(cargado, fin, consulta_medicos.values('id'), consulta_boxes.values('id'), por_medico, por_box)
+        cargado = fin
+        ordenados = _huecos_en_ventana(
+            medicos, horarios_medicos, boxes, por_medico, por_box, especialidades, duracion_minutos,
+            desde, fin, limite,
+        )
+        if len(ordenados) >= limite or fin >= hasta:
+            break
+        tramo *= 2
+
+    return [
+        {
+            'medico_id': medico['id'],
+            'medico_nombre': f"{medico['first_name']} {medico['last_name']}".strip() or medico['username'],
+            'box_id': str(box_id),
+            'box_numero': numero,
+            'inicio': desde_minutos(inicio),
+            'fin': desde_minutos(inicio + duracion_minutos),
+        }
+        for (_, inicio), ((_, numero, box_id), medico) in ordenados[:limite]
+    ]
+
+
+def _huecos_en_ventana(medicos, horarios_medicos, boxes, por_medico, por_box, especialidades, duracion_minutos,
+                       desde, hasta, limite):
+    # Candidatos ((medico_id, inicio), (box, medico)) de [desde, hasta), del más temprano al más tardío
+    tramos_por_horario = {}
+
+    def libres(horario, ocupados):
+        clave = json.dumps(horario, sort_keys=True, default=str)
+        if clave not in tramos_por_horario:
+            tramos_por_horario[clave] = tramos_en_ventana(parsear_horario(horario), desde, hasta)
+        return restar(tramos_por_horario[clave], ocupados)
+
+    # Boxes con los mismos tramos libres se evalúan una sola vez por médico
+    grupos = {}
+    for box_id, numero, especialidad_box, horario, clave in boxes:
+        libres_box = tuple(libres(horario, por_box.get(clave, [])))
+        if libres_box:
+            grupos.setdefault(libres_box, []).append((especialidades.index(especialidad_box), numero, box_id))
+    # Por primer inicio libre y, a igual inicio, el box más específico primero
+    grupos = sorted(
+        ((libres_box, min(boxes_grupo)) for libres_box, boxes_grupo in grupos.items()),
+        key=lambda grupo: (grupo[0][0][0], grupo[1]),
+    )
+
+    # candidatos: {(medico_id, inicio): (box, medico)}. El resultado se ordena por
+    # (inicio, box, medico_id); mejores guarda las `limite` claves de orden más bajas
+    # vistas y cota es la peor de ellas: lo que no la mejora no puede entrar.
+    candidatos = {}
+    mejores, cota = [], None
+    for medico in medicos:
+        medico_id = medico['id']
+        libres_medico = libres(horarios_medicos.get(medico['username']), por_medico.get(medico_id, []))
+        if not libres_medico:
+            continue
+        for libres_box, box in grupos:
+            inicio_minimo = max(libres_medico[0][0], libres_box[0][0])
+            if cota is not None:
+                if inicio_minimo > cota[0]:
+                    # Los grupos van ordenados por su primer tramo libre: ninguno posterior mejora
+                    break
+                if (inicio_minimo, box, medico_id) > cota:
+                    continue
+            for n, inicio in enumerate(huecos_comunes(libres_medico, libres_box, duracion_minutos)):
+                orden = (inicio, box, medico_id)
+                if n >= limite or (cota is not None and orden > cota):
+                    break
+                clave = (medico_id, inicio)
+                anterior = candidatos.get(clave)
+                if anterior is None:
+                    candidatos[clave] = (box, medico)
+                    insort(mejores, orden)
+                    if len(mejores) > limite:
+                        mejores.pop()
+                    if len(mejores) == limite:
+                        cota = mejores[-1]
+                elif box < anterior[0]:
+                    # Mejorar el box de una clave ya contada solo deja la cota más holgada
+                    candidatos[clave] = (box, medico)
+
+    return sorted(candidatos.items(), key=lambda item: (item[0][1], item[1][0], item[0][0]))
+
+
+# ============================================
+# RESERVAS SIN SOLAPE
+# ============================================
+
+class ConflictoAgenda(Exception):
+    # Una o más atenciones se solapan con otra del mismo médico o box
+
+    def __init__(self, conflictos):
+        self.conflictos = conflictos
+        super().__init__(self.mensaje)
+
+    @property
+    def mensaje(self):
+        if not self.conflictos:
+            return 'La atención se solapa con otra reserva del mismo médico o box.'
+        recursos = sorted({'médico' if c['recurso'] == 'medico' else 'box' for c in self.conflictos})
+        return f"La atención se solapa con otra reserva del mismo {' y '.join(recursos)}."
+
+
+def buscar_solapes(atenciones, excluir=()):
+    """
+    Solapes de `atenciones` (ya guardadas) con cualquier otra reserva vigente
+    del mismo médico o box, incluidas las del mismo lote. Una sola consulta
+    por rango indexado; el cruce se hace en memoria por recurso. `excluir`:
+    pks cuyas filas guardadas no cuentan (se van a mover o cancelar).
+    """
+    propias = [a for a in atenciones if a.estado in Atencion.ESTADOS_VIGENTES]
+    if not propias:
+        return []
+
+    filas = list(Atencion.objects.vigentes().solapadas(
+        min(a.fecha_hora_inicio for a in propias),
+        max(a.fin_reserva for a in propias),
+    ).filter(
+        Q(medico_id__in={a.medico_id for a in propias}) | Q(box_id__in={a.box_id for a in propias})
+    ).exclude(id__in=excluir).values_list('id', 'medico_id', 'box_id', 'fecha_hora_inicio', 'fin_reserva'))
+
+    por_recurso = {}
+    for fila in filas:
+        por_recurso.setdefault(('medico', fila[1]), []).append(fila)
+        por_recurso.setdefault(('box', fila[2]), []).append(fila)
+    for reservas in por_recurso.values():
+        reservas.sort(key=lambda fila: fila[3])
+
+    conflictos, vistos = [], set()
+    for atencion in propias:
+        for recurso, recurso_id in (('medico', atencion.medico_id), ('box', atencion.box_id)):
+            reservas = por_recurso.get((recurso, recurso_id), [])
+            # Solo pueden cruzarse las que empiezan en [inicio - DURACION_MAXIMA, fin)
+            desde = bisect_left(reservas, atencion.fecha_hora_inicio - Atencion.DURACION_MAXIMA, key=lambda f: f[3])
+            hasta = bisect_left(reservas, atencion.fin_reserva, key=lambda f: f[3])
+            for otra_id, _, _, inicio, fin in reservas[desde:hasta]:
+                par = (recurso, frozenset((atencion.id, otra_id)))
+                if otra_id == atencion.id or fin <= atencion.fecha_hora_inicio or par in vistos:
+                    continue
+                vistos.add(par)
+                conflictos.append({
+                    'atencion': str(atencion.id),
+                    'conflicto_con': str(otra_id),
+                    'recurso': recurso,
+                    'inicio': inicio,
+                    'fin': fin,
+                })
+    return conflictos
+
+
+def reservar(guardar):
+    """
+    Ejecuta `guardar()` (crea o modifica atenciones y las retorna) y verifica
+    solapes dentro de la misma transacción; si los hay, revierte todo y lanza
+    ConflictoAgenda.
+
+    En SQLite la primera escritura toma el lock de escritura de la base, así que
+    reservas concurrentes se serializan y cada una ve las ya confirmadas. En
+    PostgreSQL además actúan las restricciones de exclusión, que cubren la
+    carrera entre dos transacciones concurrentes.
+    """
+    try:
+        with transaction.atomic():
+            atenciones = guardar()
+            conflictos = buscar_solapes(atenciones)
+            if conflictos:
+                raise ConflictoAgenda(conflictos)
+    except IntegrityError as error:
+        if 'sin_solape' in str(error):
+            raise ConflictoAgenda([]) from error
+        raise
+    return atenciones
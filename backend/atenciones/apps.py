@@ -6,3 +6,6 @@ class AtencionesConfig(AppConfig):
     name = 'atenciones'
     def ready(self):
         import atenciones.signals
+        from config.archivo import registrar_vista_historica
+        from .models import Atencion, AtencionArchivada, AtencionHistorica
+        registrar_vista_historica(self, AtencionHistorica, Atencion, AtencionArchivada)
@@ -0,0 +1,119 @@
+"""
+Puntero cacheado a la atención actual/próxima de cada médico y payload
+compacto del cronómetro.
+
+El polling del médico solo necesita saber qué atención mostrar y si cambió.
+El puntero (tipo + id) se guarda en cache y se invalida desde la señal
+post_save de Atencion (y desde aplicar_efectos_en_lote en las cargas masivas).
+Un puntero a una atención se revalida en cada lectura contra la fila
+apuntada, así que un cambio vía update() o un borrado de esa fila se detecta
+de inmediato. El puntero 'ninguna' no tiene fila que revalidar y se sirve
+tal cual: una atención nueva que no pase por esas señales (update() masivo,
+otro proceso sin cache compartido) aparece al vencer PUNTERO_TTL.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Atencion
+
+
+PUNTERO_TTL = 60
+MINUTOS_PARA_INICIAR = 15
+CAMPOS_CRONOMETRO = [
+    'id', 'medico_id', 'estado', 'fecha_hora_inicio', 'inicio_cronometro', 'duracion_planificada',
+    'atraso_reportado', 'fecha_reporte_atraso', 'fecha_actualizacion',
+]
+
+
+def clave_puntero(medico_id):
+    return f'cronometro:puntero:{medico_id}'
+
+
+def invalidar_puntero(medico_id):
+    cache.delete(clave_puntero(medico_id))
+
+
+def _atenciones_de(medico_id):
+    return Atencion.objects.filter(medico_id=medico_id).only(*CAMPOS_CRONOMETRO)
+
+
+def _vigente(tipo, atencion, ahora):
+    # El puntero sigue siendo válido si la fila apuntada sigue en el estado que lo justificó
+    if atencion is None:
+        return False
+    if tipo == 'en_curso':
+        return atencion.estado == 'EN_CURSO'
+    return atencion.estado in ['PROGRAMADA', 'EN_ESPERA'] and atencion.fecha_hora_inicio >= ahora
+
+
+def resolver_atencion_actual(medico_id, ahora=None):
+    """
+    Retorna (tipo, atencion) con tipo 'en_curso', 'proxima' o 'ninguna',
+    usando el mismo criterio que MedicoAtencionesViewSet.actual.
+    """
+    ahora = ahora or timezone.now()
+    puntero = cache.get(clave_puntero(medico_id))
+
+    if puntero is not None:
+        if puntero['tipo'] == 'ninguna':
+            return 'ninguna', None
+        atencion = _atenciones_de(medico_id).filter(id=puntero['id']).first()
+        if _vigente(puntero['tipo'], atencion, ahora):
+            return puntero['tipo'], atencion
+
+    atencion = _atenciones_de(medico_id).filter(estado='EN_CURSO').order_by('fecha_hora_inicio').first()
+    tipo = 'en_curso'
+    if atencion is None:
+        atencion = _atenciones_de(medico_id).filter(
+            fecha_hora_inicio__gte=ahora,
+            estado__in=['PROGRAMADA', 'EN_ESPERA']
+        ).order_by('fecha_hora_inicio').first()
+        tipo = 'proxima' if atencion else 'ninguna'
+
+    cache.set(
+        clave_puntero(medico_id),
+        {'tipo': tipo, 'id': str(atencion.id) if atencion else None},
+        PUNTERO_TTL
+    )
+    return tipo, atencion
+
+
+def payload_cronometro(tipo, atencion, ahora):
+    # Solo lo necesario para dibujar el cronómetro; el cliente calcula el resto con 'servidor'
+    datos = None
+    if atencion:
+        minutos_hasta_inicio = (atencion.fecha_hora_inicio - ahora).total_seconds() / 60
+        datos = {
+            'id': str(atencion.id),
+            'estado': atencion.estado,
+            'fecha_hora_inicio': atencion.fecha_hora_inicio.isoformat(),
+            'inicio_cronometro': atencion.inicio_cronometro.isoformat() if atencion.inicio_cronometro else None,
+            'duracion_planificada': atencion.duracion_planificada,
+            'atraso_reportado': atencion.atraso_reportado,
+            'fecha_reporte_atraso': atencion.fecha_reporte_atraso.isoformat() if atencion.fecha_reporte_atraso else None,
+            'esta_retrasada': atencion.is_retrasada(),
+            'debe_marcar_no_presentado': atencion.verificar_tiempo_atraso(),
+            'puede_iniciar': tipo == 'proxima' and minutos_hasta_inicio <= MINUTOS_PARA_INICIAR,
+            'version': atencion.fecha_actualizacion.isoformat(),
+        }
+    return {
+        'tipo': tipo,
+        'servidor': ahora.isoformat(),
+        'atencion': datos,
+    }
+
+
+def etag_cronometro(payload):
+    # Depende de la versión de la fila y de las banderas derivadas del reloj, nunca de 'servidor'
+    atencion = payload['atencion'] or {}
+    base = '|'.join(str(valor) for valor in (
+        payload['tipo'],
+        atencion.get('id'),
+        atencion.get('version'),
+        atencion.get('esta_retrasada'),
+        atencion.get('debe_marcar_no_presentado'),
+        atencion.get('puede_iniciar'),
+    ))
+    return f'"{hashlib.sha1(base.encode()).hexdigest()}"'
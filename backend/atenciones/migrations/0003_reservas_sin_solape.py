@@ -0,0 +1,83 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:29
+
+from datetime import timedelta
+
+import django.core.validators
+from django.db import migrations, models
+
+
+ESTADOS_VIGENTES = ('PROGRAMADA', 'EN_ESPERA', 'EN_CURSO')
+
+
+def completar_fin_reserva(apps, schema_editor):
+    Atencion = apps.get_model('atenciones', 'Atencion')
+    pendientes = Atencion.objects.filter(fin_reserva__isnull=True).only(
+        'id', 'fecha_hora_inicio', 'fecha_hora_fin', 'duracion_planificada'
+    )
+    lote = []
+    for atencion in pendientes.iterator(chunk_size=2000):
+        atencion.fin_reserva = atencion.fecha_hora_fin or (
+            atencion.fecha_hora_inicio + timedelta(minutes=atencion.duracion_planificada)
+        )
+        lote.append(atencion)
+        if len(lote) >= 2000:
+            Atencion.objects.bulk_update(lote, ['fin_reserva'])
+            lote = []
+    Atencion.objects.bulk_update(lote, ['fin_reserva'])
+
+
+def crear_exclusiones(apps, schema_editor):
+    # Solo PostgreSQL: en SQLite el solape se verifica en la transacción que reserva
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    estados = ', '.join(f"'{estado}'" for estado in ESTADOS_VIGENTES)
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for columna, nombre in (('medico_id', 'atenciones_medico_sin_solape'), ('box_id', 'atenciones_box_sin_solape')):
+        schema_editor.execute(
+            f"ALTER TABLE atenciones ADD CONSTRAINT {nombre} EXCLUDE USING gist ("
+            f"{columna} WITH =, tstzrange(fecha_hora_inicio, fin_reserva, '[)') WITH &&"
+            f") WHERE (estado IN ({estados}))"
+        )
+
+
+def eliminar_exclusiones(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in ('atenciones_medico_sin_solape', 'atenciones_box_sin_solape'):
+        schema_editor.execute(f'ALTER TABLE atenciones DROP CONSTRAINT IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atenciones', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atencion',
+            name='fin_reserva',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(completar_fin_reserva, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='atencion',
+            name='fin_reserva',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='atencion',
+            name='duracion_planificada',
+            field=models.PositiveIntegerField(help_text='Duración planificada en minutos', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(1440)]),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['medico', 'fecha_hora_inicio'], name='atenciones_medico__a4ce4a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['box', 'fecha_hora_inicio'], name='atenciones_box_id_491397_idx'),
+        ),
+        # Falla si ya existen reservas solapadas: deben resolverse antes de migrar
+        migrations.RunPython(crear_exclusiones, eliminar_exclusiones),
+    ]
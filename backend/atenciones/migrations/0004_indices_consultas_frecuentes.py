@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atenciones', '0003_reservas_sin_solape'),
+        ('boxes', '0003_indice_ocupaciones_activas'),
+        ('pacientes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='atencion',
+            name='atenciones_estado_aade7a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['medico', 'estado', 'fecha_hora_inicio'], name='atenciones_medico_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(fields=['estado', 'fecha_hora_inicio'], name='atenciones_estado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='atencion',
+            index=models.Index(condition=models.Q(('estado', 'EN_CURSO')), fields=['box', 'fecha_hora_inicio'], name='atenciones_box_en_curso_idx'),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:52
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atenciones', '0004_indices_consultas_frecuentes'),
+        ('boxes', '0003_indice_ocupaciones_activas'),
+        ('pacientes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AtencionHistorica',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('fecha_hora_inicio', models.DateTimeField(help_text='Fecha y hora programada de inicio')),
+                ('fecha_hora_fin', models.DateTimeField(blank=True, help_text='Fecha y hora programada de fin', null=True)),
+                ('fin_reserva', models.DateTimeField(editable=False)),
+                ('inicio_cronometro', models.DateTimeField(blank=True, help_text='Momento real de inicio de la atención', null=True)),
+                ('fin_cronometro', models.DateTimeField(blank=True, help_text='Momento real de fin de la atención', null=True)),
+                ('duracion_planificada', models.PositiveIntegerField(help_text='Duración planificada en minutos', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(1440)])),
+                ('duracion_real', models.PositiveIntegerField(blank=True, help_text='Duración real en minutos', null=True)),
+                ('tipo_atencion', models.CharField(choices=[('CONSULTA_GENERAL', 'Consulta General'), ('CONSULTA_ESPECIALIDAD', 'Consulta de Especialidad'), ('CONTROL', 'Control'), ('PROCEDIMIENTO', 'Procedimiento'), ('EXAMEN', 'Examen'), ('CIRUGIA_MENOR', 'Cirugía Menor'), ('URGENCIA', 'Atención de Urgencia'), ('TELEMEDICINA', 'Telemedicina'), ('INTERCONSULTA', 'Interconsulta')], default='CONSULTA_GENERAL', max_length=25)),
+                ('estado', models.CharField(choices=[('PROGRAMADA', 'Programada'), ('EN_ESPERA', 'En Espera'), ('EN_CURSO', 'En Curso'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No se Presentó')], default='PROGRAMADA', max_length=15)),
+                ('observaciones', models.TextField(blank=True, help_text='Observaciones adicionales sobre la atención')),
+                ('atraso_reportado', models.BooleanField(default=False, help_text='Indica si el médico reportó un atraso del paciente')),
+                ('fecha_reporte_atraso', models.DateTimeField(blank=True, help_text='Momento en que se reportó el atraso', null=True)),
+                ('motivo_atraso', models.TextField(blank=True, help_text='Motivo del atraso reportado por el médico')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Atención (histórico)',
+                'verbose_name_plural': 'Atenciones (histórico)',
+                'db_table': 'atenciones_historico',
+                'ordering': ['-fecha_hora_inicio'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AtencionArchivada',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('fecha_hora_inicio', models.DateTimeField(help_text='Fecha y hora programada de inicio')),
+                ('fecha_hora_fin', models.DateTimeField(blank=True, help_text='Fecha y hora programada de fin', null=True)),
+                ('fin_reserva', models.DateTimeField(editable=False)),
+                ('inicio_cronometro', models.DateTimeField(blank=True, help_text='Momento real de inicio de la atención', null=True)),
+                ('fin_cronometro', models.DateTimeField(blank=True, help_text='Momento real de fin de la atención', null=True)),
+                ('duracion_planificada', models.PositiveIntegerField(help_text='Duración planificada en minutos', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(1440)])),
+                ('duracion_real', models.PositiveIntegerField(blank=True, help_text='Duración real en minutos', null=True)),
+                ('tipo_atencion', models.CharField(choices=[('CONSULTA_GENERAL', 'Consulta General'), ('CONSULTA_ESPECIALIDAD', 'Consulta de Especialidad'), ('CONTROL', 'Control'), ('PROCEDIMIENTO', 'Procedimiento'), ('EXAMEN', 'Examen'), ('CIRUGIA_MENOR', 'Cirugía Menor'), ('URGENCIA', 'Atención de Urgencia'), ('TELEMEDICINA', 'Telemedicina'), ('INTERCONSULTA', 'Interconsulta')], default='CONSULTA_GENERAL', max_length=25)),
+                ('estado', models.CharField(choices=[('PROGRAMADA', 'Programada'), ('EN_ESPERA', 'En Espera'), ('EN_CURSO', 'En Curso'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No se Presentó')], default='PROGRAMADA', max_length=15)),
+                ('observaciones', models.TextField(blank=True, help_text='Observaciones adicionales sobre la atención')),
+                ('atraso_reportado', models.BooleanField(default=False, help_text='Indica si el médico reportó un atraso del paciente')),
+                ('fecha_reporte_atraso', models.DateTimeField(blank=True, help_text='Momento en que se reportó el atraso', null=True)),
+                ('motivo_atraso', models.TextField(blank=True, help_text='Motivo del atraso reportado por el médico')),
+                ('fecha_creacion', models.DateTimeField()),
+                ('fecha_actualizacion', models.DateTimeField()),
+                ('fecha_archivado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('box', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atenciones_archivadas', to='boxes.box')),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atenciones_medico_archivadas', to=settings.AUTH_USER_MODEL)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='atenciones_archivadas', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Atención archivada',
+                'verbose_name_plural': 'Atenciones archivadas',
+                'db_table': 'atenciones_archivo',
+                'ordering': ['-fecha_hora_inicio'],
+                'indexes': [models.Index(fields=['paciente', 'fecha_hora_inicio'], name='atenciones__pacient_f519e0_idx'), models.Index(fields=['medico', 'fecha_hora_inicio'], name='atenciones__medico__ad7077_idx'), models.Index(fields=['box', 'fecha_hora_inicio'], name='atenciones__box_id_cb1fc0_idx'), models.Index(fields=['fecha_hora_inicio'], name='atenciones__fecha_h_12bdad_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 10:05
+
+from django.db import migrations
+
+
+ESTADOS_VIGENTES = ('PROGRAMADA', 'EN_ESPERA', 'EN_CURSO')
+EXCLUSIONES = (('medico_id', 'atenciones_medico_sin_solape'), ('box_id', 'atenciones_box_sin_solape'))
+
+
+def _recrear_exclusiones(schema_editor, diferible):
+    # Solo PostgreSQL (ver 0003_reservas_sin_solape): una restricción EXCLUDE no
+    # admite ALTER ... DEFERRABLE, se elimina y se vuelve a crear
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    estados = ', '.join(f"'{estado}'" for estado in ESTADOS_VIGENTES)
+    sufijo = ' DEFERRABLE INITIALLY IMMEDIATE' if diferible else ''
+    for columna, nombre in EXCLUSIONES:
+        schema_editor.execute(f'ALTER TABLE atenciones DROP CONSTRAINT IF EXISTS {nombre}')
+        schema_editor.execute(
+            f"ALTER TABLE atenciones ADD CONSTRAINT {nombre} EXCLUDE USING gist ("
+            f"{columna} WITH =, tstzrange(fecha_hora_inicio, fin_reserva, '[)') WITH &&"
+            f") WHERE (estado IN ({estados})){sufijo}"
+        )
+
+
+def exclusiones_diferibles(apps, schema_editor):
+    # Diferibles para que un intercambio de boxes (optimizador.aplicar_plan)
+    # pueda aplicarse en un solo UPDATE con SET CONSTRAINTS ... DEFERRED
+    _recrear_exclusiones(schema_editor, diferible=True)
+
+
+def exclusiones_inmediatas(apps, schema_editor):
+    _recrear_exclusiones(schema_editor, diferible=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('atenciones', '0005_archivo_atenciones'),
+    ]
+
+    operations = [
+        migrations.RunPython(exclusiones_diferibles, exclusiones_inmediatas),
+    ]
@@ -1,11 +1,42 @@
 import uuid
+from datetime import timedelta
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.conf import settings
+from config import configuracion
+from config.fechas import filtro_dia
 from pacientes.models import Paciente
 from boxes.models import Box
 
+class MedicoQuerySet(models.QuerySet):
+    
+    def con_metricas(self, dias=30):
+        # Anota atenciones de hoy (total_atenciones_hoy) y tiempo promedio de los
+        # últimos `dias` (tiempo_promedio) en la misma consulta, para el admin.
+        # Atencion.medico apunta a User: se cruza codigo_medico con username,
+        # igual que atenciones/agenda.py para los horarios
+        atenciones = Atencion.objects.filter(medico__username=OuterRef('codigo_medico')).order_by()
+        hoy = atenciones.filter(**filtro_dia('fecha_hora_inicio', timezone.localdate()))
+        recientes = atenciones.filter(
+            fecha_hora_inicio__gte=timezone.now() - timedelta(days=dias),
+            estado='COMPLETADA',
+            duracion_real__isnull=False
+        )
+        return self.annotate(
+            total_atenciones_hoy=Coalesce(
+                Subquery(hoy.values('medico__username').annotate(n=Count('id')).values('n')[:1]), 0
+            ),
+            tiempo_promedio=Coalesce(
+                Subquery(recientes.values('medico__username').annotate(p=Avg('duracion_real')).values('p')[:1]),
+                0.0,
+                output_field=models.FloatField()
+            ),
+        )
+
+
 class Medico(models.Model):
     
     # Modelo para gestionar médicos y prestadores de salud.
@@ -81,6 +112,8 @@ class Medico(models.Model):
             models.Index(fields=['activo']),
         ]
     
+    objects = MedicoQuerySet.as_manager()
+    
     def __str__(self):
         return f"Dr. {self.nombre} {self.apellido} ({self.get_especialidad_principal_display()})"
     
@@ -91,10 +124,10 @@ class Medico(models.Model):
     def obtener_atenciones_dia(self, fecha=None):
         # Retorna las atenciones del médico para un día específico
         if fecha is None:
-            fecha = timezone.now().date()
+            fecha = timezone.localdate()
         
         return self.atenciones.filter(
-            fecha_hora_inicio__date=fecha
+            **filtro_dia('fecha_hora_inicio', fecha)
         ).order_by('fecha_hora_inicio')
     
     def calcular_tiempo_promedio_atencion(self, dias=30):
@@ -115,27 +148,63 @@ class Medico(models.Model):
         return 0
     
     def obtener_eficiencia(self):
-        # Calcula métricas de eficiencia del médico
-        atenciones_mes = self.obtener_atenciones_dia().count()
-        tiempo_promedio = self.calcular_tiempo_promedio_atencion()
+        # Calcula métricas de eficiencia del médico. Usa las anotaciones de
+        # Medico.objects.con_metricas() si el médico viene de ahí
+        if hasattr(self, 'total_atenciones_hoy'):
+            atenciones_mes = self.total_atenciones_hoy
+            tiempo_promedio = self.tiempo_promedio
+        else:
+            atenciones_mes = self.obtener_atenciones_dia().count()
+            tiempo_promedio = self.calcular_tiempo_promedio_atencion()
         
         return {
             'atenciones_mes': atenciones_mes,
             'tiempo_promedio': tiempo_promedio,
-            'eficiencia_score': self._calcular_score_eficiencia()
+            'eficiencia_score': self._calcular_score_eficiencia(tiempo_promedio)
         }
     
-    def _calcular_score_eficiencia(self):
+    def _calcular_score_eficiencia(self, tiempo_promedio=None):
         # Cálculo interno del score de eficiencia
-        tiempo_promedio = self.calcular_tiempo_promedio_atencion()
+        if tiempo_promedio is None:
+            tiempo_promedio = self.calcular_tiempo_promedio_atencion()
         if tiempo_promedio > 0:
             return min(100, (30 / tiempo_promedio) * 100)
         return 0
 
 
-class Atencion(models.Model):
+class AtencionQuerySet(models.QuerySet):
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create no pasa por save(): se completa fin_reserva aquí
+        objs = list(objs)
+        for atencion in objs:
+            atencion.fin_reserva = atencion.calcular_fin_reserva()
+        return super().bulk_create(objs, *args, **kwargs)
+    
+    def vigentes(self):
+        # Atenciones que reservan médico y box
+        return self.filter(estado__in=Atencion.ESTADOS_VIGENTES)
+    
+    def archivables(self, limite):
+        # Cerradas y anteriores a `limite`: las mueve config/archivo.py
+        return self.filter(estado__in=Atencion.ESTADOS_CERRADOS, fecha_hora_inicio__lt=limite)
+    
+    def solapadas(self, inicio, fin):
+        # Reservas [fecha_hora_inicio, fin_reserva) que se cruzan con [inicio, fin).
+        # La cota inferior sobre fecha_hora_inicio (DURACION_MAXIMA) deja el rango
+        # acotado por ambos lados y aprovecha los índices (medico|box, fecha_hora_inicio).
+        return self.filter(
+            fecha_hora_inicio__gte=inicio - Atencion.DURACION_MAXIMA,
+            fecha_hora_inicio__lt=fin,
+            fin_reserva__gt=inicio,
+        )
+
+
+class AtencionBase(models.Model):
     
-    # Modelo para gestionar las atenciones médicas.
+    # Campos y comportamiento de una atención médica, compartidos por la tabla
+    # caliente (Atencion), el archivo (AtencionArchivada) y la vista histórica
+    # (AtencionHistorica). Las relaciones y el Meta concreto van en cada subclase.
     
     ESTADO_CHOICES = [
         ('PROGRAMADA', 'Programada'),
@@ -158,29 +227,16 @@ class Atencion(models.Model):
         ('INTERCONSULTA', 'Interconsulta'),
     ]
     
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Estados que ocupan la agenda del médico y del box
+    ESTADOS_VIGENTES = ['PROGRAMADA', 'EN_ESPERA', 'EN_CURSO']
+    # Estados finales: pasado el horizonte de archivo salen de la tabla caliente
+    ESTADOS_CERRADOS = ['COMPLETADA', 'CANCELADA', 'NO_PRESENTADO']
+    # Minutos que se espera al paciente tras reportar atraso antes de marcarlo
+    # NO_PRESENTADO; 'atenciones.minutos_espera_atraso' lo ajusta en caliente
+    MINUTOS_ESPERA_ATRASO = 5
+    DURACION_MAXIMA = timedelta(hours=24)
     
-    # Relaciones principales
-    paciente = models.ForeignKey(
-        Paciente, 
-        on_delete=models.CASCADE,
-        related_name='atenciones'
-    )
-    
-    # User con rol de medico
-    medico = models.ForeignKey(
-        settings.AUTH_USER_MODEL,
-        on_delete=models.CASCADE,
-        related_name='atenciones_medico',
-        limit_choices_to={'rol': 'MEDICO'},
-        help_text="Usuario con rol de médico asignado a esta atención"
-    )
-    
-    box = models.ForeignKey(
-        Box, 
-        on_delete=models.CASCADE,
-        related_name='atenciones'
-    )
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     
     # Campos de tiempo
     fecha_hora_inicio = models.DateTimeField(
@@ -191,6 +247,10 @@ class Atencion(models.Model):
         blank=True,
         help_text="Fecha y hora programada de fin"
     )
+    # Fin efectivo de la reserva: fecha_hora_fin o inicio + duración planificada.
+    # Lo mantienen save() y bulk_create(); en PostgreSQL lo usan las restricciones
+    # de exclusión atenciones_{medico,box}_sin_solape (migración 0003).
+    fin_reserva = models.DateTimeField(editable=False)
     
     # Cronómetro - tiempos reales
     inicio_cronometro = models.DateTimeField(
@@ -206,7 +266,7 @@ class Atencion(models.Model):
     
     # Duraciones
     duracion_planificada = models.PositiveIntegerField(
-        validators=[MinValueValidator(1)],
+        validators=[MinValueValidator(1), MaxValueValidator(int(DURACION_MAXIMA.total_seconds() // 60))],
         help_text="Duración planificada en minutos"
     )
     duracion_real = models.PositiveIntegerField(
@@ -253,23 +313,24 @@ class Atencion(models.Model):
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
-        db_table = 'atenciones'
-        verbose_name = 'Atención'
-        verbose_name_plural = 'Atenciones'
+        abstract = True
         ordering = ['-fecha_hora_inicio']
-        indexes = [
-            models.Index(fields=['paciente']),
-            models.Index(fields=['medico']),
-            models.Index(fields=['box']),
-            models.Index(fields=['fecha_hora_inicio']),
-            models.Index(fields=['estado']),
-            models.Index(fields=['tipo_atencion']),
-        ]
     
     def __str__(self):
         medico_nombre = self.medico.get_full_name() or self.medico.username
         return f"{self.tipo_atencion} - {self.paciente} con {medico_nombre} ({self.estado})"
     
+    def calcular_fin_reserva(self):
+        # Intervalo semiabierto [fecha_hora_inicio, fin_reserva)
+        return self.fecha_hora_fin or self.fecha_hora_inicio + timedelta(minutes=self.duracion_planificada)
+    
+    def save(self, *args, **kwargs):
+        self.fin_reserva = self.calcular_fin_reserva()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'fin_reserva'}
+        super().save(*args, **kwargs)
+    
     # ========================================
     # FUNCIONES DE CRONÓMETRO
     
@@ -348,8 +409,8 @@ class Atencion(models.Model):
             'retraso_inicio': self.calcular_retraso(),
             'diferencia_duracion': self.calcular_diferencia_duracion(),
             'fecha': self.fecha_hora_inicio.date(),
-            'medico_id': str(self.medico.id),
-            'box_id': str(self.box.id),
+            'medico_id': str(self.medico_id),
+            'box_id': str(self.box_id),
             'estado': self.estado,
             'completada_a_tiempo': self.duracion_real <= self.duracion_planificada if self.duracion_real else None
         }
@@ -385,11 +446,15 @@ class Atencion(models.Model):
         # Reagenda la atención para una nueva fecha/hora.
         
         if self.estado in ['PROGRAMADA', 'EN_ESPERA']:
+            fecha_anterior = self.fecha_hora_inicio
             self.fecha_hora_inicio = nueva_fecha
+            # El fin programado se desplaza junto con el inicio
+            if self.fecha_hora_fin:
+                self.fecha_hora_fin += nueva_fecha - fecha_anterior
             if nuevo_box:
                 self.box = nuevo_box
             
-            self.observaciones += f"\nReagendada desde {self.fecha_hora_inicio}"
+            self.observaciones += f"\nReagendada desde {fecha_anterior}"
             self.save()
             return True
         return False
@@ -433,16 +498,20 @@ class Atencion(models.Model):
     
     def verificar_tiempo_atraso(self):
         
-        # Verifica si han pasado 5 minutos desde el reporte de atraso.
+        # Verifica si pasó la espera por atraso desde el reporte de atraso.
         # Retorna True si debe marcarse como NO_PRESENTADO.
         
         if self.atraso_reportado and self.fecha_reporte_atraso:
             ahora = timezone.now()
             tiempo_transcurrido = ahora - self.fecha_reporte_atraso
             minutos = tiempo_transcurrido.total_seconds() / 60
-            return minutos >= 5
+            return minutos >= self.minutos_espera_atraso()
         return False
     
+    @classmethod
+    def minutos_espera_atraso(cls):
+        return configuracion.entero('atenciones.minutos_espera_atraso', cls.MINUTOS_ESPERA_ATRASO)
+    
     def marcar_no_presentado(self):
         
         # Marca la atención como 'No se presentó' y libera el box.
@@ -502,4 +571,116 @@ class Atencion(models.Model):
                 return True, ""
         
         # En cualquier otro caso
-        return False, f"No se puede reportar atraso cuando la atención está {self.get_estado_display()}"
\ No newline at end of file
+        return False, f"No se puede reportar atraso cuando la atención está {self.get_estado_display()}"
+
+
+class Atencion(AtencionBase):
+    
+    # Modelo para gestionar las atenciones médicas.
+    
+    # Relaciones principales
+    paciente = models.ForeignKey(
+        Paciente, 
+        on_delete=models.CASCADE,
+        related_name='atenciones'
+    )
+    
+    # User con rol de medico
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='atenciones_medico',
+        limit_choices_to={'rol': 'MEDICO'},
+        help_text="Usuario con rol de médico asignado a esta atención"
+    )
+    
+    box = models.ForeignKey(
+        Box, 
+        on_delete=models.CASCADE,
+        related_name='atenciones'
+    )
+    
+    class Meta:
+        db_table = 'atenciones'
+        verbose_name = 'Atención'
+        verbose_name_plural = 'Atenciones'
+        ordering = ['-fecha_hora_inicio']
+        indexes = [
+            models.Index(fields=['paciente']),
+            models.Index(fields=['medico']),
+            models.Index(fields=['box']),
+            models.Index(fields=['fecha_hora_inicio']),
+            models.Index(fields=['tipo_atencion']),
+            models.Index(fields=['medico', 'fecha_hora_inicio']),
+            models.Index(fields=['box', 'fecha_hora_inicio']),
+            # Atención en curso / próxima del médico (cronómetro, iniciar)
+            models.Index(fields=['medico', 'estado', 'fecha_hora_inicio'], name='atenciones_medico_estado_idx'),
+            # Pendientes y dashboard: estado + rango de fechas (reemplaza al índice solo por estado)
+            models.Index(fields=['estado', 'fecha_hora_inicio'], name='atenciones_estado_fecha_idx'),
+            # Atención en curso de cada box: solo indexa las pocas filas EN_CURSO.
+            # Incluye la fecha para servir el ordering por defecto sin ordenar aparte
+            models.Index(
+                fields=['box', 'fecha_hora_inicio'],
+                condition=Q(estado='EN_CURSO'),
+                name='atenciones_box_en_curso_idx',
+            ),
+        ]
+    
+    objects = AtencionQuerySet.as_manager()
+
+
+class AtencionArchivada(AtencionBase):
+    
+    # Atenciones cerradas movidas fuera de la tabla caliente (config/archivo.py).
+    # Conservan id y columnas; los timestamps se copian tal cual, sin auto_now.
+    
+    paciente = models.ForeignKey(
+        Paciente,
+        on_delete=models.CASCADE,
+        related_name='atenciones_archivadas'
+    )
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='atenciones_medico_archivadas'
+    )
+    box = models.ForeignKey(
+        Box,
+        on_delete=models.CASCADE,
+        related_name='atenciones_archivadas'
+    )
+    fecha_creacion = models.DateTimeField()
+    fecha_actualizacion = models.DateTimeField()
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'atenciones_archivo'
+        verbose_name = 'Atención archivada'
+        verbose_name_plural = 'Atenciones archivadas'
+        ordering = ['-fecha_hora_inicio']
+        indexes = [
+            models.Index(fields=['paciente', 'fecha_hora_inicio']),
+            models.Index(fields=['medico', 'fecha_hora_inicio']),
+            models.Index(fields=['box', 'fecha_hora_inicio']),
+            models.Index(fields=['fecha_hora_inicio']),
+        ]
+
+
+class AtencionHistorica(AtencionBase):
+    
+    # Solo lectura: vista atenciones UNION ALL atenciones_archivo, recreada por
+    # config/archivo.py después de cada migrate. Para analítica e historial del
+    # paciente, que deben ver también lo archivado.
+    
+    paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
+    medico = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False
+    )
+    box = models.ForeignKey(Box, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
+    
+    class Meta:
+        managed = False
+        db_table = 'atenciones_historico'
+        verbose_name = 'Atención (histórico)'
+        verbose_name_plural = 'Atenciones (histórico)'
+        ordering = ['-fecha_hora_inicio']
@@ -0,0 +1,548 @@
+"""
+Asignación de boxes a las atenciones programadas de un día.
+
+Es un coloreo de grafo de intervalos con colores restringidos: cada atención
+[inicio, fin) necesita un box compatible con la especialidad de su médico (el
+propio o MULTIUSO), abierto en ese tramo según Box.horarios_disponibles y sin
+cruzarse con las reservas que no se mueven (atenciones ya iniciadas o en otro
+estado, ocupaciones manuales).
+
+1. Construcción: las atenciones se recorren por hora de inicio y cada una va
+   al box compatible que menos costo agrega; a igual costo, el de su
+   especialidad antes que MULTIUSO y el que deja el hueco previo más chico.
+   Los boxes se indexan por especialidad según la hora en que quedan libres,
+   así cada atención evalúa unos pocos boxes y no todos los compatibles.
+2. Búsqueda local: cada atención cuyo retiro baja el costo de su box se intenta
+   reubicar en otro box compatible; el movimiento se acepta si el costo total baja.
+
+Costo = minutos de huecos inútiles (entre dos reservas del mismo box y menores
+a HUECO_UTIL_MINUTOS) + PESO_SOBRECARGA por minuto ocupado sobre
+UMBRAL_SOBRECARGA del horario del box + PESO_CAMBIO por atención que cambia
+de box. El resultado es determinista: la misma agenda da el mismo plan y la
+misma versión, que es lo que permite aplicar una vista previa.
+"""
+import hashlib
+import heapq
+import json
+import logging
+from bisect import bisect_left, bisect_right, insort
+
+from django.db import connection
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from boxes.models import Box, OcupacionManual
+from config.fechas import rango_dia
+from .agenda import (
+    ESTADOS_BOX_FUERA_DE_USO, SegundosEpoch, a_minutos, desde_minutos,
+    especialidades_de_box, parsear_horario, reservar, tramos_en_ventana,
+)
+from .models import Atencion
+
+logger = logging.getLogger(__name__)
+
+
+HUECO_UTIL_MINUTOS = 15
+UMBRAL_SOBRECARGA = 0.85  # Mismo umbral que NexaThink usa para alertar alta ocupación
+PESO_SOBRECARGA = 2
+PESO_CAMBIO = 1
+MAX_PASADAS = 3
+SIN_HUECO_PREVIO = 10 ** 9
+SIN_RESERVAS = -SIN_HUECO_PREVIO  # Hora "libre desde" de un box vacío
+
+
+def _hueco(minutos):
+    return minutos if 0 < minutos < HUECO_UTIL_MINUTOS else 0
+
+
+class _EstadoBox:
+    # Reservas de un box en el día, ordenadas por inicio (listas paralelas)
+
+    __slots__ = ('id', 'numero', 'especialidad', 'tramos', 'inicios_tramo',
+                 'inicios', 'fines', 'ocupado', 'limite', 'libre', 'lugar')
+
+    def __init__(self, box_id, numero, especialidad, tramos):
+        self.id = box_id
+        self.numero = numero
+        self.especialidad = especialidad
+        self.tramos = tramos
+        self.inicios_tramo = [inicio for inicio, _ in tramos]
+        self.inicios, self.fines = [], []
+        self.ocupado = 0
+        self.limite = UMBRAL_SOBRECARGA * sum(fin - inicio for inicio, fin in tramos)
+        # Solo durante la construcción: índice donde está el box y su clave en él
+        self.libre = SIN_RESERVAS
+        self.lugar = None
+
+    def exceso(self, ocupado):
+        return max(0, ocupado - self.limite)
+
+    def posicion(self, inicio, fin, respetar_horario=True):
+        # Índice donde insertar [inicio, fin), o None si no cabe
+        if respetar_horario:
+            t = bisect_right(self.inicios_tramo, inicio) - 1
+            if t < 0 or self.tramos[t][1] < fin:
+                return None
+        i = bisect_left(self.inicios, inicio)
+        if i > 0 and self.fines[i - 1] > inicio:
+            return None
+        if i < len(self.inicios) and self.inicios[i] < fin:
+            return None
+        return i
+
+    def delta_insertar(self, i, inicio, fin):
+        delta = PESO_SOBRECARGA * (self.exceso(self.ocupado + fin - inicio) - self.exceso(self.ocupado))
+        anterior = self.fines[i - 1] if i > 0 else None
+        siguiente = self.inicios[i] if i < len(self.inicios) else None
+        if anterior is not None:
+            delta += _hueco(inicio - anterior)
+        if siguiente is not None:
+            delta += _hueco(siguiente - fin)
+            if anterior is not None:
+                delta -= _hueco(siguiente - anterior)
+        return delta
+
+    def delta_quitar(self, i):
+        inicio, fin = self.inicios[i], self.fines[i]
+        delta = PESO_SOBRECARGA * (self.exceso(self.ocupado - (fin - inicio)) - self.exceso(self.ocupado))
+        anterior = self.fines[i - 1] if i > 0 else None
+        siguiente = self.inicios[i + 1] if i + 1 < len(self.inicios) else None
+        if anterior is not None:
+            delta -= _hueco(inicio - anterior)
+        if siguiente is not None:
+            delta -= _hueco(siguiente - fin)
+            if anterior is not None:
+                delta += _hueco(siguiente - anterior)
+        return delta
+
+    def insertar(self, i, inicio, fin, minutos):
+        self.inicios.insert(i, inicio)
+        self.fines.insert(i, fin)
+        self.ocupado += minutos
+
+    def quitar(self, i, minutos):
+        del self.inicios[i]
+        del self.fines[i]
+        self.ocupado -= minutos
+
+    def indice(self, inicio):
+        return bisect_left(self.inicios, inicio)
+
+
+class _Reserva:
+    # Atención movible: minutos epoch, box actual, especialidades de box compatibles
+    # (de la más específica a la más general) y boxes candidatos (prioridad, box)
+
+    __slots__ = ('id', 'medico_id', 'inicio', 'fin', 'minutos', 'box_actual', 'origen', 'propio',
+                 'especialidades', 'candidatos', 'box')
+
+    def __init__(self, atencion_id, medico_id, inicio, fin, minutos, box_actual, origen, especialidades,
+                 candidatos, prioridades):
+        self.id = atencion_id
+        self.medico_id = medico_id
+        self.inicio = inicio
+        self.fin = fin
+        self.minutos = minutos
+        self.box_actual = box_actual
+        self.origen = origen  # _EstadoBox del box actual, si es utilizable
+        self.especialidades = especialidades
+        self.candidatos = candidatos
+        self.propio = [(prioridades[box_actual], origen)] if box_actual in prioridades else []
+        self.box = None
+
+    def cambio(self, box):
+        return 0 if box is self.origen else PESO_CAMBIO
+
+
+def _costo(estados):
+    fragmentacion = sobrecarga = sobrecargados = 0
+    for box in estados:
+        fragmentacion += sum(_hueco(inicio - fin) for fin, inicio in zip(box.fines, box.inicios[1:]))
+        exceso = box.exceso(box.ocupado)
+        if exceso:
+            sobrecarga += exceso
+            sobrecargados += 1
+    return {
+        'fragmentacion_minutos': fragmentacion,
+        'sobrecarga_minutos': round(sobrecarga),
+        'boxes_sobrecargados': sobrecargados,
+        'total': round(fragmentacion + PESO_SOBRECARGA * sobrecarga),
+    }
+
+
+def _cargar(desde, hasta):
+    # Boxes utilizables con sus tramos del día, reservas fijas por box y atenciones movibles
+    tramos_por_horario = {}
+    boxes = {}
+    for box_id, numero, especialidad, horario in Box.objects.filter(activo=True).exclude(
+        estado__in=ESTADOS_BOX_FUERA_DE_USO
+    ).order_by('numero').values_list('id', 'numero', 'especialidad', 'horarios_disponibles'):
+        clave = json.dumps(horario, sort_keys=True, default=str)
+        if clave not in tramos_por_horario:
+            tramos_por_horario[clave] = tramos_en_ventana(parsear_horario(horario), desde, hasta)
+        boxes[box_id] = _EstadoBox(box_id, numero, especialidad, tramos_por_horario[clave])
+
+    # Movibles: programadas que empiezan en el día y aún no comienzan. Se marca en
+    # la consulta para no convertir miles de datetimes en Python
+    movible = Q(estado='PROGRAMADA', fecha_hora_inicio__gte=max(desde, timezone.now()), fecha_hora_inicio__lt=hasta)
+    fijas, movibles = [], []
+    atenciones = Atencion.objects.vigentes().solapadas(desde, hasta).annotate(
+        inicio_s=SegundosEpoch('fecha_hora_inicio'),
+        fin_s=SegundosEpoch('fin_reserva'),
+        movible=ExpressionWrapper(movible, output_field=BooleanField()),
+    ).order_by('fecha_hora_inicio', 'id').values_list(
+        'id', 'medico_id', 'medico__especialidad', 'box_id', 'box__numero', 'movible', 'inicio_s', 'fin_s',
+    )
+    for atencion_id, medico_id, especialidad, box_id, box_numero, es_movible, inicio_s, fin_s in atenciones:
+        inicio, fin = inicio_s // 60, -(-fin_s // 60)
+        if es_movible:
+            movibles.append((atencion_id, medico_id, especialidad, box_id, box_numero, inicio, fin))
+        else:
+            fijas.append((box_id, inicio, fin))
+
+    fijas.extend(
+        (box_id, a_minutos(inicio), a_minutos(fin, hacia_arriba=True))
+        for box_id, inicio, fin in OcupacionManual.objects.filter(
+            activa=True,
+            box_id__in=list(boxes),
+            fecha_inicio__lt=hasta,
+            fecha_fin_programada__gt=desde,
+        ).values_list('box_id', 'fecha_inicio', 'fecha_fin_programada')
+    )
+    return boxes, fijas, movibles
+
+
+def _reservar_fijas(boxes, fijas, desde_min, hasta_min):
+    # Las reservas fijas se cargan tal cual; la ocupación cuenta solo lo que cae en el día
+    for box_id, inicio, fin in sorted(fijas, key=lambda fija: fija[1]):
+        box = boxes.get(box_id)
+        if box is None:
+            continue
+        i = box.indice(inicio)
+        if i > 0 and box.fines[i - 1] > inicio:
+            # Ocupación manual encima de una atención: se fusiona con la anterior
+            if fin > box.fines[i - 1]:
+                box.ocupado += max(0, min(fin, hasta_min) - max(box.fines[i - 1], desde_min))
+                box.fines[i - 1] = fin
+            continue
+        box.insertar(i, inicio, fin, max(0, min(fin, hasta_min) - max(inicio, desde_min)))
+
+
+class _BoxesLibres:
+    # Boxes de una especialidad con el mismo horario y el mismo régimen de
+    # sobrecarga, ordenados por (hora en que quedan libres, número). Vale
+    # mientras ninguna reserva de esos boxes empiece después de la atención que
+    # se ubica: entonces el único costo que los distingue es el hueco previo.
+
+    __slots__ = ('tramos', 'inicios_tramo', 'claves')
+
+    def __init__(self, box):
+        self.tramos = box.tramos
+        self.inicios_tramo = box.inicios_tramo
+        self.claves = []
+
+    def agregar(self, box):
+        box.libre = box.fines[-1] if box.fines else SIN_RESERVAS
+        box.lugar = self
+        insort(self.claves, (box.libre, box.numero, box))
+
+    def quitar(self, box):
+        del self.claves[bisect_left(self.claves, (box.libre, box.numero))]
+
+    def abierto(self, inicio, fin):
+        t = bisect_right(self.inicios_tramo, inicio) - 1
+        return t >= 0 and self.tramos[t][1] >= fin
+
+    def candidatos(self, inicio):
+        # Los únicos que pueden ganar (a igual hora libre, el de menor número):
+        # el que queda libre justo a `inicio`, el de hueco inútil más chico y el
+        # de hueco útil más chico. Los que quedan libres después no caben.
+        claves = self.claves
+        j = bisect_left(claves, (inicio,))
+        if j < len(claves) and claves[j][0] == inicio:
+            yield claves[j][2]
+        if not j:
+            return
+        libre = claves[j - 1][0]
+        yield claves[bisect_left(claves, (libre,))][2]
+        if libre > inicio - HUECO_UTIL_MINUTOS:
+            k = bisect_left(claves, (inicio - HUECO_UTIL_MINUTOS + 1,))
+            if k:
+                libre = claves[k - 1][0]
+                yield claves[bisect_left(claves, (libre,))][2]
+
+
+def _construir(reservas, boxes):
+    # Los boxes sin reservas fijas por delante van a un _BoxesLibres por
+    # (especialidad, horario, sobrecargado). Se revisan uno a uno los que aún
+    # tienen una reserva fija posterior (salen del heap `pendientes` cuando la
+    # hora de inicio la alcanza) y los que están por cruzar el umbral de
+    # sobrecarga, donde el costo depende de cuánto se pasen.
+    reservas = sorted(reservas, key=lambda r: (r.inicio, -r.fin, str(r.id)))
+    maximo = max((reserva.minutos for reserva in reservas), default=0)
+    indices, revisar, pendientes = {}, {}, []
+
+    def ubicar(box):
+        if box.ocupado < box.limite < box.ocupado + maximo:
+            revisar.setdefault(box.especialidad, {})[box] = None
+            box.lugar = revisar
+            return
+        por_horario = indices.setdefault(box.especialidad, {})
+        clave = (id(box.tramos), box.ocupado >= box.limite)
+        if clave not in por_horario:
+            por_horario[clave] = _BoxesLibres(box)
+        por_horario[clave].agregar(box)
+
+    for box in boxes:
+        if box.inicios:
+            heapq.heappush(pendientes, (box.inicios[-1], box.numero, box))
+            revisar.setdefault(box.especialidad, {})[box] = None
+            box.lugar = pendientes
+        else:
+            ubicar(box)
+
+    sin_box = []
+    for reserva in reservas:
+        inicio, fin, minutos, actual = reserva.inicio, reserva.fin, reserva.minutos, reserva.origen
+        while pendientes and pendientes[0][0] <= inicio:
+            box = heapq.heappop(pendientes)[2]
+            del revisar[box.especialidad][box]
+            ubicar(box)
+
+        mejor, mejor_clave = None, None
+
+        def evaluar(box, prioridad):
+            nonlocal mejor, mejor_clave
+            t = bisect_right(box.inicios_tramo, inicio) - 1
+            if t < 0 or box.tramos[t][1] < fin:
+                return
+            inicios, fines = box.inicios, box.fines
+            i = bisect_left(inicios, inicio)
+            if i and fines[i - 1] > inicio:
+                return
+            siguiente = inicios[i] if i < len(inicios) else None
+            if siguiente is not None and siguiente < fin:
+                return
+
+            costo = 0 if box is actual else PESO_CAMBIO
+            ocupado = box.ocupado + minutos
+            if ocupado > box.limite:
+                costo += PESO_SOBRECARGA * (ocupado - max(box.ocupado, box.limite))
+            hueco_previo = inicio - fines[i - 1] if i else SIN_HUECO_PREVIO
+            costo += _hueco(hueco_previo)
+            if siguiente is not None:
+                costo += _hueco(siguiente - fin)
+                if i:
+                    costo -= _hueco(siguiente - fines[i - 1])
+
+            clave = (costo, prioridad, hueco_previo, box.numero)
+            if mejor_clave is None or clave < mejor_clave:
+                mejor, mejor_clave = (box, i), clave
+
+        for prioridad, box in reserva.propio:
+            evaluar(box, prioridad)
+        for prioridad, especialidad in enumerate(reserva.especialidades):
+            for box in revisar.get(especialidad, ()):
+                evaluar(box, prioridad)
+            for libres in indices.get(especialidad, {}).values():
+                if libres.abierto(inicio, fin):
+                    for box in libres.candidatos(inicio):
+                        evaluar(box, prioridad)
+
+        if mejor is None:
+            sin_box.append(reserva)
+            continue
+        box, i = mejor
+        lugar = box.lugar
+        if lugar is pendientes:
+            box.insertar(i, inicio, fin, minutos)
+        else:
+            if lugar is revisar:
+                del revisar[box.especialidad][box]
+            else:
+                lugar.quitar(box)
+            box.insertar(i, inicio, fin, minutos)
+            ubicar(box)
+        reserva.box = box
+
+    for box in boxes:
+        box.lugar = None
+    return sin_box
+
+
+def _mejorar(reservas):
+    # Reubicaciones que bajan el costo; termina cuando una pasada no mejora nada
+    movimientos = 0
+    for _ in range(MAX_PASADAS):
+        mejoras = 0
+        for reserva in reservas:
+            origen = reserva.box
+            i = origen.indice(reserva.inicio)
+            delta_origen = origen.delta_quitar(i) - reserva.cambio(origen)
+            if delta_origen >= 0:
+                continue
+            # Insertar en otro box cuesta PESO_CAMBIO y solo devuelve minutos si
+            # la atención cierra un hueco inútil, lo que exige que dure menos que
+            # HUECO_UTIL_MINUTOS; si ni así mejora, basta con probar el box actual
+            duracion = reserva.fin - reserva.inicio
+            cota = delta_origen + PESO_CAMBIO - (duracion if duracion < HUECO_UTIL_MINUTOS else 0)
+            candidatos = reserva.candidatos if cota < 0 else reserva.propio
+            mejor, mejor_delta = None, 0
+            for _, box in candidatos:
+                if box is origen:
+                    continue
+                j = box.posicion(reserva.inicio, reserva.fin)
+                if j is None:
+                    continue
+                delta = delta_origen + box.delta_insertar(j, reserva.inicio, reserva.fin) + reserva.cambio(box)
+                if delta < mejor_delta:
+                    mejor, mejor_delta = (box, j), delta
+            if mejor is not None:
+                box, j = mejor
+                origen.quitar(i, reserva.minutos)
+                box.insertar(j, reserva.inicio, reserva.fin, reserva.minutos)
+                reserva.box = box
+                mejoras += 1
+        movimientos += mejoras
+        if not mejoras:
+            break
+    return movimientos
+
+
+def optimizar_boxes(fecha):
+    """
+    Propone la asignación de boxes para las atenciones PROGRAMADAS de `fecha`
+    (hora local) que aún no comienzan. No escribe nada.
+
+    Retorna el plan con los cambios propuestos, las atenciones que no caben en
+    ningún box compatible (se quedan en su box actual), el costo antes y
+    después, y una versión que identifica el plan.
+    """
+    desde, hasta = rango_dia(fecha)
+    desde_min, hasta_min = a_minutos(desde), a_minutos(hasta)
+    boxes, fijas, movibles = _cargar(desde, hasta)
+
+    # Costo de la agenda tal como está, sobre los mismos boxes
+    actuales = {
+        box_id: _EstadoBox(box_id, box.numero, box.especialidad, box.tramos)
+        for box_id, box in boxes.items()
+    }
+    _reservar_fijas(actuales, fijas + [(m[3], m[5], m[6]) for m in movibles], desde_min, hasta_min)
+    costo_inicial = _costo(actuales.values())
+
+    _reservar_fijas(boxes, fijas, desde_min, hasta_min)
+    por_especialidad = {}
+    for box in boxes.values():
+        por_especialidad.setdefault(box.especialidad, []).append(box)
+
+    candidatos_por_especialidad, reservas = {}, []
+    for atencion_id, medico_id, especialidad, box_id, _, inicio, fin in movibles:
+        if especialidad not in candidatos_por_especialidad:
+            especialidades = especialidades_de_box(especialidad)
+            candidatos = [
+                (prioridad, box)
+                for prioridad, especialidad_box in enumerate(especialidades)
+                for box in por_especialidad.get(especialidad_box, [])
+            ]
+            candidatos_por_especialidad[especialidad] = (
+                especialidades, candidatos, {box.id: p for p, box in candidatos},
+            )
+        especialidades, candidatos, prioridades = candidatos_por_especialidad[especialidad]
+        reservas.append(_Reserva(
+            atencion_id, medico_id, inicio, fin, max(0, min(fin, hasta_min) - inicio),
+            box_id, boxes.get(box_id), especialidades, candidatos, prioridades,
+        ))
+
+    sin_box = _construir(reservas, list(boxes.values()))
+    asignadas = [reserva for reserva in reservas if reserva.box is not None]
+    movimientos = _mejorar(asignadas)
+
+    # Las que no caben se quedan donde están; si su box quedó tomado, el plan no es aplicable
+    aplicable = True
+    for reserva in sin_box:
+        box = boxes.get(reserva.box_actual)
+        if box is None:
+            continue
+        i = box.posicion(reserva.inicio, reserva.fin, respetar_horario=False)
+        if i is None:
+            aplicable = False
+        else:
+            box.insertar(i, reserva.inicio, reserva.fin, reserva.minutos)
+
+    numeros = {m[3]: m[4] for m in movibles}
+    cambios = [
+        {
+            'atencion_id': str(reserva.id),
+            'medico_id': reserva.medico_id,
+            'inicio': desde_minutos(reserva.inicio),
+            'fin': desde_minutos(reserva.fin),
+            'box_actual_id': str(reserva.box_actual),
+            'box_actual_numero': numeros[reserva.box_actual],
+            'box_id': str(reserva.box.id),
+            'box_numero': reserva.box.numero,
+        }
+        for reserva in asignadas if reserva.box.id != reserva.box_actual
+    ]
+    no_asignadas = [
+        {
+            'atencion_id': str(reserva.id),
+            'medico_id': reserva.medico_id,
+            'inicio': desde_minutos(reserva.inicio),
+            'fin': desde_minutos(reserva.fin),
+            'box_actual_id': str(reserva.box_actual),
+            'box_actual_numero': numeros[reserva.box_actual],
+        }
+        for reserva in sin_box
+    ]
+    firma = json.dumps(
+        [[c['atencion_id'], c['box_id']] for c in cambios] + [[n['atencion_id']] for n in no_asignadas]
+    )
+
+    return {
+        'fecha': fecha,
+        'version': hashlib.sha1(firma.encode()).hexdigest()[:16],
+        'aplicable': aplicable,
+        'resumen': {
+            'atenciones_movibles': len(reservas),
+            'reservas_fijas': len(fijas),
+            'cambios': len(cambios),
+            'sin_box_compatible': len(no_asignadas),
+            'movimientos_busqueda_local': movimientos,
+            'costo_inicial': costo_inicial,
+            'costo_final': _costo(boxes.values()),
+        },
+        'cambios': cambios,
+        'sin_box_compatible': no_asignadas,
+    }
+
+
+def aplicar_plan(plan):
+    """
+    Escribe los cambios de box del plan en una sola transacción. Si entretanto
+    apareció un solape, no se aplica nada y se lanza ConflictoAgenda.
+    """
+    nuevo_box = {cambio['atencion_id']: cambio['box_id'] for cambio in plan['cambios']}
+    if not nuevo_box:
+        return []
+
+    def guardar():
+        if connection.vendor == 'postgresql':
+            # Un intercambio entre dos boxes se cruza consigo mismo a mitad del UPDATE
+            with connection.cursor() as cursor:
+                cursor.execute('SET CONSTRAINTS atenciones_box_sin_solape DEFERRED')
+        ahora = timezone.now()
+        atenciones = list(Atencion.objects.filter(id__in=list(nuevo_box), estado='PROGRAMADA').only(
+            'id', 'medico_id', 'box_id', 'estado', 'fecha_hora_inicio', 'fin_reserva', 'fecha_actualizacion'
+        ))
+        for atencion in atenciones:
+            atencion.box_id = nuevo_box[str(atencion.id)]
+            atencion.fecha_actualizacion = ahora
+        Atencion.objects.bulk_update(atenciones, ['box', 'fecha_actualizacion'], batch_size=500)
+        return atenciones
+
+    atenciones = reservar(guardar)
+    logger.info(
+        'Asignación de boxes aplicada',
+        extra={'fecha': str(plan['fecha']), 'version': plan['version'], 'cambios': len(atenciones)},
+    )
+    return atenciones
@@ -1,4 +1,9 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
+from users.models import User
+from .agenda import MAX_DIAS_VENTANA
 from .models import Medico, Atencion
 from pacientes.serializers import PacienteListSerializer
 from boxes.serializers import BoxListSerializer
@@ -295,7 +300,7 @@ class AtencionSerializer(serializers.ModelSerializer):
         return 0
     
     def get_debe_marcar_no_presentado(self, obj):
-        # Indica si han pasado 5 minutos desde el reporte de atraso
+        # Indica si pasó la espera desde el reporte de atraso
         return obj.verificar_tiempo_atraso()
     
     def get_paciente_tiene_ruta(self, obj):
@@ -303,7 +308,7 @@ class AtencionSerializer(serializers.ModelSerializer):
         from rutas_clinicas.models import RutaClinica
         return RutaClinica.objects.filter(
             paciente=obj.paciente,
-            estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+            estado__in=RutaClinica.ESTADOS_ACTIVOS
         ).exists()
         
     def get_ruta_clinica_id(self, obj):
@@ -311,7 +316,7 @@ class AtencionSerializer(serializers.ModelSerializer):
         from rutas_clinicas.models import RutaClinica
         ruta = RutaClinica.objects.filter(
             paciente=obj.paciente,
-            estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+            estado__in=RutaClinica.ESTADOS_ACTIVOS
         ).first()
         return str(ruta.id) if ruta else None
 
@@ -414,14 +419,13 @@ class AtencionCreateUpdateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError({
                     'fecha_hora_fin': 'La fecha de fin debe ser posterior a la fecha de inicio.'
                 })
+            if data['fecha_hora_fin'] - data['fecha_hora_inicio'] > Atencion.DURACION_MAXIMA:
+                raise serializers.ValidationError({
+                    'fecha_hora_fin': 'Una atención no puede durar más de 24 horas.'
+                })
         
-        # Validar disponibilidad del box
-        box = data.get('box')
-        if box and box.estado == 'OCUPADO':
-            raise serializers.ValidationError({
-                'box': f'El box {box.numero} está actualmente ocupado.'
-            })
-        
+        # La disponibilidad de médico y box en el horario se verifica al reservar
+        # (ver agenda.reservar): el estado actual del box no dice nada de una hora futura.
         return data
 
 
@@ -445,6 +449,37 @@ class AtencionReagendarSerializer(serializers.Serializer):
     )
 
 
+class BusquedaHuecosSerializer(serializers.Serializer):
+    # Parámetros de búsqueda de horas libres médico + box
+    especialidad = serializers.ChoiceField(choices=User.ESPECIALIDAD_CHOICES)
+    duracion = serializers.IntegerField(min_value=5, max_value=480)
+    desde = serializers.DateTimeField(required=False)
+    hasta = serializers.DateTimeField(required=False)
+    medico = serializers.IntegerField(required=False)
+    limite = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+    
+    def validate(self, data):
+        desde = data.setdefault('desde', timezone.now())
+        hasta = data.setdefault('hasta', desde + timedelta(days=7))
+        if hasta <= desde:
+            raise serializers.ValidationError({'hasta': 'Debe ser posterior a "desde".'})
+        if hasta - desde > timedelta(days=MAX_DIAS_VENTANA):
+            raise serializers.ValidationError({
+                'hasta': f'La ventana de búsqueda no puede superar {MAX_DIAS_VENTANA} días.'
+            })
+        return data
+
+
+class OptimizacionBoxesSerializer(serializers.Serializer):
+    # Día a optimizar y, al aplicar, la versión de la vista previa aceptada
+    fecha = serializers.DateField(required=False)
+    version = serializers.CharField(required=False, max_length=32)
+    
+    def validate(self, data):
+        data.setdefault('fecha', timezone.localdate())
+        return data
+
+
 class AtencionEstadisticasSerializer(serializers.Serializer):
     # Serializer para estadísticas de atenciones
     total = serializers.IntegerField()
@@ -1,7 +1,12 @@
+import logging
+
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 from .models import Atencion
+from .cronometro import invalidar_puntero
+
+logger = logging.getLogger(__name__)
 
 # --- TUS FUNCIONES ORIGINALES (MANTENIDAS) ---
 
@@ -32,7 +37,7 @@ def crear_ruta_clinica_automatica(sender, instance, created, **kwargs):
     # Verificar si el paciente ya tiene una ruta clínica activa
     rutas_activas = RutaClinica.objects.filter(
         paciente=instance.paciente,
-        estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+        estado__in=RutaClinica.ESTADOS_ACTIVOS
     ).exists()
     
     if not rutas_activas:
@@ -72,7 +77,7 @@ def crear_ruta_clinica_automatica(sender, instance, created, **kwargs):
             instance.paciente.save(update_fields=['estado_actual', 'etapa_actual'])
             
         except Exception as e:
-            print(f" Error al crear ruta clínica automática: {str(e)}")
+            logger.exception('Error al crear ruta clínica automática para atención %s', instance.id)
 
 # --- NUEVA FUNCIONALIDAD (AGREGADA) ---
 
@@ -108,7 +113,120 @@ def avanzar_ruta_al_completar_atencion(sender, instance, created, **kwargs):
             )
             
             if exito:
-                print(f"   ✅ Paciente {instance.paciente.rut} avanzó a: {ruta.etapa_actual}")
+                logger.info('Paciente %s avanzó a %s', instance.paciente_id, ruta.etapa_actual)
                 # También actualizamos el paciente para reflejar el cambio en el frontend
                 instance.paciente.etapa_actual = ruta.etapa_actual
-                instance.paciente.save(update_fields=['etapa_actual'])
\ No newline at end of file
+                instance.paciente.save(update_fields=['etapa_actual'])
+@receiver(post_save, sender=Atencion)
+def invalidar_puntero_cronometro(sender, instance, **kwargs):
+    """
+    Cualquier cambio de una atención puede mover la atención actual/próxima
+    de su médico: se descarta el puntero cacheado del cronómetro.
+    Los borrados no se escuchan (impedirían el fast-delete en cascada); un
+    puntero a una atención borrada se detecta al revalidarlo.
+    """
+    if instance.medico_id:
+        invalidar_puntero(instance.medico_id)
+
+
+# --- EQUIVALENTE EN LOTE ---
+# bulk_create/bulk_update no emiten post_save. Quien escribe atenciones en
+# lote (integraciones/agenda.py) llama a esta función con el resultado, y
+# obtiene los mismos efectos que las señales de arriba con pocas consultas.
+# Si cambia una señal, cambiar también aquí.
+
+ETAPAS_RUTA_AUTOMATICA = [
+    'CONSULTA_MEDICA',
+    'PROCESO_EXAMEN',
+    'REVISION_EXAMEN',
+    'HOSPITALIZACION',
+    'OPERACION',
+    'ALTA'
+]
+
+
+def aplicar_efectos_en_lote(creadas=(), completadas=(), cerradas=(), origen=None):
+    """
+    creadas: atenciones recién insertadas.
+    completadas: atenciones que pasaron a COMPLETADA.
+    cerradas: atenciones que pasaron a COMPLETADA o CANCELADA (liberan box).
+    origen: integración de la que vienen los cambios (no se le publican).
+    Devuelve {'rutas_creadas': n, 'rutas_avanzadas': m, 'boxes_liberados': k}.
+    """
+    from boxes.models import Box
+    from integraciones.publicador import publicar
+    from pacientes.models import Paciente
+    from rutas_clinicas.models import RutaClinica
+
+    resultado = {'rutas_creadas': 0, 'rutas_avanzadas': 0, 'boxes_liberados': 0}
+
+    # gestionar_estado_box_al_guardar
+    en_curso = [a for a in creadas if a.estado == 'EN_CURSO' and a.inicio_cronometro]
+    if en_curso:
+        boxes = Box.objects.in_bulk({a.box_id for a in en_curso})
+        for atencion in en_curso:
+            boxes[atencion.box_id].ocupar(atencion.inicio_cronometro)
+    ids_cerradas = {a.box_id for a in cerradas}
+    if ids_cerradas:
+        for box in Box.objects.filter(id__in=ids_cerradas, estado='OCUPADO'):
+            resultado['boxes_liberados'] += int(box.liberar())
+
+    # crear_ruta_clinica_automatica: una ruta por paciente sin ruta activa
+    primera_por_paciente = {}
+    for atencion in creadas:
+        primera_por_paciente.setdefault(atencion.paciente_id, atencion)
+    con_ruta = set(
+        RutaClinica.objects.filter(
+            paciente_id__in=primera_por_paciente, estado__in=RutaClinica.ESTADOS_ACTIVOS
+        ).values_list('paciente_id', flat=True)
+    )
+    rutas = []
+    for paciente_id, atencion in primera_por_paciente.items():
+        if paciente_id in con_ruta:
+            continue
+        ruta = RutaClinica(
+            paciente_id=paciente_id,
+            etapas_seleccionadas=list(ETAPAS_RUTA_AUTOMATICA),
+            estado='INICIADA',
+            metadatos_adicionales={
+                'creada_automaticamente': True,
+                'creada_desde_atencion': str(atencion.id),
+                'fecha_creacion_automatica': timezone.now().isoformat(),
+                'medico_atencion': atencion.medico.get_full_name() if atencion.medico else 'N/A'
+            }
+        )
+        ruta.preparar_inicio(usuario=atencion.medico, etapa_inicial='CONSULTA_MEDICA')
+        rutas.append(ruta)
+    if rutas:
+        RutaClinica.objects.bulk_create(rutas)
+        # integraciones.signals.publicar_cambio_de_estado
+        publicar('RUTA_CLINICA', rutas, 'creacion', origen=origen)
+        Paciente.objects.filter(id__in=[r.paciente_id for r in rutas]).update(
+            estado_actual='ACTIVO', etapa_actual='CONSULTA_MEDICA'
+        )
+        resultado['rutas_creadas'] = len(rutas)
+
+    # avanzar_ruta_al_completar_atencion
+    pacientes_completados = {a.paciente_id: a for a in completadas}
+    if pacientes_completados:
+        rutas_en_progreso = {}
+        for ruta in RutaClinica.objects.filter(
+            paciente_id__in=pacientes_completados, estado='EN_PROGRESO'
+        ).select_related('paciente').order_by('-fecha_inicio'):
+            rutas_en_progreso.setdefault(ruta.paciente_id, ruta)
+        for paciente_id, ruta in rutas_en_progreso.items():
+            medico = pacientes_completados[paciente_id].medico
+            medico_nombre = medico.get_full_name() if medico else "Sistema"
+            if ruta.avanzar_etapa(
+                observaciones=f"Avance automático tras atención con {medico_nombre}",
+                usuario=medico
+            ):
+                ruta.paciente.etapa_actual = ruta.etapa_actual
+                ruta.paciente.save(update_fields=['etapa_actual'])
+                resultado['rutas_avanzadas'] += 1
+
+    # invalidar_puntero_cronometro
+    for medico_id in {a.medico_id for a in (*creadas, *completadas, *cerradas) if a.medico_id}:
+        invalidar_puntero(medico_id)
+
+    return resultado
@@ -1,3 +1,608 @@
+import random
+import time as reloj
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from boxes.models import Box, OcupacionManual
+from config.planes_consulta import PlanesConsultaMixin
+from config.presupuesto_consultas import PresupuestoAdminMixin, PresupuestoConsultasMixin, peticion, rut_sintetico
+from pacientes.models import Paciente
+from users.models import User
+from .agenda import a_minutos, buscar_huecos, buscar_solapes, especialidades_de_box, parsear_horario, tramos_en_ventana
+from .cronometro import _atenciones_de, clave_puntero, resolver_atencion_actual
+from .models import Atencion, Medico
+from .optimizador import aplicar_plan, optimizar_boxes
+from .viewsets import AtencionViewSet, MedicoViewSet
+from .viewsets_medico import MedicoAtencionesViewSet
+
+
+def _datos_atencion(escenario):
+    return {
+        'paciente': str(escenario.paciente.pk),
+        'medico': escenario.medico.pk,
+        'box': str(escenario.box.pk),
+        'fecha_hora_inicio': (escenario.ahora + timedelta(days=30)).isoformat(),
+        'duracion_planificada': 30,
+        'tipo_atencion': 'CONTROL',
+    }
+
+
+def _datos_medico(escenario):
+    return {
+        'codigo_medico': 'MED-NUEVO',
+        'nombre': 'Nuevo',
+        'apellido': 'Medico',
+        'especialidad_principal': 'CARDIOLOGIA',
+    }
+
+
+def _atencion_en_curso(escenario):
+    Atencion.objects.filter(pk=escenario.atencion.pk).update(
+        estado='EN_CURSO',
+        inicio_cronometro=timezone.now() - timedelta(minutes=10),
+    )
+
+
+def _atencion_atrasada(escenario):
+    Atencion.objects.filter(pk=escenario.atencion.pk).update(
+        fecha_hora_inicio=timezone.now() - timedelta(minutes=10),
+        atraso_reportado=True,
+        fecha_reporte_atraso=timezone.now() - timedelta(minutes=8),
+    )
+
+
+def _atraso_en_tolerancia(escenario):
+    Atencion.objects.filter(pk=escenario.atencion.pk).update(
+        atraso_reportado=True,
+        fecha_reporte_atraso=timezone.now() - timedelta(minutes=2),
+    )
+
+
+def _box_foco_en_mantenimiento(escenario):
+    # La agenda futura del box foco debe repartirse en los demás boxes, abiertos todo el día
+    Box.objects.update(horarios_disponibles={dia: '00:00-23:59' for dia in range(7)})
+    Box.objects.filter(pk=escenario.box.pk).update(estado='MANTENIMIENTO')
+
+
+def _agenda_de_manana(escenario):
+    return {'fecha': timezone.localdate(escenario.ahora + timedelta(days=1)).isoformat()}
+
+
+def _huecos_del_proximo_lunes(escenario):
+    # Un día hábil fijo: la primera vuelta de buscar_huecos encuentra hora aunque se corra un fin de semana
+    hoy = timezone.localdate(escenario.ahora)
+    lunes = datetime.combine(hoy + timedelta(days=7 - hoy.weekday()), time(8, 0))
+    return {
+        'especialidad': 'MEDICINA_GENERAL', 'duracion': 30, 'limite': 1,
+        'desde': timezone.make_aware(lunes).isoformat(),
+    }
+
+
+def _en_curso_con_atraso(escenario):
+    _atencion_en_curso(escenario)
+    _atraso_en_tolerancia(escenario)
+
+
+class AtencionViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/atenciones/
+    viewset = AtencionViewSet
+    basename = 'atencion'
+    objetivo_por_defecto = 'atencion'
+    presupuestos = {
+        ('list', 'get'): peticion(1),
+        ('create', 'post'): peticion(10, datos=_datos_atencion),
+        ('retrieve', 'get'): peticion(3),
+        ('update', 'put'): peticion(8, datos=_datos_atencion),
+        ('partial_update', 'patch'): peticion(5, datos=lambda e: {'observaciones': 'Editada'}),
+        ('destroy', 'delete'): peticion(2),
+        ('iniciar_cronometro', 'post'): peticion(4),
+        ('finalizar_cronometro', 'post'): peticion(8, preparar=_atencion_en_curso),
+        ('cancelar', 'post'): peticion(2, datos=lambda e: {'motivo': 'Paciente canceló'}),
+        ('reagendar', 'post'): peticion(5, datos=lambda e: {
+            'nueva_fecha': (e.ahora + timedelta(days=2, hours=3)).isoformat(),
+        }),
+        ('en_curso', 'get'): peticion(None),
+        ('hoy', 'get'): peticion(None),
+        ('pendientes', 'get'): peticion(None),
+        ('retrasadas', 'get'): peticion(None),
+        ('estadisticas', 'get'): peticion(22),
+        ('metricas', 'get'): peticion(1),
+        ('con_atraso_reportado', 'get'): peticion(None),
+        ('reportar_atraso', 'post'): peticion(4, datos=lambda e: {'motivo': 'Llegó tarde'}),
+        ('verificar_atraso', 'post'): peticion(4, preparar=_atencion_atrasada),
+        ('iniciar_consulta', 'post'): peticion(7, preparar=_atraso_en_tolerancia),
+        ('crear_lote', 'post'): peticion(13, datos=lambda e: [
+            _datos_atencion(e),
+            {**_datos_atencion(e), 'fecha_hora_inicio': (e.ahora + timedelta(days=31)).isoformat()},
+        ]),
+        # limite=1 se resuelve en el primer tramo de la ventana; cada tramo
+        # adicional suma 2 consultas según la densidad de la agenda, no según N
+        ('huecos_disponibles', 'get'): peticion(5, params=_huecos_del_proximo_lunes),
+        ('optimizar_boxes', 'get'): peticion(3, params=_agenda_de_manana),
+        ('optimizar_boxes', 'post'): peticion(8, preparar=_box_foco_en_mantenimiento, datos=_agenda_de_manana),
+    }
+
+
+# Medico.atenciones no existe desde que Atencion.medico apunta a User
+MEDICO_SIN_ATENCIONES = 'Medico (legacy) no tiene relación atenciones'
+
+
+class MedicoViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/medicos/ (modelo Medico legacy)
+    viewset = MedicoViewSet
+    basename = 'medico'
+    objetivo_por_defecto = 'medico_legacy'
+    presupuestos = {
+        ('list', 'get'): peticion(1),
+        ('create', 'post'): peticion(2, datos=_datos_medico),
+        ('retrieve', 'get'): peticion(None, error_conocido=MEDICO_SIN_ATENCIONES),
+        ('update', 'put'): peticion(3, datos=_datos_medico),
+        ('partial_update', 'patch'): peticion(2, datos=lambda e: {'nombre': 'Editado'}),
+        ('destroy', 'delete'): peticion(2),
+        ('atenciones_hoy', 'get'): peticion(None, error_conocido=MEDICO_SIN_ATENCIONES),
+        ('agenda_semanal', 'get'): peticion(None, error_conocido=MEDICO_SIN_ATENCIONES),
+        ('metricas', 'get'): peticion(None, error_conocido=MEDICO_SIN_ATENCIONES),
+        ('activos', 'get'): peticion(None, error_conocido=MEDICO_SIN_ATENCIONES),
+        ('por_especialidad', 'get'): peticion(66),
+        ('estadisticas', 'get'): peticion(24),
+        ('activar', 'post'): peticion(2),
+        ('desactivar', 'post'): peticion(2),
+    }
+
+
+class MedicoAtencionesViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/medico/atenciones/ (médico autenticado)
+    viewset = MedicoAtencionesViewSet
+    basename = 'medico-atenciones'
+    objetivo_por_defecto = 'atencion'
+    presupuestos = {
+        ('list', 'get'): peticion(None, usuario='medico'),
+        ('retrieve', 'get'): peticion(4, usuario='medico'),
+        ('hoy', 'get'): peticion(None, usuario='medico'),
+        ('proximas', 'get'): peticion(None, usuario='medico'),
+        ('actual', 'get'): peticion(5, usuario='medico'),
+        ('cronometro', 'get'): peticion(2, usuario='medico'),
+        ('iniciar', 'post'): peticion(8, usuario='medico'),
+        ('finalizar', 'post'): peticion(12, usuario='medico', preparar=_atencion_en_curso,
+                                        datos=lambda e: {'observaciones': 'Sin novedad'}),
+        ('no_se_presento', 'post'): peticion(5, usuario='medico', preparar=_atencion_atrasada),
+        ('estadisticas', 'get'): peticion(6, usuario='medico'),
+        ('reportar_atraso', 'post'): peticion(5, usuario='medico', datos=lambda e: {'motivo': 'Llegó tarde'}),
+        ('verificar_atraso', 'post'): peticion(5, usuario='medico', preparar=_atencion_atrasada),
+        ('iniciar_consulta', 'post'): peticion(5, usuario='medico', preparar=_en_curso_con_atraso),
+    }
+
+
+class CronometroTests(TestCase):
+    # GET /api/medico/atenciones/cronometro/: ETag/304 y puntero cacheado (atenciones/cronometro.py)
+    url = '/api/medico/atenciones/cronometro/'
+
+    def setUp(self):
+        cache.clear()
+        self.medico = User.objects.create_user(
+            'medico_cronometro', 'medico_cronometro@nexalud.medico.com', 'clave-cronometro',
+            rol='MEDICO', especialidad='MEDICINA_GENERAL',
+        )
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Cronometro',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        self.box = Box.objects.create(numero='BX-C1', nombre='Box cronómetro')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.medico)
+
+    def _crear_atencion(self, minutos=60):
+        return Atencion.objects.create(
+            paciente=self.paciente, medico=self.medico, box=self.box,
+            fecha_hora_inicio=timezone.now() + timedelta(minutes=minutos), duracion_planificada=30,
+        )
+
+    def test_etag_responde_304_mientras_no_cambie(self):
+        atencion = self._crear_atencion()
+        respuesta = self.cliente.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['tipo'], 'proxima')
+        self.assertEqual(respuesta.data['atencion']['id'], str(atencion.id))
+        etag = respuesta['ETag']
+
+        respuesta = self.cliente.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+        self.assertEqual(respuesta['ETag'], etag)
+
+    def test_etag_cambia_con_fecha_actualizacion(self):
+        atencion = self._crear_atencion()
+        etag = self.cliente.get(self.url)['ETag']
+
+        atencion.observaciones = 'Paciente avisó que llega justo'
+        atencion.save()
+        respuesta = self.cliente.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.data['atencion']['version'], atencion.fecha_actualizacion.isoformat())
+
+    def test_post_save_invalida_el_puntero(self):
+        self.assertEqual(resolver_atencion_actual(self.medico.id)[0], 'ninguna')
+        self.assertEqual(cache.get(clave_puntero(self.medico.id))['tipo'], 'ninguna')
+
+        # Una atención nueva descarta el puntero 'ninguna' sin esperar PUNTERO_TTL
+        atencion = self._crear_atencion()
+        self.assertIsNone(cache.get(clave_puntero(self.medico.id)))
+        self.assertEqual(resolver_atencion_actual(self.medico.id), ('proxima', atencion))
+
+    def test_puntero_obsoleto_se_revalida_contra_la_fila(self):
+        atencion = self._crear_atencion()
+        siguiente = self._crear_atencion(minutos=120)
+        self.assertEqual(resolver_atencion_actual(self.medico.id), ('proxima', atencion))
+
+        # update() no dispara post_save: el puntero sigue en cache pero ya no es vigente
+        Atencion.objects.filter(pk=atencion.pk).update(estado='CANCELADA')
+        self.assertIsNotNone(cache.get(clave_puntero(self.medico.id)))
+        self.assertEqual(resolver_atencion_actual(self.medico.id), ('proxima', siguiente))
+
+
+class ReservaSinSolapesTests(TestCase):
+    # Las rutas que escriben atenciones rechazan solapes de médico/box con 400 (agenda.reservar)
+    url = '/api/atenciones/'
+
+    def setUp(self):
+        self.medico = User.objects.create_user(
+            'medico_reservas', 'medico_reservas@nexalud.medico.com', 'x', rol='MEDICO', especialidad='MEDICINA_GENERAL',
+        )
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Reservas',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        self.box = Box.objects.create(numero='BX-R1', nombre='Box reservas 1')
+        self.otro_box = Box.objects.create(numero='BX-R2', nombre='Box reservas 2')
+        self.inicio = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=2), time(10, 0)))
+        self.reserva = self._crear(self.inicio)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.medico)
+
+    def _crear(self, inicio, box=None):
+        return Atencion.objects.create(
+            paciente=self.paciente, medico=self.medico, box=box or self.box,
+            fecha_hora_inicio=inicio, duracion_planificada=30,
+        )
+
+    def _datos(self, minutos, box=None):
+        return {
+            'paciente': str(self.paciente.pk),
+            'medico': self.medico.pk,
+            'box': str((box or self.otro_box).pk),
+            'fecha_hora_inicio': (self.inicio + timedelta(minutes=minutos)).isoformat(),
+            'duracion_planificada': 30,
+            'tipo_atencion': 'CONTROL',
+        }
+
+    def assertConflicto(self, respuesta, recurso='medico'):
+        self.assertEqual(respuesta.status_code, 400)
+        datos = respuesta.json()
+        # Valores con su tipo: un ValidationError los habría convertido en texto
+        self.assertIs(datos['success'], False)
+        self.assertIn('se solapa', datos['mensaje'])
+        self.assertIn(recurso, {conflicto['recurso'] for conflicto in datos['conflictos']})
+        self.assertIsInstance(respuesta.data['conflictos'][0]['inicio'], datetime)
+
+    def test_crear_solapada_se_rechaza(self):
+        self.assertConflicto(self.cliente.post(self.url, self._datos(15), format='json'))
+        self.assertConflicto(self.cliente.post(self.url, self._datos(-15, box=self.box), format='json'), 'box')
+        self.assertEqual(Atencion.objects.count(), 1)
+
+    def test_crear_contigua_se_acepta(self):
+        # Intervalos semiabiertos: [10:30, 11:00) y [09:30, 10:00) tocan a [10:00, 10:30)
+        for minutos in (30, -30):
+            respuesta = self.cliente.post(self.url, self._datos(minutos, box=self.box), format='json')
+            self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(Atencion.objects.count(), 3)
+
+    def test_patch_solapado_se_rechaza(self):
+        otra = self._crear(self.inicio + timedelta(hours=2), box=self.otro_box)
+        respuesta = self.cliente.patch(
+            f'{self.url}{otra.id}/', {'fecha_hora_inicio': (self.inicio + timedelta(minutes=10)).isoformat()},
+            format='json',
+        )
+        self.assertConflicto(respuesta)
+        otra.refresh_from_db()
+        self.assertEqual(otra.fecha_hora_inicio, self.inicio + timedelta(hours=2))
+
+        respuesta = self.cliente.patch(
+            f'{self.url}{otra.id}/', {'fecha_hora_inicio': (self.inicio + timedelta(minutes=30)).isoformat()},
+            format='json',
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+
+    def test_reagendar_solapado_se_rechaza(self):
+        otra = self._crear(self.inicio + timedelta(hours=2), box=self.otro_box)
+        url = f'{self.url}{otra.id}/reagendar/'
+        self.assertConflicto(self.cliente.post(
+            url, {'nueva_fecha': (self.inicio + timedelta(minutes=20)).isoformat()}, format='json',
+        ))
+        otra.refresh_from_db()
+        self.assertEqual(otra.fecha_hora_inicio, self.inicio + timedelta(hours=2))
+
+        respuesta = self.cliente.post(
+            url, {'nueva_fecha': (self.inicio - timedelta(minutes=30)).isoformat()}, format='json',
+        )
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+
+    def test_crear_lote_solapado_no_crea_ninguna(self):
+        # Se solapan entre sí (mismo médico) aunque ninguna toque la reserva existente
+        lote = [self._datos(60), self._datos(75, box=self.box)]
+        self.assertConflicto(self.cliente.post(f'{self.url}crear_lote/', lote, format='json'))
+        self.assertEqual(Atencion.objects.count(), 1)
+
+        lote = [self._datos(30), self._datos(60, box=self.box)]
+        respuesta = self.cliente.post(f'{self.url}crear_lote/', lote, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(Atencion.objects.count(), 3)
+
+
+class BuscarHuecosTests(TestCase):
+    # atenciones/agenda.buscar_huecos sobre un lunes futuro fijo (hora local)
+
+    def setUp(self):
+        hoy = timezone.localdate()
+        self.lunes = hoy + timedelta(days=7 + (7 - hoy.weekday()) % 7)
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Huecos',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        self.medico = self._medico('medico_huecos', {'lunes': '09:00-12:00'})
+        self.box_general = Box.objects.create(
+            numero='BX-G', nombre='General', especialidad='GENERAL', horarios_disponibles={'lunes': '10:00-18:00'},
+        )
+        self.box_multiuso = Box.objects.create(numero='BX-M', nombre='Multiuso', especialidad='MULTIUSO')
+
+    def _medico(self, username, horario):
+        medico = User.objects.create_user(
+            username, f'{username}@nexalud.medico.com', 'x', rol='MEDICO', especialidad='MEDICINA_GENERAL',
+        )
+        Medico.objects.create(codigo_medico=username, nombre='Medico', apellido=username, horarios_atencion=horario)
+        return medico
+
+    def _hora(self, hora, minuto=0, dias=0):
+        return timezone.make_aware(datetime.combine(self.lunes + timedelta(days=dias), time(hora, minuto)))
+
+    def _reservar(self, medico, box, inicio, minutos, estado='PROGRAMADA'):
+        Atencion.objects.bulk_create([Atencion(
+            paciente=self.paciente, medico=medico, box=box, fecha_hora_inicio=inicio,
+            duracion_planificada=minutos, estado=estado,
+        )])
+
+    def _buscar(self, duracion=30, dias=1, **kwargs):
+        huecos = buscar_huecos('MEDICINA_GENERAL', duracion, self._hora(0), self._hora(0, dias=dias), **kwargs)
+        return [(timezone.localtime(h['inicio']).time(), h['box_numero'], h['medico_id']) for h in huecos]
+
+    def test_respeta_horarios_de_medico_y_box(self):
+        # Médico 09-12; el box GENERAL abre a las 10 y el MULTIUSO usa el horario por defecto (08-20)
+        self.assertEqual(self._buscar(), [
+            (time(9, 0), 'BX-M', self.medico.id),
+            (time(10, 0), 'BX-G', self.medico.id),
+        ])
+
+    def test_a_igual_hora_prefiere_el_box_de_la_especialidad(self):
+        Box.objects.filter(pk=self.box_general.pk).update(horarios_disponibles={})
+        self.assertEqual(self._buscar(), [(time(9, 0), 'BX-G', self.medico.id)])
+
+    def test_reservas_vigentes_ocupan_y_las_canceladas_no(self):
+        self._reservar(self.medico, self.box_general, self._hora(9), 30)
+        self._reservar(self.medico, self.box_general, self._hora(10), 30, estado='CANCELADA')
+        otro = self._medico('medico_otro', {'martes': '08:00-09:00'})
+        self._reservar(otro, self.box_multiuso, self._hora(9, 30), 60)
+        # 09:30-10:30 el MULTIUSO está tomado por otro médico; el GENERAL abre a las 10
+        self.assertEqual(self._buscar(), [
+            (time(10, 0), 'BX-G', self.medico.id),
+            (time(10, 30), 'BX-M', self.medico.id),
+        ])
+
+    def test_intervalos_semiabiertos(self):
+        # Único hueco del médico: [09:30, 10:00), entre dos reservas que lo tocan
+        self._reservar(self.medico, self.box_general, self._hora(9), 30)
+        self._reservar(self.medico, self.box_general, self._hora(10), 120)
+        self.assertEqual(self._buscar(duracion=30), [(time(9, 30), 'BX-M', self.medico.id)])
+        self.assertEqual(self._buscar(duracion=35), [])
+
+    def test_limite_y_orden(self):
+        otros = [self._medico(f'medico_extra_{i}', {'lunes': '08:00-12:00'}) for i in range(3)]
+        huecos = self._buscar(limite=3)
+        self.assertEqual(huecos, [(time(8, 0), 'BX-M', medico.id) for medico in otros])
+        self.assertEqual(len(self._buscar(limite=1)), 1)
+
+    def test_ventana_creciente_da_lo_mismo_que_la_ventana_completa(self):
+        # Sin horas el lunes: los huecos aparecen recién el miércoles, tras ampliar la ventana
+        Medico.objects.filter(codigo_medico='medico_huecos').update(horarios_atencion={'miercoles': '15:00-17:00'})
+        Box.objects.filter(pk=self.box_general.pk).update(horarios_disponibles={'miercoles': '10:00-18:00'})
+        for i in range(3):
+            self._medico(f'medico_jueves_{i}', {'jueves': '08:00-08:40'})
+        # Otro médico (sin horas de 30 minutos) tiene el box GENERAL de 15:00 a 15:45
+        ocupado = self._medico('medico_ocupado', {'domingo': '08:00-08:10'})
+        self._reservar(ocupado, self.box_general, self._hora(15, 0, dias=2), 45)
+
+        por_tramos = buscar_huecos('MEDICINA_GENERAL', 30, self._hora(0), self._hora(0, dias=7), limite=5)
+        with mock.patch('atenciones.agenda.VENTANA_INICIAL', timedelta(days=31)):
+            completa = buscar_huecos('MEDICINA_GENERAL', 30, self._hora(0), self._hora(0, dias=7), limite=5)
+        self.assertEqual(por_tramos, completa)
+        self.assertEqual(
+            [(h['inicio'], h['box_numero'], h['medico_id']) for h in por_tramos[:2]],
+            [(self._hora(15, 0, dias=2), 'BX-M', self.medico.id), (self._hora(15, 45, dias=2), 'BX-G', self.medico.id)],
+        )
+        self.assertEqual([h['inicio'] for h in por_tramos[2:]], [self._hora(8, 0, dias=3)] * 3)
+
+
+class OptimizadorBoxesTests(TestCase):
+    # atenciones/optimizador.optimizar_boxes sobre el próximo lunes (hora local)
+
+    def setUp(self):
+        hoy = timezone.localdate()
+        self.fecha = hoy + timedelta(days=7 - hoy.weekday())
+        self.base = timezone.make_aware(datetime.combine(self.fecha, time.min))
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Optimizador',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+
+    def _medicos(self, cantidad, especialidades):
+        return User.objects.bulk_create([
+            User(
+                username=f'medico_opt_{i}', email=f'medico_opt_{i}@nexalud.medico.com', password='!',
+                rol='MEDICO', especialidad=especialidades[i % len(especialidades)],
+            )
+            for i in range(cantidad)
+        ])
+
+    def _agenda(self, medicos, boxes, rng, duraciones, pausas, box_de):
+        # Cada médico atiende de corrido desde las 08:00 (nunca se solapa consigo mismo)
+        atenciones = []
+        for j, medico in enumerate(medicos):
+            minuto = 8 * 60
+            while True:
+                duracion = rng.choice(duraciones)
+                if minuto + duracion > 20 * 60:
+                    break
+                atenciones.append(Atencion(
+                    paciente=self.paciente, medico=medico, box=box_de(j, rng),
+                    fecha_hora_inicio=self.base + timedelta(minutes=minuto), duracion_planificada=duracion,
+                ))
+                minuto += duracion + rng.choice(pausas)
+        return Atencion.objects.bulk_create(atenciones, batch_size=1000)
+
+    def test_plan_sin_solapes_y_compatible(self):
+        rng = random.Random(7)
+        medicos = self._medicos(12, ['MEDICINA_GENERAL', 'CARDIOLOGIA', 'PEDIATRIA'])
+        manana_tarde = {'lunes': ['08:00-13:00', '14:00-20:00']}
+        boxes = Box.objects.bulk_create([
+            Box(numero=f'OPT-{i:02d}', nombre=f'Box {i}', especialidad=especialidad, horarios_disponibles=horario)
+            for i, (especialidad, horario) in enumerate(
+                [('GENERAL', {}), ('GENERAL', manana_tarde), ('CARDIOLOGIA', {}), ('PEDIATRIA', manana_tarde)]
+                + [('MULTIUSO', {})] * 8 + [('MULTIUSO', manana_tarde)] * 4
+            )
+        ])
+        # Boxes al azar, incluso incompatibles: el plan tiene que repartirlas de nuevo
+        self._agenda(medicos, boxes, rng, (10, 15, 20, 30, 45), (0, 0, 5, 10, 30), lambda j, rng: rng.choice(boxes))
+        Atencion.objects.filter(medico=medicos[0], fecha_hora_inicio__lt=self.base + timedelta(hours=10)).update(
+            estado='EN_ESPERA'
+        )
+        OcupacionManual.objects.create(
+            box=boxes[4], duracion_minutos=120, activa=True,
+            fecha_inicio=self.base + timedelta(hours=11), fecha_fin_programada=self.base + timedelta(hours=13),
+        )
+
+        plan = optimizar_boxes(self.fecha)
+        self.assertTrue(plan['aplicable'])
+        self.assertEqual(plan['sin_box_compatible'], [])
+        self.assertGreater(plan['resumen']['cambios'], 0)
+        self.assertLessEqual(plan['resumen']['costo_final']['total'], plan['resumen']['costo_inicial']['total'])
+
+        # Boxes de la especialidad del médico (o MULTIUSO) y abiertos en todo el tramo
+        nuevo_box = {cambio['atencion_id']: cambio['box_id'] for cambio in plan['cambios']}
+        por_id = {str(box.id): box for box in boxes}
+        hasta = self.base + timedelta(days=1)
+        tramos = {
+            box.numero: tramos_en_ventana(parsear_horario(box.horarios_disponibles), self.base, hasta) for box in boxes
+        }
+        movibles = Atencion.objects.filter(estado='PROGRAMADA').select_related('medico', 'box')
+        for atencion in movibles:
+            box = por_id[nuevo_box.get(str(atencion.id), str(atencion.box_id))]
+            self.assertIn(box.especialidad, especialidades_de_box(atencion.medico.especialidad))
+            inicio, fin = a_minutos(atencion.fecha_hora_inicio), a_minutos(atencion.fin_reserva)
+            self.assertTrue(any(a <= inicio and fin <= b for a, b in tramos[box.numero]), atencion)
+
+        # Aplicado, ninguna reserva comparte box con otra ni con la ocupación manual
+        self.assertEqual(len(aplicar_plan(plan)), len(nuevo_box))
+        atenciones = list(Atencion.objects.all())
+        self.assertEqual(buscar_solapes(atenciones), [])
+        self.assertFalse(Atencion.objects.vigentes().filter(box=boxes[4]).solapadas(
+            self.base + timedelta(hours=11), self.base + timedelta(hours=13),
+        ).exists())
+        self.assertEqual(optimizar_boxes(self.fecha)['resumen']['cambios'], 0)
+
+    def test_agenda_grande_en_tiempo_acotado(self):
+        # 200 médicos y 402 boxes GENERAL/MULTIUSO: ~5.000 atenciones. Recorriendo
+        # todos los boxes compatibles por atención tomaba ~2,3 s; con el índice ~0,3 s
+        rng = random.Random(1)
+        medicos = self._medicos(200, ['MEDICINA_GENERAL'])
+        boxes = Box.objects.bulk_create([
+            Box(numero=f'OPT-{i:03d}', nombre=f'Box {i}', especialidad='GENERAL' if i % 2 else 'MULTIUSO')
+            for i in range(402)
+        ])
+        atenciones = self._agenda(medicos, boxes, rng, (15, 20, 30), (0, 0, 5), lambda j, rng: boxes[2 * j])
+        self.assertGreater(len(atenciones), 4500)
+
+        inicio = reloj.perf_counter()
+        plan = optimizar_boxes(self.fecha)
+        segundos = reloj.perf_counter() - inicio
+        self.assertEqual(plan['resumen']['atenciones_movibles'], len(atenciones))
+        self.assertEqual(plan['sin_box_compatible'], [])
+        self.assertLess(segundos, 1.5)
+
+
+class AtencionPlanesConsultaTests(PlanesConsultaMixin, TestCase):
+    # Cada predicado caliente de Atencion debe resolverse con el índice pensado para él
+    medico_id = 1
+    box_id = '00000000-0000-0000-0000-000000000001'
+
+    def test_en_curso_del_medico(self):
+        # cronometro.resolver_atencion_actual y MedicoAtencionesViewSet.actual/iniciar
+        self.assertUsaIndice(
+            _atenciones_de(self.medico_id).filter(estado='EN_CURSO').order_by('fecha_hora_inicio'),
+            'atenciones_medico_estado_idx',
+        )
+
+    def test_proxima_del_medico(self):
+        self.assertUsaIndice(
+            Atencion.objects.filter(
+                medico_id=self.medico_id,
+                fecha_hora_inicio__gte=timezone.now(),
+                estado__in=['PROGRAMADA', 'EN_ESPERA'],
+            ).order_by('fecha_hora_inicio'),
+            'atenciones_medico_estado_idx', 'atenciones_medico__a4ce4a_idx',
+        )
+
+    def test_en_curso_del_box(self):
+        # BoxViewSet.estado_detallado
+        self.assertUsaIndice(
+            Atencion.objects.filter(box_id=self.box_id, estado='EN_CURSO'),
+            'atenciones_box_en_curso_idx',
+        )
+
+    def test_en_curso_con_cronometro(self):
+        # BoxViewSet.sincronizar_estados
+        self.assertUsaIndice(
+            Atencion.objects.filter(estado='EN_CURSO', inicio_cronometro__isnull=False),
+            'atenciones_estado_fecha_idx', 'atenciones_box_en_curso_idx',
+        )
+
+    def test_pendientes(self):
+        # AtencionViewSet.pendientes y dashboard
+        self.assertUsaIndice(
+            Atencion.objects.filter(estado__in=['PROGRAMADA', 'EN_ESPERA']),
+            'atenciones_estado_fecha_idx',
+        )
+
+    def test_estado_en_rango_de_fechas(self):
+        ahora = timezone.now()
+        self.assertUsaIndice(
+            Atencion.objects.filter(
+                estado='COMPLETADA',
+                fecha_hora_inicio__gte=ahora - timedelta(days=1),
+                fecha_hora_inicio__lt=ahora,
+            ),
+            'atenciones_estado_fecha_idx',
+        )
+
 
-# Create your tests here.
+class AtencionesAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # Changelists del admin de atenciones: métricas de médico anotadas, sin consultas por fila
+    app_label = 'atenciones'
+    presupuestos_admin = {
+        Medico: 5,
+        Atencion: 7,
+    }
+    formularios_admin = [Atencion]
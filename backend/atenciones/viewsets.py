@@ -1,10 +1,18 @@
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Avg, Count, F
+from django.http import Http404
 from django.utils import timezone
-from .models import Medico, Atencion
+from config.fechas import filtro_dia, filtro_dias
+from config.replicas import LecturaReplicaMixin
+from .models import Medico, Atencion, AtencionHistorica
+
+logger = logging.getLogger(__name__)
 from .serializers import (
     MedicoSerializer,
     MedicoListSerializer,
@@ -15,11 +23,15 @@ from .serializers import (
     AtencionCronometroSerializer,
     AtencionCancelarSerializer,
     AtencionReagendarSerializer,
-    AtencionEstadisticasSerializer
+    AtencionEstadisticasSerializer,
+    BusquedaHuecosSerializer,
+    OptimizacionBoxesSerializer
 )
+from .agenda import ConflictoAgenda, buscar_huecos, reservar
+from .optimizador import aplicar_plan, optimizar_boxes
 
 
-class MedicoViewSet(viewsets.ModelViewSet):
+class MedicoViewSet(LecturaReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar médicos y prestadores de salud.
     
@@ -43,6 +55,7 @@ class MedicoViewSet(viewsets.ModelViewSet):
     """
     queryset = Medico.objects.all()
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas']  # GET en la réplica de lectura
     
     def get_serializer_class(self):
         # Retorna el serializer apropiado según la acción
@@ -90,7 +103,7 @@ class MedicoViewSet(viewsets.ModelViewSet):
         
         return Response({
             'medico': MedicoListSerializer(medico).data,
-            'fecha': timezone.now().date(),
+            'fecha': timezone.localdate(),
             'total_atenciones': atenciones.count(),
             'atenciones': serializer.data
         })
@@ -104,13 +117,12 @@ class MedicoViewSet(viewsets.ModelViewSet):
         medico = self.get_object()
         
         # Obtener inicio y fin de semana
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         inicio_semana = hoy - timezone.timedelta(days=hoy.weekday())
         fin_semana = inicio_semana + timezone.timedelta(days=6)
         
         atenciones = medico.atenciones.filter(
-            fecha_hora_inicio__date__gte=inicio_semana,
-            fecha_hora_inicio__date__lte=fin_semana
+            **filtro_dias('fecha_hora_inicio', inicio_semana, fin_semana)
         ).order_by('fecha_hora_inicio')
         
         serializer = AtencionListSerializer(atenciones, many=True)
@@ -244,14 +256,14 @@ class MedicoViewSet(viewsets.ModelViewSet):
         })
 
 
-class AtencionViewSet(viewsets.ModelViewSet):
+class AtencionViewSet(LecturaReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar atenciones médicas con cronómetro.
     
     Endpoints disponibles:
     - GET /api/atenciones/ - Lista todas las atenciones
     - POST /api/atenciones/ - Crea una nueva atención
-    - GET /api/atenciones/{id}/ - Detalle de una atención
+    - GET /api/atenciones/{id}/ - Detalle de una atención (también archivada, solo lectura)
     - PUT /api/atenciones/{id}/ - Actualiza una atención
     - PATCH /api/atenciones/{id}/ - Actualiza parcialmente
     - DELETE /api/atenciones/{id}/ - Elimina una atención
@@ -266,15 +278,20 @@ class AtencionViewSet(viewsets.ModelViewSet):
     - GET /api/atenciones/pendientes/ - Atenciones pendientes
     - GET /api/atenciones/retrasadas/ - Atenciones retrasadas
     - GET /api/atenciones/estadisticas/ - Estadísticas generales
+    - GET /api/atenciones/huecos_disponibles/ - Horas libres médico + box
+    - POST /api/atenciones/crear_lote/ - Crea varias atenciones sin solapes
+    - GET /api/atenciones/optimizar_boxes/ - Propone asignación de boxes del día
+    - POST /api/atenciones/optimizar_boxes/ - Aplica la asignación propuesta
     """
     queryset = Atencion.objects.all()
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas']  # GET en la réplica de lectura
     
     def get_serializer_class(self):
         # Retorna el serializer apropiado según la acción
         if self.action == 'list':
             return AtencionListSerializer
-        elif self.action in ['create', 'update', 'partial_update']:
+        elif self.action in ['create', 'update', 'partial_update', 'crear_lote']:
             return AtencionCreateUpdateSerializer
         elif self.action in ['iniciar_cronometro', 'finalizar_cronometro']:
             return AtencionCronometroSerializer
@@ -288,9 +305,24 @@ class AtencionViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Filtra el queryset basado en parámetros de query
-        queryset = Atencion.objects.select_related('paciente', 'medico', 'box')
+        return self._filtrar(Atencion.objects.select_related('paciente', 'medico', 'box'))
+    
+    def retrieve(self, request, *args, **kwargs):
+        # Una atención archivada (config/archivo.py) ya no está en la tabla caliente:
+        # su detalle se sirve desde la vista histórica, solo lectura (editarla da 404)
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archivada = get_object_or_404(
+                self._filtrar(AtencionHistorica.objects.select_related('paciente', 'medico', 'box')),
+                pk=kwargs[self.lookup_url_kwarg or self.lookup_field],
+            )
+            self.check_object_permissions(request, archivada)
+            return Response(self.get_serializer(archivada).data)
+    
+    def _filtrar(self, queryset):
+        # Filtros de query params; sirve también para AtencionHistorica
         
-        # Filtros
         estado = self.request.query_params.get('estado', None)
         medico_id = self.request.query_params.get('medico', None)
         box_id = self.request.query_params.get('box', None)
@@ -316,7 +348,7 @@ class AtencionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(tipo_atencion=tipo)
         
         if fecha:
-            queryset = queryset.filter(fecha_hora_inicio__date=fecha)
+            queryset = queryset.filter(**filtro_dia('fecha_hora_inicio', fecha))
         
         if fecha_desde:
             queryset = queryset.filter(fecha_hora_inicio__gte=fecha_desde)
@@ -414,7 +446,12 @@ class AtencionViewSet(viewsets.ModelViewSet):
             nueva_fecha = serializer.validated_data['nueva_fecha']
             nuevo_box = serializer.validated_data.get('nuevo_box')
             
-            if atencion.reagendar(nueva_fecha, nuevo_box):
+            try:
+                reagendada = reservar(lambda: [atencion] if atencion.reagendar(nueva_fecha, nuevo_box) else [])
+            except ConflictoAgenda as conflicto:
+                return self._respuesta_conflicto(conflicto)
+            
+            if reagendada:
                 return Response({
                     'success': True,
                     'mensaje': 'Atención reagendada correctamente',
@@ -429,6 +466,93 @@ class AtencionViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'])
+    def crear_lote(self, request):
+        
+        # Crea varias atenciones en una sola transacción; si alguna se solapa
+        # (entre sí o con la agenda existente) no se crea ninguna.
+        # POST /api/atenciones/crear_lote/  body: [{...}, {...}]
+        
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        self._guardar_reserva(serializer.save)
+        
+        return Response({
+            'success': True,
+            'mensaje': f'{len(serializer.instance)} atenciones creadas',
+            'ids': [str(atencion.id) for atencion in serializer.instance]
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['get'])
+    def huecos_disponibles(self, request):
+        
+        # Primeros pares (médico, box) libres para una especialidad y duración.
+        # GET /api/atenciones/huecos_disponibles/?especialidad=CARDIOLOGIA&duracion=30&desde=...&hasta=...
+        
+        serializer = BusquedaHuecosSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        datos = serializer.validated_data
+        huecos = buscar_huecos(
+            especialidad=datos['especialidad'],
+            duracion_minutos=datos['duracion'],
+            desde=datos['desde'],
+            hasta=datos['hasta'],
+            limite=datos['limite'],
+            medico_id=datos.get('medico'),
+        )
+        
+        return Response({
+            'success': True,
+            'desde': datos['desde'],
+            'hasta': datos['hasta'],
+            'count': len(huecos),
+            'huecos': huecos
+        })
+    
+    @action(detail=False, methods=['get', 'post'])
+    def optimizar_boxes(self, request):
+        
+        # Reasigna boxes a las atenciones programadas de un día.
+        # GET  /api/atenciones/optimizar_boxes/?fecha=YYYY-MM-DD - vista previa, no escribe
+        # POST /api/atenciones/optimizar_boxes/  body: {"fecha": ..., "version": ...} - aplica
+        
+        datos = request.query_params if request.method == 'GET' else request.data
+        serializer = OptimizacionBoxesSerializer(data=datos)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        plan = optimizar_boxes(serializer.validated_data['fecha'])
+        if request.method == 'GET':
+            return Response({'success': True, **plan})
+        
+        version = serializer.validated_data.get('version')
+        if version and version != plan['version']:
+            return Response({
+                'success': False,
+                'mensaje': 'La agenda cambió desde la vista previa. Revise la nueva propuesta.',
+                **plan
+            }, status=status.HTTP_409_CONFLICT)
+        
+        if not plan['aplicable']:
+            return Response({
+                'success': False,
+                'mensaje': 'Hay atenciones sin box compatible cuyo box actual quedaría ocupado.',
+                **plan
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            aplicadas = aplicar_plan(plan)
+        except ConflictoAgenda as conflicto:
+            return self._respuesta_conflicto(conflicto)
+        
+        return Response({
+            'success': True,
+            'mensaje': f'{len(aplicadas)} atenciones cambiaron de box',
+            **plan
+        })
+    
     @action(detail=False, methods=['get'])
     def en_curso(self, request):
         
@@ -449,8 +573,8 @@ class AtencionViewSet(viewsets.ModelViewSet):
         # Lista atenciones del día actual.
         # GET /api/atenciones/hoy/
         
-        hoy = timezone.now().date()
-        atenciones = self.get_queryset().filter(fecha_hora_inicio__date=hoy)
+        hoy = timezone.localdate()
+        atenciones = self.get_queryset().filter(**filtro_dia('fecha_hora_inicio', hoy))
         serializer = self.get_serializer(atenciones, many=True)
         
         return Response({
@@ -499,8 +623,9 @@ class AtencionViewSet(viewsets.ModelViewSet):
         
         # Estadísticas generales de atenciones.
         # GET /api/atenciones/estadisticas/
+        # Incluye las atenciones archivadas (vista histórica).
     
-        queryset = self.get_queryset()
+        queryset = self._filtrar(AtencionHistorica.objects.all())
         
         # Por estado
         por_estado = {}
@@ -605,16 +730,17 @@ class AtencionViewSet(viewsets.ModelViewSet):
             fecha_reporte_atraso__isnull=False
         ).select_related('paciente', 'medico', 'box')
         
-        # Marcar como no presentado si han pasado más de 5 min desde el reporte de atraso
+        # Marcar como no presentado si pasó la espera desde el reporte de atraso
+        espera = Atencion.minutos_espera_atraso()
         atenciones_actualizadas = 0
         for atencion in atenciones:
             minutos_desde_reporte = (ahora - atencion.fecha_reporte_atraso).total_seconds() / 60
             
-            if minutos_desde_reporte >= 5:
+            if minutos_desde_reporte >= espera:
                 # Marcar como no presentado automáticamente
                 resultado = atencion.marcar_no_presentado()
                 if resultado:
-                    atencion.observaciones += "\n\n[AUTOMÁTICO] Marcado como no presentado después de 5 minutos de espera desde reporte de atraso."
+                    atencion.observaciones += f"\n\n[AUTOMÁTICO] Marcado como no presentado después de {espera} minutos de espera desde reporte de atraso."
                     atencion.save()
                     atenciones_actualizadas += 1
         
@@ -653,10 +779,11 @@ class AtencionViewSet(viewsets.ModelViewSet):
             serializer = AtencionSerializer(atencion)
             
             # Mensaje diferente según el estado
+            espera = Atencion.minutos_espera_atraso()
             if atencion.estado == 'EN_CURSO':
-                mensaje = '⚠️ Atraso reportado - Paciente tiene 5 minutos para regresar'
+                mensaje = f'⚠️ Atraso reportado - Paciente tiene {espera} minutos para regresar'
             else:
-                mensaje = '⚠️ Atraso reportado - Paciente tiene 5 minutos para llegar'
+                mensaje = f'⚠️ Atraso reportado - Paciente tiene {espera} minutos para llegar'
             
             return Response({
                 'success': True,
@@ -754,6 +881,31 @@ class AtencionViewSet(viewsets.ModelViewSet):
             'atencion': serializer.data
         }, status=status.HTTP_200_OK)
         
+    def _guardar_reserva(self, guardar):
+        # Guarda verificando solapes de médico/box; el ConflictoAgenda que lanza
+        # reservar() lo convierte en 400 handle_exception
+        return reservar(guardar)
+    
+    def _respuesta_conflicto(self, conflicto):
+        return Response({
+            'success': False,
+            'mensaje': conflicto.mensaje,
+            'conflictos': conflicto.conflictos
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    def handle_exception(self, exc):
+        # Respuesta directa y no ValidationError: DRF convertiría en texto cada
+        # valor de los conflictos (success, ids, fechas)
+        if isinstance(exc, ConflictoAgenda):
+            return self._respuesta_conflicto(exc)
+        return super().handle_exception(exc)
+    
+    def perform_create(self, serializer):
+        self._guardar_reserva(lambda: [serializer.save()])
+    
+    def perform_update(self, serializer):
+        self._guardar_reserva(lambda: [serializer.save()])
+    
     def create(self, request, *args, **kwargs):
         """
         Crea una nueva atención y automáticamente crea ruta clínica si no existe.
@@ -767,7 +919,7 @@ class AtencionViewSet(viewsets.ModelViewSet):
         paciente = serializer.validated_data['paciente']
         tiene_ruta_antes = RutaClinica.objects.filter(
             paciente=paciente,
-            estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+            estado__in=RutaClinica.ESTADOS_ACTIVOS
         ).exists()
         
         # Crear la atención
@@ -776,12 +928,12 @@ class AtencionViewSet(viewsets.ModelViewSet):
         # Verificar si se creó ruta después
         tiene_ruta_despues = RutaClinica.objects.filter(
             paciente=paciente,
-            estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+            estado__in=RutaClinica.ESTADOS_ACTIVOS
         ).exists()
         
         # Log para debugging
         if not tiene_ruta_antes and tiene_ruta_despues:
-            print(f" Ruta clínica creada automáticamente para paciente {paciente.identificador_hash[:8]}")
+            logger.info('Ruta clínica creada automáticamente para paciente %s', paciente.identificador_hash[:8])
         
         headers = self.get_success_headers(serializer.data)
         
@@ -1,14 +1,21 @@
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
+from config.fechas import filtro_dia
 from django.db.models import Q
-from .models import Atencion
+from config.replicas import LecturaReplicaMixin
+from .models import Atencion, AtencionHistorica
 from .serializers import AtencionSerializer
+from .cronometro import resolver_atencion_actual, payload_cronometro, etag_cronometro
+
+logger = logging.getLogger(__name__)
 
 
-class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
+class MedicoAtencionesViewSet(LecturaReplicaMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para que los médicos gestionen sus propias atenciones.
     Solo muestra las atenciones asignadas al médico autenticado.
@@ -19,6 +26,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
     - GET /api/medico/atenciones/hoy/ - Atenciones de hoy
     - GET /api/medico/atenciones/proximas/ - Próximas atenciones
     - GET /api/medico/atenciones/actual/ - Atención en curso o próxima
+    - GET /api/medico/atenciones/cronometro/ - Versión compacta de actual (ETag/304)
     - POST /api/medico/atenciones/{id}/iniciar/ - Iniciar atención
     - POST /api/medico/atenciones/{id}/finalizar/ - Finalizar atención
     - POST /api/medico/atenciones/{id}/no_se_presento/ - Marcar no presentado
@@ -26,6 +34,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
     
     serializer_class = AtencionSerializer
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas']  # GET en la réplica de lectura
     
     def get_queryset(self):
         
@@ -55,7 +64,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(estado=estado)
         
         if fecha:
-            queryset = queryset.filter(fecha_hora_inicio__date=fecha)
+            queryset = queryset.filter(**filtro_dia('fecha_hora_inicio', fecha))
         
         serializer = self.get_serializer(queryset, many=True)
         
@@ -75,21 +84,16 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
         ahora_local = timezone.localtime(timezone.now())
         hoy = ahora_local.date()
         
-        print(f"\n DEBUG HOY:")
-        print(f"   Ahora UTC: {timezone.now()}")
-        print(f"   Ahora Local: {ahora_local}")
-        print(f"   Fecha HOY: {hoy}")
-        print(f"   Usuario: {request.user.username}")
+        logger.debug(
+            'Atenciones de hoy para %s', request.user.username,
+            extra={'fecha': hoy.isoformat(), 'ahora_local': ahora_local.isoformat()}
+        )
         
         # Filtrar atenciones del día
         atenciones = self.get_queryset().filter(
-            fecha_hora_inicio__date=hoy
+            **filtro_dia('fecha_hora_inicio', hoy)
         ).order_by('fecha_hora_inicio')
         
-        print(f"   Atenciones encontradas: {atenciones.count()}")
-        for a in atenciones:
-            print(f"      - {a.id}: {timezone.localtime(a.fecha_hora_inicio)} | {a.paciente.identificador_hash[:8]}")
-        
         serializer = self.get_serializer(atenciones, many=True)
         
         # Calcular estadísticas del día
@@ -180,6 +184,29 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
             'mensaje': 'No tienes atenciones programadas'
         })
     
+    @action(detail=False, methods=['get'])
+    def cronometro(self, request):
+        
+        # Payload mínimo para el polling del cronómetro del médico.
+        # Responde 304 si el cliente envía el ETag vigente en If-None-Match.
+        # GET /api/medico/atenciones/cronometro/
+        
+        if request.user.rol != 'MEDICO':
+            return Response({'tipo': 'ninguna', 'servidor': timezone.now().isoformat(), 'atencion': None})
+        
+        ahora = timezone.now()
+        tipo, atencion = resolver_atencion_actual(request.user.id, ahora)
+        payload = payload_cronometro(tipo, atencion, ahora)
+        etag = etag_cronometro(payload)
+        
+        if etag in request.headers.get('If-None-Match', ''):
+            respuesta = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            respuesta = Response(payload)
+        respuesta['ETag'] = etag
+        respuesta['Cache-Control'] = 'private, no-cache'
+        return respuesta
+    
     @action(detail=True, methods=['post'])
     def iniciar(self, request, pk=None):
         
@@ -298,7 +325,10 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
         periodo = int(request.query_params.get('periodo', 30))
         fecha_desde = timezone.now() - timezone.timedelta(days=periodo)
         
-        atenciones = self.get_queryset().filter(fecha_hora_inicio__gte=fecha_desde)
+        # Vista histórica: el periodo puede superar el horizonte de archivo
+        atenciones = AtencionHistorica.objects.filter(
+            medico=request.user, fecha_hora_inicio__gte=fecha_desde
+        ) if request.user.rol == 'MEDICO' else AtencionHistorica.objects.none()
         
         # Estadísticas por estado
         total = atenciones.count()
@@ -349,7 +379,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
             serializer = AtencionSerializer(atencion)
             return Response({
                 'success': True,
-                'message': 'Atraso reportado. El paciente tiene 5 minutos para llegar.',
+                'message': f'Atraso reportado. El paciente tiene {Atencion.minutos_espera_atraso()} minutos para llegar.',
                 'atencion': serializer.data
             })
         
@@ -358,11 +388,11 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
             'error': 'No se pudo reportar el atraso'
         }, status=status.HTTP_400_BAD_REQUEST)
         
-    # 2. VERIFICAR ATRASO (marcar como no presentado si pasaron 5 min)
+    # 2. VERIFICAR ATRASO (marcar como no presentado si pasó la espera)
     @action(detail=True, methods=['post'])
     def verificar_atraso(self, request, pk=None):
         
-        # Verifica si han pasado 5 minutos desde el reporte de atraso.
+        # Verifica si pasó la espera (Atencion.minutos_espera_atraso) desde el reporte de atraso.
         # Si es así, marca automáticamente como NO_PRESENTADO.
         # POST /api/medico/atenciones/{id}/verificar_atraso/
         
@@ -375,7 +405,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
             }, status=status.HTTP_200_OK)
         
         if atencion.verificar_tiempo_atraso():
-            # Si han pasado 5 minutos, marcar como NO_PRESENTADO
+            # Si pasó la espera, marcar como NO_PRESENTADO
             if atencion.marcar_no_presentado():
                 serializer = AtencionSerializer(atencion)
                 return Response({
@@ -413,7 +443,7 @@ class MedicoAtencionesViewSet(viewsets.ReadOnlyModelViewSet):
                 'error': 'No hay atraso reportado'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Verificar que no hayan pasado 5 minutos
+        # Verificar que no haya pasado la espera
         if atencion.verificar_tiempo_atraso():
             return Response({
                 'success': False,
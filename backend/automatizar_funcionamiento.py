@@ -72,16 +72,31 @@ def crear_infraestructura_y_personal(num_medicos, num_secretarias):
             token_map[username] = t.key
             medicos.append(u)
             
+        # Secretarías (usadas por los perfiles de secretaría y recepción del locustfile)
+        for i in range(num_secretarias):
+            username = f"secretaria_{i}"
+            email = f"secretaria{i}@nexalud.secretario.com"
+            if not User.objects.filter(username=username).exists():
+                u = User.objects.create_user(username, email, 'password123',
+                                           first_name=fake.first_name(), last_name=fake.last_name(),
+                                           rol='SECRETARIA')
+            else:
+                u = User.objects.get(username=username)
+
+            t, _ = Token.objects.get_or_create(user=u)
+            token_map[username] = t.key
+
         # Admin
-        if not User.objects.filter(username='admin').exists():
+        adm = User.objects.filter(username='admin').first()
+        if not adm:
             adm = User.objects.create_superuser('admin', 'admin@nexalud.admin.com', 'password123')
-            t, _ = Token.objects.get_or_create(user=adm)
-            token_map['admin'] = t.key
+        t, _ = Token.objects.get_or_create(user=adm)
+        token_map['admin'] = t.key
 
     with open('tokens.json', 'w') as f:
         json.dump(token_map, f)
     
-    print(f"   -> {len(medicos)} Médicos listos.")
+    print(f"   -> {len(medicos)} Médicos y {num_secretarias} Secretarías listos.")
     return medicos, boxes
 
 def generar_paciente_y_ruta(estado_inicial='CONSULTA_MEDICA'):
@@ -1,11 +1,17 @@
 from django.contrib import admin
-from .models import Box
+from django.db import transaction
+from django.utils import timezone
+
+from config.autocompletar import BusquedaIndexadaMixin
+from integraciones.publicador import publicar
+from .models import Box, IntervaloOcupacion
 
 @admin.register(Box)
-class BoxAdmin(admin.ModelAdmin):
+class BoxAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
     list_display = ['numero', 'nombre', 'especialidad', 'estado', 'activo', 'ultima_ocupacion']
     list_filter = ['estado', 'especialidad', 'activo']
     search_fields = ['numero', 'nombre']
+    campos_prefijo = ['numero', 'nombre']  # autocompletar (ver config/autocompletar.py)
     readonly_fields = ['tiempo_ocupado_hoy', 'ultima_ocupacion', 'ultima_liberacion', 'fecha_creacion', 'fecha_actualizacion']
     
     fieldsets = (
@@ -32,14 +38,43 @@ class BoxAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related()
     
+    def save_model(self, request, obj, form, change):
+        # Editar `estado` en el formulario abre o cierra el intervalo de ocupación
+        estado_anterior = form.initial.get('estado') if change else None
+        super().save_model(request, obj, form, change)
+        obj.registrar_cambio_estado(estado_anterior)
+    
     actions = ['marcar_disponible', 'marcar_mantenimiento']
     
+    def _cambiar_estado(self, queryset, estado):
+        # update() no pasa por post_save: el cierre de intervalos y los eventos
+        # salientes (integraciones/publicador.py) van a mano, en la misma transacción
+        with transaction.atomic():
+            boxes = list(queryset.select_for_update())
+            anteriores = {box.pk: {'estado': box.estado} for box in boxes if box.estado != estado}
+            IntervaloOcupacion.cerrar_abiertos(queryset.values('id'), timezone.now())
+            actualizados = queryset.update(estado=estado)
+            cambiados = [box for box in boxes if box.pk in anteriores]
+            for box in cambiados:
+                box.estado = estado
+            publicar('BOX', cambiados, 'cambio_estado', anteriores=anteriores)
+        return actualizados
+    
     def marcar_disponible(self, request, queryset):
-        updated = queryset.update(estado='DISPONIBLE')
+        updated = self._cambiar_estado(queryset, 'DISPONIBLE')
         self.message_user(request, f'{updated} boxes marcados como disponibles.')
     marcar_disponible.short_description = "Marcar como disponible"
     
     def marcar_mantenimiento(self, request, queryset):
-        updated = queryset.update(estado='MANTENIMIENTO')
+        updated = self._cambiar_estado(queryset, 'MANTENIMIENTO')
         self.message_user(request, f'{updated} boxes marcados en mantenimiento.')
-    marcar_mantenimiento.short_description = "Marcar en mantenimiento"
\ No newline at end of file
+    marcar_mantenimiento.short_description = "Marcar en mantenimiento"
+
+
+@admin.register(IntervaloOcupacion)
+class IntervaloOcupacionAdmin(admin.ModelAdmin):
+    list_display = ['box', 'inicio', 'fin', 'origen']
+    list_filter = ['origen']
+    search_fields = ['box__numero']
+    date_hierarchy = 'inicio'
+    list_select_related = ['box']
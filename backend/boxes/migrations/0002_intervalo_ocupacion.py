@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def abrir_intervalos_de_boxes_ocupados(apps, schema_editor):
+    # Los boxes ocupados al migrar quedan con su intervalo abierto
+    Box = apps.get_model('boxes', 'Box')
+    IntervaloOcupacion = apps.get_model('boxes', 'IntervaloOcupacion')
+    IntervaloOcupacion.objects.bulk_create([
+        IntervaloOcupacion(box_id=box_id, inicio=ultima_ocupacion or timezone.now(), origen='ATENCION')
+        for box_id, ultima_ocupacion in Box.objects.filter(estado='OCUPADO').values_list('id', 'ultima_ocupacion')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='box',
+            name='tiempo_ocupado_hoy',
+        ),
+        migrations.CreateModel(
+            name='IntervaloOcupacion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField(blank=True, null=True)),
+                ('origen', models.CharField(choices=[('ATENCION', 'Atención'), ('MANUAL', 'Ocupación manual')], default='ATENCION', max_length=10)),
+                ('box', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intervalos_ocupacion', to='boxes.box')),
+            ],
+            options={
+                'verbose_name': 'Intervalo de Ocupación',
+                'verbose_name_plural': 'Intervalos de Ocupación',
+                'db_table': 'intervalos_ocupacion',
+                'ordering': ['-inicio'],
+                'indexes': [models.Index(fields=['box', 'inicio'], name='intervalos__box_id_897d0a_idx'), models.Index(fields=['inicio', 'fin'], name='intervalos__inicio_f4289c_idx')],
+            },
+        ),
+        migrations.RunPython(abrir_intervalos_de_boxes_ocupados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0002_intervalo_ocupacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ocupacionmanual',
+            index=models.Index(condition=models.Q(('activa', True)), fields=['fecha_fin_programada'], name='ocupaciones_activas_fin_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0003_indice_ocupaciones_activas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(fields=['nombre'], name='boxes_nombre_4b145b_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 09:10
+
+from django.db import migrations
+
+
+# Autocompletar del admin en PostgreSQL: LIKE 'Pér%' (config/autocompletar.py)
+# solo usa un índice varchar_pattern_ops si la collation no es "C". Los campos
+# unique ya tienen el índice _like que crea Django; estos van en Meta.indexes.
+INDICES_PATRON = {
+    'boxes_nombre_like': 'nombre',
+}
+
+
+def crear_indices_patron(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columna in INDICES_PATRON.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON boxes ({columna} varchar_pattern_ops)'
+        )
+
+
+def eliminar_indices_patron(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in INDICES_PATRON:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0004_indices_autocompletar'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_patron, eliminar_indices_patron),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+# Reemplaza los índices varchar_pattern_ops creados con SQL en 0005_indices_patron
+# por los declarados en Meta.indexes, que sí conoce el estado de migraciones
+INDICES_SQL = {
+    'boxes_nombre_like': 'nombre',
+}
+
+
+def eliminar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in INDICES_SQL:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+def restaurar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columna in INDICES_SQL.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON boxes ({columna} varchar_pattern_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boxes', '0005_indices_patron'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_indices_sql, restaurar_indices_sql),
+        migrations.RemoveIndex(
+            model_name='box',
+            name='boxes_nombre_4b145b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(fields=['nombre'], name='boxes_nombre_patron_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -1,5 +1,8 @@
 import uuid
+from datetime import datetime, time
 from django.db import models
+from django.db.models import DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.utils import timezone
 from django.core.validators import MinValueValidator
 
@@ -77,11 +80,7 @@ class Box(models.Model):
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
-    # Campos para métricas
-    tiempo_ocupado_hoy = models.DurationField(
-        default=timezone.timedelta,
-        help_text="Tiempo total ocupado en el día actual"
-    )
+    # Campos para métricas (el historial de ocupación vive en IntervaloOcupacion)
     ultima_ocupacion = models.DateTimeField(
         null=True, 
         blank=True,
@@ -100,6 +99,8 @@ class Box(models.Model):
         ordering = ['numero']
         indexes = [
             models.Index(fields=['numero']),
+            # Autocompletar del admin por prefijo (ver config/autocompletar.py)
+            models.Index(fields=['nombre'], name='boxes_nombre_patron_idx', opclasses=['varchar_pattern_ops']),
             models.Index(fields=['estado']),
             models.Index(fields=['especialidad']),
             models.Index(fields=['activo']),
@@ -108,32 +109,49 @@ class Box(models.Model):
     def __str__(self):
         return f"{self.numero} - {self.nombre} ({self.get_estado_display()})"
     
-    def ocupar(self, timestamp=None):
+    def ocupar(self, timestamp=None, origen='ATENCION'):
         """
-        Marca el box como ocupado y registra el timestamp.
+        Marca el box como ocupado, registra el timestamp y abre un intervalo de ocupación.
         """
         if self.estado == 'DISPONIBLE':
             self.estado = 'OCUPADO'
             self.ultima_ocupacion = timestamp or timezone.now()
             self.save()
+            # Un box DISPONIBLE no tiene intervalos abiertos: todo paso fuera de OCUPADO los cierra
+            IntervaloOcupacion.objects.create(box=self, inicio=self.ultima_ocupacion, origen=origen)
             return True
         return False
     
+    def abrir_intervalo(self, inicio, origen='ATENCION'):
+        
+        # Abre un intervalo de ocupación si el box no tiene uno abierto.
+        
+        if not self.intervalos_ocupacion.filter(fin__isnull=True).exists():
+            IntervaloOcupacion.objects.create(box=self, inicio=inicio, origen=origen)
+    
+    def registrar_cambio_estado(self, estado_anterior, momento=None):
+        
+        # Mantiene los intervalos cuando `estado` se cambia directamente (API, admin)
+        # en vez de pasar por ocupar()/liberar(): entrar a OCUPADO abre uno y salir lo cierra.
+        
+        if self.estado == estado_anterior:
+            return
+        momento = momento or timezone.now()
+        if self.estado == 'OCUPADO':
+            self.abrir_intervalo(momento, origen='MANUAL')
+        elif estado_anterior == 'OCUPADO':
+            IntervaloOcupacion.cerrar_abiertos([self.id], momento)
+    
     def liberar(self, timestamp=None):
     
-        # Marca el box como disponible y calcula tiempo de ocupación.
+        # Marca el box como disponible y cierra su intervalo de ocupación.
         
         if self.estado == 'OCUPADO':
             self.estado = 'DISPONIBLE'
             liberacion_time = timestamp or timezone.now()
             self.ultima_liberacion = liberacion_time
-            
-            # Calcular duración de la ocupación
-            if self.ultima_ocupacion:
-                duracion = liberacion_time - self.ultima_ocupacion
-                self.tiempo_ocupado_hoy += duracion
-            
             self.save()
+            IntervaloOcupacion.cerrar_abiertos([self.id], liberacion_time)
             return True
         return False
     
@@ -143,18 +161,24 @@ class Box(models.Model):
         
         return self.estado == 'DISPONIBLE' and self.activo
     
-    def calcular_tiempo_ocupacion_hoy(self):
+    @property
+    def tiempo_ocupado_hoy(self):
         
-        # Calcula el porcentaje de ocupación del día actual.
+        # Tiempo ocupado desde la medianoche local, calculado desde los intervalos.
         
-        hoy = timezone.now().date()
-        total_segundos_dia = 24 * 60 * 60  # Total segundos en un día
+        desde, hasta = IntervaloOcupacion.ventana_hoy()
+        return IntervaloOcupacion.objects.tiempo_ocupado(desde, hasta, boxes=[self.id]).get(self.id, timezone.timedelta())
+    
+    def calcular_tiempo_ocupacion_hoy(self, tiempo_ocupado=None):
         
-        if self.tiempo_ocupado_hoy:
-            segundos_ocupado = self.tiempo_ocupado_hoy.total_seconds()
-            porcentaje = (segundos_ocupado / total_segundos_dia) * 100
-            return min(porcentaje, 100)  # Máximo 100%
-        return 0
+        # Calcula el porcentaje de ocupación del día actual sobre el tiempo
+        # transcurrido desde la medianoche local (no sobre 24h completas).
+        # tiempo_ocupado permite pasar el valor ya calculado en lote.
+        
+        desde, hasta = IntervaloOcupacion.ventana_hoy()
+        if tiempo_ocupado is None:
+            tiempo_ocupado = self.tiempo_ocupado_hoy
+        return IntervaloOcupacion.porcentaje(tiempo_ocupado, desde, hasta)
     
     def obtener_ocupacion_actual(self):
         
@@ -173,14 +197,6 @@ class Box(models.Model):
             'inicio_ocupacion': None
         }
     
-    def reset_tiempo_ocupado_diario(self):
-        """
-        Resetea el contador de tiempo ocupado diario. 
-        Se ejecutaría automáticamente a medianoche.
-        """
-        self.tiempo_ocupado_hoy = timezone.timedelta()
-        self.save()
-        
     def is_disponible_para_especialidad(self, especialidad):
         """
         Verifica si el box puede ser usado para una especialidad específica.
@@ -232,6 +248,12 @@ class OcupacionManual(models.Model):
         indexes = [
             models.Index(fields=['box', 'activa']),
             models.Index(fields=['fecha_fin_programada']),
+            # Ocupaciones activas por vencer (finalizar_ocupaciones_expiradas, agenda)
+            models.Index(
+                fields=['fecha_fin_programada'],
+                condition=Q(activa=True),
+                name='ocupaciones_activas_fin_idx',
+            ),
         ]
     
     def __str__(self):
@@ -249,4 +271,94 @@ class OcupacionManual(models.Model):
     
     def debe_finalizar(self):
         # Verifica si la ocupación debe finalizar según la hora programada
-        return timezone.now() >= self.fecha_fin_programada and self.activa
\ No newline at end of file
+        return timezone.now() >= self.fecha_fin_programada and self.activa
+
+
+class IntervaloOcupacionQuerySet(models.QuerySet):
+    
+    def solapados(self, desde, hasta):
+        # Intervalos [inicio, fin) que se cruzan con la ventana [desde, hasta); fin nulo = aún abierto
+        return self.filter(inicio__lt=hasta).filter(Q(fin__isnull=True) | Q(fin__gt=desde))
+    
+    def tiempo_ocupado(self, desde, hasta, boxes=None):
+        """
+        Tiempo ocupado por box dentro de la ventana, en una sola consulta.
+        Cada intervalo se recorta a la ventana (y los abiertos a "ahora").
+        Retorna {box_id: timedelta}.
+        """
+        tope = min(hasta, timezone.now())
+        queryset = self.solapados(desde, hasta)
+        if boxes is not None:
+            queryset = queryset.filter(box_id__in=boxes)
+        
+        desde_valor = Value(desde, output_field=models.DateTimeField())
+        tope_valor = Value(tope, output_field=models.DateTimeField())
+        solapamiento = ExpressionWrapper(
+            Least(Coalesce(F('fin'), tope_valor), tope_valor) - Greatest(F('inicio'), desde_valor),
+            output_field=DurationField()
+        )
+        filas = queryset.order_by().values('box_id').annotate(ocupado=Sum(solapamiento))
+        return {
+            fila['box_id']: max(fila['ocupado'] or timezone.timedelta(), timezone.timedelta())
+            for fila in filas
+        }
+
+
+class IntervaloOcupacion(models.Model):
+    
+    # Historial de ocupación de un box como intervalos cerrados [inicio, fin).
+    # Se abre en Box.ocupar y se cierra en Box.liberar; fin nulo = ocupación en curso.
+    
+    ORIGEN_CHOICES = [
+        ('ATENCION', 'Atención'),
+        ('MANUAL', 'Ocupación manual'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    box = models.ForeignKey(
+        'Box',
+        on_delete=models.CASCADE,
+        related_name='intervalos_ocupacion'
+    )
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField(null=True, blank=True)
+    origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES, default='ATENCION')
+    
+    objects = IntervaloOcupacionQuerySet.as_manager()
+    
+    class Meta:
+        db_table = 'intervalos_ocupacion'
+        verbose_name = 'Intervalo de Ocupación'
+        verbose_name_plural = 'Intervalos de Ocupación'
+        ordering = ['-inicio']
+        indexes = [
+            models.Index(fields=['box', 'inicio']),
+            models.Index(fields=['inicio', 'fin']),
+        ]
+    
+    def __str__(self):
+        return f"{self.box_id} {self.inicio:%Y-%m-%d %H:%M} → {self.fin or 'en curso'}"
+    
+    @classmethod
+    def cerrar_abiertos(cls, box_ids, fin):
+        # Cierra los intervalos abiertos de los boxes indicados (sin dejar fin < inicio)
+        cls.objects.filter(box_id__in=box_ids, fin__isnull=True).update(
+            fin=Greatest(F('inicio'), Value(fin, output_field=models.DateTimeField()))
+        )
+    
+    @staticmethod
+    def ventana_hoy():
+        # [medianoche local, ahora)
+        ahora = timezone.now()
+        medianoche = timezone.make_aware(
+            datetime.combine(timezone.localdate(ahora), time.min),
+            timezone.get_current_timezone()
+        )
+        return medianoche, ahora
+    
+    @staticmethod
+    def porcentaje(tiempo_ocupado, desde, hasta):
+        total = (min(hasta, timezone.now()) - desde).total_seconds()
+        if total <= 0 or not tiempo_ocupado:
+            return 0
+        return min(tiempo_ocupado.total_seconds() / total * 100, 100)
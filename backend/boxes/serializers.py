@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from django.utils.duration import duration_string
 from rest_framework import serializers
 from .models import Box, OcupacionManual
 
@@ -7,6 +10,7 @@ class BoxSerializer(serializers.ModelSerializer):
     estado_display = serializers.CharField(source='get_estado_display', read_only=True)
     especialidad_display = serializers.CharField(source='get_especialidad_display', read_only=True)
     disponibilidad = serializers.SerializerMethodField()
+    tiempo_ocupado_hoy = serializers.SerializerMethodField()
     ocupacion_actual = serializers.SerializerMethodField()
     porcentaje_ocupacion_hoy = serializers.SerializerMethodField()
     tiempo_ocupado_formateado = serializers.SerializerMethodField()
@@ -39,7 +43,6 @@ class BoxSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = [
             'id',
-            'tiempo_ocupado_hoy',
             'ultima_ocupacion',
             'ultima_liberacion',
             'fecha_creacion',
@@ -59,14 +62,26 @@ class BoxSerializer(serializers.ModelSerializer):
             )
         return ocupacion
     
+    def _tiempo_ocupado(self, obj):
+        # Tiempo ocupado hoy, calculado una vez por box (o en lote vía context['tiempo_ocupado'])
+        if 'tiempo_ocupado' in self.context:
+            return self.context['tiempo_ocupado'].get(obj.id, timedelta())
+        if not hasattr(obj, '_tiempo_ocupado_hoy'):
+            obj._tiempo_ocupado_hoy = obj.tiempo_ocupado_hoy
+        return obj._tiempo_ocupado_hoy
+    
+    def get_tiempo_ocupado_hoy(self, obj):
+        return duration_string(self._tiempo_ocupado(obj))
+    
     def get_porcentaje_ocupacion_hoy(self, obj):
         # Porcentaje de ocupación del día
-        return round(obj.calcular_tiempo_ocupacion_hoy(), 2)
+        return round(obj.calcular_tiempo_ocupacion_hoy(self._tiempo_ocupado(obj)), 2)
     
     def get_tiempo_ocupado_formateado(self, obj):
         # Tiempo ocupado en formato legible
-        if obj.tiempo_ocupado_hoy:
-            total_segundos = obj.tiempo_ocupado_hoy.total_seconds()
+        tiempo_ocupado = self._tiempo_ocupado(obj)
+        if tiempo_ocupado:
+            total_segundos = tiempo_ocupado.total_seconds()
             horas = int(total_segundos // 3600)
             minutos = int((total_segundos % 3600) // 60)
             return {
@@ -82,10 +97,14 @@ class BoxSerializer(serializers.ModelSerializer):
             
             from django.utils import timezone
             
-            ocupacion = OcupacionManual.objects.filter(
-                box=obj,
-                activa=True
-            ).first()
+            if 'ocupacion_manual' in self.context:
+                # Cargadas en lote por BoxViewSet.list
+                ocupacion = self.context['ocupacion_manual'].get(obj.id)
+            else:
+                ocupacion = OcupacionManual.objects.filter(
+                    box=obj,
+                    activa=True
+                ).first()
             
             if ocupacion:
                 ahora = timezone.now()
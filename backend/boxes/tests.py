@@ -1,3 +1,157 @@
-from django.test import TestCase
+from django.contrib import admin
+from django.test import RequestFactory, TestCase
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from boxes.models import Box, IntervaloOcupacion, OcupacionManual
+from config.planes_consulta import PlanesConsultaMixin
+from config.presupuesto_consultas import PresupuestoAdminMixin, PresupuestoConsultasMixin, peticion
+from integraciones import publicador
+from integraciones.models import EventoSaliente, IntegracionExterna
+from users.models import User
+from .viewsets import BoxViewSet
+
+
+def _datos_box(escenario):
+    return {
+        'numero': 'BX-NUEVO',
+        'nombre': 'Box Nuevo',
+        'especialidad': 'GENERAL',
+        'estado': 'DISPONIBLE',
+        'capacidad_maxima': 1,
+    }
+
+
+def _box_ocupado_sin_ocupacion_manual(escenario):
+    OcupacionManual.objects.filter(box=escenario.box).update(activa=False)
+    Box.objects.filter(pk=escenario.box.pk).update(estado='OCUPADO', ultima_ocupacion=escenario.ahora)
+
+
+class BoxViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/boxes/
+    viewset = BoxViewSet
+    basename = 'box'
+    objetivo_por_defecto = 'box'
+    presupuestos = {
+        ('list', 'get'): peticion(3),
+        ('create', 'post'): peticion(2, datos=_datos_box),
+        ('retrieve', 'get'): peticion(3),
+        ('update', 'put'): peticion(3, datos=_datos_box),
+        ('partial_update', 'patch'): peticion(2, datos=lambda e: {'nombre': 'Editado'}),
+        ('destroy', 'delete'): peticion(6),
+        ('ocupar', 'post'): peticion(4, datos=lambda e: {'duracion_minutos': 30, 'motivo': 'Aseo'}),
+        ('liberar', 'post'): peticion(5, preparar=_box_ocupado_sin_ocupacion_manual),
+        ('mantenimiento', 'post'): peticion(3),
+        ('disponibles', 'get'): peticion(2),
+        ('ocupados', 'get'): peticion(2),
+        ('estadisticas', 'get'): peticion(21),
+        ('por_especialidad', 'get'): peticion(18),
+        ('sincronizar_estados', 'get'): peticion(None),
+        ('verificar_y_liberar', 'get'): peticion(None),
+        ('verificar_y_liberar', 'post'): peticion(None),
+        ('estado_detallado', 'get'): peticion(None),
+        ('liberar_ocupaciones_manuales', 'get'): peticion(2),
+        ('liberar_ocupaciones_manuales', 'post'): peticion(2),
+    }
+
+
+class CambioEstadoIntervalosTests(TestCase):
+    # Cambiar `estado` por PUT/PATCH o en el admin deja el mismo rastro que ocupar/liberar
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin_intervalos', 'admin_intervalos@nexalud.admin.com', 'clave-intervalos'
+        )
+        self.box = Box.objects.create(numero='BX-E1', nombre='Box estado')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+
+    def _patch(self, datos):
+        respuesta = self.cliente.patch(f'/api/boxes/{self.box.id}/', datos, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+
+    def test_patch_de_estado_abre_y_cierra_el_intervalo(self):
+        self._patch({'estado': 'OCUPADO'})
+        intervalo = IntervaloOcupacion.objects.get(box=self.box)
+        self.assertIsNone(intervalo.fin)
+        self.assertEqual(intervalo.origen, 'MANUAL')
+
+        # Cambios que no tocan el estado no abren otro
+        self._patch({'nombre': 'Box renombrado', 'estado': 'OCUPADO'})
+        self.assertEqual(IntervaloOcupacion.objects.filter(box=self.box).count(), 1)
+
+        self._patch({'estado': 'MANTENIMIENTO'})
+        intervalo.refresh_from_db()
+        self.assertIsNotNone(intervalo.fin)
+        desde, hasta = IntervaloOcupacion.ventana_hoy()
+        self.assertIn(self.box.id, IntervaloOcupacion.objects.tiempo_ocupado(desde, hasta, boxes=[self.box.id]))
+
+    def test_box_creado_ocupado(self):
+        respuesta = self.cliente.post('/api/boxes/', {
+            'numero': 'BX-E2', 'nombre': 'Box nuevo', 'especialidad': 'GENERAL', 'estado': 'OCUPADO',
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.content)
+        self.assertTrue(IntervaloOcupacion.objects.filter(box__numero='BX-E2', fin__isnull=True).exists())
+
+    def test_formulario_del_admin(self):
+        self.client.force_login(self.admin)
+        respuesta = self.client.post(reverse('admin:boxes_box_change', args=[self.box.pk]), {
+            'numero': self.box.numero, 'nombre': self.box.nombre, 'especialidad': 'GENERAL',
+            'capacidad_maxima': 1, 'estado': 'OCUPADO', 'activo': 'on',
+            'equipamiento': '[]', 'horarios_disponibles': '{}',
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertTrue(IntervaloOcupacion.objects.filter(box=self.box, fin__isnull=True).exists())
+
+
+    def test_acciones_del_admin_publican_el_cambio(self):
+        en_mantenimiento = Box.objects.create(numero='BX-E3', nombre='Box en mantención', estado='MANTENIMIENTO')
+        publicador.olvidar_suscriptores()
+        self.addCleanup(publicador.olvidar_suscriptores)
+        integracion = IntegracionExterna.objects.create(
+            nombre_sistema='EMR', tipo_sistema='EMR', endpoint_base_url='http://emr.invalid',
+            token_acceso_encrypted='t', publicar_eventos=True,
+        )
+        self.client.force_login(self.admin)
+
+        respuesta = self.client.post(reverse('admin:boxes_box_changelist'), {
+            'action': 'marcar_mantenimiento', '_selected_action': [self.box.pk, en_mantenimiento.pk],
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Box.objects.filter(estado='MANTENIMIENTO').count(), 2)
+        # Solo el box que cambió de estado genera evento, con su estado anterior
+        evento = EventoSaliente.objects.get(integracion=integracion)
+        self.assertEqual((evento.tipo_evento, evento.id_agregado), ('box.cambio_estado', str(self.box.pk)))
+        self.assertEqual(evento.payload['anterior'], {'estado': 'DISPONIBLE'})
+        self.assertEqual(evento.payload['estado'], 'MANTENIMIENTO')
+
+
+class OcupacionManualPlanesConsultaTests(PlanesConsultaMixin, TestCase):
+
+    def test_ocupaciones_activas_vencidas(self):
+        # BoxViewSet.liberar_ocupaciones_manuales
+        self.assertUsaIndice(
+            OcupacionManual.objects.filter(activa=True, fecha_fin_programada__lte=timezone.now()),
+            'ocupaciones_activas_fin_idx',
+        )
+
+
+class AutocompletarBoxesPlanesConsultaTests(PlanesConsultaMixin, TestCase):
+
+    def test_prefijo_del_nombre_usa_su_indice(self):
+        # BoxAdmin.get_search_results en el autocompletar: rango en SQLite, LIKE
+        # 'Sal%' con varchar_pattern_ops en PostgreSQL (config/autocompletar.py)
+        request = RequestFactory().get('/admin/autocomplete/')
+        request.resolver_match = resolve('/admin/autocomplete/')
+        queryset, _ = admin.site._registry[Box].get_search_results(request, Box.objects.all(), 'sala')
+        self.assertUsaIndice(queryset.order_by(), 'boxes_nombre_patron_idx')
+
+
+class BoxesAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # Changelists del admin de boxes
+    app_label = 'boxes'
+    presupuestos_admin = {
+        Box: 5,
+        IntervaloOcupacion: 7,
+    }
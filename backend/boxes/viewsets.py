@@ -1,11 +1,16 @@
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Avg, Count
 from django.utils import timezone
-from .models import Box, OcupacionManual
+from config.replicas import LecturaReplicaMixin
+from .models import Box, IntervaloOcupacion, OcupacionManual
 from datetime import timedelta
+
+logger = logging.getLogger(__name__)
 from .serializers import (
     BoxSerializer,
     BoxListSerializer,
@@ -14,7 +19,7 @@ from .serializers import (
     BoxOcupacionSerializer
 )
 
-class BoxViewSet(viewsets.ModelViewSet):
+class BoxViewSet(LecturaReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet para gestionar boxes de atención.
     
@@ -34,7 +39,6 @@ class BoxViewSet(viewsets.ModelViewSet):
     - GET /api/boxes/estadisticas/ - Estadísticas generales
     - GET /api/boxes/por_especialidad/ - Agrupa por especialidad
     - POST /api/boxes/{id}/mantenimiento/ - Marca en mantenimiento
-    - POST /api/boxes/reset_ocupacion/ - Resetea contadores diarios
     - GET /api/boxes/sincronizar_estados/ - Sincroniza estados con atenciones
     - GET/POST /api/boxes/verificar_y_liberar/ - Verifica y libera boxes según atenciones
     - GET /api/boxes/estado_detallado/ - Estado detallado de boxes y atenciones
@@ -42,6 +46,7 @@ class BoxViewSet(viewsets.ModelViewSet):
     """
     queryset = Box.objects.all()
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas']  # GET en la réplica de lectura
     
     def get_serializer_class(self):
         # Retorna el serializer apropiado según la acción
@@ -55,6 +60,35 @@ class BoxViewSet(viewsets.ModelViewSet):
             return BoxEstadisticasSerializer
         return BoxSerializer
     
+    def list(self, request, *args, **kwargs):
+        # Tiempo ocupado y ocupación manual activa en lote para todos los boxes
+        # de la respuesta (BoxSerializer los calcularía con una consulta por box)
+        queryset = self.filter_queryset(self.get_queryset())
+        pagina = self.paginate_queryset(queryset)
+        boxes = list(pagina if pagina is not None else queryset)
+        ids = [box.id for box in boxes]
+        ocupaciones = {}
+        for ocupacion in OcupacionManual.objects.filter(box_id__in=ids, activa=True):
+            ocupaciones.setdefault(ocupacion.box_id, ocupacion)
+        contexto = {
+            **self.get_serializer_context(),
+            'tiempo_ocupado': IntervaloOcupacion.objects.tiempo_ocupado(*IntervaloOcupacion.ventana_hoy(), boxes=ids),
+            'ocupacion_manual': ocupaciones,
+        }
+        serializer = self.get_serializer(boxes, many=True, context=contexto)
+        if pagina is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
+    def perform_create(self, serializer):
+        # Un box creado OCUPADO empieza con su intervalo abierto
+        serializer.save().registrar_cambio_estado(None)
+    
+    def perform_update(self, serializer):
+        # PUT/PATCH de `estado` abre o cierra el intervalo igual que ocupar/liberar
+        estado_anterior = serializer.instance.estado
+        serializer.save().registrar_cambio_estado(estado_anterior)
+    
     def get_queryset(self):
         # Filtra el queryset basado en parámetros de query
         queryset = Box.objects.all()
@@ -128,7 +162,7 @@ class BoxViewSet(viewsets.ModelViewSet):
         
         # Ocupar el box
         ahora = timezone.now()
-        if box.ocupar(ahora):
+        if box.ocupar(ahora, origen='MANUAL'):
             # Crear registro de ocupación manual
             fecha_fin = ahora + timedelta(minutes=duracion_minutos)
             
@@ -262,10 +296,14 @@ class BoxViewSet(viewsets.ModelViewSet):
         
         # Tasa de ocupación promedio
         boxes_activos = queryset.filter(activo=True)
-        if boxes_activos.exists():
+        ids_activos = list(boxes_activos.values_list('id', flat=True))
+        if ids_activos:
+            # Una sola consulta de solapamiento para todos los boxes activos
+            desde, hasta = IntervaloOcupacion.ventana_hoy()
+            ocupado = IntervaloOcupacion.objects.tiempo_ocupado(desde, hasta, boxes=ids_activos)
             tasa_ocupacion_promedio = sum(
-                box.calcular_tiempo_ocupacion_hoy() for box in boxes_activos
-            ) / boxes_activos.count()
+                IntervaloOcupacion.porcentaje(ocupado.get(box_id), desde, hasta) for box_id in ids_activos
+            ) / len(ids_activos)
         else:
             tasa_ocupacion_promedio = 0
         
@@ -322,6 +360,7 @@ class BoxViewSet(viewsets.ModelViewSet):
         box = self.get_object()
         box.estado = 'MANTENIMIENTO'
         box.save()
+        IntervaloOcupacion.cerrar_abiertos([box.id], timezone.now())
         
         return Response({
             'success': True,
@@ -329,26 +368,6 @@ class BoxViewSet(viewsets.ModelViewSet):
             'estado': box.estado
         })
     
-    @action(detail=False, methods=['post'])
-    def reset_ocupacion(self, request):
-        
-        # Resetea los contadores de ocupación diaria de todos los boxes.
-        # Se ejecutaría típicamente a medianoche.
-        # POST /api/boxes/reset_ocupacion/
-        
-        boxes = self.get_queryset()
-        count = 0
-        
-        for box in boxes:
-            box.reset_tiempo_ocupado_diario()
-            count += 1
-        
-        return Response({
-            'success': True,
-            'mensaje': f'Contadores reseteados para {count} boxes',
-            'boxes_actualizados': count
-        })
-
     @action(detail=False, methods=['get'])
     def sincronizar_estados(self, request):
         
@@ -397,6 +416,7 @@ class BoxViewSet(viewsets.ModelViewSet):
                         atencion.box.estado = 'OCUPADO'
                         atencion.box.ultima_ocupacion = atencion.fecha_hora_inicio
                         atencion.box.save()
+                        atencion.box.abrir_intervalo(atencion.fecha_hora_inicio)
                         boxes_actualizados += 1
                     
                     # Si la atención está programada, iniciarla automáticamente
@@ -436,7 +456,7 @@ class BoxViewSet(viewsets.ModelViewSet):
         
         except Exception as e:
             # Si hay error con atenciones (módulo no existe, etc), solo procesar ocupaciones manuales
-            print(f"Error al sincronizar con atenciones: {e}")
+            logger.exception('Error al sincronizar boxes con atenciones')
             
             # Solo asegurarse de respetar ocupaciones manuales
             ocupaciones_manuales = OcupacionManual.objects.filter(
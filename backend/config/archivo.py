@@ -0,0 +1,174 @@
+"""
+Archivo frío de atenciones y rutas clínicas cerradas.
+
+Las atenciones COMPLETADA/CANCELADA/NO_PRESENTADO y las rutas COMPLETADA/
+CANCELADA anteriores al horizonte (settings.ARCHIVO_HORIZONTE_DIAS) se mueven
+de la tabla caliente a su tabla de archivo, en lotes:
+- cada lote es una transacción (copiar al archivo + borrar de la tabla
+  caliente), así que una corrida interrumpida deja todo consistente y la
+  siguiente retoma desde donde quedó: el criterio de selección es el mismo;
+- el borrado es un DELETE directo, sin pre/post_delete: archivar no es
+  eliminar, y las señales de eliminación de rutas tocan al paciente. Ningún
+  modelo tiene FK hacia Atencion ni RutaClinica, no hay cascadas que perder.
+
+La lectura conjunta se hace con las vistas atenciones_historico y
+rutas_clinicas_historico (UNION ALL de caliente y archivo), modeladas como
+AtencionHistorica y RutaClinicaHistorica. No van en una migración: se
+recrean después de cada migrate a partir de las columnas actuales del modelo
+y se eliminan antes, porque SQLite no deja reconstruir una tabla que una
+vista referencia (AlterField/AddField rehacen la tabla).
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 1000
+
+
+# ============================================
+# VISTAS HISTÓRICAS
+# ============================================
+
+def sql_vista_historica(conexion, modelo_historico, modelo, modelo_archivo):
+    q = conexion.ops.quote_name
+    columnas = ', '.join(q(campo.column) for campo in modelo_historico._meta.concrete_fields)
+    return (
+        f'CREATE VIEW {q(modelo_historico._meta.db_table)} AS '
+        f'SELECT {columnas} FROM {q(modelo._meta.db_table)} '
+        f'UNION ALL SELECT {columnas} FROM {q(modelo_archivo._meta.db_table)}'
+    )
+
+
+def eliminar_vista_historica(conexion, modelo_historico):
+    with conexion.cursor() as cursor:
+        cursor.execute(f'DROP VIEW IF EXISTS {conexion.ops.quote_name(modelo_historico._meta.db_table)}')
+
+
+def crear_vista_historica(conexion, modelo_historico, modelo, modelo_archivo):
+    # Solo si ambas tablas existen (migrate hacia atrás o parcial: no hay vista)
+    tablas = set(conexion.introspection.table_names())
+    if not {modelo._meta.db_table, modelo_archivo._meta.db_table} <= tablas:
+        return
+    eliminar_vista_historica(conexion, modelo_historico)
+    try:
+        with transaction.atomic(using=conexion.alias), conexion.cursor() as cursor:
+            cursor.execute(sql_vista_historica(conexion, modelo_historico, modelo, modelo_archivo))
+    except DatabaseError:
+        # Columnas del modelo que la base aún no tiene (migrate a una migración anterior)
+        logger.warning(
+            'No se pudo crear la vista histórica',
+            exc_info=True, extra={'vista': modelo_historico._meta.db_table, 'alias': conexion.alias}
+        )
+
+
+def registrar_vista_historica(app_config, modelo_historico, modelo, modelo_archivo):
+    """
+    Conecta la vista de una app a pre_migrate/post_migrate. Se llama desde
+    AppConfig.ready().
+    """
+    from django.db.models.signals import post_migrate, pre_migrate
+
+    def antes(using, **kwargs):
+        eliminar_vista_historica(connections[using], modelo_historico)
+
+    def despues(using, **kwargs):
+        crear_vista_historica(connections[using], modelo_historico, modelo, modelo_archivo)
+
+    uid = modelo_historico._meta.label_lower
+    pre_migrate.connect(antes, sender=app_config, weak=False, dispatch_uid=f'{uid}:eliminar')
+    post_migrate.connect(despues, sender=app_config, weak=False, dispatch_uid=f'{uid}:crear')
+
+
+# ============================================
+# MOVER AL ARCHIVO
+# ============================================
+
+def _borrar_directo(modelo, ids, conexion):
+    # DELETE ... WHERE pk IN (...) sin Collector (sin señales ni cascadas)
+    q = conexion.ops.quote_name
+    pk = modelo._meta.pk
+    valores = [pk.get_db_prep_value(valor, conexion) for valor in ids]
+    marcadores = ', '.join(['%s'] * len(valores))
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {q(modelo._meta.db_table)} WHERE {q(pk.column)} IN ({marcadores})',
+            valores
+        )
+
+
+def mover_lote(archivables, modelo_archivo, tamano_lote=TAMANO_LOTE):
+    """
+    Mueve hasta `tamano_lote` filas de `archivables` (queryset de la tabla
+    caliente) a `modelo_archivo` en una transacción. Devuelve cuántas movió.
+    """
+    modelo = archivables.model
+    alias = router.db_for_write(modelo)
+    campos = [campo.attname for campo in modelo._meta.concrete_fields]
+    with transaction.atomic(using=alias):
+        # Sin orden: cualquier lote sirve. En PostgreSQL las filas quedan
+        # bloqueadas hasta el commit y se saltan las que otra transacción edita
+        ids = list(
+            archivables.using(alias).select_for_update(skip_locked=True)
+            .order_by().values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return 0
+        filas = modelo._default_manager.using(alias).filter(pk__in=ids).values(*campos)
+        modelo_archivo._default_manager.using(alias).bulk_create(
+            [modelo_archivo(**fila) for fila in filas]
+        )
+        _borrar_directo(modelo, ids, connections[alias])
+    return len(ids)
+
+
+def archivar(archivables, modelo_archivo, tamano_lote=TAMANO_LOTE, max_lotes=None):
+    # Lotes hasta agotar los archivables (o max_lotes); devuelve el total movido
+    total = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        inicio = time.monotonic()
+        movidas = mover_lote(archivables, modelo_archivo, tamano_lote)
+        if not movidas:
+            break
+        total += movidas
+        lotes += 1
+        logger.info(
+            'Lote archivado',
+            extra={
+                'tabla': modelo_archivo._meta.db_table, 'filas': movidas, 'total': total,
+                'ms': round((time.monotonic() - inicio) * 1000),
+            }
+        )
+    return total
+
+
+def limite_archivo(horizonte_dias=None):
+    # Todo lo cerrado antes de este instante es archivable
+    dias = settings.ARCHIVO_HORIZONTE_DIAS if horizonte_dias is None else horizonte_dias
+    if dias < 1:
+        raise ValueError('El horizonte de archivo debe ser de al menos 1 día')
+    return timezone.now() - timedelta(days=dias)
+
+
+def archivar_historico(horizonte_dias=None, tamano_lote=TAMANO_LOTE, max_lotes=None):
+    """
+    Archiva atenciones cerradas y rutas finalizadas anteriores al horizonte.
+    Devuelve {'atenciones': n, 'rutas_clinicas': m}.
+    """
+    from atenciones.models import Atencion, AtencionArchivada
+    from rutas_clinicas.models import RutaClinica, RutaClinicaArchivada
+
+    limite = limite_archivo(horizonte_dias)
+    return {
+        'atenciones': archivar(
+            Atencion.objects.archivables(limite), AtencionArchivada, tamano_lote, max_lotes
+        ),
+        'rutas_clinicas': archivar(
+            RutaClinica.objects.archivables(limite), RutaClinicaArchivada, tamano_lote, max_lotes
+        ),
+    }
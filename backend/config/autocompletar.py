@@ -0,0 +1,75 @@
+"""
+Búsqueda indexada para el autocompletar de los formularios del admin.
+
+Los admin de pacientes, usuarios y boxes son el destino de los
+autocomplete_fields de Atencion y RutaClinica: el formulario ya no carga
+todas las filas en un <select>, y cada tecla consulta la vista de
+autocompletar del admin, que llama a get_search_results. Por defecto esa
+búsqueda aplica icontains ('%texto%') sobre todas las search_fields y
+recorre la tabla completa.
+
+En el autocompletar, BusquedaIndexadaMixin busca cada palabra por prefijo en
+campos_prefijo (todos con índice). Cómo se expresa el prefijo depende de la
+collation de la base:
+
+- SQLite compara texto con la collation BINARY: el rango
+  (campo >= 'Pér' AND campo < 'Pés') calza exacto con el prefijo y usa el
+  índice B-tree, cosa que LIKE (insensible a mayúsculas) no hace.
+- PostgreSQL suele usar una collation lingüística (es_CL, en_US), que ignora
+  o antepone la puntuación: 'Pérez' queda fuera de ['Pérez', 'Pére{') y un
+  apellido terminado en z no se encontraría. Ahí se usa LIKE 'Pér%'
+  (startswith), que resuelven los índices varchar_pattern_ops: los _like
+  que Django crea para los campos unique y los declarados con opclasses en
+  Meta.indexes (las demás bases ignoran opclasses).
+
+El changelist conserva la búsqueda por contenido de search_fields.
+"""
+from django.db import connections
+from django.db.models import Q
+
+
+def filtro_prefijo(campo, prefijo, vendor):
+    # `campo` empieza con `prefijo`, de forma que use el índice del campo en `vendor`
+    if vendor == 'postgresql':
+        return Q(**{f'{campo}__startswith': prefijo})
+    siguiente = prefijo[:-1] + chr(ord(prefijo[-1]) + 1)
+    return Q(**{f'{campo}__gte': prefijo, f'{campo}__lt': siguiente})
+
+
+def variantes(palabra):
+    # Rango y LIKE de PostgreSQL distinguen mayúsculas: se prueban las formas usuales
+    return list(dict.fromkeys([palabra, palabra.capitalize(), palabra.upper()]))
+
+
+class BusquedaIndexadaMixin:
+    """
+    Mixin para ModelAdmin destino de autocomplete_fields. Las subclases definen:
+
+    campos_prefijo: campos con índice buscados por prefijo en el autocompletar
+    busqueda_exacta(palabra): opcional, Q adicional por palabra (o None)
+    """
+
+    campos_prefijo = ()
+
+    def es_autocompletar(self, request):
+        coincidencia = getattr(request, 'resolver_match', None)
+        return coincidencia is not None and coincidencia.url_name == 'autocomplete'
+
+    def busqueda_exacta(self, palabra):
+        return None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.es_autocompletar(request):
+            return super().get_search_results(request, queryset, search_term)
+        vendor = connections[queryset.db].vendor
+        # Cada palabra debe calzar con el prefijo de alguno de los campos
+        for palabra in search_term.split():
+            condicion = Q()
+            for variante in variantes(palabra):
+                for campo in self.campos_prefijo:
+                    condicion |= filtro_prefijo(campo, variante, vendor)
+            exacta = self.busqueda_exacta(palabra)
+            if exacta is not None:
+                condicion |= exacta
+            queryset = queryset.filter(condicion)
+        return queryset, False
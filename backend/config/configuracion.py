@@ -0,0 +1,131 @@
+"""
+Lectura de ConfiguracionSistema sin consultas en el camino caliente.
+
+Cada proceso guarda todas las claves activas ya tipadas (una sola consulta
+al cargar) y las sirve desde memoria. Guardar o borrar una configuración
+cambia la versión compartida en la cache de Django (integraciones/signals.py,
+al confirmar la transacción); cada proceso compara su versión con la
+compartida cada INTERVALO_VERIFICACION segundos y recarga si cambió. Si la
+cache perdió la versión (reinicio, expulsión) el proceso la vuelve a
+sembrar con la suya, y en todo caso recarga pasados VIGENCIA_MAXIMA segundos.
+
+La versión solo es compartida si la cache lo es: con varios procesos
+settings.CACHES debe apuntar a un cache común (CACHE_REDIS_URL). Con el
+LocMemCache por defecto cada proceso ve únicamente sus propias
+invalidaciones y los demás tardan hasta VIGENCIA_MAXIMA en enterarse.
+
+Los umbrales que antes eran constantes (RutaClinica.DURACIONES_ESTIMADAS y
+MARGEN_TOLERANCIA, la espera por atraso de Atencion) siguen siendo el valor
+por defecto; una fila de ConfiguracionSistema con la clave los ajusta en
+caliente:
+
+    rutas.duracion_estimada.<ETAPA>   INTEGER  minutos
+    rutas.margen_tolerancia.<ETAPA>   FLOAT    fracción sobre la duración
+    atenciones.minutos_espera_atraso  INTEGER  minutos
+"""
+import logging
+import time
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = 'configuracion_sistema:version'
+
+# Cada cuánto un proceso mira la versión compartida (segundos, sin consultas)
+INTERVALO_VERIFICACION = 5
+# Recarga forzada aunque no se haya visto un cambio de versión (segundos)
+VIGENCIA_MAXIMA = 300
+
+_memo = {'valores': None, 'version': None, 'cargado_en': None, 'verificado_en': None}
+
+
+# ============================================
+# CARGA E INVALIDACIÓN
+# ============================================
+
+def cargar():
+    # Lee todas las claves activas en una consulta y las deja tipadas en memoria
+    ConfiguracionSistema = apps.get_model('integraciones', 'ConfiguracionSistema')
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(CLAVE_VERSION, version, timeout=None)
+        version = cache.get(CLAVE_VERSION, version)
+    valores = {}
+    for config in ConfiguracionSistema.objects.filter(activo=True).only('clave', 'valor', 'tipo_dato'):
+        valores[config.clave] = config.obtener_valor_tipado()
+        if config.tipo_dato != 'STRING' and isinstance(valores[config.clave], str):
+            # obtener_valor_tipado deja el texto si no pudo convertirlo; se avisa una vez por carga
+            logger.warning('Configuración con valor inválido', extra={
+                'clave': config.clave, 'valor': config.valor, 'tipo_dato': config.tipo_dato,
+            })
+    ahora = time.monotonic()
+    _memo.update(valores=valores, version=version, cargado_en=ahora, verificado_en=ahora)
+    return valores
+
+
+def _vigentes():
+    ahora = time.monotonic()
+    if _memo['valores'] is None or ahora - _memo['cargado_en'] >= VIGENCIA_MAXIMA:
+        return cargar()
+    if ahora - _memo['verificado_en'] >= INTERVALO_VERIFICACION:
+        _memo['verificado_en'] = ahora
+        version = cache.get(CLAVE_VERSION)
+        if version is None:
+            # La cache perdió la versión: se siembra la propia para seguir comparando
+            cache.add(CLAVE_VERSION, _memo['version'], timeout=None)
+        elif version != _memo['version']:
+            return cargar()
+    return _memo['valores']
+
+
+def invalidar():
+    # Nueva versión compartida: todos los procesos recargan en su próxima verificación
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
+    olvidar_configuracion()
+
+
+def olvidar_configuracion():
+    # Fuerza una nueva lectura en este proceso
+    _memo['valores'] = None
+
+
+# ============================================
+# ACCESO TIPADO
+# ============================================
+
+def valor(clave, defecto=None):
+    # Valor ya tipado según tipo_dato, o `defecto` si la clave no existe o está inactiva.
+    # Los JSON se comparten entre llamadas: no modificarlos en el lugar.
+    return _vigentes().get(clave, defecto)
+
+
+def _convertido(clave, defecto, tipo):
+    dato = _vigentes().get(clave)
+    if dato is None:
+        return defecto
+    try:
+        return tipo(dato)
+    except (TypeError, ValueError):
+        return defecto
+
+
+def entero(clave, defecto):
+    return _convertido(clave, defecto, int)
+
+
+def flotante(clave, defecto):
+    # float, no Decimal: fracciones y umbrales que se comparan con otros float
+    return _convertido(clave, defecto, float)
+
+
+def booleano(clave, defecto):
+    dato = _vigentes().get(clave)
+    if isinstance(dato, bool):
+        return dato
+    if isinstance(dato, str):
+        return dato.lower() in ['true', '1', 'yes', 'si']
+    return defecto
@@ -0,0 +1,56 @@
+"""
+Días calendario locales (settings.TIME_ZONE, America/Santiago) como rangos
+semiabiertos [inicio, fin) de datetimes aware.
+
+`campo__date=dia` compila a una conversión de zona horaria sobre la columna
+(django_datetime_cast_date en SQLite, AT TIME ZONE en PostgreSQL), así que la
+base no puede usar el índice del campo y recorre la tabla. El mismo filtro
+como `campo__gte=inicio, campo__lt=fin` es una búsqueda por rango indexada.
+
+Cada borde es la medianoche local de su propio día, de modo que los días con
+cambio de horario duran 23 o 25 horas igual que con __date.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def _como_fecha(dia):
+    # Acepta date o 'YYYY-MM-DD' (query params); None es hoy en hora local
+    if dia is None:
+        return timezone.localdate()
+    if isinstance(dia, str):
+        return date.fromisoformat(dia)
+    return dia
+
+
+def inicio_dia(dia=None):
+    # Medianoche local del día como datetime aware
+    return timezone.make_aware(datetime.combine(_como_fecha(dia), time.min))
+
+
+def rango_dia(dia=None):
+    # (inicio, fin) del día local; fin es la medianoche del día siguiente
+    dia = _como_fecha(dia)
+    return inicio_dia(dia), inicio_dia(dia + timedelta(days=1))
+
+
+def rango_dias(desde, hasta):
+    # (inicio, fin) de los días locales desde..hasta, ambos incluidos
+    return inicio_dia(desde), inicio_dia(_como_fecha(hasta) + timedelta(days=1))
+
+
+def filtro_dia(campo, dia=None):
+    """
+    Lookups equivalentes a `campo__date=dia` que sí usan el índice:
+        Atencion.objects.filter(**filtro_dia('fecha_hora_inicio', hoy), estado='COMPLETADA')
+    Sirve también con relaciones ('atenciones__fecha_hora_inicio').
+    """
+    inicio, fin = rango_dia(dia)
+    return {f'{campo}__gte': inicio, f'{campo}__lt': fin}
+
+
+def filtro_dias(campo, desde, hasta):
+    # Equivalente a `campo__date__gte=desde, campo__date__lte=hasta`
+    inicio, fin = rango_dias(desde, hasta)
+    return {f'{campo}__gte': inicio, f'{campo}__lt': fin}
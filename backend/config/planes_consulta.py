@@ -0,0 +1,49 @@
+"""
+Verificación de planes de ejecución (EXPLAIN) de las consultas calientes.
+
+Los tests construyen el mismo queryset que usa el código (mismos filtros,
+ordering por defecto y parámetros ligados) y verifican que el plan use el
+índice pensado para ese predicado. Así, quitar o renombrar un índice, o
+cambiar un filtro de forma que deje de aprovecharlo, rompe un test.
+
+Soporta SQLite y PostgreSQL. En PostgreSQL se desactiva el seq scan durante
+el EXPLAIN: con las tablas casi vacías de los tests el planner siempre
+preferiría recorrer la tabla, y lo que interesa es si el índice es aplicable.
+"""
+import re
+
+from django.db import connection
+
+
+_RE_INDICE = {
+    'sqlite': re.compile(r'USING (?:COVERING )?INDEX (\w+)'),
+    'postgresql': re.compile(r'(?:Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)'),
+}
+
+
+def indices_del_plan(queryset):
+    # Nombres de los índices que aparecen en el plan del queryset
+    patron = _RE_INDICE.get(connection.vendor)
+    if patron is None:
+        raise NotImplementedError(f'EXPLAIN no soportado para {connection.vendor}')
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # SET LOCAL: dura hasta el fin de la transacción del test
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    plan = queryset.explain()
+    return set(patron.findall(plan)), plan
+
+
+class PlanesConsultaMixin:
+    """
+    Mixin para TestCase con aserciones sobre el plan de ejecución.
+    """
+
+    def assertUsaIndice(self, queryset, *indices):
+        # Pasa si el plan usa al menos uno de `indices`
+        usados, plan = indices_del_plan(queryset)
+        self.assertTrue(
+            usados & set(indices),
+            f"Se esperaba alguno de {sorted(indices)} y el plan usa {sorted(usados) or 'ninguno'}.\n"
+            f"SQL: {queryset.query}\nPlan:\n{plan}"
+        )
@@ -0,0 +1,575 @@
+"""
+Arnés de presupuestos de consultas SQL para los viewsets de la API.
+
+Cada test enumera las rutas CRUD y los @action de un viewset, ejecuta cada
+ruta sobre un escenario de tamaño N y luego sobre el mismo escenario crecido
+10 veces, y verifica que el número de consultas no supere un presupuesto fijo
+ni crezca con N. Cuando una ruta falla, el mensaje lista las huellas
+(fingerprints) de las consultas ofensoras para ubicar el N+1 rápidamente.
+"""
+import re
+from collections import Counter
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from atenciones.models import Atencion, Medico
+from config import configuracion
+from boxes.models import Box, OcupacionManual
+from pacientes.models import Paciente
+from rutas_clinicas.models import RutaClinica
+from users.models import User
+
+
+# Tamaño base del escenario y factor de crecimiento para verificar N-independencia
+ESCALA_BASE = 3
+FACTOR_CRECIMIENTO = 10
+
+ACCIONES_CRUD_LISTA = {'list': 'get', 'create': 'post'}
+ACCIONES_CRUD_DETALLE = {
+    'retrieve': 'get',
+    'update': 'put',
+    'partial_update': 'patch',
+    'destroy': 'delete',
+}
+
+
+# ============================================
+# HUELLAS DE CONSULTAS
+# ============================================
+
+_RE_CADENA = re.compile(r"'(?:[^']|'')*'")
+_RE_UUID = re.compile(r'\b[0-9a-f]{32}\b|\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I)
+_RE_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_RE_LISTA_IN = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+
+def huella_sql(sql):
+    # Normaliza una consulta quitando literales para agrupar consultas equivalentes
+    huella = _RE_CADENA.sub('?', sql)
+    huella = _RE_UUID.sub('?', huella)
+    huella = _RE_NUMERO.sub('?', huella)
+    huella = _RE_LISTA_IN.sub('(...)', huella)
+    return _RE_ESPACIOS.sub(' ', huella).strip()
+
+
+def contar_huellas(consultas):
+    return Counter(huella_sql(q['sql']) for q in consultas)
+
+
+def describir_huellas(base, crecido, limite=10):
+    # Arma el detalle de huellas para el mensaje de error, marcando las que crecieron
+    lineas = []
+    for huella, cantidad in crecido.most_common(limite):
+        previas = base.get(huella, 0)
+        marca = '  <-- crece con N' if cantidad > previas else ''
+        lineas.append(f"    {previas:>4} -> {cantidad:<4} {huella[:220]}{marca}")
+    for huella, previas in base.items():
+        if huella not in crecido:
+            lineas.append(f"    {previas:>4} -> 0    {huella[:220]}")
+    return '\n'.join(lineas)
+
+
+# ============================================
+# ESCENARIO DE DATOS
+# ============================================
+
+def _digito_verificador(cuerpo):
+    suma = 0
+    multiplicador = 2
+    for digito in reversed(str(cuerpo)):
+        suma += int(digito) * multiplicador
+        multiplicador = 2 if multiplicador == 7 else multiplicador + 1
+    resto = 11 - (suma % 11)
+    if resto == 11:
+        return '0'
+    if resto == 10:
+        return 'K'
+    return str(resto)
+
+
+def rut_sintetico(indice):
+    # RUT válido y único derivado de un índice
+    cuerpo = 10_000_000 + indice
+    return Paciente.formatear_rut(f"{cuerpo}{_digito_verificador(cuerpo)}")
+
+
+class EscenarioCarga:
+    """
+    Escenario de datos que crece por unidades. Cada unidad agrega un paciente,
+    un box, un médico, una ruta, una ocupación manual y varias atenciones,
+    parte de ellas asociadas a los objetos "foco" sobre los que operan las
+    rutas de detalle. Se usa bulk_create para no disparar signals.
+    """
+
+    def __init__(self, escala=ESCALA_BASE):
+        self.unidades = 0
+        self.ahora = timezone.now()
+        self._crear_focos()
+        self.crecer_hasta(escala)
+        # La configuración se lee una vez por proceso, no en cada petición medida
+        configuracion.cargar()
+
+    def _crear_focos(self):
+        self.admin = User.objects.create_superuser(
+            'admin_presupuesto', 'admin_presupuesto@nexalud.admin.com', 'clave-presupuesto'
+        )
+        self.medico = User.objects.create_user(
+            'medico_presupuesto', 'medico_presupuesto@nexalud.medico.com', 'clave-presupuesto',
+            rol='MEDICO', especialidad='MEDICINA_GENERAL'
+        )
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(0),
+            nombre='Paciente',
+            apellido_paterno='Foco',
+            fecha_nacimiento=date(1985, 5, 20),
+            telefono='+56912345678',
+            peso=72,
+            altura=175,
+        )
+        self.box = Box.objects.create(numero='FOCO-1', nombre='Box Foco')
+        self.medico_legacy = Medico.objects.create(
+            codigo_medico='MED-FOCO', nombre='Medico', apellido='Foco'
+        )
+        self.ruta = RutaClinica.objects.create(
+            paciente=self.paciente,
+            etapas_seleccionadas=[key for key, _ in RutaClinica.ETAPAS_CHOICES],
+        )
+        self.ruta.iniciar_ruta(usuario=self.medico)
+        self.atencion = Atencion.objects.create(
+            paciente=self.paciente,
+            medico=self.medico,
+            box=self.box,
+            fecha_hora_inicio=self.ahora + timedelta(minutes=5),
+            duracion_planificada=30,
+        )
+        # La signal de creación de atenciones no debe alterar los focos
+        self.ruta.refresh_from_db()
+        self.ocupacion = OcupacionManual.objects.create(
+            box=self.box,
+            duracion_minutos=15,
+            fecha_inicio=self.ahora - timedelta(minutes=30),
+            fecha_fin_programada=self.ahora - timedelta(minutes=15),
+        )
+
+    def crecer_hasta(self, unidades):
+        desde = self.unidades + 1
+        hasta = unidades
+        if hasta < desde:
+            return
+
+        indices = range(desde, hasta + 1)
+        pacientes = []
+        for i in indices:
+            rut = rut_sintetico(i)
+            pacientes.append(Paciente(
+                rut=rut,
+                identificador_hash=Paciente.generar_hash_rut(rut),
+                nombre=f'Paciente {i}',
+                apellido_paterno='Carga',
+                apellido_materno='Sintetica',
+                fecha_nacimiento=date(1950 + i % 50, 1 + i % 12, 1 + i % 28),
+                edad=30,
+                genero='F' if i % 2 else 'M',
+                telefono='+56911111111',
+                estado_actual='EN_ESPERA' if i % 3 else 'ACTIVO',
+                tipo_sangre='O+',
+                alergias='Penicilina' if i % 2 else '',
+                seguro_medico='FONASA_A' if i % 2 else 'PARTICULAR',
+                direccion_region='RM',
+            ))
+        Paciente.objects.bulk_create(pacientes)
+
+        boxes = Box.objects.bulk_create([
+            Box(
+                numero=f'BX-{i:05d}',
+                nombre=f'Box {i}',
+                especialidad='GENERAL' if i % 2 else 'MULTIUSO',
+                estado='OCUPADO' if i % 2 else 'DISPONIBLE',
+                ultima_ocupacion=self.ahora - timedelta(minutes=20) if i % 2 else None,
+            )
+            for i in indices
+        ])
+
+        medicos = User.objects.bulk_create([
+            User(
+                username=f'medico_carga_{i}',
+                email=f'medico_carga_{i}@nexalud.medico.com',
+                password='!',
+                rol='MEDICO',
+                especialidad='MEDICINA_GENERAL',
+                first_name='Medico',
+                last_name=f'Carga {i}',
+            )
+            for i in indices
+        ])
+
+        Medico.objects.bulk_create([
+            Medico(codigo_medico=f'MED-{i:05d}', nombre='Medico', apellido=f'Carga {i}')
+            for i in indices
+        ])
+
+        etapas = [key for key, _ in RutaClinica.ETAPAS_CHOICES]
+        inicio_ruta = self.ahora - timedelta(days=3)
+        timestamps = {
+            etapas[0]: {
+                'fecha_inicio': inicio_ruta.isoformat(),
+                'fecha_fin': (inicio_ruta + timedelta(days=1)).isoformat(),
+            },
+            etapas[1]: {'fecha_inicio': (inicio_ruta + timedelta(days=1)).isoformat(), 'fecha_fin': None},
+        }
+        rutas = []
+        for paciente in pacientes:
+            rutas.append(RutaClinica(
+                paciente=paciente,
+                etapas_seleccionadas=etapas,
+                etapa_actual=etapas[1],
+                indice_etapa_actual=1,
+                etapas_completadas=[etapas[0]],
+                timestamps_etapas=timestamps,
+                fecha_inicio=inicio_ruta,
+                estado='EN_PROGRESO',
+                porcentaje_completado=16.7,
+            ))
+            # Rutas históricas del paciente foco para que su detalle crezca con N
+            rutas.append(RutaClinica(
+                paciente=self.paciente,
+                etapas_seleccionadas=etapas,
+                etapas_completadas=etapas,
+                fecha_inicio=inicio_ruta - timedelta(days=30),
+                fecha_fin_real=inicio_ruta - timedelta(days=20),
+                estado='COMPLETADA',
+                porcentaje_completado=100.0,
+            ))
+        RutaClinica.objects.bulk_create(rutas)
+
+        atenciones = []
+        for i, paciente, box, medico in zip(indices, pacientes, boxes, medicos):
+            atenciones.extend([
+                Atencion(
+                    paciente=paciente, medico=medico, box=box,
+                    fecha_hora_inicio=self.ahora + timedelta(hours=1),
+                    duracion_planificada=30,
+                ),
+                Atencion(
+                    paciente=paciente, medico=medico, box=box,
+                    fecha_hora_inicio=self.ahora - timedelta(minutes=40),
+                    inicio_cronometro=self.ahora - timedelta(minutes=35),
+                    duracion_planificada=20,
+                    estado='EN_CURSO',
+                    atraso_reportado=True,
+                    fecha_reporte_atraso=self.ahora - timedelta(minutes=39),
+                ),
+                Atencion(
+                    paciente=paciente, medico=self.medico, box=box,
+                    fecha_hora_inicio=self.ahora - timedelta(hours=2),
+                    inicio_cronometro=self.ahora - timedelta(hours=2) + timedelta(minutes=4),
+                    fin_cronometro=self.ahora - timedelta(hours=1, minutes=30),
+                    duracion_planificada=30,
+                    duracion_real=26,
+                    estado='COMPLETADA',
+                ),
+                Atencion(
+                    paciente=self.paciente, medico=self.medico, box=self.box,
+                    # Agenda futura del médico/box foco, sin solapes entre sí
+                    fecha_hora_inicio=self.ahora + timedelta(days=1, minutes=40 * i),
+                    duracion_planificada=30,
+                ),
+            ])
+        Atencion.objects.bulk_create(atenciones)
+
+        OcupacionManual.objects.bulk_create([
+            OcupacionManual(
+                box=box,
+                duracion_minutos=30,
+                fecha_inicio=self.ahora - timedelta(minutes=20),
+                fecha_fin_programada=self.ahora + timedelta(minutes=10),
+                activa=bool(indice % 2),
+            )
+            for indice, box in zip(indices, boxes)
+        ])
+
+        self.unidades = hasta
+
+
+# ============================================
+# MIXIN DE TESTS
+# ============================================
+
+def peticion(presupuesto, datos=None, params=None, objetivo=None, preparar=None, usuario='admin',
+             error_conocido=None):
+    """
+    Describe cómo ejecutar una ruta dentro del arnés.
+
+    presupuesto: máximo de consultas permitido (None = ruta dependiente de N conocida)
+    datos/params: callables que reciben el escenario y retornan el body o query params
+    objetivo: nombre del atributo del escenario usado como pk en rutas de detalle
+    preparar: callable que ajusta el estado del escenario antes de medir (se revierte)
+    usuario: atributo del escenario con el usuario autenticado
+    error_conocido: motivo si la ruta hoy responde 500; el test avisa cuando deja de fallar
+    """
+    return {
+        'presupuesto': presupuesto,
+        'datos': datos,
+        'params': params,
+        'objetivo': objetivo,
+        'preparar': preparar,
+        'usuario': usuario,
+        'error_conocido': error_conocido,
+    }
+
+
+def enumerar_rutas(viewset):
+    # Retorna (accion, metodo, es_detalle, url_name) para cada ruta CRUD y @action
+    rutas = []
+    for accion, metodo in ACCIONES_CRUD_LISTA.items():
+        if hasattr(viewset, accion):
+            rutas.append((accion, metodo, False, 'list'))
+    for accion, metodo in ACCIONES_CRUD_DETALLE.items():
+        if hasattr(viewset, accion):
+            rutas.append((accion, metodo, True, 'detail'))
+    for extra in viewset.get_extra_actions():
+        for metodo in extra.mapping:
+            rutas.append((extra.__name__, metodo, extra.detail, extra.url_name))
+    return rutas
+
+
+class _Rollback(Exception):
+    pass
+
+
+class PresupuestoConsultasMixin:
+    """
+    Mixin para TestCase. Las subclases definen:
+
+    viewset: clase del viewset a cubrir
+    basename: basename con el que se registró en el router
+    objetivo_por_defecto: atributo del escenario usado como pk en rutas de detalle
+    presupuestos: {(accion, metodo): peticion(...)} para cada ruta del viewset
+    """
+
+    viewset = None
+    basename = None
+    objetivo_por_defecto = None
+    presupuestos = {}
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        enumeradas = {(accion, metodo) for accion, metodo, _, _ in enumerar_rutas(self.viewset)}
+        faltantes = sorted(enumeradas - set(self.presupuestos))
+        sobrantes = sorted(set(self.presupuestos) - enumeradas)
+        self.assertFalse(faltantes, f"Rutas de {self.viewset.__name__} sin presupuesto: {faltantes}")
+        self.assertFalse(sobrantes, f"Presupuestos de rutas inexistentes: {sobrantes}")
+
+    def test_presupuesto_independiente_de_n(self):
+        escenario = EscenarioCarga(ESCALA_BASE)
+        base = self._medir_rutas(escenario)
+        escenario.crecer_hasta(ESCALA_BASE * FACTOR_CRECIMIENTO)
+        crecido = self._medir_rutas(escenario)
+
+        for clave, spec in self.presupuestos.items():
+            if clave not in base:
+                continue
+            accion, metodo = clave
+            with self.subTest(ruta=f"{metodo.upper()} {self.basename}:{accion}"):
+                huellas_base, status_base = base[clave]
+                huellas_crecido, status_crecido = crecido[clave]
+                n_base = sum(huellas_base.values())
+                n_crecido = sum(huellas_crecido.values())
+                detalle = describir_huellas(huellas_base, huellas_crecido)
+
+                if spec['error_conocido']:
+                    self.assertGreaterEqual(
+                        status_crecido, 500,
+                        f"{accion} ya no responde error ({spec['error_conocido']}); "
+                        f"quite error_conocido y asígnele un presupuesto."
+                    )
+                    continue
+
+                self.assertLess(status_crecido, 500, f"{accion} respondió {status_crecido}")
+
+                if spec['presupuesto'] is None:
+                    # Ruta N+1 conocida: el test falla cuando se corrige para fijarle presupuesto
+                    self.assertGreater(
+                        n_crecido, n_base,
+                        f"{accion} ya no depende de N ({n_base} -> {n_crecido} consultas); "
+                        f"asígnele un presupuesto fijo."
+                    )
+                    continue
+
+                self.assertEqual(
+                    n_base, n_crecido,
+                    f"{accion} depende de N: {n_base} -> {n_crecido} consultas "
+                    f"al crecer x{FACTOR_CRECIMIENTO}.\n{detalle}"
+                )
+                self.assertLessEqual(
+                    n_crecido, spec['presupuesto'],
+                    f"{accion} excede su presupuesto: {n_crecido} > {spec['presupuesto']}.\n{detalle}"
+                )
+
+    def _medir_rutas(self, escenario):
+        resultados = {}
+        rutas = {(accion, metodo): (detalle, url_name)
+                 for accion, metodo, detalle, url_name in enumerar_rutas(self.viewset)}
+        for clave, spec in self.presupuestos.items():
+            if clave not in rutas:
+                continue
+            detalle, url_name = rutas[clave]
+            resultados[clave] = self._medir(escenario, clave, spec, detalle, url_name)
+        return resultados
+
+    def _medir(self, escenario, clave, spec, detalle, url_name):
+        accion, metodo = clave
+        kwargs = {}
+        if detalle:
+            objetivo = getattr(escenario, spec['objetivo'] or self.objetivo_por_defecto)
+            kwargs['pk'] = objetivo.pk
+        url = reverse(f'{self.basename}-{url_name}', kwargs=kwargs)
+
+        cliente = APIClient(raise_request_exception=False)
+        cliente.force_authenticate(user=getattr(escenario, spec['usuario']))
+
+        # Cada ruta se ejecuta en un savepoint revertido para no contaminar las siguientes
+        try:
+            with transaction.atomic():
+                if spec['preparar']:
+                    spec['preparar'](escenario)
+                datos = spec['datos'](escenario) if spec['datos'] else None
+                params = spec['params'](escenario) if spec['params'] else None
+                if params:
+                    url = f"{url}?{urlencode(params)}"
+                # Cache fría: se mide el peor caso y la medición no depende del orden de las rutas
+                cache.clear()
+                with CaptureQueriesContext(connection) as capturadas:
+                    respuesta = getattr(cliente, metodo)(url, datos, format='json')
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        for nombre in ('atencion', 'box', 'ruta', 'paciente', 'medico_legacy', 'ocupacion'):
+            getattr(escenario, nombre).refresh_from_db()
+
+        return contar_huellas(capturadas.captured_queries), respuesta.status_code
+
+
+# ============================================
+# CHANGELISTS DEL ADMIN
+# ============================================
+
+class PresupuestoAdminMixin:
+    """
+    Mixin para TestCase que mide el changelist de cada ModelAdmin de una app
+    sobre el escenario de tamaño N y sobre el escenario crecido. Las subclases
+    definen:
+
+    app_label: app cuyos ModelAdmin se cubren
+    presupuestos_admin: {Modelo: máximo de consultas del changelist}
+    formularios_admin: modelos cuyo formulario de alta no debe crecer con N
+        (ni en consultas ni en bytes: las FK sin autocompletar listan todas las filas)
+    poblar(escenario): opcional, agrega filas de modelos que el escenario no crea
+    """
+
+    app_label = None
+    presupuestos_admin = {}
+    formularios_admin = []
+
+    def poblar(self, escenario):
+        pass
+
+    def _modelos_registrados(self):
+        return {modelo for modelo in admin.site._registry if modelo._meta.app_label == self.app_label}
+
+    def test_todos_los_admin_tienen_presupuesto(self):
+        registrados = self._modelos_registrados()
+        faltantes = sorted(m.__name__ for m in registrados - set(self.presupuestos_admin))
+        self.assertFalse(faltantes, f"ModelAdmin de {self.app_label} sin presupuesto: {faltantes}")
+
+    def test_changelist_independiente_de_n(self):
+        escenario = EscenarioCarga(ESCALA_BASE)
+        self.poblar(escenario)
+        base = self._medir_changelists(escenario)
+        escenario.crecer_hasta(ESCALA_BASE * FACTOR_CRECIMIENTO)
+        self.poblar(escenario)
+        crecido = self._medir_changelists(escenario)
+
+        for modelo, presupuesto in self.presupuestos_admin.items():
+            with self.subTest(changelist=modelo.__name__):
+                huellas_base, status_base = base[modelo]
+                huellas_crecido, status_crecido = crecido[modelo]
+                n_base = sum(huellas_base.values())
+                n_crecido = sum(huellas_crecido.values())
+                detalle = describir_huellas(huellas_base, huellas_crecido)
+
+                self.assertEqual(status_crecido, 200, f"changelist de {modelo.__name__} respondió {status_crecido}")
+                self.assertEqual(
+                    n_base, n_crecido,
+                    f"changelist de {modelo.__name__} depende de N: {n_base} -> {n_crecido} consultas "
+                    f"al crecer x{FACTOR_CRECIMIENTO}.\n{detalle}"
+                )
+                self.assertLessEqual(
+                    n_crecido, presupuesto,
+                    f"changelist de {modelo.__name__} excede su presupuesto: {n_crecido} > {presupuesto}.\n{detalle}"
+                )
+
+    def test_formulario_independiente_de_n(self):
+        escenario = EscenarioCarga(ESCALA_BASE)
+        self.poblar(escenario)
+        base = self._medir_formularios(escenario)
+        escenario.crecer_hasta(ESCALA_BASE * FACTOR_CRECIMIENTO)
+        self.poblar(escenario)
+        crecido = self._medir_formularios(escenario)
+
+        for modelo in self.formularios_admin:
+            with self.subTest(formulario=modelo.__name__):
+                huellas_base, bytes_base = base[modelo]
+                huellas_crecido, bytes_crecido = crecido[modelo]
+                n_base = sum(huellas_base.values())
+                n_crecido = sum(huellas_crecido.values())
+                self.assertEqual(
+                    n_base, n_crecido,
+                    f"formulario de {modelo.__name__} depende de N: {n_base} -> {n_crecido} consultas.\n"
+                    f"{describir_huellas(huellas_base, huellas_crecido)}"
+                )
+                self.assertEqual(
+                    bytes_base, bytes_crecido,
+                    f"formulario de {modelo.__name__} crece con N: {bytes_base} -> {bytes_crecido} bytes "
+                    f"(¿una FK sin autocomplete_fields?)"
+                )
+
+    def _cliente(self, escenario):
+        cliente = Client()
+        cliente.force_login(escenario.admin)
+        return cliente
+
+    def _medir_changelists(self, escenario):
+        cliente = self._cliente(escenario)
+        resultados = {}
+        for modelo in self.presupuestos_admin:
+            url = reverse(f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_changelist')
+            cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = cliente.get(url)
+            resultados[modelo] = (contar_huellas(capturadas.captured_queries), respuesta.status_code)
+        return resultados
+
+    def _medir_formularios(self, escenario):
+        cliente = self._cliente(escenario)
+        resultados = {}
+        for modelo in self.formularios_admin:
+            url = reverse(f'admin:{modelo._meta.app_label}_{modelo._meta.model_name}_add')
+            # La primera visita llena caches de proceso (ContentType) que no dependen de N
+            cliente.get(url)
+            cache.clear()
+            with CaptureQueriesContext(connection) as capturadas:
+                respuesta = cliente.get(url)
+            self.assertEqual(respuesta.status_code, 200, f"formulario de {modelo.__name__} respondió {respuesta.status_code}")
+            resultados[modelo] = (contar_huellas(capturadas.captured_queries), len(respuesta.content))
+        return resultados
@@ -0,0 +1,74 @@
+"""
+Logging estructurado y no bloqueante.
+
+Los loggers de cada app escriben en ManejadorColaJSON, un QueueHandler: en el
+hilo de la request solo se interpola el mensaje y se encola el registro. El
+formateo JSON y la escritura a stdout ocurren en el hilo del QueueListener,
+así un stdout lento o bloqueado (pipe de Docker) no agrega latencia.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Atributos estándar de LogRecord; lo demás viene de extra={...} y va al JSON
+_ATRIBUTOS_RECORD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class FormateadorJSON(logging.Formatter):
+    # Una línea JSON por registro
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorColaJSON(QueueHandler):
+    """
+    QueueHandler con su propio QueueListener hacia stdout en JSON.
+    Se instancia una vez desde settings.LOGGING (dictConfig).
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        destino = logging.StreamHandler(stream or sys.stdout)
+        destino.setFormatter(FormateadorJSON())
+        self.listener = QueueListener(self.queue, destino)
+        self.listener.start()
+        atexit.register(self._detener_listener)
+
+    def _detener_listener(self):
+        # Vacía la cola pendiente; idempotente (atexit y close pueden llamarlo ambos)
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Solo lo indispensable para que el registro sea seguro de encolar:
+        # interpolar args y serializar la excepción. El JSON se arma en el listener.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        self._detener_listener()
+        super().close()
@@ -0,0 +1,213 @@
+"""
+Lecturas de analítica en la réplica de la base de datos.
+
+El router solo manda lecturas a la réplica dentro de una vista que lo pide
+explícitamente (@lectura_replica en vistas función, LecturaReplicaMixin en
+viewsets); todo lo demás, y toda escritura, va a 'default'. Se vuelve a la
+primaria cuando:
+- settings.REPLICA_LECTURA es None (sin réplica configurada),
+- el retraso de la réplica supera settings.REPLICA_RETRASO_MAXIMO o no se
+  puede medir,
+- el usuario escribió hace menos de REPLICA_RETRASO_MAXIMO segundos (leer lo
+  propio: con el retraso acotado por ese máximo, pasado ese tiempo su
+  escritura ya está en la réplica),
+- la misma request ya escribió algo.
+
+La marca de "escribió hace poco" vive en el cache de Django; con varios
+procesos debe ser un cache compartido (CACHE_REDIS_URL en settings).
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se vuelve a medir el retraso de la réplica (segundos, por proceso)
+INTERVALO_MEDICION = 2
+
+# Alias desde el que se leen los modelos en el contexto actual (None = primaria)
+_alias_lectura = ContextVar('alias_lectura', default=None)
+
+_medicion = {'retraso': None, 'medido_en': None}
+
+
+# ============================================
+# RETRASO DE LA RÉPLICA
+# ============================================
+
+def medir_retraso(alias):
+    # Segundos que la réplica lleva detrás de la primaria
+    conexion = connections[alias]
+    if conexion.vendor != 'postgresql':
+        # Bases locales (desarrollo y tests): no hay replicación que medir
+        return 0.0
+    with conexion.cursor() as cursor:
+        # Sin WAL pendiente de aplicar la réplica está al día aunque la
+        # última transacción reproducida sea antigua (primaria sin escrituras)
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+        )
+        valor = cursor.fetchone()[0]
+    return float(valor or 0)
+
+
+def retraso_replica(alias):
+    # medir_retraso con cache por proceso; None si no se pudo medir
+    ahora = time.monotonic()
+    if _medicion['medido_en'] is None or ahora - _medicion['medido_en'] >= INTERVALO_MEDICION:
+        try:
+            _medicion['retraso'] = medir_retraso(alias)
+        except DatabaseError:
+            logger.warning('No se pudo medir el retraso de la réplica', exc_info=True, extra={'alias': alias})
+            _medicion['retraso'] = None
+        _medicion['medido_en'] = ahora
+    return _medicion['retraso']
+
+
+def olvidar_retraso():
+    # Fuerza una nueva medición en la próxima lectura
+    _medicion['medido_en'] = None
+
+
+# ============================================
+# LEER LO PROPIO
+# ============================================
+
+def clave_escritura(usuario_id):
+    return f'replica:escritura:{usuario_id}'
+
+
+def escribio_hace_poco(usuario):
+    return bool(usuario and usuario.is_authenticated and cache.get(clave_escritura(usuario.pk)))
+
+
+class MarcaEscrituraMiddleware:
+    """
+    Marca al usuario que hizo una request de escritura para que sus lecturas
+    de analítica vayan a la primaria durante REPLICA_RETRASO_MAXIMO segundos.
+    DRF autentica dentro de la vista y deja el usuario en la request de Django,
+    así que aquí ya está disponible también con TokenAuthentication.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        respuesta = self.get_response(request)
+        usuario = getattr(request, 'user', None)
+        if (
+            settings.REPLICA_LECTURA
+            and request.method not in SAFE_METHODS
+            and usuario is not None
+            and usuario.is_authenticated
+        ):
+            cache.set(clave_escritura(usuario.pk), True, timeout=settings.REPLICA_RETRASO_MAXIMO)
+        return respuesta
+
+
+# ============================================
+# ACTIVACIÓN POR VISTA
+# ============================================
+
+def alias_replica_disponible(usuario=None):
+    # Alias de la réplica si es seguro leer de ella ahora, si no None
+    alias = settings.REPLICA_LECTURA
+    if not alias or escribio_hace_poco(usuario):
+        return None
+    retraso = retraso_replica(alias)
+    if retraso is None:
+        return None
+    if retraso > settings.REPLICA_RETRASO_MAXIMO:
+        logger.info('Réplica atrasada, lectura en primaria', extra={'alias': alias, 'retraso': retraso})
+        return None
+    return alias
+
+
+def activar_lectura_replica(usuario=None):
+    # Devuelve el token para desactivar_lectura_replica
+    return _alias_lectura.set(alias_replica_disponible(usuario))
+
+
+def desactivar_lectura_replica(token):
+    _alias_lectura.reset(token)
+
+
+@contextmanager
+def lectura_en_replica(usuario=None):
+    """
+    Las lecturas del ORM dentro del bloque van a la réplica si está disponible:
+        with lectura_en_replica(request.user):
+            reporte = calcular_kpis(...)
+    """
+    token = activar_lectura_replica(usuario)
+    try:
+        yield
+    finally:
+        desactivar_lectura_replica(token)
+
+
+def lectura_replica(vista):
+    # Para vistas @api_view; va debajo de @permission_classes (request ya autenticada)
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return vista(request, *args, **kwargs)
+        with lectura_en_replica(request.user):
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+class LecturaReplicaMixin:
+    """
+    Mixin para viewsets: las acciones listadas en acciones_replica leen de la
+    réplica en GET. Se activa después de autenticar y chequear permisos.
+    """
+    acciones_replica = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.acciones_replica and request.method in SAFE_METHODS:
+            self._token_replica = activar_lectura_replica(request.user)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_token_replica', None)
+        if token is not None:
+            self._token_replica = None
+            desactivar_lectura_replica(token)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# ============================================
+# ROUTER
+# ============================================
+
+class RouterReplica:
+    """
+    settings.DATABASE_ROUTERS. Las lecturas siguen al contexto activado por la
+    vista; las escrituras van siempre a la primaria y además devuelven el resto
+    de la request a la primaria.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Explícito aunque haya hint de instancia: un objeto leído de la réplica
+        # no arrastra a la réplica las lecturas posteriores fuera del contexto
+        return _alias_lectura.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _alias_lectura.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplica tienen los mismos datos
+        aliases = {DEFAULT_DB_ALIAS, settings.REPLICA_LECTURA or DEFAULT_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -50,12 +51,18 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware', # React
     'django.middleware.security.SecurityMiddleware',
+    'config.replicas.MarcaEscrituraMiddleware', # Lecturas propias en la primaria
 ]
 
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # Servidor de developer de React
 ]
 
+# Polling condicional del cronómetro (ETag / If-None-Match)
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'if-none-match')
+CORS_EXPOSE_HEADERS = ['ETag']
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -102,6 +109,83 @@ else:
         }
     }
 
+# Réplica de lectura para analítica (ver config/replicas.py). Sin DB_REPLICA_HOST
+# el alias apunta a la misma base y el router no lo usa. En tests es una segunda
+# base local, distinta de la primaria.
+REPLICA_LECTURA = 'replica' if os.environ.get('DB_REPLICA_HOST') else None
+REPLICA_RETRASO_MAXIMO = float(os.environ.get('DB_REPLICA_RETRASO_MAXIMO', '5'))  # segundos
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+    'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+}
+if 'postgresql' in DB_ENGINE:
+    DATABASES['replica']['TEST'] = {'NAME': f"test_{DATABASES['default']['NAME']}_replica"}
+DATABASE_ROUTERS = ['config.replicas.RouterReplica']
+
+# Cache de Django. La versión de ConfiguracionSistema (config/configuracion.py)
+# y la marca de escritura reciente (config/replicas.py) deben verse desde todos
+# los procesos: con más de un worker, CACHE_REDIS_URL es obligatoria (requiere
+# el paquete redis). Sin ella queda el LocMemCache por proceso, válido solo
+# para desarrollo y tests con un único proceso.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Atenciones y rutas cerradas hace más de este horizonte pasan a las tablas de
+# archivo (ver config/archivo.py y archivar_historico.py)
+ARCHIVO_HORIZONTE_DIAS = int(os.environ.get('ARCHIVO_HORIZONTE_DIAS', '180'))
+
+# Días que se conservan los LogSincronizacion crudos por estado (None = siempre).
+# Cada integración puede sobreescribirlos en IntegracionExterna.retencion_logs;
+# los resúmenes por hora se conservan (ver integraciones/retencion.py)
+RETENCION_LOGS_DIAS = {
+    'EXITOSA': 7,
+    'WEBHOOK_PROCESADO': 7,
+    'ADVERTENCIA': 30,
+    'ERROR': 90,
+    'TIMEOUT': 90,
+    'DATOS_INVALIDOS': 90,
+}
+
+# Worker de sincronización de integraciones (integraciones/worker.py)
+INTEGRACIONES_CONCURRENCIA = int(os.environ.get('INTEGRACIONES_CONCURRENCIA', '8'))
+INTEGRACIONES_HTTP_TIMEOUT = float(os.environ.get('INTEGRACIONES_HTTP_TIMEOUT', '10'))  # segundos
+INTEGRACIONES_REINTENTOS = int(os.environ.get('INTEGRACIONES_REINTENTOS', '3'))
+INTEGRACIONES_BACKOFF_BASE = 0.5  # segundos
+INTEGRACIONES_BACKOFF_MAXIMO = 30  # segundos
+
+# Webhooks entrantes (integraciones/cola_webhooks.py)
+WEBHOOK_BACKLOG_MAXIMO = int(os.environ.get('WEBHOOK_BACKLOG_MAXIMO', '10000'))  # eventos en cola → 429
+WEBHOOK_RETRY_AFTER = 30  # segundos sugeridos al emisor cuando hay backpressure
+WEBHOOK_MAX_EVENTOS = 500  # eventos por petición
+WEBHOOK_MAX_INTENTOS = 5
+WEBHOOK_RETENCION_DIAS = 7  # eventos ya procesados
+WEBHOOK_RETENCION_ERRORES_DIAS = 30  # eventos en ERROR (inválidos o sin más reintentos)
+
+# Sincronización incremental de agenda (integraciones/agenda.py)
+AGENDA_TAMANO_PAGINA = int(os.environ.get('AGENDA_TAMANO_PAGINA', '500'))  # cambios por petición
+
+# Eventos salientes hacia las integraciones (integraciones/publicador.py)
+PUBLICACION_TAMANO_LOTE = int(os.environ.get('PUBLICACION_TAMANO_LOTE', '100'))  # eventos por POST
+PUBLICACION_MAX_INTENTOS = 10  # después quedan MUERTO (dead letter)
+PUBLICACION_RETENCION_DIAS = 7  # eventos ya enviados
+
+# Instantánea de métricas del dashboard (dashboard/instantanea.py, refrescar_dashboard.py)
+DASHBOARD_INTERVALO_REFRESCO = int(os.environ.get('DASHBOARD_INTERVALO_REFRESCO', '60'))  # segundos
+DASHBOARD_VIGENCIA_MAXIMA = 300  # segundos; más antigua, la recalcula quien la lee
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -159,4 +243,30 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-}
\ No newline at end of file
+}
+# Logging estructurado (JSON) y no bloqueante: ver config/registro.py
+# LOG_LEVEL controla el nivel de las apps del proyecto (DEBUG en desarrollo).
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+APPS_PROYECTO = [
+    'atenciones', 'boxes', 'config', 'dashboard', 'integraciones',
+    'pacientes', 'rutas_clinicas', 'users',
+]
+# Bajo `manage.py test` no se escribe a stdout (se mezclaría con la salida del
+# runner); los tests que verifican registros usan assertLogs.
+MANEJADOR_LOG = 'nulo' if sys.argv[1:2] == ['test'] else 'cola_json'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'cola_json': {
+            'class': 'config.registro.ManejadorColaJSON',
+        },
+        'nulo': {
+            'class': 'logging.NullHandler',
+        },
+    },
+    'loggers': {
+        app: {'handlers': [MANEJADOR_LOG], 'level': LOG_LEVEL, 'propagate': False}
+        for app in APPS_PROYECTO
+    },
+}
@@ -0,0 +1,232 @@
+import io
+import json
+import logging
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from atenciones.models import Atencion, AtencionArchivada, AtencionHistorica
+from boxes.models import Box, OcupacionManual
+from pacientes.models import Paciente
+from rutas_clinicas.models import RutaClinica, RutaClinicaArchivada
+from users.models import User
+from .archivo import archivar_historico
+from .fechas import filtro_dia, filtro_dias, rango_dia, rango_dias
+from .presupuesto_consultas import rut_sintetico
+from .registro import FormateadorJSON, ManejadorColaJSON
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def _en_utc(rango):
+    # Las horas locales inexistentes nunca son == a un datetime de otra zona (PEP 495)
+    # y restar dos de la misma zona da la diferencia de reloj: se compara en UTC
+    return tuple(momento.astimezone(dt_timezone.utc) for momento in rango)
+
+
+class RegistroJSONTests(SimpleTestCase):
+    # Logging estructurado de config/registro.py
+
+    def _registro(self, mensaje, *args, **kwargs):
+        logger = logging.getLogger('config.tests.registro')
+        return logger.makeRecord(logger.name, logging.INFO, __file__, 1, mensaje, args, None, **kwargs)
+
+    def test_formateador_incluye_extra(self):
+        registro = self._registro('Box %s liberado', 'BX-1', extra={'box_id': 'BX-1', 'minutos': 12})
+        datos = json.loads(FormateadorJSON().format(registro))
+        self.assertEqual(datos['nivel'], 'INFO')
+        self.assertEqual(datos['logger'], 'config.tests.registro')
+        self.assertEqual(datos['mensaje'], 'Box BX-1 liberado')
+        self.assertEqual((datos['box_id'], datos['minutos']), ('BX-1', 12))
+        self.assertNotIn('args', datos)
+
+    def test_manejador_escribe_json_desde_el_listener(self):
+        salida = io.StringIO()
+        manejador = ManejadorColaJSON(stream=salida)
+        logger = logging.getLogger('config.tests.cola')
+        logger.addHandler(manejador)
+        logger.propagate = False
+        try:
+            logger.warning('Sincronización %s lenta', 'agenda', extra={'duracion_ms': 950})
+            try:
+                raise ValueError('timeout')
+            except ValueError:
+                logger.exception('Falló la sincronización', extra={'integracion': 'agenda'})
+        finally:
+            logger.removeHandler(manejador)
+            logger.propagate = True
+            # close() detiene el listener después de vaciar la cola
+            manejador.close()
+
+        lineas = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual(len(lineas), 2)
+        self.assertEqual(lineas[0]['mensaje'], 'Sincronización agenda lenta')
+        self.assertEqual(lineas[0]['duracion_ms'], 950)
+        self.assertEqual(lineas[1]['nivel'], 'ERROR')
+        self.assertEqual(lineas[1]['integracion'], 'agenda')
+        self.assertIn('ValueError: timeout', lineas[1]['excepcion'])
+
+
+@override_settings(TIME_ZONE='America/Santiago')
+class FechasTests(TestCase):
+    # Días locales como rangos [inicio, fin) de config/fechas.py. En 2026 Chile
+    # atrasa la hora el sábado 4 de abril (25 h) y la adelanta el domingo 6 de
+    # septiembre (23 h, sin medianoche local: el día parte a la 01:00 -03)
+
+    def test_dia_normal(self):
+        self.assertEqual(_en_utc(rango_dia(date(2026, 3, 10))), (_utc(2026, 3, 10, 3), _utc(2026, 3, 11, 3)))
+        self.assertEqual(_en_utc(rango_dia('2026-07-15')), (_utc(2026, 7, 15, 4), _utc(2026, 7, 16, 4)))
+
+    def test_dia_de_25_horas(self):
+        inicio, fin = _en_utc(rango_dia(date(2026, 4, 4)))
+        self.assertEqual((inicio, fin), (_utc(2026, 4, 4, 3), _utc(2026, 4, 5, 4)))
+        self.assertEqual(fin - inicio, timedelta(hours=25))
+
+    def test_dia_de_23_horas(self):
+        inicio, fin = _en_utc(rango_dia(date(2026, 9, 6)))
+        self.assertEqual((inicio, fin), (_utc(2026, 9, 6, 4), _utc(2026, 9, 7, 3)))
+        self.assertEqual(fin - inicio, timedelta(hours=23))
+
+    def test_rango_de_dias_incluye_ambos_extremos(self):
+        self.assertEqual(
+            _en_utc(rango_dias(date(2026, 4, 3), date(2026, 4, 5))), (_utc(2026, 4, 3, 3), _utc(2026, 4, 6, 4)),
+        )
+        self.assertEqual(_en_utc(rango_dias('2026-09-05', '2026-09-06')), (_utc(2026, 9, 5, 4), _utc(2026, 9, 7, 3)))
+        self.assertEqual(rango_dias(date(2026, 3, 10), date(2026, 3, 10)), rango_dia(date(2026, 3, 10)))
+
+    def test_filtros_equivalen_a_date(self):
+        # Instantes a ambos lados de cada borde: el rango indexado y __date eligen las mismas filas
+        box = Box.objects.create(numero='BX-F1', nombre='Box fechas')
+        instantes = [
+            borde + delta
+            for borde in (
+                _utc(2026, 4, 4, 3), _utc(2026, 4, 5, 3), _utc(2026, 4, 5, 4),
+                _utc(2026, 9, 6, 4), _utc(2026, 9, 7, 3), _utc(2026, 9, 7, 4),
+            )
+            for delta in (timedelta(seconds=-1), timedelta(0), timedelta(minutes=30))
+        ]
+        OcupacionManual.objects.bulk_create([
+            OcupacionManual(box=box, duracion_minutos=10, fecha_inicio=instante,
+                            fecha_fin_programada=instante + timedelta(minutes=10))
+            for instante in instantes
+        ])
+
+        def ids(**filtro):
+            return set(OcupacionManual.objects.filter(**filtro).values_list('id', flat=True))
+
+        for dia in (date(2026, 4, 4), date(2026, 4, 5), date(2026, 9, 6), date(2026, 9, 7)):
+            with self.subTest(dia=dia):
+                self.assertEqual(ids(**filtro_dia('fecha_inicio', dia)), ids(fecha_inicio__date=dia))
+        self.assertEqual(
+            ids(**filtro_dias('fecha_inicio', date(2026, 9, 5), date(2026, 9, 6))),
+            ids(fecha_inicio__date__gte=date(2026, 9, 5), fecha_inicio__date__lte=date(2026, 9, 6)),
+        )
+
+
+class ArchivoTests(TestCase):
+    # Movimiento al archivo frío de config/archivo.py con un horizonte de 30 días
+
+    def setUp(self):
+        self.ahora = timezone.now()
+        self.medico = User.objects.create_user(
+            'medico_archivo', 'medico_archivo@nexalud.medico.com', 'x', rol='MEDICO', especialidad='MEDICINA_GENERAL',
+        )
+        self.paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Archivo',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        self.box = Box.objects.create(numero='BX-A1', nombre='Box archivo')
+
+    def _atenciones(self, *especificacion):
+        # (estado, días atrás) por atención, cada una en su propia hora
+        return Atencion.objects.bulk_create([
+            Atencion(
+                paciente=self.paciente, medico=self.medico, box=self.box, estado=estado,
+                fecha_hora_inicio=self.ahora - timedelta(days=dias, hours=i), duracion_planificada=30,
+            )
+            for i, (estado, dias) in enumerate(especificacion)
+        ])
+
+    def _ruta(self, estado, dias_fin=None, dias_actualizacion=0):
+        ruta = RutaClinica.objects.create(paciente=self.paciente, etapas_seleccionadas=['CONSULTA_MEDICA'])
+        RutaClinica.objects.filter(pk=ruta.pk).update(
+            estado=estado,
+            fecha_fin_real=self.ahora - timedelta(days=dias_fin) if dias_fin is not None else None,
+            fecha_actualizacion=self.ahora - timedelta(days=dias_actualizacion),
+        )
+        return ruta
+
+    def _ids(self, modelo):
+        return set(modelo.objects.values_list('id', flat=True))
+
+    def test_mueve_solo_lo_cerrado_antes_del_horizonte(self):
+        viejas_cerradas = self._atenciones(('COMPLETADA', 60), ('CANCELADA', 45), ('NO_PRESENTADO', 31))
+        quedan = self._atenciones(('PROGRAMADA', 60), ('EN_CURSO', 40), ('COMPLETADA', 5))
+        rutas_viejas = [self._ruta('COMPLETADA', dias_fin=60), self._ruta('CANCELADA', dias_actualizacion=90)]
+        rutas_que_quedan = [
+            self._ruta('EN_PROGRESO', dias_actualizacion=90),
+            self._ruta('COMPLETADA', dias_fin=5),
+            self._ruta('CANCELADA', dias_actualizacion=2),
+        ]
+
+        self.assertEqual(archivar_historico(horizonte_dias=30), {'atenciones': 3, 'rutas_clinicas': 2})
+        self.assertEqual(self._ids(AtencionArchivada), {a.id for a in viejas_cerradas})
+        self.assertEqual(self._ids(Atencion), {a.id for a in quedan})
+        self.assertEqual(self._ids(RutaClinicaArchivada), {r.id for r in rutas_viejas})
+        self.assertEqual(self._ids(RutaClinica), {r.id for r in rutas_que_quedan})
+        # La copia conserva las columnas
+        archivada = AtencionArchivada.objects.get(pk=viejas_cerradas[0].pk)
+        self.assertEqual(
+            (archivada.estado, archivada.fecha_hora_inicio, archivada.box_id),
+            ('COMPLETADA', viejas_cerradas[0].fecha_hora_inicio, self.box.id),
+        )
+
+    def test_lotes_y_reanudacion(self):
+        viejas = self._atenciones(*[('COMPLETADA', 40 + i) for i in range(5)])
+        todas = self._ids(AtencionHistorica)
+
+        # Corrida cortada tras dos lotes de 2: la siguiente retoma con lo que falta
+        self.assertEqual(archivar_historico(30, tamano_lote=2, max_lotes=2)['atenciones'], 4)
+        self.assertEqual(Atencion.objects.count(), 1)
+        self.assertEqual(self._ids(AtencionHistorica), todas)
+        self.assertEqual(archivar_historico(30, tamano_lote=2)['atenciones'], 1)
+        self.assertEqual(archivar_historico(30, tamano_lote=2), {'atenciones': 0, 'rutas_clinicas': 0})
+
+        self.assertEqual(self._ids(AtencionArchivada), {a.id for a in viejas})
+        self.assertEqual(AtencionHistorica.objects.count(), 5)
+        self.assertFalse(Atencion.objects.exists())
+
+    def test_archivar_rutas_no_dispara_pre_delete(self):
+        # Borrar la última ruta limpia etapa_actual del paciente (rutas_clinicas.signals); archivarla no
+        self._ruta('COMPLETADA', dias_fin=60)
+        Paciente.objects.filter(pk=self.paciente.pk).update(etapa_actual='CONSULTA_MEDICA')
+
+        self.assertEqual(archivar_historico(horizonte_dias=30)['rutas_clinicas'], 1)
+        self.paciente.refresh_from_db()
+        self.assertEqual(self.paciente.etapa_actual, 'CONSULTA_MEDICA')
+
+    def test_api_incluye_lo_archivado(self):
+        archivada, = self._atenciones(('COMPLETADA', 60))
+        caliente, = self._atenciones(('PROGRAMADA', -1))
+        archivar_historico(horizonte_dias=30)
+        cliente = APIClient()
+        cliente.force_authenticate(self.medico)
+
+        respuesta = cliente.get(f'/api/pacientes/{self.paciente.pk}/atenciones/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual({fila['id'] for fila in respuesta.json()}, {str(archivada.id), str(caliente.id)})
+
+        estadisticas = cliente.get('/api/atenciones/estadisticas/').json()
+        self.assertEqual(estadisticas['total'], 2)
+        self.assertEqual(estadisticas['por_estado']['COMPLETADA']['count'], 1)
+
+        # El detalle de una archivada se lee desde la vista histórica, pero no se edita
+        respuesta = cliente.get(f'/api/atenciones/{archivada.id}/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual((respuesta.json()['id'], respuesta.json()['estado']), (str(archivada.id), 'COMPLETADA'))
+        self.assertEqual(cliente.patch(f'/api/atenciones/{archivada.id}/', {'observaciones': 'x'}).status_code, 404)
+        self.assertEqual(cliente.get('/api/atenciones/00000000-0000-0000-0000-000000000000/').status_code, 404)
@@ -41,6 +41,9 @@ urlpatterns = [
     
     # Dashboard
     path('api/dashboard/', include('dashboard.urls')),
+    
+    # Integraciones externas (webhooks)
+    path('api/integraciones/', include('integraciones.urls')),
 ]
 
 # Configuración del admin
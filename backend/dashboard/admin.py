@@ -1,14 +1,29 @@
 from django.contrib import admin
-from django.utils.html import format_html
-from django.utils import timezone
+from django.core.paginator import Paginator
 from django.urls import path
 from django.shortcuts import render
-from django.db.models import Count, Avg, Sum, Q
 from pacientes.models import Paciente
 from boxes.models import Box
 from atenciones.models import Atencion
-from rutas_clinicas.models import RutaClinica
-from users.models import User
+from .instantanea import obtener as obtener_instantanea
+
+# Filas por página en las listas del dashboard del admin
+POR_PAGINA = 25
+
+
+def paginar(request, parametro, filas):
+    # Página ?<parametro>=N de una lista o queryset; fuera de rango da la última
+    pagina = Paginator(filas, POR_PAGINA).get_page(request.GET.get(parametro))
+
+    def enlace(numero):
+        # Conserva la página de las demás listas de la vista
+        params = request.GET.copy()
+        params[parametro] = numero
+        return f'?{params.urlencode()}'
+
+    pagina.enlace_anterior = enlace(pagina.previous_page_number()) if pagina.has_previous() else None
+    pagina.enlace_siguiente = enlace(pagina.next_page_number()) if pagina.has_next() else None
+    return pagina
 
 
 class DashboardAdmin(admin.AdminSite):
@@ -30,8 +45,46 @@ class DashboardMetricas(Paciente):
         verbose_name_plural = "📊 Dashboard y Métricas"
 
 
+class MetricasGeneralesAdmin(admin.ModelAdmin):
+    """
+    Administrador adicional para métricas generales del sistema.
+    DashboardMetricasAdmin lo hereda para publicar la vista de tiempo real.
+    """
+    
+    def get_urls(self):
+        urls = super().get_urls()
+        custom_urls = [
+            path('metricas-tiempo-real/', 
+                 self.admin_site.admin_view(self.metricas_tiempo_real_view),
+                 name='metricas-tiempo-real'),
+        ]
+        return custom_urls + urls
+    
+    def metricas_tiempo_real_view(self, request):
+        """Vista de métricas en tiempo real (listas paginadas)"""
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Métricas en Tiempo Real',
+            'atenciones_activas': paginar(
+                request, 'pagina_atenciones',
+                Atencion.objects.filter(estado='EN_CURSO').select_related(
+                    'paciente', 'medico', 'box'
+                ).order_by('inicio_cronometro', 'id')
+            ),
+            'boxes_ocupados': paginar(
+                request, 'pagina_boxes',
+                Box.objects.filter(estado='OCUPADO').order_by('numero')
+            ),
+            'pacientes_en_espera': paginar(
+                request, 'pagina_pacientes',
+                Paciente.objects.filter(estado_actual='EN_ESPERA').order_by('fecha_ingreso', 'id')
+            ),
+        }
+        return render(request, 'admin/metricas_tiempo_real.html', context)
+
+
 @admin.register(DashboardMetricas)
-class DashboardMetricasAdmin(admin.ModelAdmin):
+class DashboardMetricasAdmin(MetricasGeneralesAdmin):
     """
     Admin personalizado que muestra métricas del sistema.
     No permite agregar/editar/eliminar, solo visualización.
@@ -47,149 +100,61 @@ class DashboardMetricasAdmin(admin.ModelAdmin):
         return False
     
     def changelist_view(self, request, extra_context=None):
-        """Vista personalizada del dashboard con métricas"""
-        
-        # Métricas de Pacientes
-        hoy = timezone.now().date()
-        pacientes_hoy = Paciente.objects.filter(
-            fecha_ingreso__date=hoy,
-            activo=True
-        ).count()
-        
-        pacientes_por_estado = Paciente.objects.filter(
-            activo=True
-        ).values('estado_actual').annotate(
-            total=Count('id')
-        )
-        
-        # Métricas de Boxes
-        boxes_disponibles = Box.objects.filter(
-            estado='DISPONIBLE',
-            activo=True
-        ).count()
-        
-        boxes_ocupados = Box.objects.filter(
-            estado='OCUPADO',
-            activo=True
-        ).count()
-        
-        boxes_total = Box.objects.filter(activo=True).count()
-        
-        ocupacion_porcentaje = (boxes_ocupados / boxes_total * 100) if boxes_total > 0 else 0
-        
-        # Métricas de Atenciones
-        atenciones_hoy = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy
-        ).count()
-        
-        atenciones_en_curso = Atencion.objects.filter(
-            estado='EN_CURSO'
-        ).count()
-        
-        atenciones_completadas_hoy = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy,
-            estado='COMPLETADA'
-        ).count()
-        
-        # Tiempo promedio de atención hoy
-        tiempo_promedio = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy,
-            estado='COMPLETADA',
-            duracion_real__isnull=False
-        ).aggregate(promedio=Avg('duracion_real'))['promedio'] or 0
-        
-        # Métricas de Rutas Clínicas
-        rutas_activas = RutaClinica.objects.filter(
-            estado__in=['INICIADA', 'EN_PROGRESO']
-        ).count()
-        
-        rutas_completadas_hoy = RutaClinica.objects.filter(
-            fecha_fin_real__date=hoy,
-            estado='COMPLETADA'
-        ).count()
-        
-        # Progreso promedio de rutas activas
-        progreso_promedio = RutaClinica.objects.filter(
-            estado__in=['INICIADA', 'EN_PROGRESO']
-        ).aggregate(promedio=Avg('porcentaje_completado'))['promedio'] or 0
-        
-        # Médicos activos hoy (usando User con rol MEDICO)
-        medicos_atendiendo = User.objects.filter(
-            rol='MEDICO',
-            atenciones_medico__fecha_hora_inicio__date=hoy,
-            is_active=True
-        ).distinct().count()
-        
-        medicos_total = User.objects.filter(
-            rol='MEDICO',
-            is_active=True
-        ).count()
-        
-        #Etapas q se han retrasado
-        etapas_retrasadas = 0
-        for ruta in RutaClinica.objects.filter(estado='EN_PROGRESO'):
-            if ruta.detectar_retrasos():
-                etapas_retrasadas += 1
-        
-        # Atenciones por tipo
-        atenciones_por_tipo = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy
-        ).values('tipo_atencion').annotate(
-            total=Count('id')
-        )
-        
-        #Top 5 médicos
-        top_medicos = User.objects.filter(
-            rol='MEDICO',
-            atenciones_medico__fecha_hora_inicio__date=hoy,
-            is_active=True
-        ).annotate(
-            total_atenciones=Count('atenciones_medico')
-        ).order_by('-total_atenciones')[:5]
-        
-        # Boxes más utilizados
-        top_boxes = Box.objects.filter(
-            atenciones__fecha_hora_inicio__date=hoy,
-            activo=True
-        ).annotate(
-            total_atenciones=Count('atenciones')
-        ).order_by('-total_atenciones')[:5]
-        
-        context = extra_context or {}
+        """
+        Vista personalizada del dashboard con métricas.
+        Lee la instantánea compartida con /api/dashboard/metricas/ (ver
+        dashboard/instantanea.py); ?actualizar=1 la recalcula.
+        """
+        instantanea = obtener_instantanea(actualizar=request.GET.get('actualizar') == '1')
+        datos = instantanea.datos
+        pacientes, boxes, atenciones = datos['pacientes'], datos['boxes'], datos['atenciones']
+        rutas, medicos = datos['rutas_clinicas'], datos['medicos']
+        
+        context = {**self.admin_site.each_context(request), **(extra_context or {})}
         context.update({
             'title': 'Dashboard de Métricas',
+            'opts': self.model._meta,
             
             # Métricas generales para dashboard
-            'pacientes_hoy': pacientes_hoy,
-            'pacientes_por_estado': pacientes_por_estado,
-            'atenciones_hoy': atenciones_hoy,
-            'atenciones_en_curso': atenciones_en_curso,
-            'atenciones_completadas_hoy': atenciones_completadas_hoy,
-            'tiempo_promedio_atencion': tiempo_promedio,
+            'pacientes_hoy': pacientes['hoy'],
+            'pacientes_por_estado': [
+                {'estado_actual': estado, 'label': valor['label'], 'total': valor['count']}
+                for estado, valor in pacientes['por_estado'].items() if valor['count']
+            ],
+            'atenciones_hoy': atenciones['hoy'],
+            'atenciones_en_curso': atenciones['en_curso'],
+            'atenciones_completadas_hoy': atenciones['completadas_hoy'],
+            'tiempo_promedio_atencion': atenciones['tiempo_promedio_hoy_minutos'],
             
             # Boxes
-            'boxes_disponibles': boxes_disponibles,
-            'boxes_ocupados': boxes_ocupados,
-            'boxes_total': boxes_total,
-            'ocupacion_porcentaje': ocupacion_porcentaje,
+            'boxes_disponibles': boxes['disponibles'],
+            'boxes_ocupados': boxes['ocupados'],
+            'boxes_total': boxes['total'],
+            'ocupacion_porcentaje': boxes['tasa_ocupacion'],
             
             # Rutas clínicas
-            'rutas_activas': rutas_activas,
-            'rutas_completadas_hoy': rutas_completadas_hoy,
-            'progreso_promedio': progreso_promedio,
+            'rutas_activas': rutas['activas'],
+            'rutas_completadas_hoy': rutas['completadas_hoy'],
+            'progreso_promedio': rutas['progreso_promedio'],
             
             # Médicos
-            'medicos_atendiendo': medicos_atendiendo,
-            'medicos_total': medicos_total,
+            'medicos_atendiendo': medicos['atendiendo_hoy'],
+            'medicos_total': medicos['total_activos'],
             
-            # Detallado
-            'etapas_retrasadas': etapas_retrasadas,
-            'atenciones_por_tipo': atenciones_por_tipo,
-            'top_medicos': top_medicos,
-            'top_boxes': top_boxes,
+            # Detallado (top 5 ya acotados; las retrasadas se paginan)
+            'etapas_retrasadas': rutas['con_retraso'],
+            'atenciones_por_tipo': [
+                {'tipo_atencion': tipo, 'label': valor['label'], 'total': valor['count']}
+                for tipo, valor in atenciones['por_tipo'].items() if valor['count']
+            ],
+            'atenciones_retrasadas': paginar(request, 'pagina_retrasadas', atenciones['retrasadas']),
+            'top_medicos': medicos['top_5_hoy'],
+            'top_boxes': boxes['top_5_hoy'],
+            'alertas': datos['alertas'],
             
             # Metadata
-            'fecha_actual': timezone.now(),
+            'fecha_actual': instantanea.calculado_en,
+            'duracion_calculo_ms': instantanea.duracion_ms,
         })
         
         return render(request, 'admin/dashboard_metricas.html', context)
@@ -198,29 +163,3 @@ class DashboardMetricasAdmin(admin.ModelAdmin):
         css = {
             'all': ('admin/css/dashboard.css',)
         }
-
-
-# Si quieres crear una vista de admin personalizada sin modelo
-class MetricasGeneralesAdmin(admin.ModelAdmin):
-    """
-    Administrador adicional para métricas generales del sistema.
-    """
-    
-    def get_urls(self):
-        urls = super().get_urls()
-        custom_urls = [
-            path('metricas-tiempo-real/', 
-                 self.admin_site.admin_view(self.metricas_tiempo_real_view),
-                 name='metricas-tiempo-real'),
-        ]
-        return custom_urls + urls
-    
-    def metricas_tiempo_real_view(self, request):
-        """Vista de métricas en tiempo real"""
-        context = {
-            'title': 'Métricas en Tiempo Real',
-            'atenciones_activas': Atencion.objects.filter(estado='EN_CURSO'),
-            'boxes_ocupados': Box.objects.filter(estado='OCUPADO'),
-            'pacientes_en_espera': Paciente.objects.filter(estado_actual='EN_ESPERA'),
-        }
-        return render(request, 'admin/metricas_tiempo_real.html', context)
\ No newline at end of file
@@ -1,8 +1,9 @@
 from django.db.models import Avg, Count, Q, F, Sum
 from django.utils import timezone
 from datetime import timedelta
+from config.fechas import filtro_dia
 from atenciones.models import Atencion, Medico
-from boxes.models import Box, OcupacionManual
+from boxes.models import Box, IntervaloOcupacion, OcupacionManual
 from pacientes.models import Paciente
 from users.models import User
 from rutas_clinicas.models import RutaClinica
@@ -13,11 +14,13 @@ class NexaThinkAnalyzer:
     def __init__(self):
         self.insights = []
         self.ahora = timezone.now()
-        self.hoy = self.ahora.date()
+        self.hoy = timezone.localdate(self.ahora)
+        self._ocupacion_boxes_hoy = None
         
     def generar_insights(self):
         # Genera todos los insights disponibles
         self.insights = []
+        self._ocupacion_boxes_hoy = None
         
         # ========== ANÁLISIS ==========
         self._analizar_medicos()
@@ -142,7 +145,7 @@ class NexaThinkAnalyzer:
         # Total de atrasos del día
         atrasos_hoy = Atencion.objects.filter(
             atraso_reportado=True,
-            fecha_reporte_atraso__date=self.hoy
+            **filtro_dia('fecha_reporte_atraso', self.hoy)
         ).count()
         
         if atrasos_hoy > 10:
@@ -379,6 +382,13 @@ class NexaThinkAnalyzer:
                 'data': {'criticos_sin_ruta': criticos_sin_ruta}
             })
     
+    def _porcentaje_ocupacion_hoy(self, box):
+        # Un solo cálculo de solapamiento para todos los boxes, compartido por los analizadores
+        if self._ocupacion_boxes_hoy is None:
+            desde, hasta = IntervaloOcupacion.ventana_hoy()
+            self._ocupacion_boxes_hoy = IntervaloOcupacion.objects.tiempo_ocupado(desde, hasta)
+        return box.calcular_tiempo_ocupacion_hoy(self._ocupacion_boxes_hoy.get(box.id, timedelta()))
+    
     def _analizar_eficiencia_boxes_por_especialidad(self):
         """Analiza eficiencia de boxes por especialidad"""
         boxes = Box.objects.filter(activo=True)
@@ -392,7 +402,7 @@ class NexaThinkAnalyzer:
                     fecha_hora_inicio__gte=ayer
                 ).count()
                 
-                porcentaje_ocupacion = box.calcular_tiempo_ocupacion_hoy()
+                porcentaje_ocupacion = self._porcentaje_ocupacion_hoy(box)
                 
                 if porcentaje_ocupacion < 20 and atenciones_box < 3:
                     self.insights.append({
@@ -490,7 +500,7 @@ class NexaThinkAnalyzer:
         
         boxes_criticos = []
         for box in boxes:
-            porcentaje_ocupacion = box.calcular_tiempo_ocupacion_hoy()
+            porcentaje_ocupacion = self._porcentaje_ocupacion_hoy(box)
             
             # Verificar si hay ocupación manual activa
             tiene_ocupacion_manual = OcupacionManual.objects.filter(
@@ -560,7 +570,7 @@ class NexaThinkAnalyzer:
         # No presentados
         no_presentados_hoy = Atencion.objects.filter(
             estado='NO_PRESENTADO',
-            fecha_actualizacion__date=self.hoy
+            **filtro_dia('fecha_actualizacion', self.hoy)
         ).count()
         
         if no_presentados_hoy > 5:
@@ -0,0 +1,302 @@
+"""
+Instantánea de las métricas generales del dashboard.
+
+Las métricas (unos 40 agregados más el recorrido de las rutas en progreso
+para detectar retrasos) se calculan una vez y se guardan en
+InstantaneaDashboard; /api/dashboard/metricas/ y el dashboard del admin leen
+la misma fila. refrescar_dashboard.py la recalcula cada
+DASHBOARD_INTERVALO_REFRESCO segundos. Un lector también la recalcula si lo
+pide (?actualizar=1), si no existe, si es de otro día o si tiene más de
+DASHBOARD_VIGENCIA_MAXIMA segundos (el proceso de fondo no está corriendo).
+Un lock en el cache evita que varios lectores la recalculen a la vez: los
+demás sirven la anterior mientras tanto.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from atenciones.models import Atencion
+from boxes.models import Box
+from config.fechas import filtro_dia, filtro_dias
+from pacientes.models import Paciente
+from rutas_clinicas.models import RutaClinica
+from users.models import User
+from .models import InstantaneaDashboard
+
+logger = logging.getLogger(__name__)
+
+CLAVE_GENERAL = 'general'
+CLAVE_BLOQUEO = 'dashboard:instantanea:calculando'
+# Máximo que un cálculo retiene el lock si el proceso muere a mitad (segundos)
+BLOQUEO_MAXIMO = 120
+
+
+# ============================================
+# CÁLCULO
+# ============================================
+
+def _conteo_por(queryset, campo, opciones):
+    # Un GROUP BY en vez de un COUNT por opción; las opciones sin filas quedan en 0
+    conteos = dict(queryset.values_list(campo).annotate(total=Count('pk')).order_by())
+    return {
+        clave: {'label': etiqueta, 'count': conteos.get(clave, 0)}
+        for clave, etiqueta in opciones
+    }
+
+
+def _por_dia_local(queryset, campo, desde, hasta):
+    # Filas del rango agrupadas por día local (TruncDate en la zona horaria activa)
+    return queryset.filter(**filtro_dias(campo, desde, hasta)).annotate(
+        dia=TruncDate(campo, tzinfo=timezone.get_current_timezone())
+    ).values('dia').order_by()
+
+
+def calcular_metricas_generales(ahora=None):
+    # Mismo contenido que respondía /api/dashboard/metricas/, más los top de boxes
+    # y el tiempo promedio del día que muestra el admin
+    ahora = ahora or timezone.now()
+    hoy = timezone.localdate(ahora)
+
+    #  MÉTRICAS DE PACIENTES
+    pacientes_activos = Paciente.objects.filter(activo=True)
+    total_pacientes = pacientes_activos.count()
+    pacientes_hoy = pacientes_activos.filter(**filtro_dia('fecha_ingreso', hoy)).count()
+    pacientes_por_estado = _conteo_por(pacientes_activos, 'estado_actual', Paciente.ESTADO_CHOICES)
+    pacientes_por_urgencia = _conteo_por(pacientes_activos, 'nivel_urgencia', Paciente.URGENCIA_CHOICES)
+
+    #  MÉTRICAS DE BOXES
+    boxes_activos = Box.objects.filter(activo=True)
+    total_boxes = boxes_activos.count()
+    boxes_disponibles = boxes_activos.filter(estado='DISPONIBLE').count()
+    boxes_ocupados = boxes_activos.filter(estado='OCUPADO').count()
+    tasa_ocupacion_boxes = round(
+        (boxes_ocupados / total_boxes * 100) if total_boxes > 0 else 0,
+        2
+    )
+    top_boxes_hoy = [
+        {'id': str(box['id']), 'numero': box['numero'], 'nombre': box['nombre'], 'atenciones': box['total_atenciones']}
+        for box in boxes_activos.filter(
+            **filtro_dia('atenciones__fecha_hora_inicio', hoy)
+        ).annotate(
+            total_atenciones=Count('atenciones')
+        ).order_by('-total_atenciones').values('id', 'numero', 'nombre', 'total_atenciones')[:5]
+    ]
+
+    #  MÉTRICAS DE ATENCIONES
+    atenciones_del_dia = Atencion.objects.filter(**filtro_dia('fecha_hora_inicio', hoy))
+    atenciones_hoy = atenciones_del_dia.count()
+    atenciones_completadas_hoy = atenciones_del_dia.filter(estado='COMPLETADA').count()
+    atenciones_en_curso = Atencion.objects.filter(estado='EN_CURSO').count()
+    atenciones_pendientes = Atencion.objects.filter(
+        estado__in=['PROGRAMADA', 'EN_ESPERA']
+    ).count()
+
+    tiempo_promedio_atencion = Atencion.objects.filter(
+        fecha_hora_inicio__gte=ahora - timedelta(days=7),
+        estado='COMPLETADA',
+        duracion_real__isnull=False
+    ).aggregate(promedio=Avg('duracion_real'))['promedio'] or 0
+    tiempo_promedio_hoy = atenciones_del_dia.filter(
+        estado='COMPLETADA',
+        duracion_real__isnull=False
+    ).aggregate(promedio=Avg('duracion_real'))['promedio'] or 0
+
+    atenciones_por_tipo = _conteo_por(atenciones_del_dia, 'tipo_atencion', Atencion.TIPO_ATENCION_CHOICES)
+
+    atenciones_retrasadas = []
+    for atencion in Atencion.objects.filter(estado='EN_CURSO').select_related('paciente', 'box'):
+        if atencion.is_retrasada():
+            atenciones_retrasadas.append({
+                'id': str(atencion.id),
+                'paciente': atencion.paciente.identificador_hash[:12],
+                'box': atencion.box.numero,
+                'retraso_minutos': atencion.calcular_retraso()
+            })
+
+    #  MÉTRICAS DE RUTAS CLÍNICAS
+    rutas_en_curso = RutaClinica.objects.filter(estado__in=['INICIADA', 'EN_PROGRESO'])
+    rutas_activas = rutas_en_curso.count()
+    rutas_completadas_hoy = RutaClinica.objects.filter(
+        **filtro_dia('fecha_fin_real', hoy),
+        estado='COMPLETADA'
+    ).count()
+    rutas_pausadas = RutaClinica.objects.filter(esta_pausado=True).count()
+    progreso_promedio_rutas = rutas_en_curso.aggregate(
+        promedio=Avg('porcentaje_completado')
+    )['promedio'] or 0
+
+    # detectar_retrasos solo usa timestamps_etapas: no se cargan las demás columnas
+    rutas_con_retraso = sum(
+        1 for ruta in RutaClinica.objects.filter(estado='EN_PROGRESO').only('id', 'timestamps_etapas')
+        .iterator(chunk_size=2000)
+        if ruta.detectar_retrasos()
+    )
+
+    #  MÉTRICAS DE MÉDICOS
+    medicos = User.objects.filter(rol='MEDICO', is_active=True)
+    medicos_activos = medicos.count()
+    medicos_hoy = medicos.filter(**filtro_dia('atenciones_medico__fecha_hora_inicio', hoy))
+    medicos_atendiendo_hoy = medicos_hoy.distinct().count()
+    top_medicos_data = [
+        {
+            'id': str(medico.id),
+            'nombre': medico.nombre_completo,
+            'especialidad': medico.get_especialidad_display() if medico.especialidad else 'Sin especialidad',
+            'atenciones': medico.total_atenciones
+        }
+        for medico in medicos_hoy.annotate(
+            total_atenciones=Count('atenciones_medico')
+        ).order_by('-total_atenciones')[:5]
+    ]
+
+    #  TENDENCIAS (ÚLTIMOS 7 DÍAS): un GROUP BY por día local y tabla
+    desde = hoy - timedelta(days=6)
+    atenciones_por_dia = {
+        fila['dia']: fila
+        for fila in _por_dia_local(Atencion.objects.all(), 'fecha_hora_inicio', desde, hoy).annotate(
+            atenciones=Count('pk'), completadas=Count('pk', filter=Q(estado='COMPLETADA'))
+        )
+    }
+    pacientes_por_dia = dict(
+        _por_dia_local(pacientes_activos, 'fecha_ingreso', desde, hoy).annotate(total=Count('pk')).values_list('dia', 'total')
+    )
+    tendencias = []
+    for i in range(7):
+        dia = desde + timedelta(days=i)
+        fila = atenciones_por_dia.get(dia, {})
+        tendencias.append({
+            'fecha': dia.isoformat(),
+            'pacientes': pacientes_por_dia.get(dia, 0),
+            'atenciones': fila.get('atenciones', 0),
+            'completadas': fila.get('completadas', 0)
+        })
+
+    # ===== ALERTAS =====
+    alertas = []
+
+    if len(atenciones_retrasadas) > 0:
+        alertas.append({
+            'tipo': 'warning',
+            'titulo': 'Atenciones Retrasadas',
+            'mensaje': f'{len(atenciones_retrasadas)} atenciones están retrasadas',
+            'prioridad': 'alta'
+        })
+
+    if tasa_ocupacion_boxes > 80:
+        alertas.append({
+            'tipo': 'warning',
+            'titulo': 'Alta Ocupación de Boxes',
+            'mensaje': f'{tasa_ocupacion_boxes}% de boxes ocupados',
+            'prioridad': 'media'
+        })
+
+    if rutas_pausadas > 5:
+        alertas.append({
+            'tipo': 'info',
+            'titulo': 'Rutas Pausadas',
+            'mensaje': f'{rutas_pausadas} rutas clínicas están pausadas',
+            'prioridad': 'baja'
+        })
+
+    if rutas_con_retraso > 0:
+        alertas.append({
+            'tipo': 'warning',
+            'titulo': 'Rutas con Retraso',
+            'mensaje': f'{rutas_con_retraso} rutas clínicas presentan retrasos',
+            'prioridad': 'alta'
+        })
+
+    return {
+        'timestamp': ahora.isoformat(),
+        'fecha_hoy': hoy.isoformat(),
+
+        'pacientes': {
+            'total': total_pacientes,
+            'hoy': pacientes_hoy,
+            'por_estado': pacientes_por_estado,
+            'por_urgencia': pacientes_por_urgencia,
+        },
+
+        'boxes': {
+            'total': total_boxes,
+            'disponibles': boxes_disponibles,
+            'ocupados': boxes_ocupados,
+            'tasa_ocupacion': tasa_ocupacion_boxes,
+            'top_5_hoy': top_boxes_hoy,
+        },
+
+        'atenciones': {
+            'hoy': atenciones_hoy,
+            'completadas_hoy': atenciones_completadas_hoy,
+            'en_curso': atenciones_en_curso,
+            'pendientes': atenciones_pendientes,
+            'tiempo_promedio_minutos': round(tiempo_promedio_atencion, 1),
+            'tiempo_promedio_hoy_minutos': round(tiempo_promedio_hoy, 1),
+            'por_tipo': atenciones_por_tipo,
+            'retrasadas': atenciones_retrasadas,
+        },
+
+        'rutas_clinicas': {
+            'activas': rutas_activas,
+            'completadas_hoy': rutas_completadas_hoy,
+            'pausadas': rutas_pausadas,
+            'progreso_promedio': round(progreso_promedio_rutas, 1),
+            'con_retraso': rutas_con_retraso,
+        },
+
+        'medicos': {
+            'total_activos': medicos_activos,
+            'atendiendo_hoy': medicos_atendiendo_hoy,
+            'top_5_hoy': top_medicos_data,
+        },
+
+        'tendencias_7_dias': tendencias,
+        'alertas': alertas,
+    }
+
+
+# ============================================
+# LECTURA Y REFRESCO
+# ============================================
+
+def refrescar():
+    # Recalcula y guarda la instantánea; retorna la fila guardada
+    inicio = time.monotonic()
+    ahora = timezone.now()
+    datos = calcular_metricas_generales(ahora)
+    duracion_ms = int((time.monotonic() - inicio) * 1000)
+    instantanea, _ = InstantaneaDashboard.objects.update_or_create(
+        clave=CLAVE_GENERAL,
+        defaults={'datos': datos, 'calculado_en': ahora, 'duracion_ms': duracion_ms},
+    )
+    logger.info('Instantánea del dashboard recalculada', extra={'duracion_ms': duracion_ms})
+    return instantanea
+
+
+def _vigente(instantanea, ahora):
+    return (
+        instantanea.datos.get('fecha_hoy') == timezone.localdate(ahora).isoformat()
+        and (ahora - instantanea.calculado_en).total_seconds() <= settings.DASHBOARD_VIGENCIA_MAXIMA
+    )
+
+
+def obtener(actualizar=False):
+    # Instantánea para mostrar: la guardada si está vigente, si no una recién calculada
+    instantanea = InstantaneaDashboard.objects.filter(clave=CLAVE_GENERAL).first()
+    if instantanea is not None and not actualizar and _vigente(instantanea, timezone.now()):
+        return instantanea
+    if not cache.add(CLAVE_BLOQUEO, True, timeout=BLOQUEO_MAXIMO):
+        # Otro lector la está recalculando: se sirve la anterior si existe
+        if instantanea is not None:
+            return instantanea
+        return refrescar()
+    try:
+        return refrescar()
+    finally:
+        cache.delete(CLAVE_BLOQUEO)
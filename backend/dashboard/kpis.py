@@ -0,0 +1,184 @@
+"""
+Motor de KPIs de atenciones calculado en la base de datos.
+
+Los percentiles se obtienen desde histogramas agregados por minuto: la base
+agrupa (grupo, minuto) y devuelve solo los conteos, así el volumen que viaja a
+Python depende de la cantidad de grupos y no de la cantidad de atenciones.
+Funciona igual en SQLite y PostgreSQL con resolución de 1 minuto.
+"""
+from datetime import timedelta
+
+from django.db import NotSupportedError
+from django.db.models import Avg, Count, F, FloatField, Func, Q
+from django.db.models.functions import Floor, TruncDate
+from django.utils import timezone
+
+from atenciones.models import AtencionHistorica
+from boxes.models import Box
+from config.fechas import rango_dias
+from users.models import User
+
+
+AGRUPACIONES = {
+    'dia': 'dia',
+    'medico': 'medico_id',
+    'box': 'box_id',
+    'especialidad': 'medico__especialidad',
+}
+PERCENTILES = (50, 90, 99)
+DIAS_POR_DEFECTO = 30
+
+
+class MinutosEntre(Func):
+    # Minutos (con decimales) transcurridos entre dos columnas datetime
+    arity = 2
+    output_field = FloatField()
+
+    def _compilar(self, compiler):
+        inicio, fin = self.source_expressions
+        sql_inicio, params_inicio = compiler.compile(inicio)
+        sql_fin, params_fin = compiler.compile(fin)
+        return sql_inicio, sql_fin, (*params_fin, *params_inicio)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julianday es un float: se redondea al milisegundo para que 20 minutos
+        # exactos no queden en 19,9999… y caigan en el balde del minuto anterior
+        inicio, fin, params = self._compilar(compiler)
+        return f'(ROUND((julianday({fin}) - julianday({inicio})) * 86400000.0) / 60000.0)', params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        inicio, fin, params = self._compilar(compiler)
+        return f'(EXTRACT(EPOCH FROM ({fin} - {inicio})) / 60.0)', params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'MinutosEntre no está implementado para {connection.vendor}')
+
+
+def espera_minutos():
+    # Espera real: desde la hora programada hasta que el médico inicia el cronómetro
+    return MinutosEntre(F('fecha_hora_inicio'), F('inicio_cronometro'))
+
+
+def percentiles_desde_histograma(histograma, percentiles=PERCENTILES):
+    # histograma: {valor: conteo}. Percentil por rango más cercano.
+    total = sum(histograma.values())
+    if not total:
+        return {f'p{p}': None for p in percentiles}
+
+    resultado = {}
+    objetivos = sorted((max(1, -(-p * total // 100)), p) for p in percentiles)
+    acumulado = 0
+    pendientes = iter(objetivos)
+    rango, p = next(pendientes)
+    for valor in sorted(histograma):
+        acumulado += histograma[valor]
+        while p is not None and acumulado >= rango:
+            resultado[f'p{p}'] = valor
+            rango, p = next(pendientes, (None, None))
+    return resultado
+
+
+def calcular_kpis(desde=None, hasta=None, agrupar_por=None):
+    """
+    Calcula espera, duración y tasa de completitud para las atenciones
+    programadas entre `desde` y `hasta` (fechas locales, inclusive).
+
+    agrupar_por: None, 'dia', 'medico', 'box' o 'especialidad'.
+    """
+    if agrupar_por is not None and agrupar_por not in AGRUPACIONES:
+        raise ValueError(f"agrupar_por debe ser uno de: {', '.join(AGRUPACIONES)}")
+
+    hasta = hasta or timezone.localdate()
+    desde = desde or hasta - timedelta(days=DIAS_POR_DEFECTO - 1)
+    if desde > hasta:
+        raise ValueError('La fecha "desde" no puede ser posterior a "hasta"')
+    inicio, fin = rango_dias(desde, hasta)
+
+    # Vista histórica: el rango puede ir más atrás del horizonte de archivo
+    queryset = AtencionHistorica.objects.filter(
+        fecha_hora_inicio__gte=inicio,
+        fecha_hora_inicio__lt=fin,
+    ).order_by()
+    if agrupar_por == 'dia':
+        queryset = queryset.annotate(dia=TruncDate('fecha_hora_inicio', tzinfo=timezone.get_current_timezone()))
+
+    campo = AGRUPACIONES.get(agrupar_por)
+    campos = [campo] if campo else []
+    completadas = Q(estado='COMPLETADA')
+    con_cronometro = completadas & Q(inicio_cronometro__isnull=False)
+
+    # 1. Conteos y promedios por grupo
+    agregados = dict(
+        total=Count('id'),
+        completadas=Count('id', filter=completadas),
+        canceladas=Count('id', filter=Q(estado='CANCELADA')),
+        no_presentados=Count('id', filter=Q(estado='NO_PRESENTADO')),
+        espera_promedio=Avg(espera_minutos(), filter=con_cronometro),
+        duracion_promedio=Avg('duracion_real', filter=completadas & Q(duracion_real__isnull=False)),
+    )
+    if campos:
+        conteos = list(queryset.values(*campos).annotate(**agregados))
+    else:
+        conteos = [queryset.aggregate(**agregados)]
+
+    # 2. Histogramas por minuto (espera y duración real)
+    histograma_espera = queryset.filter(con_cronometro).annotate(
+        minuto=Floor(espera_minutos())
+    ).values(*campos, 'minuto').annotate(n=Count('id'))
+    histograma_duracion = queryset.filter(completadas, duracion_real__isnull=False).values(
+        *campos, 'duracion_real'
+    ).annotate(n=Count('id'))
+
+    esperas, duraciones = {}, {}
+    for fila in histograma_espera:
+        esperas.setdefault(fila.get(campo), {})[int(fila['minuto'])] = fila['n']
+    for fila in histograma_duracion:
+        duraciones.setdefault(fila.get(campo), {})[fila['duracion_real']] = fila['n']
+
+    etiquetas = etiquetas_de_grupo(agrupar_por, [fila.get(campo) for fila in conteos])
+
+    grupos = []
+    for fila in conteos:
+        clave = fila.get(campo)
+        grupos.append({
+            'clave': str(clave) if clave is not None else None,
+            'etiqueta': etiquetas.get(clave, str(clave) if clave is not None else 'Total'),
+            'total': fila['total'],
+            'completadas': fila['completadas'],
+            'canceladas': fila['canceladas'],
+            'no_presentados': fila['no_presentados'],
+            'tasa_completitud': round(fila['completadas'] / fila['total'] * 100, 1) if fila['total'] else 0,
+            'espera_minutos': {
+                'promedio': round(fila['espera_promedio'], 1) if fila['espera_promedio'] is not None else None,
+                **percentiles_desde_histograma(esperas.get(clave, {})),
+            },
+            'duracion_minutos': {
+                'promedio': round(fila['duracion_promedio'], 1) if fila['duracion_promedio'] is not None else None,
+                **percentiles_desde_histograma(duraciones.get(clave, {})),
+            },
+        })
+    grupos.sort(key=lambda g: (g['clave'] is None, g['clave'] if agrupar_por == 'dia' else g['etiqueta']))
+
+    return {
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'agrupar_por': agrupar_por,
+        'grupos': grupos,
+    }
+
+
+def etiquetas_de_grupo(agrupar_por, claves):
+    # Nombres legibles para las claves de grupo (una consulta como máximo)
+    claves = [c for c in claves if c is not None]
+    if agrupar_por == 'medico':
+        return {
+            u.id: u.get_full_name() or u.username
+            for u in User.objects.filter(id__in=claves).only('id', 'username', 'first_name', 'last_name')
+        }
+    if agrupar_por == 'box':
+        return dict(Box.objects.filter(id__in=claves).values_list('id', 'numero'))
+    if agrupar_por == 'especialidad':
+        return {c: dict(User.ESPECIALIDAD_CHOICES).get(c, c) for c in claves}
+    if agrupar_por == 'dia':
+        return {c: c.isoformat() for c in claves}
+    return {}
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InstantaneaDashboard',
+            fields=[
+                ('clave', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('datos', models.JSONField()),
+                ('calculado_en', models.DateTimeField()),
+                ('duracion_ms', models.PositiveIntegerField(default=0, help_text='Tiempo que tomó calcular la instantánea')),
+            ],
+            options={
+                'verbose_name': 'Instantánea del Dashboard',
+                'verbose_name_plural': 'Instantáneas del Dashboard',
+                'db_table': 'instantaneas_dashboard',
+            },
+        ),
+    ]
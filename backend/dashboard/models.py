@@ -1,3 +1,24 @@
 from django.db import models
 
 
+class InstantaneaDashboard(models.Model):
+    """
+    Métricas del dashboard precalculadas (ver dashboard/instantanea.py). La API
+    y el admin leen la última; refrescar_dashboard.py la recalcula de fondo.
+    """
+    
+    clave = models.CharField(max_length=50, primary_key=True)
+    datos = models.JSONField()
+    calculado_en = models.DateTimeField()
+    duracion_ms = models.PositiveIntegerField(
+        default=0,
+        help_text="Tiempo que tomó calcular la instantánea"
+    )
+    
+    class Meta:
+        db_table = 'instantaneas_dashboard'
+        verbose_name = 'Instantánea del Dashboard'
+        verbose_name_plural = 'Instantáneas del Dashboard'
+    
+    def __str__(self):
+        return f"{self.clave} - {self.calculado_en:%d/%m/%Y %H:%M:%S}"
@@ -1,2 +1,366 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
+from django.core.cache import cache
+from django.db import DatabaseError, NotSupportedError, connections
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from atenciones.models import Atencion
+from boxes.models import Box
+from config.presupuesto_consultas import PresupuestoAdminMixin, rut_sintetico
+from config.replicas import lectura_en_replica, olvidar_retraso
+from pacientes.models import Paciente
+from users.models import User
+from .admin import POR_PAGINA, DashboardMetricas
+from .instantanea import CLAVE_BLOQUEO, calcular_metricas_generales, refrescar
+from .kpis import MinutosEntre, calcular_kpis, percentiles_desde_histograma
+from .models import InstantaneaDashboard
+
+
+@override_settings(REPLICA_LECTURA='replica', REPLICA_RETRASO_MAXIMO=5)
+class RouterReplicaTests(TestCase):
+    # 'default' y 'replica' son dos bases locales distintas: lo escrito en la
+    # primaria no aparece en la réplica, así se ve desde dónde leyó cada vista.
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        olvidar_retraso()
+        self.admin = User.objects.create_superuser(
+            'admin_replica', 'admin_replica@nexalud.admin.com', 'clave-replica'
+        )
+        self.box = Box.objects.create(
+            numero='BX-R1', nombre='Box réplica', especialidad='GENERAL', estado='DISPONIBLE'
+        )
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+
+    def _consultas_por_base(self, url):
+        with CaptureQueriesContext(connections['default']) as primaria, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            respuesta = self.cliente.get(url)
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+        return respuesta, len(primaria), len(replica)
+
+    def test_vista_dashboard_lee_de_la_replica(self):
+        respuesta, en_primaria, en_replica = self._consultas_por_base('/api/dashboard/tiempo-real/')
+        self.assertEqual(en_primaria, 0)
+        self.assertGreater(en_replica, 0)
+        # El box existe solo en la primaria
+        self.assertEqual(respuesta.data['boxes_disponibles'], 0)
+
+    def test_accion_estadisticas_lee_de_la_replica(self):
+        _, en_primaria, en_replica = self._consultas_por_base('/api/boxes/estadisticas/')
+        self.assertEqual(en_primaria, 0)
+        self.assertGreater(en_replica, 0)
+
+    def test_acciones_sin_opt_in_leen_de_la_primaria(self):
+        _, en_primaria, en_replica = self._consultas_por_base('/api/boxes/')
+        self.assertGreater(en_primaria, 0)
+        self.assertEqual(en_replica, 0)
+
+    def test_replica_atrasada_vuelve_a_la_primaria(self):
+        with mock.patch('config.replicas.medir_retraso', return_value=30.0):
+            respuesta, en_primaria, en_replica = self._consultas_por_base('/api/dashboard/tiempo-real/')
+        self.assertEqual(en_replica, 0)
+        self.assertEqual(respuesta.data['boxes_disponibles'], 1)
+
+    def test_retraso_no_medible_vuelve_a_la_primaria(self):
+        with mock.patch('config.replicas.medir_retraso', side_effect=DatabaseError('sin conexión')):
+            _, en_primaria, en_replica = self._consultas_por_base('/api/dashboard/tiempo-real/')
+        self.assertGreater(en_primaria, 0)
+        self.assertEqual(en_replica, 0)
+
+    def test_usuario_que_acaba_de_escribir_lee_de_la_primaria(self):
+        respuesta = self.cliente.patch(f'/api/boxes/{self.box.id}/', {'nombre': 'Box editado'}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.content)
+
+        _, en_primaria, en_replica = self._consultas_por_base('/api/dashboard/tiempo-real/')
+        self.assertEqual(en_replica, 0)
+
+        # Otro usuario sin escrituras recientes sigue en la réplica
+        otro = User.objects.create_superuser('otro_replica', 'otro_replica@nexalud.admin.com', 'clave-replica')
+        self.cliente.force_authenticate(otro)
+        _, en_primaria, en_replica = self._consultas_por_base('/api/dashboard/tiempo-real/')
+        self.assertEqual(en_primaria, 0)
+
+    def test_escritura_devuelve_el_resto_del_bloque_a_la_primaria(self):
+        with lectura_en_replica(self.admin):
+            self.assertEqual(Box.objects.all().db, 'replica')
+            self.box.nombre = 'Box guardado'
+            self.box.save()
+            self.assertEqual(self.box._state.db, 'default')
+            self.assertEqual(Box.objects.all().db, 'default')
+        self.assertEqual(Box.objects.all().db, 'default')
+
+    @override_settings(REPLICA_LECTURA=None)
+    def test_sin_replica_configurada_todo_va_a_la_primaria(self):
+        with lectura_en_replica(self.admin):
+            self.assertEqual(Box.objects.all().db, 'default')
+
+
+class PercentilesHistogramaTests(TestCase):
+    # Percentil por rango más cercano: el menor valor cuyo acumulado alcanza ceil(p·N/100)
+
+    def test_histograma_vacio(self):
+        self.assertEqual(percentiles_desde_histograma({}), {'p50': None, 'p90': None, 'p99': None})
+
+    def test_un_solo_valor(self):
+        self.assertEqual(percentiles_desde_histograma({7: 1}), {'p50': 7, 'p90': 7, 'p99': 7})
+
+    def test_empates(self):
+        self.assertEqual(percentiles_desde_histograma({5: 10}), {'p50': 5, 'p90': 5, 'p99': 5})
+        self.assertEqual(percentiles_desde_histograma({1: 50, 100: 50}), {'p50': 1, 'p90': 100, 'p99': 100})
+
+    def test_rango_mas_cercano(self):
+        histograma = {valor: 1 for valor in range(1, 11)}
+        self.assertEqual(percentiles_desde_histograma(histograma), {'p50': 5, 'p90': 9, 'p99': 10})
+        self.assertEqual(percentiles_desde_histograma(histograma, percentiles=(10, 100)), {'p10': 1, 'p100': 10})
+
+
+class MinutosEntreTests(TestCase):
+    # SQL distinto por motor: se compila con un compilador falso para ver la forma
+
+    def _sql(self, metodo):
+        compilador = mock.Mock(compile=lambda expresion: (f'"{expresion.name}"', []))
+        return metodo(compilador, mock.Mock(vendor='oracle'))
+
+    def test_sql_por_motor(self):
+        expresion = MinutosEntre(F('fecha_hora_inicio'), F('inicio_cronometro'))
+        self.assertEqual(
+            self._sql(expresion.as_sqlite),
+            ('(ROUND((julianday("inicio_cronometro") - julianday("fecha_hora_inicio")) * 86400000.0) / 60000.0)', ()),
+        )
+        self.assertEqual(
+            self._sql(expresion.as_postgresql),
+            ('(EXTRACT(EPOCH FROM ("inicio_cronometro" - "fecha_hora_inicio")) / 60.0)', ()),
+        )
+        with self.assertRaises(NotSupportedError):
+            self._sql(expresion.as_sql)
+
+    def test_minutos_en_la_base(self):
+        paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Minutos',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        medico = User.objects.create_user('medico_minutos', 'medico_minutos@nexalud.medico.com', 'x',
+            rol='MEDICO', especialidad='MEDICINA_GENERAL',
+        )
+        box = Box.objects.create(numero='BX-M1', nombre='Box minutos')
+        inicio = timezone.now() - timedelta(days=1)
+        Atencion.objects.bulk_create([Atencion(
+            paciente=paciente, medico=medico, box=box, fecha_hora_inicio=inicio,
+            duracion_planificada=30, inicio_cronometro=inicio + timedelta(minutes=7, seconds=30),
+        )])
+        minutos = Atencion.objects.annotate(
+            espera=MinutosEntre(F('fecha_hora_inicio'), F('inicio_cronometro'))
+        ).get().espera
+        self.assertEqual(minutos, 7.5)
+
+
+class CalcularKpisTests(TestCase):
+    # Conteos, promedios y percentiles calculados en la base, en total y por grupo
+
+    def setUp(self):
+        self.dia = timezone.localdate() - timedelta(days=10)
+        paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Paciente', apellido_paterno='Kpi',
+            fecha_nacimiento=date(1980, 1, 1), telefono='+56912345678',
+        )
+        self.medico_a = User.objects.create_user(
+            'medico_kpi_a', 'medico_kpi_a@nexalud.medico.com', 'x',
+            rol='MEDICO', especialidad='CARDIOLOGIA', first_name='Ana', last_name='Kpi',
+        )
+        self.medico_b = User.objects.create_user(
+            'medico_kpi_b', 'medico_kpi_b@nexalud.medico.com', 'x',
+            rol='MEDICO', especialidad='PEDIATRIA', first_name='Bruno', last_name='Kpi',
+        )
+        self.box_a = Box.objects.create(numero='BX-KA', nombre='Box A')
+        self.box_b = Box.objects.create(numero='BX-KB', nombre='Box B')
+
+        def atencion(medico, box, hora, estado, espera=None, duracion=None, dia=self.dia):
+            inicio = timezone.make_aware(datetime.combine(dia, datetime.min.time()) + timedelta(hours=hora))
+            return Atencion(
+                paciente=paciente, medico=medico, box=box, fecha_hora_inicio=inicio,
+                duracion_planificada=30, estado=estado, duracion_real=duracion,
+                inicio_cronometro=inicio + timedelta(minutes=espera) if espera is not None else None,
+            )
+
+        Atencion.objects.bulk_create([
+            atencion(self.medico_a, self.box_a, 9, 'COMPLETADA', espera=0, duracion=15),
+            atencion(self.medico_a, self.box_a, 10, 'COMPLETADA', espera=10, duracion=20),
+            atencion(self.medico_a, self.box_a, 11, 'COMPLETADA', espera=20, duracion=43),
+            atencion(self.medico_a, self.box_a, 12, 'CANCELADA'),
+            atencion(self.medico_b, self.box_b, 9, 'COMPLETADA', espera=6, duracion=30),
+            atencion(self.medico_b, self.box_b, 10, 'NO_PRESENTADO'),
+            # Fuera del rango consultado
+            atencion(self.medico_a, self.box_a, 9, 'COMPLETADA', espera=90, duracion=90,
+                     dia=self.dia - timedelta(days=1)),
+        ])
+
+    def test_total(self):
+        reporte = calcular_kpis(desde=self.dia, hasta=self.dia)
+        self.assertEqual(reporte['desde'], self.dia.isoformat())
+        [total] = reporte['grupos']
+        self.assertEqual(total['etiqueta'], 'Total')
+        self.assertEqual(
+            (total['total'], total['completadas'], total['canceladas'], total['no_presentados']),
+            (6, 4, 1, 1),
+        )
+        self.assertEqual(total['tasa_completitud'], 66.7)
+        self.assertEqual(total['espera_minutos'], {'promedio': 9.0, 'p50': 6, 'p90': 20, 'p99': 20})
+        self.assertEqual(total['duracion_minutos'], {'promedio': 27.0, 'p50': 20, 'p90': 43, 'p99': 43})
+
+    def test_agrupado_por_medico(self):
+        grupos = {g['clave']: g for g in calcular_kpis(self.dia, self.dia, agrupar_por='medico')['grupos']}
+        grupo_a = grupos[str(self.medico_a.id)]
+        self.assertEqual(grupo_a['etiqueta'], 'Ana Kpi')
+        self.assertEqual((grupo_a['total'], grupo_a['tasa_completitud']), (4, 75.0))
+        self.assertEqual(grupo_a['espera_minutos']['p50'], 10)
+        grupo_b = grupos[str(self.medico_b.id)]
+        self.assertEqual((grupo_b['total'], grupo_b['tasa_completitud']), (2, 50.0))
+        self.assertEqual(grupo_b['duracion_minutos'], {'promedio': 30.0, 'p50': 30, 'p90': 30, 'p99': 30})
+
+    def test_agrupado_por_dia_box_y_especialidad(self):
+        reporte = calcular_kpis(self.dia - timedelta(days=1), self.dia, agrupar_por='dia')
+        self.assertEqual(
+            [(g['etiqueta'], g['total']) for g in reporte['grupos']],
+            [((self.dia - timedelta(days=1)).isoformat(), 1), (self.dia.isoformat(), 6)],
+        )
+        reporte = calcular_kpis(self.dia, self.dia, agrupar_por='box')
+        self.assertEqual([(g['etiqueta'], g['total']) for g in reporte['grupos']], [('BX-KA', 4), ('BX-KB', 2)])
+        reporte = calcular_kpis(self.dia, self.dia, agrupar_por='especialidad')
+        self.assertEqual([g['clave'] for g in reporte['grupos']], ['CARDIOLOGIA', 'PEDIATRIA'])
+
+    def test_parametros_invalidos(self):
+        with self.assertRaises(ValueError):
+            calcular_kpis(agrupar_por='paciente')
+        with self.assertRaises(ValueError):
+            calcular_kpis(desde=self.dia, hasta=self.dia - timedelta(days=1))
+
+    def test_endpoint(self):
+        cliente = APIClient()
+        cliente.force_authenticate(self.medico_a)
+        self.assertEqual(cliente.get('/api/dashboard/kpis/').status_code, 403)
+
+        admin = User.objects.create_superuser('admin_kpi', 'admin_kpi@nexalud.admin.com', 'clave-kpi')
+        cliente.force_authenticate(admin)
+        respuesta = cliente.get('/api/dashboard/kpis/', {
+            'desde': self.dia.isoformat(), 'hasta': self.dia.isoformat(), 'agrupar_por': 'box',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['agrupar_por'], 'box')
+        self.assertEqual([g['total'] for g in respuesta.data['grupos']], [4, 2])
+
+        self.assertEqual(cliente.get('/api/dashboard/kpis/', {'agrupar_por': 'paciente'}).status_code, 400)
+        self.assertEqual(cliente.get('/api/dashboard/kpis/', {'desde': 'ayer'}).status_code, 400)
+
+
+class InstantaneaDashboardTests(TestCase):
+    # Métricas precalculadas compartidas por la API y el admin (dashboard/instantanea.py)
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            'admin_instantanea', 'admin_instantanea@nexalud.admin.com', 'clave-instantanea'
+        )
+        Box.objects.create(numero='BX-I1', nombre='Box 1', especialidad='GENERAL', estado='OCUPADO')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+
+    def _boxes_api(self, params=''):
+        respuesta = self.cliente.get(f'/api/dashboard/metricas/{params}')
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data['boxes']
+
+    def test_api_y_admin_leen_la_misma_instantanea(self):
+        self.assertEqual(self._boxes_api()['total'], 1)
+        Box.objects.create(numero='BX-I2', nombre='Box 2', especialidad='GENERAL', estado='DISPONIBLE')
+
+        # Vigente: se sirve sin recalcular, con una sola consulta de métricas
+        with CaptureQueriesContext(connections['default']) as consultas:
+            self.assertEqual(self._boxes_api()['total'], 1)
+        self.assertEqual(sum('instantaneas_dashboard' in c['sql'] for c in consultas.captured_queries), 1)
+        self.assertFalse(any('"boxes"' in c['sql'] for c in consultas.captured_queries))
+
+        self.client.force_login(self.admin)
+        respuesta = self.client.get('/admin/dashboard/dashboardmetricas/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['boxes_total'], 1)
+
+        # Pedida explícitamente, o vencida, se recalcula
+        self.assertEqual(self._boxes_api('?actualizar=1')['total'], 2)
+        Box.objects.create(numero='BX-I3', nombre='Box 3', especialidad='GENERAL', estado='DISPONIBLE')
+        InstantaneaDashboard.objects.update(calculado_en=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self._boxes_api()['total'], 3)
+
+    def test_tendencias_por_dia_local(self):
+        medico = User.objects.create_user(
+            'medico_tendencias', 'medico_tendencias@nexalud.medico.com', 'clave', rol='MEDICO',
+            especialidad='MEDICINA_GENERAL'
+        )
+        paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Ana', apellido_paterno='Soto', fecha_nacimiento=date(1980, 1, 1),
+        )
+        box = Box.objects.get(numero='BX-I1')
+        hoy = timezone.localdate()
+
+        def a_las(dias_atras, hora, minuto):
+            return timezone.make_aware(datetime.combine(hoy - timedelta(days=dias_atras), time(hora, minuto)))
+
+        # 23:30 y 00:15 locales caen en días UTC distintos a su día local
+        for inicio in (a_las(1, 23, 30), a_las(0, 0, 15), a_las(3, 10, 0), a_las(10, 10, 0)):
+            Atencion.objects.create(
+                paciente=paciente, medico=medico, box=box, fecha_hora_inicio=inicio, duracion_planificada=20,
+            )
+        Atencion.objects.filter(fecha_hora_inicio=a_las(1, 23, 30)).update(estado='COMPLETADA')
+
+        with CaptureQueriesContext(connections['default']) as consultas:
+            tendencias = calcular_metricas_generales()['tendencias_7_dias']
+        self.assertEqual([t['fecha'] for t in tendencias], [(hoy - timedelta(days=6 - i)).isoformat() for i in range(7)])
+        self.assertEqual([t['atenciones'] for t in tendencias], [0, 0, 0, 1, 0, 1, 1])
+        self.assertEqual([t['completadas'] for t in tendencias], [0, 0, 0, 0, 0, 1, 0])
+        self.assertEqual(tendencias[-1]['pacientes'], 1)
+        # Un GROUP BY por tabla, no tres COUNT por día
+        self.assertEqual(sum('GROUP BY' in c['sql'] and 'fecha_ingreso' in c['sql']
+                             for c in consultas.captured_queries), 1)
+
+    def test_otro_lector_calculando_sirve_la_anterior(self):
+        refrescar()
+        InstantaneaDashboard.objects.update(calculado_en=timezone.now() - timedelta(hours=1))
+        cache.add(CLAVE_BLOQUEO, True)
+        with mock.patch('dashboard.instantanea.calcular_metricas_generales') as calcular:
+            self.assertEqual(self._boxes_api()['total'], 1)
+        calcular.assert_not_called()
+
+    def test_tiempo_real_pagina_las_listas(self):
+        Box.objects.bulk_create([
+            Box(numero=f'BX-P{i}', nombre=f'Box {i}', especialidad='GENERAL', estado='OCUPADO')
+            for i in range(POR_PAGINA + 5)
+        ])
+        self.client.force_login(self.admin)
+        url = reverse('admin:metricas-tiempo-real')
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        pagina = respuesta.context['boxes_ocupados']
+        self.assertEqual(len(pagina.object_list), POR_PAGINA)
+        self.assertEqual(pagina.paginator.count, POR_PAGINA + 6)
+
+        respuesta = self.client.get(url, {'pagina_boxes': 2})
+        self.assertEqual(len(respuesta.context['boxes_ocupados'].object_list), 6)
+
+
+class DashboardAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # El dashboard del admin lee la instantánea: su costo no depende del volumen
+    app_label = 'dashboard'
+    presupuestos_admin = {
+        DashboardMetricas: 4,
+    }
+
+    def poblar(self, escenario):
+        refrescar()
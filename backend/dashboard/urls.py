@@ -21,4 +21,9 @@ urlpatterns = [
     path('nexathink-insights/', 
          views.nexathink_insights, 
          name='nexathink-insights'),
+
+    # KPIs con percentiles (espera, duración, completitud)
+    path('kpis/',
+         views.dashboard_kpis,
+         name='dashboard-kpis'),
 ]
\ No newline at end of file
@@ -2,15 +2,19 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Count, Avg, Q, Sum
+from django.db.models import Avg
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, timedelta
+from config.fechas import filtro_dia
+from config.replicas import lectura_replica
 from pacientes.models import Paciente
 from boxes.models import Box
-from atenciones.models import Atencion
+from atenciones.models import Atencion, AtencionHistorica
 from users.models import User
-from rutas_clinicas.models import RutaClinica
+from rutas_clinicas.models import RutaClinica, RutaClinicaHistorica
+from .instantanea import obtener as obtener_instantanea
 from .insights_ml import NexaThinkAnalyzer
+from .kpis import calcular_kpis
 
 # ============================================
 # PERMISO PERSONALIZADO
@@ -42,262 +46,20 @@ class IsAdminOrStaff(permissions.BasePermission):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrStaff])
+@lectura_replica
 def dashboard_metricas_generales(request):
     """
     Endpoint principal del dashboard con todas las métricas.
+    Sirve la instantánea precalculada (ver dashboard/instantanea.py);
+    ?actualizar=1 la recalcula en el momento.
     """
-    ahora = timezone.now()
-    hoy = ahora.date()
-
-    #  MÉTRICAS DE PACIENTES 
-    total_pacientes = Paciente.objects.filter(activo=True).count()
-    pacientes_hoy = Paciente.objects.filter(
-        fecha_ingreso__date=hoy,
-        activo=True
-    ).count()
-    
-    pacientes_por_estado = {}
-    for estado_key, estado_label in Paciente.ESTADO_CHOICES:
-        count = Paciente.objects.filter(
-            estado_actual=estado_key,
-            activo=True
-        ).count()
-        pacientes_por_estado[estado_key] = {
-            'label': estado_label,
-            'count': count
-        }
-    
-    pacientes_por_urgencia = {}
-    for urgencia_key, urgencia_label in Paciente.URGENCIA_CHOICES:
-        count = Paciente.objects.filter(
-            nivel_urgencia=urgencia_key,
-            activo=True
-        ).count()
-        pacientes_por_urgencia[urgencia_key] = {
-            'label': urgencia_label,
-            'count': count
-        }
-
-    #  MÉTRICAS DE BOXES 
-    total_boxes = Box.objects.filter(activo=True).count()
-    boxes_disponibles = Box.objects.filter(
-        estado='DISPONIBLE',
-        activo=True
-    ).count()
-    boxes_ocupados = Box.objects.filter(
-        estado='OCUPADO',
-        activo=True
-    ).count()
-    
-    tasa_ocupacion_boxes = round(
-        (boxes_ocupados / total_boxes * 100) if total_boxes > 0 else 0,
-        2
-    )
-
-    #  MÉTRICAS DE ATENCIONES 
-    atenciones_hoy = Atencion.objects.filter(
-        fecha_hora_inicio__date=hoy
-    ).count()
-    
-    atenciones_completadas_hoy = Atencion.objects.filter(
-        fecha_hora_inicio__date=hoy,
-        estado='COMPLETADA'
-    ).count()
-    
-    atenciones_en_curso = Atencion.objects.filter(
-        estado='EN_CURSO'
-    ).count()
-    
-    atenciones_pendientes = Atencion.objects.filter(
-        estado__in=['PROGRAMADA', 'EN_ESPERA']
-    ).count()
-    
-    tiempo_promedio_atencion = Atencion.objects.filter(
-        fecha_hora_inicio__gte=ahora - timedelta(days=7),
-        estado='COMPLETADA',
-        duracion_real__isnull=False
-    ).aggregate(promedio=Avg('duracion_real'))['promedio'] or 0
-    
-    atenciones_por_tipo = {}
-    for tipo_key, tipo_label in Atencion.TIPO_ATENCION_CHOICES:
-        count = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy,
-            tipo_atencion=tipo_key
-        ).count()
-        atenciones_por_tipo[tipo_key] = {
-            'label': tipo_label,
-            'count': count
-        }
-
-    atenciones_retrasadas = []
-    atenciones_activas = Atencion.objects.filter(estado='EN_CURSO')
-    for atencion in atenciones_activas:
-        if atencion.is_retrasada():
-            atenciones_retrasadas.append({
-                'id': str(atencion.id),
-                'paciente': atencion.paciente.identificador_hash[:12],
-                'box': atencion.box.numero,
-                'retraso_minutos': atencion.calcular_retraso()
-            })
-
-    #  MÉTRICAS DE RUTAS CLÍNICAS 
-    rutas_activas = RutaClinica.objects.filter(
-        estado__in=['INICIADA', 'EN_PROGRESO']
-    ).count()
-    
-    rutas_completadas_hoy = RutaClinica.objects.filter(
-        fecha_fin_real__date=hoy,
-        estado='COMPLETADA'
-    ).count()
-    
-    rutas_pausadas = RutaClinica.objects.filter(
-        esta_pausado=True
-    ).count()
-    
-    progreso_promedio_rutas = RutaClinica.objects.filter(
-        estado__in=['INICIADA', 'EN_PROGRESO']
-    ).aggregate(promedio=Avg('porcentaje_completado'))['promedio'] or 0
-
-    #Etapas con retraso (detectar rutas con retrasos)
-    rutas_con_retraso = 0
-    for ruta in RutaClinica.objects.filter(estado='EN_PROGRESO'):
-        if ruta.detectar_retrasos():
-            rutas_con_retraso += 1
-
-    #  MÉTRICAS DE MÉDICOS 
-    medicos_activos = User.objects.filter(
-        rol='MEDICO',
-        is_active=True
-    ).count()
-    
-    medicos_atendiendo_hoy = User.objects.filter(
-        rol='MEDICO',
-        is_active=True,
-        atenciones_medico__fecha_hora_inicio__date=hoy
-    ).distinct().count()
-
-    # Top 5 médicos por atenciones hoy
-    top_medicos_hoy = User.objects.filter(
-        rol='MEDICO',
-        is_active=True,
-        atenciones_medico__fecha_hora_inicio__date=hoy
-    ).annotate(
-        total_atenciones=Count('atenciones_medico')
-    ).order_by('-total_atenciones')[:5]
-    
-    top_medicos_data = []
-    for medico in top_medicos_hoy:
-        top_medicos_data.append({
-            'id': str(medico.id),
-            'nombre': medico.nombre_completo,
-            'especialidad': medico.get_especialidad_display() if medico.especialidad else 'Sin especialidad',
-            'atenciones': medico.total_atenciones
-        })
-
-    #  TENDENCIAS (ÚLTIMOS 7 DÍAS) 
-    tendencias = []
-    for i in range(7):
-        dia = hoy - timedelta(days=6-i)
-        tendencias.append({
-            'fecha': dia.isoformat(),
-            'pacientes': Paciente.objects.filter(
-                fecha_ingreso__date=dia,
-                activo=True
-            ).count(),
-            'atenciones': Atencion.objects.filter(
-                fecha_hora_inicio__date=dia
-            ).count(),
-            'completadas': Atencion.objects.filter(
-                fecha_hora_inicio__date=dia,
-                estado='COMPLETADA'
-            ).count()
-        })
-
-    # ===== ALERTAS =====
-    alertas = []
-    
-    if len(atenciones_retrasadas) > 0:
-        alertas.append({
-            'tipo': 'warning',
-            'titulo': 'Atenciones Retrasadas',
-            'mensaje': f'{len(atenciones_retrasadas)} atenciones están retrasadas',
-            'prioridad': 'alta'
-        })
-    
-    if tasa_ocupacion_boxes > 80:
-        alertas.append({
-            'tipo': 'warning',
-            'titulo': 'Alta Ocupación de Boxes',
-            'mensaje': f'{tasa_ocupacion_boxes}% de boxes ocupados',
-            'prioridad': 'media'
-        })
-    
-    if rutas_pausadas > 5:
-        alertas.append({
-            'tipo': 'info',
-            'titulo': 'Rutas Pausadas',
-            'mensaje': f'{rutas_pausadas} rutas clínicas están pausadas',
-            'prioridad': 'baja'
-        })
-    
-    if rutas_con_retraso > 0:
-        alertas.append({
-            'tipo': 'warning',
-            'titulo': 'Rutas con Retraso',
-            'mensaje': f'{rutas_con_retraso} rutas clínicas presentan retrasos',
-            'prioridad': 'alta'
-        })
-
-    # ===== RESPONSE =====
-    return Response({
-        'timestamp': ahora.isoformat(),
-        'fecha_hoy': hoy.isoformat(),
-        
-        'pacientes': {
-            'total': total_pacientes,
-            'hoy': pacientes_hoy,
-            'por_estado': pacientes_por_estado,
-            'por_urgencia': pacientes_por_urgencia,
-        },
-        
-        'boxes': {
-            'total': total_boxes,
-            'disponibles': boxes_disponibles,
-            'ocupados': boxes_ocupados,
-            'tasa_ocupacion': tasa_ocupacion_boxes,
-        },
-        
-        'atenciones': {
-            'hoy': atenciones_hoy,
-            'completadas_hoy': atenciones_completadas_hoy,
-            'en_curso': atenciones_en_curso,
-            'pendientes': atenciones_pendientes,
-            'tiempo_promedio_minutos': round(tiempo_promedio_atencion, 1),
-            'por_tipo': atenciones_por_tipo,
-            'retrasadas': atenciones_retrasadas,
-        },
-        
-        'rutas_clinicas': {
-            'activas': rutas_activas,
-            'completadas_hoy': rutas_completadas_hoy,
-            'pausadas': rutas_pausadas,
-            'progreso_promedio': round(progreso_promedio_rutas, 1),
-            'con_retraso': rutas_con_retraso,
-        },
-        
-        'medicos': {
-            'total_activos': medicos_activos,
-            'atendiendo_hoy': medicos_atendiendo_hoy,
-            'top_5_hoy': top_medicos_data,
-        },
-        
-        'tendencias_7_dias': tendencias,
-        'alertas': alertas,
-    })
+    instantanea = obtener_instantanea(actualizar=request.GET.get('actualizar') == '1')
+    return Response(instantanea.datos)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrStaff])
+@lectura_replica
 def dashboard_metricas_tiempo_real(request):
     """
     Endpoint para actualización en tiempo real.
@@ -368,10 +130,12 @@ def get_ultimo_paciente():
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrStaff])
+@lectura_replica
 def dashboard_estadisticas_detalladas(request):
     """
     Endpoint para estadísticas detalladas con análisis por especialidad.
     """
+    # Históricos (caliente + archivo): el periodo puede superar el horizonte de archivo
     periodo = request.GET.get('periodo', '7')
     dias = int(periodo)
     fecha_inicio = timezone.now() - timedelta(days=dias)
@@ -383,17 +147,17 @@ def dashboard_estadisticas_detalladas(request):
         estadisticas_diarias.append({
             'fecha': dia.isoformat(),
             'pacientes_nuevos': Paciente.objects.filter(
-                fecha_ingreso__date=dia
+                **filtro_dia('fecha_ingreso', dia)
             ).count(),
-            'atenciones_total': Atencion.objects.filter(
-                fecha_hora_inicio__date=dia
+            'atenciones_total': AtencionHistorica.objects.filter(
+                **filtro_dia('fecha_hora_inicio', dia)
             ).count(),
-            'atenciones_completadas': Atencion.objects.filter(
-                fecha_hora_inicio__date=dia,
+            'atenciones_completadas': AtencionHistorica.objects.filter(
+                **filtro_dia('fecha_hora_inicio', dia),
                 estado='COMPLETADA'
             ).count(),
-            'rutas_completadas': RutaClinica.objects.filter(
-                fecha_fin_real__date=dia,
+            'rutas_completadas': RutaClinicaHistorica.objects.filter(
+                **filtro_dia('fecha_fin_real', dia),
                 estado='COMPLETADA'
             ).count(),
         })
@@ -401,7 +165,7 @@ def dashboard_estadisticas_detalladas(request):
     # Estadísticas por especialidad (hay que ver si se usa)
     por_especialidad = {}
     for esp_key, esp_label in User.ESPECIALIDAD_CHOICES:
-        atenciones = Atencion.objects.filter(
+        atenciones = AtencionHistorica.objects.filter(
             medico__especialidad=esp_key,
             medico__rol='MEDICO',
             fecha_hora_inicio__gte=fecha_inicio
@@ -425,7 +189,7 @@ def dashboard_estadisticas_detalladas(request):
     return Response({
         'periodo_dias': dias,
         'fecha_inicio': fecha_inicio.date().isoformat(),
-        'fecha_fin': timezone.now().date().isoformat(),
+        'fecha_fin': timezone.localdate().isoformat(),
         'estadisticas_diarias': estadisticas_diarias,
         'por_especialidad': por_especialidad,
     })
@@ -433,6 +197,7 @@ def dashboard_estadisticas_detalladas(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated, IsAdminOrStaff])
+@lectura_replica
 def nexathink_insights(request):
     """
     Endpoint para insights de NexaThink.
@@ -452,4 +217,25 @@ def nexathink_insights(request):
         return Response({
             'error': str(e),
             'status': 'error'
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminOrStaff])
+@lectura_replica
+def dashboard_kpis(request):
+    """
+    KPIs de espera, duración y completitud con percentiles p50/p90/p99.
+    GET /api/dashboard/kpis/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD&agrupar_por=dia|medico|box|especialidad
+    """
+    try:
+        desde = request.GET.get('desde')
+        hasta = request.GET.get('hasta')
+        reporte = calcular_kpis(
+            desde=date.fromisoformat(desde) if desde else None,
+            hasta=date.fromisoformat(hasta) if hasta else None,
+            agrupar_por=request.GET.get('agrupar_por') or None,
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(reporte)
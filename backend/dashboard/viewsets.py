@@ -5,6 +5,8 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.db.models import Count, Avg, Q, F
 from django.utils import timezone
 from datetime import timedelta
+from config.fechas import filtro_dia
+from config.replicas import LecturaReplicaMixin
 
 from pacientes.models import Paciente
 from boxes.models import Box
@@ -12,12 +14,17 @@ from atenciones.models import Atencion, Medico
 from rutas_clinicas.models import RutaClinica
 
 
-class DashboardViewSet(viewsets.ViewSet):
+class DashboardViewSet(LecturaReplicaMixin, viewsets.ViewSet):
     
     # ViewSet para el dashboard administrativo con métricas en tiempo real.
     # Solo accesible para usuarios administradores.
     
     permission_classes = [IsAuthenticated, IsAdminUser]
+    # Solo lectura de métricas: todas las acciones leen de la réplica
+    acciones_replica = [
+        'metricas_generales', 'grafico_atenciones_hora',
+        'grafico_progreso_rutas', 'actividad_reciente',
+    ]
     
     @action(detail=False, methods=['get'])
     def metricas_generales(self, request):
@@ -25,7 +32,7 @@ class DashboardViewSet(viewsets.ViewSet):
         Obtiene métricas generales del sistema en tiempo real.
         GET /api/dashboard/metricas_generales/
         """
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         ahora = timezone.now()
         
         # ============================================
@@ -33,7 +40,7 @@ class DashboardViewSet(viewsets.ViewSet):
         # ============================================
         pacientes_totales = Paciente.objects.filter(activo=True).count()
         pacientes_hoy = Paciente.objects.filter(
-            fecha_ingreso__date=hoy,
+            **filtro_dia('fecha_ingreso', hoy),
             activo=True
         ).count()
         
@@ -85,7 +92,7 @@ class DashboardViewSet(viewsets.ViewSet):
         # MÉTRICAS DE ATENCIONES
         # ============================================
         atenciones_hoy = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy
+            **filtro_dia('fecha_hora_inicio', hoy)
         ).count()
         
         atenciones_en_curso = Atencion.objects.filter(
@@ -93,7 +100,7 @@ class DashboardViewSet(viewsets.ViewSet):
         ).count()
         
         atenciones_completadas_hoy = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy,
+            **filtro_dia('fecha_hora_inicio', hoy),
             estado='COMPLETADA'
         ).count()
         
@@ -103,7 +110,7 @@ class DashboardViewSet(viewsets.ViewSet):
         
         # Tiempo promedio de atención
         tiempo_promedio_atencion = Atencion.objects.filter(
-            fecha_hora_inicio__date=hoy,
+            **filtro_dia('fecha_hora_inicio', hoy),
             estado='COMPLETADA',
             duracion_real__isnull=False
         ).aggregate(promedio=Avg('duracion_real'))['promedio'] or 0
@@ -116,7 +123,7 @@ class DashboardViewSet(viewsets.ViewSet):
         atenciones_por_tipo = {}
         for tipo_key, tipo_label in Atencion.TIPO_ATENCION_CHOICES:
             count = Atencion.objects.filter(
-                fecha_hora_inicio__date=hoy,
+                **filtro_dia('fecha_hora_inicio', hoy),
                 tipo_atencion=tipo_key
             ).count()
             atenciones_por_tipo[tipo_key] = {
@@ -136,7 +143,7 @@ class DashboardViewSet(viewsets.ViewSet):
         ).count()
         
         rutas_completadas_hoy = RutaClinica.objects.filter(
-            fecha_fin_real__date=hoy,
+            **filtro_dia('fecha_fin_real', hoy),
             estado='COMPLETADA'
         ).count()
         
@@ -156,13 +163,13 @@ class DashboardViewSet(viewsets.ViewSet):
         # ============================================
         medicos_activos = Medico.objects.filter(activo=True).count()
         medicos_atendiendo_hoy = Medico.objects.filter(
-            atenciones__fecha_hora_inicio__date=hoy,
+            **filtro_dia('atenciones__fecha_hora_inicio', hoy),
             activo=True
         ).distinct().count()
         
         # Top 5 médicos por atenciones hoy
         top_medicos = Medico.objects.filter(
-            atenciones__fecha_hora_inicio__date=hoy,
+            **filtro_dia('atenciones__fecha_hora_inicio', hoy),
             activo=True
         ).annotate(
             total_atenciones=Count('atenciones')
@@ -269,13 +276,13 @@ class DashboardViewSet(viewsets.ViewSet):
         Datos para gráfico de atenciones por hora del día.
         GET /api/dashboard/grafico_atenciones_hora/
         """
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         
         # Crear array de 24 horas
         atenciones_por_hora = []
         for hora in range(24):
             count = Atencion.objects.filter(
-                fecha_hora_inicio__date=hoy,
+                **filtro_dia('fecha_hora_inicio', hoy),
                 fecha_hora_inicio__hour=hora
             ).count()
             
@@ -0,0 +1,24 @@
+import os
+import argparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from integraciones.retencion import TAMANO_LOTE, mantener_logs
+
+
+# Pensado para correr cada hora (cron): resume las horas cerradas de
+# LogSincronizacion y borra los logs vencidos en lotes cortos.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resume y depura los logs de sincronización')
+    parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--pausa', type=float, default=0,
+                        help='Segundos de espera entre lotes de borrado (baja la carga en la base)')
+    args = parser.parse_args()
+
+    resultado = mantener_logs(tamano_lote=args.tamano_lote, pausa=args.pausa)
+    print(f"📊 Resúmenes por hora creados: {resultado['resumenes']}")
+    for estado, borrados in resultado['eliminados'].items():
+        print(f"🗑️  {estado}: {borrados} logs eliminados")
@@ -0,0 +1,23 @@
+import os
+import argparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from pacientes.duplicados import detectar_duplicados
+
+
+# Pensado para cron (p. ej. cada noche): cada corrida reindexa solo los
+# pacientes modificados desde la anterior y compara los bloques que los
+# contienen. --completo reconstruye el índice de claves y compara todo.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Detecta pacientes posiblemente duplicados')
+    parser.add_argument('--completo', action='store_true', help='Reconstruye el índice de claves completo')
+    args = parser.parse_args()
+
+    resultado = detectar_duplicados(completo=args.completo)
+    print(f"🔎 {resultado.get('indexados', 0)} pacientes indexados, {resultado.get('bloques', 0)} bloques "
+          f"({resultado.get('comparaciones', 0)} comparaciones, {resultado.get('bloques_omitidos', 0)} omitidos "
+          f"por tamaño) → {resultado.get('sugerencias', 0)} sugerencias de fusión")
@@ -0,0 +1,428 @@
+"""
+Generador masivo y determinista de datos sintéticos para pruebas de escala.
+
+A diferencia de automatizar_funcionamiento.py (fila por fila con full_clean,
+save y señales), aquí todo se inserta con bulk_create en lotes. bulk_create no
+dispara post_save, así que el script escribe directamente el estado que las
+señales habrían dejado: cada paciente tiene su ruta con timestamps por etapa
+coherentes, su estado/etapa sincronizados con la ruta, y las atenciones
+pasadas ya vienen completadas con cronómetro. Con la misma semilla y la misma
+fecha base se obtienen exactamente los mismos datos (incluidos los UUID): el
+corte entre pasado y futuro es HORA_CORTE de la fecha base, no la hora real.
+
+Uso:
+    python generar_datos_masivos.py --atenciones 1000000 --semilla 42 --limpiar
+    python generar_datos_masivos.py --atenciones 50000 --dias 60 --tokens
+"""
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+from datetime import datetime, date, time as dtime, timedelta
+
+import django
+
+# Configuración del entorno
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.contrib.auth.hashers import make_password
+
+from users.models import User
+from pacientes.models import Paciente
+from atenciones.models import Atencion
+from boxes.models import Box, IntervaloOcupacion, OcupacionManual
+from rutas_clinicas.models import RutaClinica
+from rest_framework.authtoken.models import Token
+
+
+NOMBRES = ['Camila', 'Sofía', 'Valentina', 'Isidora', 'Martina', 'Florencia', 'Josefa', 'Antonia',
+           'Benjamín', 'Vicente', 'Martín', 'Matías', 'Joaquín', 'Agustín', 'Tomás', 'Cristóbal']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva',
+             'Martínez', 'Sepúlveda', 'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres']
+REGIONES = [key for key, _ in Paciente.REGION_CHOICES]
+SEGUROS = [key for key, _ in Paciente.SEGURO_MEDICO_CHOICES]
+SANGRE = [key for key, _ in Paciente.TIPO_SANGRE_CHOICES]
+URGENCIAS = ['BAJA', 'MEDIA', 'MEDIA', 'ALTA', 'CRITICA']
+TIPOS_ATENCION = ['CONSULTA_GENERAL', 'CONSULTA_GENERAL', 'CONTROL', 'CONSULTA_ESPECIALIDAD',
+                  'PROCEDIMIENTO', 'EXAMEN']
+DURACIONES = [15, 20, 30, 30, 45]
+# Rutas típicas (subconjuntos ordenados de RutaClinica.ETAPAS_CHOICES)
+RUTAS_TIPO = [
+    ['CONSULTA_MEDICA', 'ALTA'],
+    ['CONSULTA_MEDICA', 'PROCESO_EXAMEN', 'REVISION_EXAMEN', 'ALTA'],
+    ['CONSULTA_MEDICA', 'PROCESO_EXAMEN', 'REVISION_EXAMEN', 'HOSPITALIZACION', 'ALTA'],
+    ['CONSULTA_MEDICA', 'PROCESO_EXAMEN', 'REVISION_EXAMEN', 'OPERACION', 'HOSPITALIZACION', 'ALTA'],
+]
+HORA_APERTURA = 8
+# "Ahora" del dataset: esta hora local de la fecha base, no el reloj real, para
+# que lo cerrado/pendiente (y los sorteos que consume) dependa solo de semilla y fecha
+HORA_CORTE = 12
+
+
+class GeneradorMasivo:
+    # Genera el dataset en lotes. Todo el azar sale de un único random.Random(semilla).
+
+    def __init__(self, semilla, fecha_base, lote):
+        self.rng = random.Random(semilla)
+        self.fecha_base = fecha_base
+        self.lote = lote
+        self.tz = timezone.get_current_timezone()
+        self.ahora = self.momento(0, HORA_CORTE * 60)
+
+    def nuevo_uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def momento(self, dia, minutos):
+        # Fecha/hora local (America/Santiago) del día relativo `dia` + minutos desde medianoche
+        base = datetime.combine(self.fecha_base + timedelta(days=dia), dtime())
+        return timezone.make_aware(base + timedelta(minutes=minutos), self.tz)
+
+    def insertar(self, modelo, objetos):
+        with transaction.atomic():
+            modelo.objects.bulk_create(objetos, batch_size=self.lote)
+
+    # ---------------- Personal e infraestructura ----------------
+
+    def crear_boxes(self, cantidad):
+        especialidades = [key for key, _ in Box.ESPECIALIDAD_CHOICES]
+        existentes = set(Box.objects.values_list('numero', flat=True))
+        nuevos = [
+            Box(
+                id=self.nuevo_uuid(),
+                numero=f'BOX-{i:04d}',
+                nombre=f'Box {i}',
+                especialidad=especialidades[i % len(especialidades)],
+                estado='DISPONIBLE',
+            )
+            for i in range(1, cantidad + 1)
+            if f'BOX-{i:04d}' not in existentes
+        ]
+        self.insertar(Box, nuevos)
+        return list(Box.objects.filter(activo=True).order_by('numero').values_list('id', flat=True))[:cantidad]
+
+    def crear_medicos(self, cantidad):
+        especialidades = [key for key, _ in User.ESPECIALIDAD_CHOICES]
+        existentes = set(User.objects.filter(username__startswith='medico_').values_list('username', flat=True))
+        # Un solo hash para todos: hashear 1 contraseña por usuario domina el tiempo total
+        password = make_password('password123')
+        nuevos = [
+            User(
+                username=f'medico_{i}',
+                email=f'medico{i}@nexalud.medico.com',
+                password=password,
+                first_name=self.rng.choice(NOMBRES),
+                last_name=self.rng.choice(APELLIDOS),
+                rol='MEDICO',
+                especialidad=especialidades[i % len(especialidades)],
+            )
+            for i in range(cantidad)
+            if f'medico_{i}' not in existentes
+        ]
+        self.insertar(User, nuevos)
+        usernames = [f'medico_{i}' for i in range(cantidad)]
+        return list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+
+    def escribir_tokens(self, medico_ids):
+        # tokens.json compatible con locustfile.py
+        sin_token = User.objects.filter(id__in=medico_ids, auth_token__isnull=True)
+        self.insertar(Token, [Token(user=u, key=Token.generate_key()) for u in sin_token])
+        admin = User.objects.filter(username='admin').first()
+        if not admin:
+            admin = User.objects.create_superuser('admin', 'admin@nexalud.admin.com', 'password123')
+        Token.objects.get_or_create(user=admin)
+
+        token_map = dict(
+            Token.objects.filter(user_id__in=list(medico_ids) + [admin.id]).values_list('user__username', 'key')
+        )
+        with open('tokens.json', 'w') as f:
+            json.dump(token_map, f)
+        print(f"   -> tokens.json con {len(token_map)} tokens.")
+
+    # ---------------- Pacientes y rutas ----------------
+
+    def rut(self, indice):
+        # RUT válido y único derivado del índice (rango 30.000.000+ para no chocar con reales)
+        cuerpo = 30000000 + indice
+        suma, multiplicador = 0, 2
+        for digito in reversed(str(cuerpo)):
+            suma += int(digito) * multiplicador
+            multiplicador = 2 if multiplicador == 7 else multiplicador + 1
+        dv = {11: '0', 10: 'K'}.get(11 - suma % 11, str(11 - suma % 11))
+        return Paciente.formatear_rut(f'{cuerpo}{dv}')
+
+    def construir_ruta(self, paciente, dias_historia):
+        # Ruta con timestamps por etapa encadenados y duraciones alrededor de la estimada
+        rng = self.rng
+        etapas = rng.choice(RUTAS_TIPO)
+        inicio = self.momento(-rng.randint(0, dias_historia), rng.randint(HORA_APERTURA * 60, 18 * 60))
+        ahora = self.ahora
+
+        timestamps = {}
+        completadas = []
+        cursor = inicio
+        indice_actual = 0
+        for indice, etapa in enumerate(etapas):
+            estimada = RutaClinica.DURACIONES_ESTIMADAS.get(etapa, 1440)
+            real = int(estimada * rng.uniform(0.5, 1.4))
+            fin = cursor + timedelta(minutes=real)
+            indice_actual = indice
+            if fin > ahora:
+                timestamps[etapa] = {
+                    'fecha_inicio': cursor.isoformat(),
+                    'fecha_fin': None,
+                    'duracion_real': None,
+                    'duracion_estimada': estimada,
+                    'observaciones': '',
+                    'usuario_inicio': 'Sistema',
+                }
+                break
+            timestamps[etapa] = {
+                'fecha_inicio': cursor.isoformat(),
+                'fecha_fin': fin.isoformat(),
+                'duracion_real': real,
+                'duracion_estimada': estimada,
+                'observaciones': '',
+                'usuario_inicio': 'Sistema',
+            }
+            completadas.append(etapa)
+            cursor = fin
+
+        completa = len(completadas) == len(etapas)
+        cancelada = not completa and rng.random() < 0.03
+        if completa:
+            estado = 'COMPLETADA'
+        elif cancelada:
+            estado = 'CANCELADA'
+        else:
+            estado = 'EN_PROGRESO' if completadas else 'INICIADA'
+
+        ruta = RutaClinica(
+            id=self.nuevo_uuid(),
+            paciente_id=paciente.id,
+            etapas_seleccionadas=etapas,
+            etapa_actual=None if completa else etapas[indice_actual],
+            indice_etapa_actual=indice_actual,
+            etapas_completadas=completadas,
+            timestamps_etapas=timestamps,
+            fecha_inicio=inicio,
+            fecha_estimada_fin=inicio + timedelta(
+                minutes=sum(RutaClinica.DURACIONES_ESTIMADAS.get(e, 1440) for e in etapas)
+            ),
+            fecha_fin_real=cursor if completa else None,
+            porcentaje_completado=round(len(completadas) / len(etapas) * 100, 1),
+            estado=estado,
+        )
+
+        # Lo que habría dejado la señal verificar_consistencia_etapa
+        if completa:
+            paciente.estado_actual, paciente.etapa_actual = 'ALTA_COMPLETA', None
+        elif cancelada:
+            paciente.estado_actual, paciente.etapa_actual = 'PROCESO_CANCELADO', None
+        else:
+            paciente.estado_actual, paciente.etapa_actual = 'ACTIVO', ruta.etapa_actual
+        paciente.fecha_ingreso = inicio
+        return ruta
+
+    def crear_pacientes_y_rutas(self, cantidad, dias_historia):
+        rng = self.rng
+        hoy = self.fecha_base
+        ids = []
+        for desde in range(0, cantidad, self.lote):
+            pacientes, rutas = [], []
+            for i in range(desde, min(desde + self.lote, cantidad)):
+                rut = self.rut(i)
+                nacimiento = date(rng.randint(1935, 2022), rng.randint(1, 12), rng.randint(1, 28))
+                paciente = Paciente(
+                    id=self.nuevo_uuid(),
+                    rut=rut,
+                    identificador_hash=hashlib.sha256(rut.replace('.', '').replace('-', '').encode()).hexdigest(),
+                    nombre=rng.choice(NOMBRES),
+                    apellido_paterno=rng.choice(APELLIDOS),
+                    apellido_materno=rng.choice(APELLIDOS),
+                    fecha_nacimiento=nacimiento,
+                    edad=hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day)),
+                    genero=rng.choice(['M', 'F']),
+                    telefono=f'+569{rng.randint(10000000, 99999999)}',
+                    correo=f'paciente{i}@correo.cl',
+                    direccion_region=rng.choice(REGIONES),
+                    seguro_medico=rng.choice(SEGUROS),
+                    tipo_sangre=rng.choice(SANGRE),
+                    nivel_urgencia=rng.choice(URGENCIAS),
+                )
+                rutas.append(self.construir_ruta(paciente, dias_historia))
+                pacientes.append(paciente)
+                ids.append(paciente.id)
+            self.insertar(Paciente, pacientes)
+            self.insertar(RutaClinica, rutas)
+            print(f"   -> {len(ids)}/{cantidad} pacientes con ruta", end='\r')
+        print()
+        return ids
+
+    # ---------------- Agenda y ocupación ----------------
+
+    def crear_atenciones(self, total, paciente_ids, medico_ids, box_ids, dias_historia, dias_futuros):
+        # Reparte `total` atenciones en días/médicos con slots consecutivos por médico (sin solapes
+        # de médico ni de box: cada médico activo usa un box distinto por día).
+        rng = self.rng
+        dias = list(range(-dias_historia, dias_futuros + 1))
+        activos = min(len(medico_ids), len(box_ids))
+        por_medico_dia = -(-total // (len(dias) * activos))
+        ahora = self.ahora
+
+        creadas = 0
+        buffer_atenciones, buffer_ocupaciones, buffer_intervalos = [], [], []
+        for dia in dias:
+            if creadas >= total:
+                break
+            for j in range(activos):
+                medico_id = medico_ids[(j + dia) % len(medico_ids)]
+                box_id = box_ids[j]
+                minuto = HORA_APERTURA * 60
+                fin_anterior = None
+                for _ in range(por_medico_dia):
+                    if creadas >= total:
+                        break
+                    duracion = rng.choice(DURACIONES)
+                    inicio = self.momento(dia, minuto)
+                    minuto += duracion + rng.choice([0, 0, 5, 10])
+                    atencion = Atencion(
+                        id=self.nuevo_uuid(),
+                        paciente_id=rng.choice(paciente_ids),
+                        medico_id=medico_id,
+                        box_id=box_id,
+                        fecha_hora_inicio=inicio,
+                        fecha_hora_fin=inicio + timedelta(minutes=duracion),
+                        duracion_planificada=duracion,
+                        tipo_atencion=rng.choice(TIPOS_ATENCION),
+                    )
+                    if inicio + timedelta(minutes=duracion) < ahora:
+                        self.cerrar_atencion(atencion)
+                        if atencion.estado == 'COMPLETADA':
+                            # Historial de ocupación del box; sin solapes aunque la consulta se alargue
+                            inicio_intervalo = max(atencion.inicio_cronometro, fin_anterior or atencion.inicio_cronometro)
+                            fin_anterior = max(atencion.fin_cronometro, inicio_intervalo)
+                            buffer_intervalos.append(IntervaloOcupacion(
+                                box_id=box_id, inicio=inicio_intervalo, fin=fin_anterior, origen='ATENCION'
+                            ))
+                    buffer_atenciones.append(atencion)
+                    creadas += 1
+
+                # Ocupación manual ocasional al cierre de la jornada (limpieza/mantención)
+                if dia < 0 and rng.random() < 0.2:
+                    inicio = self.momento(dia, minuto + 10)
+                    inicio = max(inicio, fin_anterior or inicio)
+                    duracion = rng.choice([15, 30, 60])
+                    buffer_ocupaciones.append(OcupacionManual(
+                        id=self.nuevo_uuid(),
+                        box_id=box_id,
+                        duracion_minutos=duracion,
+                        fecha_inicio=inicio,
+                        fecha_fin_programada=inicio + timedelta(minutes=duracion),
+                        fecha_fin_real=inicio + timedelta(minutes=duracion),
+                        motivo='Mantención',
+                        activa=False,
+                    ))
+                    buffer_intervalos.append(IntervaloOcupacion(
+                        box_id=box_id, inicio=inicio, fin=inicio + timedelta(minutes=duracion), origen='MANUAL'
+                    ))
+
+                if len(buffer_atenciones) >= self.lote:
+                    self.insertar(Atencion, buffer_atenciones)
+                    self.insertar(IntervaloOcupacion, buffer_intervalos)
+                    buffer_atenciones, buffer_intervalos = [], []
+                    print(f"   -> {creadas}/{total} atenciones", end='\r')
+
+        self.insertar(Atencion, buffer_atenciones)
+        self.insertar(OcupacionManual, buffer_ocupaciones)
+        self.insertar(IntervaloOcupacion, buffer_intervalos)
+        print(f"   -> {creadas}/{total} atenciones, {len(buffer_ocupaciones)} ocupaciones manuales")
+        return creadas
+
+    def cerrar_atencion(self, atencion):
+        # Estado final de una atención pasada, como la dejaría el flujo del médico
+        rng = self.rng
+        sorteo = rng.random()
+        if sorteo < 0.06:
+            atencion.estado = 'NO_PRESENTADO'
+            return
+        if sorteo < 0.10:
+            atencion.estado = 'CANCELADA'
+            return
+        espera = max(0, int(rng.gauss(6, 5)))
+        real = max(5, int(atencion.duracion_planificada * rng.uniform(0.7, 1.4)))
+        atencion.estado = 'COMPLETADA'
+        atencion.inicio_cronometro = atencion.fecha_hora_inicio + timedelta(minutes=espera)
+        atencion.fin_cronometro = atencion.inicio_cronometro + timedelta(minutes=real)
+        atencion.duracion_real = real
+        if espera > 5:
+            atencion.atraso_reportado = True
+            atencion.fecha_reporte_atraso = atencion.fecha_hora_inicio + timedelta(minutes=5)
+
+
+def limpiar_tablas():
+    # DELETE directo por tabla: el delete() del ORM recorre cascadas y la señal pre_delete
+    # de RutaClinica fila por fila, impracticable con millones de registros.
+    print("\n🧹 LIMPIEZA MASIVA -------------------")
+    tablas = [
+        Atencion._meta.db_table,
+        RutaClinica._meta.db_table,
+        OcupacionManual._meta.db_table,
+        IntervaloOcupacion._meta.db_table,
+        Paciente._meta.db_table,
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for tabla in tablas:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(tabla)}')
+    Box.objects.update(estado='DISPONIBLE', ultima_ocupacion=None)
+    print("✅ Tablas de agenda, rutas y pacientes vacías.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generador masivo de datos sintéticos')
+    parser.add_argument('--atenciones', type=int, default=100000)
+    parser.add_argument('--pacientes', type=int, help='Por defecto, 1 paciente cada 5 atenciones')
+    parser.add_argument('--medicos', type=int, default=120)
+    parser.add_argument('--boxes', type=int, default=120)
+    parser.add_argument('--dias', type=int, default=365, help='Días de historial hacia atrás')
+    parser.add_argument('--dias-futuros', type=int, default=14)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--fecha-base', type=date.fromisoformat, help='YYYY-MM-DD (por defecto hoy)')
+    parser.add_argument('--lote', type=int, default=5000)
+    parser.add_argument('--limpiar', action='store_true', help='Vacía pacientes, rutas y atenciones antes')
+    parser.add_argument('--tokens', action='store_true', help='Genera tokens.json para locust')
+    args = parser.parse_args()
+
+    inicio = time.time()
+    if args.limpiar:
+        limpiar_tablas()
+
+    generador = GeneradorMasivo(
+        semilla=args.semilla,
+        fecha_base=args.fecha_base or timezone.localdate(),
+        lote=args.lote,
+    )
+
+    print("\n🏗️  INFRAESTRUCTURA Y PERSONAL -------")
+    box_ids = generador.crear_boxes(args.boxes)
+    medico_ids = generador.crear_medicos(args.medicos)
+    print(f"   -> {len(box_ids)} boxes, {len(medico_ids)} médicos.")
+    if args.tokens:
+        generador.escribir_tokens(medico_ids)
+
+    print("\n🧑 PACIENTES Y RUTAS -----------------")
+    paciente_ids = generador.crear_pacientes_y_rutas(args.pacientes or max(1, args.atenciones // 5), args.dias)
+
+    print("\n📅 AGENDA E HISTORIAL ----------------")
+    generador.crear_atenciones(args.atenciones, paciente_ids, medico_ids, box_ids, args.dias, args.dias_futuros)
+
+    print(f"\n✨ LISTO en {time.time() - inicio:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,21 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from django.utils import timezone
-from .models import IntegracionExterna, LogSincronizacion, ConfiguracionSistema
+from django.db.models import OuterRef, Subquery
+from .models import (
+    IntegracionExterna, LogSincronizacion, ResumenLogSincronizacion, EventoWebhook, EventoSaliente,
+    IdentificadorExterno, ConfiguracionSistema
+)
+from .publicador import descartar as descartar_salientes, reencolar as reencolar_salientes
 
-
-class LogSincronizacionInline(admin.TabularInline):
-    model = LogSincronizacion
-    extra = 0
-    fields = ['timestamp', 'estado', 'mensaje', 'tiempo_respuesta_ms']
-    readonly_fields = ['timestamp', 'estado', 'mensaje', 'tiempo_respuesta_ms']
-    can_delete = False
-    max_num = 10
-    ordering = ['-timestamp']
-    
-    def has_add_permission(self, request, obj=None):
-        return False
+COLORES_LOG = {
+    'EXITOSA': 'green',
+    'ERROR': 'red',
+    'ADVERTENCIA': 'orange',
+    'WEBHOOK_PROCESADO': 'blue',
+    'TIMEOUT': 'darkred',
+    'DATOS_INVALIDOS': 'purple'
+}
 
 
 @admin.register(IntegracionExterna)
@@ -26,7 +27,8 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
         'metodo_autenticacion',
         'ultima_sincronizacion_info',
         'activo_badge',
-        'intervalo_sync'
+        'intervalo_sync',
+        'ultimo_log_badge'
     ]
     list_filter = [
         'tipo_sistema',
@@ -40,11 +42,11 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
     ]
     readonly_fields = [
         'ultima_sincronizacion',
+        'ultima_sincronizacion_agenda',
         'fecha_creacion',
         'fecha_actualizacion',
         'logs_recientes'
     ]
-    inlines = [LogSincronizacionInline]
     
     fieldsets = (
         ('Información Básica', {
@@ -60,6 +62,7 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
                 'endpoint_base_url',
                 'metodo_autenticacion',
                 'token_acceso_encrypted',
+                'secreto_webhook',
             )
         }),
         ('Sincronización', {
@@ -69,6 +72,26 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
                 'configuracion_mapeo',
             )
         }),
+        ('Agenda', {
+            'fields': (
+                'agenda_activa',
+                'mapeo_agenda',
+                'cursor_agenda',
+                'ultima_sincronizacion_agenda',
+            ),
+            'classes': ('collapse',)
+        }),
+        ('Publicación de Eventos', {
+            'fields': (
+                'publicar_eventos',
+                'eventos_publicados',
+            ),
+            'classes': ('collapse',)
+        }),
+        ('Retención de Logs', {
+            'fields': ('retencion_logs',),
+            'classes': ('collapse',)
+        }),
         ('Responsable', {
             'fields': ('usuario_configuracion',),
             'classes': ('collapse',)
@@ -147,8 +170,30 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
         return f"{minutos}m"
     intervalo_sync.short_description = "Intervalo"
     
+    def get_queryset(self, request):
+        # Estado del último log anotado (índice integracion, -timestamp): sin consultas por fila
+        ultimo = LogSincronizacion.objects.filter(integracion=OuterRef('pk')).order_by('-timestamp')
+        return super().get_queryset(request).annotate(
+            ultimo_log_estado=Subquery(ultimo.values('estado')[:1]),
+            ultimo_log_timestamp=Subquery(ultimo.values('timestamp')[:1]),
+        )
+    
+    def ultimo_log_badge(self, obj):
+        if not obj.ultimo_log_estado:
+            return '-'
+        color = COLORES_LOG.get(obj.ultimo_log_estado, 'black')
+        return format_html(
+            '<span style="color: {}; font-weight: bold;">{}</span><br><small>{}</small>',
+            color,
+            dict(LogSincronizacion.ESTADO_CHOICES).get(obj.ultimo_log_estado, obj.ultimo_log_estado),
+            timezone.localtime(obj.ultimo_log_timestamp).strftime('%d/%m %H:%M')
+        )
+    ultimo_log_badge.short_description = "Último Log"
+    ultimo_log_badge.admin_order_field = 'ultimo_log_timestamp'
+    
     def logs_recientes(self, obj):
-        logs = obj.logs_sincronizacion.all()[:10]
+        # Solo en el detalle: una consulta sobre el índice (integracion, -timestamp)
+        logs = obj.logs_sincronizacion.order_by('-timestamp')[:10]
         if not logs:
             return "No hay logs disponibles"
         
@@ -156,14 +201,7 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
         html += "<tr style='background: #f5f5f5;'><th>Timestamp</th><th>Estado</th><th>Mensaje</th><th>Tiempo</th></tr>"
         
         for log in logs:
-            color = {
-                'EXITOSA': 'green',
-                'ERROR': 'red',
-                'ADVERTENCIA': 'orange',
-                'WEBHOOK_PROCESADO': 'blue',
-                'TIMEOUT': 'darkred',
-                'DATOS_INVALIDOS': 'purple'
-            }.get(log.estado, 'black')
+            color = COLORES_LOG.get(log.estado, 'black')
             
             html += f"<tr style='border-bottom: 1px solid #ddd;'>"
             html += f"<td>{log.timestamp.strftime('%d/%m %H:%M')}</td>"
@@ -178,6 +216,7 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
     
     actions = [
         'sincronizar_ahora',
+        'sincronizar_agenda',
         'validar_conexion',
         'activar_integraciones',
         'desactivar_integraciones',
@@ -199,6 +238,21 @@ class IntegracionExternaAdmin(admin.ModelAdmin):
         )
     sincronizar_ahora.short_description = "Sincronizar ahora"
     
+    def sincronizar_agenda(self, request, queryset):
+        creadas = actualizadas = count_error = 0
+        for integracion in queryset.filter(agenda_activa=True):
+            resultado = integracion.sincronizar_agenda()
+            if 'error' in resultado:
+                count_error += 1
+            creadas += resultado['creadas']
+            actualizadas += resultado['actualizadas'] + resultado['canceladas']
+        
+        self.message_user(
+            request,
+            f'Agenda: {creadas} atenciones nuevas, {actualizadas} actualizadas, {count_error} integraciones con error.'
+        )
+    sincronizar_agenda.short_description = "Sincronizar agenda (cambios)"
+    
     def validar_conexion(self, request, queryset):
         count_ok = 0
         count_fail = 0
@@ -262,6 +316,7 @@ class LogSincronizacionAdmin(admin.ModelAdmin):
         'datos_formateados'
     ]
     date_hierarchy = 'timestamp'
+    list_select_related = ['integracion']
     
     fieldsets = (
         ('Información del Log', {
@@ -288,15 +343,7 @@ class LogSincronizacionAdmin(admin.ModelAdmin):
         return False
     
     def estado_badge(self, obj):
-        colors = {
-            'EXITOSA': 'green',
-            'ERROR': 'red',
-            'ADVERTENCIA': 'orange',
-            'WEBHOOK_PROCESADO': 'blue',
-            'TIMEOUT': 'darkred',
-            'DATOS_INVALIDOS': 'purple'
-        }
-        color = colors.get(obj.estado, 'black')
+        color = COLORES_LOG.get(obj.estado, 'black')
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>',
             color,
@@ -333,6 +380,149 @@ class LogSincronizacionAdmin(admin.ModelAdmin):
     exportar_logs.short_description = "Exportar logs seleccionados"
 
 
+@admin.register(ResumenLogSincronizacion)
+class ResumenLogSincronizacionAdmin(admin.ModelAdmin):
+    list_display = [
+        'hora',
+        'integracion',
+        'estado',
+        'total',
+        'tiempo_respuesta_promedio_ms',
+        'tiempo_respuesta_p95_ms',
+        'tiempo_respuesta_max_ms',
+    ]
+    list_filter = [
+        'estado',
+        'integracion__nombre_sistema',
+    ]
+    list_select_related = ['integracion']
+    date_hierarchy = 'hora'
+    
+    # Los genera integraciones/retencion.py
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EventoWebhook)
+class EventoWebhookAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'integracion',
+        'tipo_evento',
+        'estado',
+        'intentos',
+        'recibido_en',
+        'procesado_en',
+    ]
+    list_filter = [
+        'estado',
+        'tipo_evento',
+        'integracion__nombre_sistema',
+    ]
+    search_fields = [
+        'clave_idempotencia',
+    ]
+    list_select_related = ['integracion']
+    readonly_fields = [
+        'integracion',
+        'clave_idempotencia',
+        'tipo_evento',
+        'payload',
+        'estado',
+        'intentos',
+        'error',
+        'recibido_en',
+        'disponible_en',
+        'procesado_en',
+    ]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    actions = ['reencolar']
+    
+    def reencolar(self, request, queryset):
+        updated = queryset.filter(estado='ERROR').update(
+            estado='PENDIENTE', intentos=0, disponible_en=timezone.now(), procesado_en=None
+        )
+        self.message_user(request, f'{updated} eventos devueltos a la cola.')
+    reencolar.short_description = "Reencolar eventos con error"
+
+
+@admin.register(EventoSaliente)
+class EventoSalienteAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'integracion',
+        'tipo_evento',
+        'id_agregado',
+        'estado',
+        'intentos',
+        'creado_en',
+        'enviado_en',
+    ]
+    list_filter = [
+        'estado',
+        'tipo_agregado',
+        'integracion__nombre_sistema',
+    ]
+    search_fields = [
+        'id_agregado',
+    ]
+    list_select_related = ['integracion']
+    readonly_fields = [
+        'integracion',
+        'tipo_agregado',
+        'id_agregado',
+        'tipo_evento',
+        'payload',
+        'estado',
+        'intentos',
+        'error',
+        'creado_en',
+        'disponible_en',
+        'enviado_en',
+    ]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    actions = ['reencolar', 'descartar']
+    
+    def reencolar(self, request, queryset):
+        updated = reencolar_salientes(queryset)
+        self.message_user(request, f'{updated} eventos devueltos a la cola.')
+    reencolar.short_description = "Reencolar eventos sin más reintentos (dead letter)"
+    
+    def descartar(self, request, queryset):
+        updated = descartar_salientes(queryset)
+        self.message_user(request, f'{updated} eventos descartados; los siguientes de su agregado ya pueden salir.')
+    descartar.short_description = "Descartar eventos sin más reintentos (dead letter)"
+
+
+@admin.register(IdentificadorExterno)
+class IdentificadorExternoAdmin(admin.ModelAdmin):
+    list_display = [
+        'id_externo',
+        'tipo',
+        'id_local',
+        'integracion',
+        'fecha_creacion',
+    ]
+    list_filter = [
+        'tipo',
+        'integracion__nombre_sistema',
+    ]
+    search_fields = [
+        'id_externo',
+        'id_local',
+    ]
+    list_select_related = ['integracion']
+
+
 @admin.register(ConfiguracionSistema)
 class ConfiguracionSistemaAdmin(admin.ModelAdmin):
     list_display = [
@@ -353,6 +543,7 @@ class ConfiguracionSistemaAdmin(admin.ModelAdmin):
         'valor',
         'descripcion'
     ]
+    list_select_related = ['usuario_modificacion']
     readonly_fields = [
         'fecha_modificacion',
         'valor_tipado_display'
@@ -0,0 +1,494 @@
+"""
+Sincronización incremental de agenda (IntegracionExterna.sincronizar_agenda).
+
+El sistema externo expone GET RUTA_AGENDA con los cambios de agenda desde un
+cursor opaco, paginados:
+    ?cursor=...&limite=500         -> {"registros": [...], "cursor": "...", "hay_mas": true}
+    ?desde=<ISO 8601>&limite=500   (sin cursor: cambios desde la última corrida)
+Cada página se mapea con mapeo_agenda, se escribe en una transacción con
+bulk_create/bulk_update (Atencion ↔ id externo en IdentificadorExterno) y se
+guarda su cursor: una corrida cortada retoma desde la última página escrita.
+El costo es proporcional a los cambios, no al tamaño de la agenda. Lo que se
+solapa con la agenda vigente (mismo médico o box) no se escribe y se cuenta
+en 'conflictos'.
+
+Cada registro mapeado trae:
+    id_externo, fecha_hora_inicio, duracion_planificada o fecha_hora_fin,
+    paciente (RUT o id externo), medico (username o id externo),
+    box (número o id externo), y opcionalmente tipo_atencion, estado,
+    observaciones y eliminado (true = cancelada en el sistema externo).
+
+Solo se modifican atenciones PROGRAMADA o EN_ESPERA: una vez iniciada en el
+centro manda el cronómetro local. Los efectos de las señales de Atencion
+(ruta automática, box, cronómetro) se aplican por página con
+atenciones.signals.aplicar_efectos_en_lote, y los cambios se publican a las
+demás integraciones suscritas (integraciones/publicador.py).
+"""
+import logging
+import math
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from atenciones.agenda import buscar_solapes
+from atenciones.models import Atencion
+from atenciones.signals import aplicar_efectos_en_lote
+from boxes.models import Box
+from pacientes.models import Paciente
+
+from .cliente_http import ErrorHttp, con_reintentos
+from .mapeo import ErrorMapeo, mapeador_de
+from .models import IdentificadorExterno, IntegracionExterna, LogSincronizacion
+from .publicador import publicar
+from .sincronizacion import solicitar
+
+logger = logging.getLogger(__name__)
+
+# Solo estas se tocan desde el sistema externo; el resto ya las maneja el centro
+ESTADOS_EDITABLES = ['PROGRAMADA', 'EN_ESPERA']
+
+# EN_CURSO solo lo pone el cronómetro local
+ESTADOS_EXTERNOS = ['PROGRAMADA', 'EN_ESPERA', 'COMPLETADA', 'CANCELADA', 'NO_PRESENTADO']
+
+CAMPOS_SINCRONIZADOS = [
+    'paciente_id', 'medico_id', 'box_id', 'fecha_hora_inicio', 'fecha_hora_fin',
+    'duracion_planificada', 'tipo_atencion', 'estado', 'observaciones',
+]
+
+METRICAS = [
+    'recibidos', 'creadas', 'actualizadas', 'canceladas', 'sin_cambios', 'sin_referencia',
+    'invalidos', 'bloqueadas', 'conflictos', 'paginas',
+    'rutas_creadas', 'rutas_avanzadas', 'boxes_liberados',
+]
+
+
+# ============================================
+# NORMALIZACIÓN
+# ============================================
+
+def _fechahora(valor, campo):
+    momento = valor if isinstance(valor, datetime) else None
+    if isinstance(valor, str):
+        try:
+            momento = parse_datetime(valor)
+        except ValueError:
+            momento = None
+    if momento is None:
+        raise ErrorMapeo(f'{campo}: fecha y hora inválida: {valor!r}')
+    return momento if timezone.is_aware(momento) else timezone.make_aware(momento)
+
+
+def normalizar_registro(dato):
+    """
+    Registro mapeado -> dict con los campos de Atencion (referencias aún
+    externas). Levanta ErrorMapeo si falta algo o no tiene sentido.
+    """
+    if not isinstance(dato, dict):
+        raise ErrorMapeo('Registro de agenda inválido')
+    if dato.get('id_externo') in (None, ''):
+        raise ErrorMapeo('Falta id_externo')
+    registro = {'id_externo': str(dato['id_externo'])[:100]}
+    if dato.get('eliminado') is True:
+        registro['eliminado'] = True
+        return registro
+
+    inicio = _fechahora(dato.get('fecha_hora_inicio'), 'fecha_hora_inicio')
+    fin = None
+    if dato.get('fecha_hora_fin') not in (None, ''):
+        fin = _fechahora(dato['fecha_hora_fin'], 'fecha_hora_fin')
+        if fin <= inicio:
+            raise ErrorMapeo('fecha_hora_fin debe ser posterior a fecha_hora_inicio')
+
+    duracion = dato.get('duracion_planificada')
+    if duracion in (None, ''):
+        if fin is None:
+            raise ErrorMapeo('Falta duracion_planificada o fecha_hora_fin')
+        duracion = math.ceil((fin - inicio).total_seconds() / 60)
+    try:
+        duracion = int(duracion)
+    except (TypeError, ValueError):
+        raise ErrorMapeo(f'duracion_planificada inválida: {duracion!r}') from None
+    if not 1 <= duracion <= Atencion.DURACION_MAXIMA.total_seconds() // 60:
+        raise ErrorMapeo(f'duracion_planificada fuera de rango: {duracion}')
+
+    tipo = dato.get('tipo_atencion') or 'CONSULTA_GENERAL'
+    if tipo not in dict(Atencion.TIPO_ATENCION_CHOICES):
+        raise ErrorMapeo(f'tipo_atencion desconocido: {tipo!r}')
+    estado = dato.get('estado') or 'PROGRAMADA'
+    if estado not in ESTADOS_EXTERNOS:
+        raise ErrorMapeo(f'estado no importable: {estado!r}')
+
+    for referencia in ('paciente', 'medico', 'box'):
+        if dato.get(referencia) in (None, ''):
+            raise ErrorMapeo(f'Falta {referencia}')
+        registro[referencia] = str(dato[referencia])
+
+    registro.update(
+        fecha_hora_inicio=inicio,
+        fecha_hora_fin=fin,
+        duracion_planificada=duracion,
+        tipo_atencion=tipo,
+        estado=estado,
+        observaciones=str(dato.get('observaciones') or ''),
+    )
+    return registro
+
+
+# ============================================
+# REFERENCIAS
+# ============================================
+
+def _resolver(integracion, tipo, claves, modelo, por_clave_natural):
+    """
+    {clave externa: pk local} para un lote: primero IdentificadorExterno de
+    la integración, y lo que falte por la clave natural. Dos consultas.
+    """
+    if not claves:
+        return {}
+    a_pk = modelo._meta.pk.to_python
+    resueltas = {
+        id_externo: a_pk(id_local)
+        for id_externo, id_local in IdentificadorExterno.objects.filter(
+            integracion=integracion, tipo=tipo, id_externo__in=claves
+        ).values_list('id_externo', 'id_local')
+    }
+    pendientes = set(claves) - resueltas.keys()
+    if pendientes:
+        resueltas.update(por_clave_natural(pendientes))
+    return resueltas
+
+
+def _pacientes_por_rut(claves):
+    por_rut = {Paciente.formatear_rut(clave): clave for clave in claves if Paciente.validar_rut(clave)}
+    return {
+        por_rut[rut]: pk
+        for rut, pk in Paciente.objects.filter(rut__in=por_rut).values_list('rut', 'id')
+    }
+
+
+def _medicos_por_username(claves):
+    return dict(
+        get_user_model().objects.filter(username__in=claves, rol='MEDICO').values_list('username', 'id')
+    )
+
+
+def _boxes_por_numero(claves):
+    return dict(Box.objects.filter(numero__in=claves).values_list('numero', 'id'))
+
+
+# ============================================
+# ESCRITURA EN BLOQUE
+# ============================================
+
+def _sin_solapes(nuevas, cambiadas):
+    """
+    Descarta de la página lo que se solapa (mismo médico o box) con la agenda
+    vigente o con otro registro de la misma página, antes de escribir: en
+    SQLite no hay restricción de exclusión que lo rechace en el bulk_create/
+    bulk_update, y en PostgreSQL evita caer en los reintentos de a una.
+    La agenda se revisa con buscar_solapes (una consulta) sin las filas que la
+    página mueve o cancela: esas se cruzan entre sí solo en memoria, en su
+    posición y estado nuevos, así un intercambio o "cancelar X y reservar Y en
+    su lugar" no choca con la fila vieja. Dentro de la página gana lo que ya
+    estaba reservado (cambiadas) y luego el orden de llegada.
+    Devuelve (nuevas, cambiadas, rechazadas).
+    """
+    candidatas = [*cambiadas, *(atencion for _, atencion in nuevas)]
+    for atencion in candidatas:
+        atencion.fin_reserva = atencion.calcular_fin_reserva()
+    rechazadas = {
+        conflicto['atencion']
+        for conflicto in buscar_solapes(candidatas, excluir=[atencion.pk for atencion in cambiadas])
+    }
+
+    tomados = {}
+    for atencion in candidatas:
+        if atencion.estado not in Atencion.ESTADOS_VIGENTES or str(atencion.pk) in rechazadas:
+            continue
+        inicio, fin = atencion.fecha_hora_inicio, atencion.fin_reserva
+        recursos = (('medico', atencion.medico_id), ('box', atencion.box_id))
+        if any(
+            inicio < fin_otra and inicio_otra < fin
+            for recurso in recursos for inicio_otra, fin_otra in tomados.get(recurso, ())
+        ):
+            rechazadas.add(str(atencion.pk))
+            continue
+        for recurso in recursos:
+            tomados.setdefault(recurso, []).append((inicio, fin))
+
+    return (
+        [par for par in nuevas if str(par[1].pk) not in rechazadas],
+        [atencion for atencion in cambiadas if str(atencion.pk) not in rechazadas],
+        len(rechazadas),
+    )
+
+
+def _insertar(integracion, nuevas):
+    """
+    Inserta [(id_externo, Atencion)] con un bulk_create. Si choca con una
+    restricción (en PostgreSQL, un solape que otra transacción confirmó
+    después de _sin_solapes), reintenta de a una con savepoint para no perder
+    el resto. Devuelve las insertadas.
+    """
+    if not nuevas:
+        return []
+    try:
+        with transaction.atomic():
+            Atencion.objects.bulk_create([atencion for _, atencion in nuevas])
+        insertadas = nuevas
+    except IntegrityError:
+        insertadas = []
+        for par in nuevas:
+            try:
+                with transaction.atomic():
+                    Atencion.objects.bulk_create([par[1]])
+                insertadas.append(par)
+            except IntegrityError:
+                pass
+    IdentificadorExterno.objects.bulk_create([
+        IdentificadorExterno(integracion=integracion, tipo='ATENCION', id_externo=id_externo, id_local=str(atencion.pk))
+        for id_externo, atencion in insertadas
+    ])
+    return [atencion for _, atencion in insertadas]
+
+
+def _actualizar(cambiadas):
+    # bulk_update no pasa por save(): fin_reserva y fecha_actualizacion a mano
+    if not cambiadas:
+        return []
+    ahora = timezone.now()
+    for atencion in cambiadas:
+        atencion.fin_reserva = atencion.calcular_fin_reserva()
+        atencion.fecha_actualizacion = ahora
+    campos = [*(campo.removesuffix('_id') for campo in CAMPOS_SINCRONIZADOS), 'fin_reserva', 'fecha_actualizacion']
+    try:
+        with transaction.atomic():
+            Atencion.objects.bulk_update(cambiadas, campos)
+        return cambiadas
+    except IntegrityError:
+        aplicadas = []
+        for atencion in cambiadas:
+            try:
+                with transaction.atomic():
+                    Atencion.objects.bulk_update([atencion], campos)
+                aplicadas.append(atencion)
+            except IntegrityError:
+                pass
+        return aplicadas
+
+
+def aplicar_registros(integracion, registros):
+    """
+    Upsert de registros normalizados (una página) y efectos de las señales en
+    lote. Llamar dentro de una transacción. Devuelve un Counter de métricas.
+    """
+    metricas = Counter()
+    # Si un id viene repetido en la página, vale el último cambio
+    registros = list({registro['id_externo']: registro for registro in registros}.values())
+
+    locales = dict(
+        IdentificadorExterno.objects.filter(
+            integracion=integracion, tipo='ATENCION', id_externo__in=[r['id_externo'] for r in registros]
+        ).values_list('id_externo', 'id_local')
+    )
+    existentes = Atencion.objects.in_bulk([uuid.UUID(id_local) for id_local in locales.values()])
+
+    vigentes = [r for r in registros if not r.get('eliminado')]
+    pacientes = _resolver(integracion, 'PACIENTE', {r['paciente'] for r in vigentes}, Paciente, _pacientes_por_rut)
+    medicos = _resolver(
+        integracion, 'MEDICO', {r['medico'] for r in vigentes}, get_user_model(), _medicos_por_username
+    )
+    boxes = _resolver(integracion, 'BOX', {r['box'] for r in vigentes}, Box, _boxes_por_numero)
+
+    nuevas, cambiadas = [], []
+    estados_previos = {}
+    for registro in registros:
+        id_local = locales.get(registro['id_externo'])
+        atencion = existentes.get(uuid.UUID(id_local)) if id_local else None
+        if id_local and atencion is None:
+            # Importada antes pero ya archivada o borrada localmente
+            metricas['bloqueadas'] += 1
+            continue
+
+        if registro.get('eliminado'):
+            if atencion is None:
+                metricas['sin_cambios'] += 1
+                continue
+            campos = {'estado': 'CANCELADA'}
+        else:
+            try:
+                campos = {
+                    'paciente_id': pacientes[registro['paciente']],
+                    'medico_id': medicos[registro['medico']],
+                    'box_id': boxes[registro['box']],
+                }
+            except KeyError:
+                metricas['sin_referencia'] += 1
+                continue
+            campos.update({campo: registro[campo] for campo in CAMPOS_SINCRONIZADOS if campo in registro})
+
+        if atencion is None:
+            nuevas.append((registro['id_externo'], Atencion(**campos)))
+            continue
+        if all(getattr(atencion, campo) == valor for campo, valor in campos.items()):
+            metricas['sin_cambios'] += 1
+            continue
+        if atencion.estado not in ESTADOS_EDITABLES:
+            metricas['bloqueadas'] += 1
+            continue
+        if atencion.estado != campos.get('estado', atencion.estado):
+            estados_previos[atencion.pk] = {'estado': atencion.estado}
+        for campo, valor in campos.items():
+            setattr(atencion, campo, valor)
+        cambiadas.append(atencion)
+
+    nuevas, cambiadas, rechazadas = _sin_solapes(nuevas, cambiadas)
+    # Primero lo que se mueve o cancela: libera los lugares que toman las nuevas
+    actualizadas = _actualizar(cambiadas)
+    creadas = _insertar(integracion, nuevas)
+    metricas['conflictos'] += rechazadas + len(nuevas) - len(creadas) + len(cambiadas) - len(actualizadas)
+    metricas['creadas'] += len(creadas)
+    for atencion in actualizadas:
+        metricas['canceladas' if atencion.estado == 'CANCELADA' else 'actualizadas'] += 1
+
+    # Los estados de las editables eran PROGRAMADA/EN_ESPERA: todo cierre es nuevo
+    completadas = [a for a in actualizadas if a.estado == 'COMPLETADA']
+    cerradas = [a for a in (*creadas, *actualizadas) if a.estado in ('COMPLETADA', 'CANCELADA')]
+    con_efectos = [*creadas, *completadas]
+    usuarios = get_user_model().objects.in_bulk({a.medico_id for a in con_efectos})
+    for atencion in con_efectos:
+        atencion.medico = usuarios[atencion.medico_id]
+    metricas.update(aplicar_efectos_en_lote(
+        creadas=creadas, completadas=completadas, cerradas=cerradas, origen=integracion
+    ))
+
+    # Eventos salientes para las demás integraciones (el equivalente de
+    # integraciones.signals en lote)
+    publicar('ATENCION', creadas, 'creacion', origen=integracion)
+    publicar(
+        'ATENCION', [a for a in actualizadas if a.pk in estados_previos], 'cambio_estado',
+        anteriores=estados_previos, origen=integracion
+    )
+    return metricas
+
+
+# ============================================
+# CORRIDA
+# ============================================
+
+def _texto_fecha(valor):
+    return valor.isoformat() if isinstance(valor, (date, datetime)) else str(valor)
+
+
+def _pedir_pagina(integracion, parametros, pool):
+    respuesta = con_reintentos(lambda: solicitar(integracion, 'GET', integracion.RUTA_AGENDA, pool=pool,
+                                                 parametros=parametros))
+    if respuesta.estado >= 400:
+        raise ErrorHttp(f'HTTP {respuesta.estado}', estado=respuesta.estado, tiempo_ms=respuesta.tiempo_ms)
+    pagina = respuesta.json()
+    if isinstance(pagina, list):
+        pagina = {'registros': pagina}
+    if not isinstance(pagina, dict) or not isinstance(pagina.get('registros', []), list):
+        raise ErrorHttp('Respuesta de agenda con formato inesperado', estado=respuesta.estado)
+    return pagina, respuesta.tiempo_ms
+
+
+def _mapear_pagina(mapeador, registros, errores):
+    # Mapeo + normalización; los inválidos quedan en `errores`
+    normalizados = []
+    for resultado in mapeador.mapear_lote(registros, errores):
+        if resultado is None:
+            continue
+        for dato in resultado if isinstance(resultado, list) else [resultado]:
+            try:
+                normalizados.append(normalizar_registro(dato))
+            except ErrorMapeo as error:
+                errores.append((None, str(error)))
+    return normalizados
+
+
+def sincronizar_agenda(integracion, fecha_desde=None, fecha_hasta=None, pool=None, tamano_pagina=None):
+    """
+    Trae y aplica los cambios de agenda desde la marca de agua de la
+    integración (cursor_agenda, o ultima_sincronizacion_agenda si aún no hay
+    cursor). Con fecha_desde/fecha_hasta pide esa ventana completa y no
+    mueve la marca. Deja un LogSincronizacion con las métricas y las devuelve.
+    """
+    inicio_corrida = timezone.now()
+    inicio = time.monotonic()
+    ventana = fecha_desde is not None or fecha_hasta is not None
+    cursor = '' if ventana else integracion.cursor_agenda
+    metricas = Counter({nombre: 0 for nombre in METRICAS})
+    errores = []
+    ms_http = 0
+    error_corrida = None
+
+    try:
+        mapeador = mapeador_de(integracion, 'mapeo_agenda')
+        while True:
+            parametros = {'limite': tamano_pagina or settings.AGENDA_TAMANO_PAGINA}
+            if cursor:
+                parametros['cursor'] = cursor
+            elif integracion.ultima_sincronizacion_agenda and not ventana:
+                parametros['desde'] = integracion.ultima_sincronizacion_agenda.isoformat()
+            if fecha_desde is not None:
+                parametros['fecha_desde'] = _texto_fecha(fecha_desde)
+            if fecha_hasta is not None:
+                parametros['fecha_hasta'] = _texto_fecha(fecha_hasta)
+
+            pagina, ms = _pedir_pagina(integracion, parametros, pool)
+            ms_http += ms or 0
+            registros = pagina.get('registros') or []
+            cursor_nuevo = str(pagina.get('cursor') or cursor)
+            invalidos_antes = len(errores)
+            normalizados = _mapear_pagina(mapeador, registros, errores)
+
+            # La página y su cursor juntos: si algo falla, se vuelve a pedir
+            with transaction.atomic():
+                metricas.update(aplicar_registros(integracion, normalizados))
+                if not ventana and cursor_nuevo != integracion.cursor_agenda:
+                    IntegracionExterna.objects.filter(pk=integracion.pk).update(cursor_agenda=cursor_nuevo)
+                    integracion.cursor_agenda = cursor_nuevo
+
+            metricas['paginas'] += 1
+            metricas['recibidos'] += len(registros)
+            metricas['invalidos'] += len(errores) - invalidos_antes
+            # Sin avance del cursor no hay forma de pedir la página siguiente
+            if not pagina.get('hay_mas') or not registros or cursor_nuevo == cursor:
+                break
+            cursor = cursor_nuevo
+    except (ErrorHttp, ValueError) as error:
+        error_corrida = error
+        logger.warning('Falla sincronizando agenda',
+                       extra={'integracion': integracion.nombre_sistema, 'error': str(error)})
+
+    if error_corrida is None and not ventana:
+        IntegracionExterna.objects.filter(pk=integracion.pk).update(ultima_sincronizacion_agenda=inicio_corrida)
+        integracion.ultima_sincronizacion_agenda = inicio_corrida
+
+    datos = dict(metricas, duracion_ms=round((time.monotonic() - inicio) * 1000))
+    if errores:
+        datos['errores'] = [mensaje for _, mensaje in errores[:20]]
+    if error_corrida is not None:
+        estado, mensaje = 'ERROR', f'Error sincronizando agenda: {error_corrida}'
+        datos['error'] = str(error_corrida)
+    elif metricas['invalidos'] or metricas['sin_referencia'] or metricas['conflictos']:
+        estado, mensaje = 'ADVERTENCIA', 'Agenda sincronizada con registros omitidos'
+    else:
+        estado, mensaje = 'EXITOSA', 'Agenda sincronizada'
+    LogSincronizacion.objects.create(
+        integracion=integracion,
+        estado=estado,
+        mensaje=f"{mensaje}: {metricas['creadas']} nuevas, {metricas['actualizadas']} actualizadas, "
+                f"{metricas['canceladas']} canceladas",
+        datos_adicionales=datos,
+        tiempo_respuesta_ms=ms_http,
+    )
+    return datos
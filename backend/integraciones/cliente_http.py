@@ -0,0 +1,245 @@
+"""
+Cliente HTTP para los sistemas externos (IntegracionExterna).
+
+Solo biblioteca estándar: http.client con un pool de conexiones keep-alive
+por (esquema, host, puerto), para no pagar TCP + TLS en cada sincronización.
+Las llamadas son bloqueantes; el worker asíncrono (integraciones/worker.py)
+las corre en hilos con asyncio.to_thread.
+
+Los errores que vale la pena reintentar (conexión, timeout, 5xx, 429) se
+levantan como ErrorTransitorio; con_reintentos los reintenta con backoff
+exponencial con jitter completo.
+"""
+import base64
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from urllib.parse import urlencode, urljoin, urlsplit
+
+from django.conf import settings
+
+
+# Una conexión del pool que el servidor cerró por inactividad falla así al
+# reutilizarla; se reintenta una vez con una conexión nueva
+_CONEXION_VENCIDA = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class ErrorHttp(Exception):
+    """Respuesta no exitosa o falla de red."""
+
+    def __init__(self, mensaje, estado=None, tiempo_ms=None):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.tiempo_ms = tiempo_ms
+
+
+class ErrorTransitorio(ErrorHttp):
+    """Vale la pena reintentar (conexión, timeout, 5xx, 429)."""
+
+    def __init__(self, mensaje, estado=None, tiempo_ms=None, reintentar_en=None, timeout=False):
+        super().__init__(mensaje, estado, tiempo_ms)
+        self.reintentar_en = reintentar_en
+        self.timeout = timeout
+
+
+@dataclass
+class RespuestaHttp:
+    estado: int
+    cuerpo: bytes
+    cabeceras: dict = field(default_factory=dict)
+    tiempo_ms: int = 0
+
+    def json(self):
+        return json.loads(self.cuerpo) if self.cuerpo else None
+
+
+def _reintentar_en(cabeceras):
+    # Retry-After en segundos (la forma con fecha HTTP no se usa en la práctica)
+    try:
+        return max(0.0, float(cabeceras.get('retry-after')))
+    except (TypeError, ValueError):
+        return None
+
+
+class PoolConexiones:
+    """
+    Conexiones keep-alive reutilizables, seguro entre hilos. Guarda hasta
+    `max_por_host` conexiones ociosas por destino; las que el servidor marca
+    para cerrar (Connection: close, HTTP/1.0) no vuelven al pool.
+    """
+
+    def __init__(self, max_por_host=10, timeout=None):
+        self.max_por_host = max_por_host
+        self.timeout = settings.INTEGRACIONES_HTTP_TIMEOUT if timeout is None else timeout
+        self._ociosas = defaultdict(list)
+        self._lock = threading.Lock()
+        self.conexiones_abiertas = 0
+
+    def _destino(self, url):
+        partes = urlsplit(url)
+        if partes.scheme not in ('http', 'https'):
+            raise ErrorHttp(f'Esquema no soportado: {partes.scheme}')
+        puerto = partes.port or (443 if partes.scheme == 'https' else 80)
+        ruta = partes.path or '/'
+        if partes.query:
+            ruta = f'{ruta}?{partes.query}'
+        return (partes.scheme, partes.hostname, puerto), ruta
+
+    def _tomar(self, destino, nueva=False):
+        with self._lock:
+            if self._ociosas[destino] and not nueva:
+                return self._ociosas[destino].pop(), True
+            self.conexiones_abiertas += 1
+        esquema, host, puerto = destino
+        clase = http.client.HTTPSConnection if esquema == 'https' else http.client.HTTPConnection
+        return clase(host, puerto, timeout=self.timeout), False
+
+    def _devolver(self, destino, conexion):
+        with self._lock:
+            if len(self._ociosas[destino]) < self.max_por_host:
+                self._ociosas[destino].append(conexion)
+                return
+        conexion.close()
+
+    def solicitar(self, metodo, url, cuerpo=None, cabeceras=None):
+        """
+        Hace la petición y devuelve RespuestaHttp con el cuerpo completo. Los
+        4xx se devuelven (el llamador decide); 5xx, 429 y fallas de red
+        levantan ErrorTransitorio.
+        """
+        destino, ruta = self._destino(url)
+        cabeceras = {'Accept': 'application/json', **(cabeceras or {})}
+        if cuerpo is not None and not isinstance(cuerpo, bytes):
+            cuerpo = json.dumps(cuerpo, ensure_ascii=False, default=str).encode()
+            cabeceras.setdefault('Content-Type', 'application/json')
+
+        inicio = time.monotonic()
+        for intento in range(2):
+            conexion, reutilizada = self._tomar(destino, nueva=intento > 0)
+            try:
+                conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = conexion.getresponse()
+                contenido = respuesta.read()
+            except _CONEXION_VENCIDA as error:
+                conexion.close()
+                if reutilizada:
+                    continue
+                raise ErrorTransitorio(f'Conexión cerrada por el servidor: {error}',
+                                       tiempo_ms=_ms_desde(inicio)) from error
+            except socket.timeout as error:
+                conexion.close()
+                raise ErrorTransitorio('Tiempo de espera agotado', tiempo_ms=_ms_desde(inicio),
+                                       timeout=True) from error
+            except (OSError, http.client.HTTPException) as error:
+                conexion.close()
+                raise ErrorTransitorio(f'Error de conexión: {error}', tiempo_ms=_ms_desde(inicio)) from error
+            break
+
+        if respuesta.will_close:
+            conexion.close()
+        else:
+            self._devolver(destino, conexion)
+
+        resultado = RespuestaHttp(
+            estado=respuesta.status,
+            cuerpo=contenido,
+            cabeceras={clave.lower(): valor for clave, valor in respuesta.getheaders()},
+            tiempo_ms=_ms_desde(inicio),
+        )
+        if respuesta.status == 429 or respuesta.status >= 500:
+            raise ErrorTransitorio(
+                f'HTTP {respuesta.status}', estado=respuesta.status, tiempo_ms=resultado.tiempo_ms,
+                reintentar_en=_reintentar_en(resultado.cabeceras)
+            )
+        return resultado
+
+    def cerrar(self):
+        with self._lock:
+            ociosas = [conexion for lista in self._ociosas.values() for conexion in lista]
+            self._ociosas.clear()
+        for conexion in ociosas:
+            conexion.close()
+
+
+def _ms_desde(inicio):
+    return round((time.monotonic() - inicio) * 1000)
+
+
+# Pool compartido del proceso (acción del admin, llamadas puntuales del modelo)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_compartido():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolConexiones()
+        return _pool
+
+
+# ============================================
+# REINTENTOS
+# ============================================
+
+def espera_backoff(intento, base=None, maximo=None):
+    # Jitter completo: uniforme en [0, min(maximo, base * 2^intento)]
+    base = settings.INTEGRACIONES_BACKOFF_BASE if base is None else base
+    maximo = settings.INTEGRACIONES_BACKOFF_MAXIMO if maximo is None else maximo
+    return random.uniform(0, min(maximo, base * 2 ** intento))
+
+
+def espera_reintento(error, intento):
+    # Respeta Retry-After si el servidor lo manda
+    espera = espera_backoff(intento)
+    if error.reintentar_en is not None:
+        espera = max(espera, min(error.reintentar_en, settings.INTEGRACIONES_BACKOFF_MAXIMO))
+    return espera
+
+
+def con_reintentos(funcion, intentos=None, dormir=time.sleep):
+    # Llama funcion() hasta `intentos` veces mientras levante ErrorTransitorio
+    intentos = settings.INTEGRACIONES_REINTENTOS if intentos is None else intentos
+    for intento in range(intentos):
+        try:
+            return funcion()
+        except ErrorTransitorio as error:
+            if intento == intentos - 1:
+                raise
+            dormir(espera_reintento(error, intento))
+
+
+# ============================================
+# PETICIONES A UNA INTEGRACIÓN
+# ============================================
+
+def cabeceras_autenticacion(integracion):
+    # token_acceso_encrypted se usa tal cual: el proyecto aún no cifra el token
+    token = integracion.token_acceso_encrypted
+    if not token:
+        return {}
+    metodo = integracion.metodo_autenticacion
+    if metodo == 'API_KEY':
+        return {'X-API-Key': token}
+    if metodo == 'BASIC_AUTH':
+        # Guardado como "usuario:clave"
+        return {'Authorization': f"Basic {base64.b64encode(token.encode()).decode()}"}
+    if metodo in ('BEARER_TOKEN', 'OAUTH2', 'JWT'):
+        return {'Authorization': f'Bearer {token}'}
+    return {}
+
+
+def url_integracion(integracion, ruta='', parametros=None):
+    # ruta relativa a endpoint_base_url (con o sin / final en la base)
+    base = integracion.endpoint_base_url
+    if not base.endswith('/'):
+        base += '/'
+    url = urljoin(base, ruta.lstrip('/'))
+    if parametros:
+        url = f'{url}?{urlencode(parametros)}'
+    return url
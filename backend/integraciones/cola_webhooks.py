@@ -0,0 +1,283 @@
+"""
+Cola persistente de webhooks entrantes (EventoWebhook).
+
+El endpoint (views.recibir_webhook) verifica la firma, encola con un único
+INSERT y responde 202; no mapea ni escribe logs. Un reenvío del mismo evento
+choca con la restricción (integracion, clave_idempotencia) y se descarta en
+el mismo INSERT (ON CONFLICT DO NOTHING). Si la cola supera
+settings.WEBHOOK_BACKLOG_MAXIMO, el endpoint responde 429 con Retry-After y
+el emisor reintenta más tarde.
+
+procesar_webhooks.py drena la cola en lotes: toma eventos con un arriendo
+(otro worker los retoma si el que los tomó muere), los mapea y los procesa
+por integración y tipo en una transacción, con una sola actualización de
+estado y un solo LogSincronizacion por grupo. Los tipos con efecto en el
+dominio registran su manejador con @manejador_webhook('tipo'), que recibe
+todos los eventos del tipo del lote a la vez para escribir en bloque.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .mapeo import mapeador_de
+from .models import EventoWebhook, LogSincronizacion
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 200
+
+# Tiempo que un worker tiene un lote tomado antes de que otro pueda retomarlo
+ARRIENDO = timedelta(minutes=5)
+
+# El tamaño de la cola se cachea: contarla en cada webhook sería otro
+# recorrido por petición justo cuando llegan en ráfaga
+CLAVE_BACKLOG = 'webhooks:backlog'
+CACHE_BACKLOG = 2  # segundos
+
+ESTADOS_EN_COLA = ['PENDIENTE', 'PROCESANDO']
+
+_manejadores = {}
+
+
+def manejador_webhook(tipo):
+    """
+    Registra la función que procesa los eventos de `tipo`:
+        @manejador_webhook('agenda')
+        def procesar_agenda(integracion, eventos, datos): ...
+    `datos` son los payloads ya mapeados, en el mismo orden que `eventos`.
+    """
+    def registrar(funcion):
+        _manejadores[tipo] = funcion
+        return funcion
+    return registrar
+
+
+# ============================================
+# RECEPCIÓN
+# ============================================
+
+def firma_valida(secreto, cuerpo, firma):
+    # X-Webhook-Firma: HMAC-SHA256 hex del cuerpo, con o sin prefijo "sha256="
+    if not secreto or not firma:
+        return False
+    esperada = hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperada, firma.removeprefix('sha256=').strip().lower())
+
+
+def clave_idempotencia(evento, cabecera=None):
+    # Idempotency-Key de la petición, id propio del evento o hash del contenido
+    if cabecera:
+        return cabecera[:200]
+    for campo in ('idempotency_key', 'event_id', 'id'):
+        valor = evento.get(campo)
+        if valor not in (None, ''):
+            return str(valor)[:200]
+    contenido = json.dumps(evento, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return f"sha256:{hashlib.sha256(contenido.encode()).hexdigest()}"
+
+
+def tipo_evento(evento):
+    for campo in ('tipo', 'tipo_evento', 'type', 'event'):
+        if isinstance(evento.get(campo), str):
+            return evento[campo][:100]
+    return ''
+
+
+def backlog():
+    # Eventos en cola (aproximado, cacheado CACHE_BACKLOG segundos)
+    total = cache.get(CLAVE_BACKLOG)
+    if total is None:
+        total = EventoWebhook.objects.filter(estado__in=ESTADOS_EN_COLA).count()
+        cache.set(CLAVE_BACKLOG, total, timeout=CACHE_BACKLOG)
+    return total
+
+
+def encolar(integracion_id, eventos, idempotency_key=None):
+    """
+    Encola los eventos (dicts) de una integración; los repetidos se ignoran.
+    La Idempotency-Key de la petición solo aplica si viene un único evento.
+    """
+    cabecera = idempotency_key if len(eventos) == 1 else None
+    EventoWebhook.objects.bulk_create(
+        [
+            EventoWebhook(
+                integracion_id=integracion_id,
+                clave_idempotencia=clave_idempotencia(evento, cabecera),
+                tipo_evento=tipo_evento(evento),
+                payload=evento,
+            )
+            for evento in eventos
+        ],
+        ignore_conflicts=True
+    )
+    return len(eventos)
+
+
+# ============================================
+# PROCESAMIENTO EN LOTES
+# ============================================
+
+def tomar_lote(tamano=TAMANO_LOTE):
+    # Toma hasta `tamano` eventos disponibles (pendientes o con arriendo vencido)
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            EventoWebhook.objects.select_for_update(skip_locked=True)
+            .filter(estado__in=ESTADOS_EN_COLA, disponible_en__lte=ahora)
+            .order_by('disponible_en', 'id')
+            .values_list('id', flat=True)[:tamano]
+        )
+        if not ids:
+            return []
+        EventoWebhook.objects.filter(id__in=ids).update(
+            estado='PROCESANDO', disponible_en=ahora + ARRIENDO, intentos=F('intentos') + 1
+        )
+    return list(EventoWebhook.objects.filter(id__in=ids).select_related('integracion').order_by('id'))
+
+
+def _espera_reintento(intentos):
+    # 10 s, 20 s, 40 s... hasta 10 minutos
+    return timedelta(seconds=min(600, 10 * 2 ** (intentos - 1)))
+
+
+def _reprogramar(eventos, error):
+    ahora = timezone.now()
+    fallidos = 0
+    for evento in eventos:
+        evento.error = str(error)[:2000]
+        if evento.intentos >= settings.WEBHOOK_MAX_INTENTOS:
+            evento.estado = 'ERROR'
+            evento.procesado_en = ahora
+            fallidos += 1
+        else:
+            evento.estado = 'PENDIENTE'
+            evento.disponible_en = ahora + _espera_reintento(evento.intentos)
+    EventoWebhook.objects.bulk_update(eventos, ['estado', 'disponible_en', 'procesado_en', 'error'])
+    return fallidos
+
+
+def _procesar_grupo(integracion, eventos):
+    # Eventos de una integración: todo o nada en una transacción
+    inicio = time.monotonic()
+    validos = [evento for evento in eventos if integracion._validar_formato_webhook(evento.payload)]
+
+    # Mapeo del grupo completo con el mapeador compilado; los que no se
+    # pueden mapear quedan inválidos sin frenar al resto
+    errores = []
+    datos = mapeador_de(integracion).mapear_lote([evento.payload for evento in validos], errores)
+    con_error = {indice for indice, _ in errores}
+    mapeados = [(evento, dato) for indice, (evento, dato) in enumerate(zip(validos, datos)) if indice not in con_error]
+
+    ids_validos = {evento.id for evento, _ in mapeados}
+    invalidos = [evento.id for evento in eventos if evento.id not in ids_validos]
+
+    with transaction.atomic():
+        por_tipo = defaultdict(lambda: ([], []))
+        for evento, dato in mapeados:
+            lista_eventos, lista_datos = por_tipo[evento.tipo_evento]
+            lista_eventos.append(evento)
+            lista_datos.append(dato)
+        for tipo, (lista_eventos, lista_datos) in por_tipo.items():
+            manejador = _manejadores.get(tipo)
+            if manejador is not None:
+                manejador(integracion, lista_eventos, lista_datos)
+
+        ahora = timezone.now()
+        EventoWebhook.objects.filter(id__in=ids_validos).update(
+            estado='PROCESADO', procesado_en=ahora, error=''
+        )
+        if invalidos:
+            EventoWebhook.objects.filter(id__in=invalidos).update(
+                estado='ERROR', procesado_en=ahora, error='Formato de webhook inválido o no mapeable'
+            )
+        LogSincronizacion.objects.create(
+            integracion=integracion,
+            estado='WEBHOOK_PROCESADO' if not invalidos else 'DATOS_INVALIDOS',
+            mensaje=f'{len(mapeados)} webhooks procesados' + (f', {len(invalidos)} inválidos' if invalidos else ''),
+            datos_adicionales={
+                'eventos': len(eventos),
+                'tipos': dict(Counter(evento.tipo_evento or '-' for evento, _ in mapeados)),
+                'invalidos': invalidos[:50],
+                'errores_mapeo': [mensaje for _, mensaje in errores[:20]],
+            },
+            tiempo_respuesta_ms=round((time.monotonic() - inicio) * 1000),
+        )
+    return len(mapeados), len(invalidos)
+
+
+def procesar_lote(eventos):
+    """
+    Procesa eventos tomados con tomar_lote. Devuelve
+    {'procesados': n, 'invalidos': m, 'reintentos': r, 'fallidos': f}.
+    """
+    resultado = Counter(procesados=0, invalidos=0, reintentos=0, fallidos=0)
+    por_integracion = defaultdict(list)
+    for evento in eventos:
+        por_integracion[evento.integracion_id].append(evento)
+
+    for grupo in por_integracion.values():
+        integracion = grupo[0].integracion
+        try:
+            procesados, invalidos = _procesar_grupo(integracion, grupo)
+        except Exception as error:
+            logger.warning(
+                'Falla procesando webhooks',
+                exc_info=True, extra={'integracion': integracion.nombre_sistema, 'eventos': len(grupo)}
+            )
+            fallidos = _reprogramar(grupo, error)
+            resultado['fallidos'] += fallidos
+            resultado['reintentos'] += len(grupo) - fallidos
+            LogSincronizacion.objects.create(
+                integracion=integracion,
+                estado='ERROR',
+                mensaje=f'Error procesando webhooks: {error}',
+                datos_adicionales={'eventos': len(grupo), 'fallidos': fallidos},
+            )
+            continue
+        resultado['procesados'] += procesados
+        resultado['invalidos'] += invalidos
+    return dict(resultado)
+
+
+def drenar(tamano_lote=TAMANO_LOTE, max_lotes=None):
+    # Procesa lotes hasta vaciar la cola (o max_lotes); devuelve los totales
+    totales = Counter()
+    lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        eventos = tomar_lote(tamano_lote)
+        if not eventos:
+            break
+        totales.update(procesar_lote(eventos))
+        lotes += 1
+    return dict(totales)
+
+
+def depurar_eventos(dias=None, dias_error=None, tamano_lote=2000):
+    # Borra los eventos procesados hace más de `dias` y los en ERROR hace más
+    # de `dias_error` (los anteriores a procesado_en, por recibido_en); devuelve cuántos
+    dias = settings.WEBHOOK_RETENCION_DIAS if dias is None else dias
+    dias_error = settings.WEBHOOK_RETENCION_ERRORES_DIAS if dias_error is None else dias_error
+    ahora = timezone.now()
+    limite, limite_error = ahora - timedelta(days=dias), ahora - timedelta(days=dias_error)
+    vencidos = Q(estado='PROCESADO', procesado_en__lt=limite) | Q(estado='ERROR') & (
+        Q(procesado_en__lt=limite_error) | Q(procesado_en__isnull=True, recibido_en__lt=limite_error)
+    )
+    total = 0
+    while True:
+        ids = list(
+            EventoWebhook.objects.filter(vencidos)
+            .order_by().values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return total
+        total += EventoWebhook.objects.filter(pk__in=ids).delete()[0]
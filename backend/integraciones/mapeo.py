@@ -0,0 +1,409 @@
+"""
+Mapeo de payloads externos a campos locales (IntegracionExterna.configuracion_mapeo).
+
+configuracion_mapeo es {campo_local: regla}. La regla puede ser:
+- una ruta: "rut", "paciente.rut", "diagnosticos[].codigo" (lista por cada
+  elemento), "telefonos.0" (índice);
+- un dict con:
+    origen: la ruta
+    tipo: texto | entero | decimal | booleano | fecha | fechahora | rut | enum
+    valores: {externo: local} para enum
+    formato: formato strptime para fecha/fechahora (por defecto ISO 8601)
+    por_defecto: valor si la ruta no existe o viene null
+La clave especial "_registros" es la ruta a una lista del payload: cada
+elemento se mapea como un registro aparte (fan-out) y las reglas se resuelven
+contra el elemento; "^." en una ruta apunta al payload completo.
+
+La configuración se compila una vez en closures (rutas ya partidas,
+conversores ya elegidos) y se cachea por integración mientras no cambie su
+fecha_actualizacion; mapear un registro solo ejecuta esas closures.
+mapear_lote procesa miles de registros con el mismo mapeador.
+
+MapeadorInverso aplica la misma configuración al revés, para los eventos
+salientes (integraciones/publicador.py): cada campo local se escribe en su
+ruta externa. Solo se invierten rutas de claves ("a.b.c"); las reglas con
+"[]", índices o "^." no tienen inversa y sus campos salen sin renombrar.
+"""
+import threading
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class ErrorMapeo(ValueError):
+    """El payload no se puede mapear (tipo inválido, enum desconocido, etc.)."""
+
+
+# Marca de "la ruta no existe" (distinta de un null explícito)
+_FALTA = object()
+
+CLAVE_REGISTROS = '_registros'
+PREFIJO_RAIZ = '^.'
+
+
+# ============================================
+# RUTAS
+# ============================================
+
+def _partir_ruta(ruta):
+    # "a.b[].c.0" -> [('clave', 'a'), ('clave', 'b'), ('todos', None), ('clave', 'c'), ('indice', 0)]
+    pasos = []
+    for parte in ruta.split('.'):
+        todos = parte.endswith('[]')
+        if todos:
+            parte = parte[:-2]
+        if parte:
+            pasos.append(('indice', int(parte)) if parte.isdigit() else ('clave', parte))
+        if todos:
+            pasos.append(('todos', None))
+    if not pasos:
+        raise ErrorMapeo(f'Ruta vacía: {ruta!r}')
+    return pasos
+
+
+def _compilar_pasos(pasos):
+    # Una closure por paso, encadenadas
+    if not pasos:
+        return lambda valor: valor
+    tipo, argumento = pasos[0]
+    resto = _compilar_pasos(pasos[1:])
+
+    if tipo == 'clave':
+        if len(pasos) == 1:
+            def obtener(valor):
+                return valor.get(argumento, _FALTA) if isinstance(valor, dict) else _FALTA
+        else:
+            def obtener(valor):
+                if isinstance(valor, dict) and argumento in valor:
+                    return resto(valor[argumento])
+                return _FALTA
+    elif tipo == 'indice':
+        def obtener(valor):
+            if isinstance(valor, list) and -len(valor) <= argumento < len(valor):
+                return resto(valor[argumento])
+            return _FALTA
+    else:
+        def obtener(valor):
+            if not isinstance(valor, list):
+                return _FALTA
+            return [x for x in map(resto, valor) if x is not _FALTA]
+    return obtener
+
+
+def compilar_ruta(ruta):
+    # Función (registro, raiz) -> valor o _FALTA
+    if ruta.startswith(PREFIJO_RAIZ):
+        obtener = _compilar_pasos(_partir_ruta(ruta[len(PREFIJO_RAIZ):]))
+        return lambda registro, raiz: obtener(raiz)
+    obtener = _compilar_pasos(_partir_ruta(ruta))
+    return lambda registro, raiz: obtener(registro)
+
+
+# ============================================
+# CONVERSORES
+# ============================================
+
+def _texto(valor):
+    return valor if isinstance(valor, str) else str(valor)
+
+
+def _entero(valor):
+    if isinstance(valor, bool):
+        raise ErrorMapeo(f'Entero inválido: {valor!r}')
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ErrorMapeo(f'Entero inválido: {valor!r}') from None
+
+
+def _decimal(valor):
+    try:
+        return Decimal(str(valor))
+    except InvalidOperation:
+        raise ErrorMapeo(f'Decimal inválido: {valor!r}') from None
+
+
+_VERDADEROS = {'1', 'true', 't', 'si', 'sí', 's', 'yes', 'y'}
+_FALSOS = {'0', 'false', 'f', 'no', 'n'}
+
+
+def _booleano(valor):
+    if isinstance(valor, bool):
+        return valor
+    texto = str(valor).strip().lower()
+    if texto in _VERDADEROS:
+        return True
+    if texto in _FALSOS:
+        return False
+    raise ErrorMapeo(f'Booleano inválido: {valor!r}')
+
+
+def _conversor_fecha(formato):
+    def convertir(valor):
+        if isinstance(valor, date):
+            return valor
+        try:
+            fecha = datetime.strptime(valor, formato).date() if formato else parse_date(valor)
+        except (TypeError, ValueError):
+            fecha = None
+        if fecha is None:
+            raise ErrorMapeo(f'Fecha inválida: {valor!r}')
+        return fecha
+    return convertir
+
+
+def _conversor_fechahora(formato):
+    def convertir(valor):
+        try:
+            momento = datetime.strptime(valor, formato) if formato else parse_datetime(valor)
+        except (TypeError, ValueError):
+            momento = None
+        if momento is None:
+            raise ErrorMapeo(f'Fecha y hora inválida: {valor!r}')
+        # Sin zona: hora local del centro (settings.TIME_ZONE)
+        return momento if timezone.is_aware(momento) else timezone.make_aware(momento)
+    return convertir
+
+
+def _conversor_rut():
+    from pacientes.models import Paciente
+
+    def convertir(valor):
+        rut = _texto(valor).strip()
+        if not Paciente.validar_rut(rut):
+            raise ErrorMapeo(f'RUT inválido: {valor!r}')
+        return Paciente.formatear_rut(rut)
+    return convertir
+
+
+def _conversor_enum(valores):
+    # Las claves se comparan como texto: {"1": "URGENTE"} acepta 1 y "1"
+    tabla = {str(externo): local for externo, local in valores.items()}
+
+    def convertir(valor):
+        try:
+            return tabla[str(valor)]
+        except KeyError:
+            raise ErrorMapeo(f'Valor fuera del enum: {valor!r}') from None
+    return convertir
+
+
+def _conversor(regla):
+    tipo = regla.get('tipo', 'crudo')
+    if tipo == 'crudo':
+        return None
+    if tipo == 'texto':
+        return _texto
+    if tipo == 'entero':
+        return _entero
+    if tipo == 'decimal':
+        return _decimal
+    if tipo == 'booleano':
+        return _booleano
+    if tipo == 'fecha':
+        return _conversor_fecha(regla.get('formato'))
+    if tipo == 'fechahora':
+        return _conversor_fechahora(regla.get('formato'))
+    if tipo == 'rut':
+        return _conversor_rut()
+    if tipo == 'enum':
+        if not isinstance(regla.get('valores'), dict):
+            raise ErrorMapeo("Un enum necesita 'valores': {externo: local}")
+        return _conversor_enum(regla['valores'])
+    raise ErrorMapeo(f'Tipo de mapeo desconocido: {tipo!r}')
+
+
+# ============================================
+# COMPILACIÓN
+# ============================================
+
+def _compilar_campo(campo, regla):
+    if isinstance(regla, str):
+        regla = {'origen': regla}
+    if not isinstance(regla, dict) or not isinstance(regla.get('origen'), str):
+        raise ErrorMapeo(f'Regla de mapeo inválida para {campo!r}: {regla!r}')
+    obtener = compilar_ruta(regla['origen'])
+    convertir = _conversor(regla)
+    tiene_defecto = 'por_defecto' in regla
+    por_defecto = regla.get('por_defecto')
+
+    def mapear(registro, raiz, destino):
+        valor = obtener(registro, raiz)
+        if valor is _FALTA or valor is None:
+            if tiene_defecto:
+                destino[campo] = por_defecto
+            elif valor is None:
+                destino[campo] = None
+            return
+        if convertir is not None:
+            try:
+                valor = [convertir(x) for x in valor] if isinstance(valor, list) else convertir(valor)
+            except ErrorMapeo as error:
+                raise ErrorMapeo(f'{campo}: {error}') from None
+        destino[campo] = valor
+    return mapear
+
+
+class MapeadorCompilado:
+    """
+    Mapeador de una configuracion_mapeo. Llamarlo con un payload devuelve el
+    dict mapeado, o la lista de dicts si la configuración tiene _registros.
+    """
+
+    def __init__(self, configuracion):
+        configuracion = dict(configuracion or {})
+        ruta_registros = configuracion.pop(CLAVE_REGISTROS, None)
+        self.identidad = not configuracion
+        self.fan_out = ruta_registros is not None
+        self._registros = compilar_ruta(ruta_registros) if self.fan_out else None
+        self._campos = [_compilar_campo(campo, regla) for campo, regla in configuracion.items()]
+
+    def _mapear_registro(self, registro, raiz):
+        if self.identidad:
+            return registro
+        destino = {}
+        for mapear in self._campos:
+            mapear(registro, raiz, destino)
+        return destino
+
+    def __call__(self, payload):
+        if not self.fan_out:
+            return self._mapear_registro(payload, payload)
+        registros = self._registros(payload, payload)
+        if registros is _FALTA:
+            return []
+        if not isinstance(registros, list):
+            registros = [registros]
+        return [self._mapear_registro(registro, payload) for registro in registros]
+
+    def mapear_lote(self, payloads, errores=None):
+        """
+        Mapea muchos payloads con el mismo mapeador. Sin `errores`, el primer
+        payload inválido levanta ErrorMapeo; con una lista, se agregan ahí
+        (indice, mensaje) y ese resultado queda en None.
+        """
+        if errores is None:
+            return [self(payload) for payload in payloads]
+        resultados = []
+        for indice, payload in enumerate(payloads):
+            try:
+                resultados.append(self(payload))
+            except ErrorMapeo as error:
+                errores.append((indice, str(error)))
+                resultados.append(None)
+        return resultados
+
+
+# ============================================
+# MAPEO INVERSO
+# ============================================
+
+def _inverso_enum(valores):
+    # {externo: local} -> {local: externo}; si dos externos van al mismo local, gana el primero
+    tabla = {}
+    for externo, local in valores.items():
+        tabla.setdefault(local, externo)
+    return lambda valor: tabla.get(valor, valor)
+
+
+def _inverso_fecha(formato, fechahora):
+    def convertir(valor):
+        momento = parse_datetime(valor) if fechahora else parse_date(valor)
+        if momento is None:
+            return valor
+        if fechahora and timezone.is_aware(momento):
+            momento = timezone.localtime(momento)
+        return momento.strftime(formato)
+    return convertir
+
+
+def _conversor_inverso(regla):
+    # Los valores salientes ya son JSON (fechas en ISO 8601); solo se
+    # deshacen los enum y los formatos de fecha explícitos
+    tipo = regla.get('tipo')
+    if tipo == 'enum' and isinstance(regla.get('valores'), dict):
+        return _inverso_enum(regla['valores'])
+    if tipo in ('fecha', 'fechahora') and regla.get('formato'):
+        return _inverso_fecha(regla['formato'], tipo == 'fechahora')
+    return None
+
+
+class MapeadorInverso:
+    """
+    Inversa de una configuracion_mapeo: {campo_local: valor} -> dict con la
+    forma del sistema externo. Los campos sin regla pasan tal cual.
+    """
+
+    def __init__(self, configuracion):
+        configuracion = dict(configuracion or {})
+        configuracion.pop(CLAVE_REGISTROS, None)
+        self._campos = []
+        for campo, regla in configuracion.items():
+            if isinstance(regla, str):
+                regla = {'origen': regla}
+            origen = regla.get('origen') if isinstance(regla, dict) else None
+            if not isinstance(origen, str) or origen.startswith(PREFIJO_RAIZ):
+                continue
+            pasos = _partir_ruta(origen)
+            if any(tipo != 'clave' for tipo, _ in pasos):
+                continue
+            self._campos.append((campo, [clave for _, clave in pasos], _conversor_inverso(regla)))
+        self._renombrados = {campo for campo, _, _ in self._campos}
+
+    def __call__(self, datos):
+        salida = {campo: valor for campo, valor in datos.items() if campo not in self._renombrados}
+        for campo, claves, convertir in self._campos:
+            if campo not in datos:
+                continue
+            valor = datos[campo]
+            if valor is not None and convertir is not None:
+                valor = convertir(valor)
+            destino = salida
+            for clave in claves[:-1]:
+                if not isinstance(destino.get(clave), dict):
+                    destino[clave] = {}
+                destino = destino[clave]
+            destino[claves[-1]] = valor
+        return salida
+
+
+# ============================================
+# CACHE POR INTEGRACIÓN
+# ============================================
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cacheado(integracion, clave, construir):
+    # Se recompila solo si cambió fecha_actualizacion (cualquier save() de la
+    # configuración la cambia)
+    clave = (integracion.pk, clave)
+    with _cache_lock:
+        guardado = _cache.get(clave)
+    if guardado is not None and guardado[0] == integracion.fecha_actualizacion:
+        return guardado[1]
+    mapeador = construir()
+    with _cache_lock:
+        _cache[clave] = (integracion.fecha_actualizacion, mapeador)
+    return mapeador
+
+
+def mapeador_de(integracion, campo='configuracion_mapeo'):
+    """
+    Mapeador compilado de la integración para `campo` (configuracion_mapeo o
+    mapeo_agenda).
+    """
+    return _cacheado(integracion, campo, lambda: MapeadorCompilado(getattr(integracion, campo)))
+
+
+def mapeador_inverso_de(integracion):
+    # Inversa de configuracion_mapeo, para los eventos salientes
+    return _cacheado(integracion, 'inverso', lambda: MapeadorInverso(integracion.configuracion_mapeo))
+
+
+def olvidar_mapeadores():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integraciones', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenLogSincronizacion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hora', models.DateTimeField(help_text='Inicio de la hora resumida (UTC)')),
+                ('estado', models.CharField(choices=[('EXITOSA', 'Exitosa'), ('ERROR', 'Error'), ('ADVERTENCIA', 'Advertencia'), ('WEBHOOK_PROCESADO', 'Webhook Procesado'), ('TIMEOUT', 'Timeout'), ('DATOS_INVALIDOS', 'Datos Inválidos')], max_length=20)),
+                ('total', models.PositiveIntegerField()),
+                ('con_tiempo_respuesta', models.PositiveIntegerField(default=0, help_text='Logs de la hora que registraron tiempo_respuesta_ms')),
+                ('tiempo_respuesta_promedio_ms', models.FloatField(blank=True, null=True)),
+                ('tiempo_respuesta_p95_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('tiempo_respuesta_max_ms', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Resumen de Logs de Sincronización',
+                'verbose_name_plural': 'Resúmenes de Logs de Sincronización',
+                'db_table': 'resumenes_logs_sincronizacion',
+                'ordering': ['-hora'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='logsincronizacion',
+            name='logs_sincro_estado_b53f82_idx',
+        ),
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='retencion_logs',
+            field=models.JSONField(blank=True, default=dict, help_text='Días de retención de logs por estado (ej: {"ERROR": 180, "EXITOSA": 3})'),
+        ),
+        migrations.AddIndex(
+            model_name='logsincronizacion',
+            index=models.Index(fields=['estado', 'timestamp'], name='logs_sincro_estado_552c97_idx'),
+        ),
+        migrations.AddField(
+            model_name='resumenlogsincronizacion',
+            name='integracion',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_logs', to='integraciones.integracionexterna'),
+        ),
+        migrations.AddIndex(
+            model_name='resumenlogsincronizacion',
+            index=models.Index(fields=['hora'], name='resumenes_l_hora_c01aec_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumenlogsincronizacion',
+            constraint=models.UniqueConstraint(fields=('integracion', 'hora', 'estado'), name='resumen_log_integracion_hora_estado_unico'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integraciones', '0003_retencion_logs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='secreto_webhook',
+            field=models.CharField(blank=True, help_text='Secreto para firmar los webhooks entrantes (HMAC-SHA256). Vacío = webhooks deshabilitados', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='EventoWebhook',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('clave_idempotencia', models.CharField(help_text='Idempotency-Key, id del evento o hash del contenido', max_length=200)),
+                ('tipo_evento', models.CharField(blank=True, max_length=100)),
+                ('payload', models.JSONField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('PROCESADO', 'Procesado'), ('ERROR', 'Error (sin más reintentos)')], default='PENDIENTE', max_length=15)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('recibido_en', models.DateTimeField(auto_now_add=True)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('procesado_en', models.DateTimeField(blank=True, null=True)),
+                ('integracion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_webhook', to='integraciones.integracionexterna')),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'db_table': 'eventos_webhook',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'PROCESANDO'])), fields=['disponible_en', 'id'], name='evento_webhook_cola_idx'), models.Index(fields=['estado', 'procesado_en'], name='eventos_web_estado_e8cd40_idx')],
+                'constraints': [models.UniqueConstraint(fields=('integracion', 'clave_idempotencia'), name='evento_webhook_idempotencia_unica')],
+            },
+        ),
+    ]
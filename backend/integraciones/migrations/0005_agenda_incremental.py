@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integraciones', '0004_cola_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='agenda_activa',
+            field=models.BooleanField(default=False, help_text='Importar la agenda del sistema externo como atenciones'),
+        ),
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='cursor_agenda',
+            field=models.CharField(blank=True, help_text='Cursor de cambios del sistema externo (última página aplicada)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='mapeo_agenda',
+            field=models.JSONField(blank=True, default=dict, help_text='Mapeo de los registros de agenda externos a campos de Atención (mismo formato que configuracion_mapeo)'),
+        ),
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='ultima_sincronizacion_agenda',
+            field=models.DateTimeField(blank=True, help_text='Inicio de la última sincronización de agenda completa', null=True),
+        ),
+        migrations.CreateModel(
+            name='IdentificadorExterno',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('ATENCION', 'Atención'), ('PACIENTE', 'Paciente'), ('MEDICO', 'Médico'), ('BOX', 'Box')], max_length=10)),
+                ('id_externo', models.CharField(max_length=100)),
+                ('id_local', models.CharField(help_text='Clave primaria local (UUID o entero, como texto)', max_length=64)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('integracion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identificadores_externos', to='integraciones.integracionexterna')),
+            ],
+            options={
+                'verbose_name': 'Identificador Externo',
+                'verbose_name_plural': 'Identificadores Externos',
+                'db_table': 'identificadores_externos',
+                'indexes': [models.Index(fields=['tipo', 'id_local'], name='identificad_tipo_473fc0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('integracion', 'tipo', 'id_externo'), name='identificador_externo_unico')],
+            },
+        ),
+    ]
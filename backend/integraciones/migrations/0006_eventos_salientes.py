@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integraciones', '0005_agenda_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='eventos_publicados',
+            field=models.JSONField(blank=True, default=list, help_text='Tipos de agregado a publicar (ej: ["ATENCION", "BOX"]). Vacío = todos'),
+        ),
+        migrations.AddField(
+            model_name='integracionexterna',
+            name='publicar_eventos',
+            field=models.BooleanField(default=False, help_text='Enviar al sistema externo los cambios de estado de atenciones, rutas clínicas y boxes'),
+        ),
+        migrations.AlterField(
+            model_name='integracionexterna',
+            name='secreto_webhook',
+            field=models.CharField(blank=True, help_text='Secreto HMAC-SHA256 de los webhooks entrantes y de la firma de los eventos salientes. Vacío = webhooks deshabilitados', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='EventoSaliente',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('tipo_agregado', models.CharField(choices=[('ATENCION', 'Atención'), ('RUTA_CLINICA', 'Ruta Clínica'), ('BOX', 'Box')], max_length=15)),
+                ('id_agregado', models.CharField(max_length=64)),
+                ('tipo_evento', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ENVIADO', 'Enviado'), ('MUERTO', 'Sin más reintentos')], default='PENDIENTE', max_length=10)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('disponible_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('enviado_en', models.DateTimeField(blank=True, null=True)),
+                ('integracion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_salientes', to='integraciones.integracionexterna')),
+            ],
+            options={
+                'verbose_name': 'Evento Saliente',
+                'verbose_name_plural': 'Eventos Salientes',
+                'db_table': 'eventos_salientes',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'ENVIANDO'])), fields=['integracion', 'id'], name='evento_saliente_cola_idx'), models.Index(fields=['estado', 'enviado_en'], name='eventos_sal_estado_5c95aa_idx')],
+            },
+        ),
+    ]
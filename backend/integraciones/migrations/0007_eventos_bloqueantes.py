@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integraciones', '0006_eventos_salientes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventosaliente',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIANDO', 'Enviando'), ('ENVIADO', 'Enviado'), ('MUERTO', 'Sin más reintentos'), ('DESCARTADO', 'Descartado')], default='PENDIENTE', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='eventosaliente',
+            index=models.Index(condition=models.Q(('estado__in', ['PENDIENTE', 'ENVIANDO', 'MUERTO'])), fields=['integracion', 'tipo_agregado', 'id_agregado', 'id'], name='evento_saliente_agregado_idx'),
+        ),
+    ]
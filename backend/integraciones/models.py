@@ -1,9 +1,17 @@
 import uuid
+from urllib.parse import quote
+
 from django.db import models
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import URLValidator
 from django.contrib.auth.models import User
 
+from config import configuracion
+
+from .cliente_http import ErrorHttp, con_reintentos
+from .mapeo import ErrorMapeo, MapeadorCompilado, mapeador_de
+
 class IntegracionExterna(models.Model):
     """
     Modelo para gestionar integraciones con sistemas externos como Rayen, Fonendo, etc.
@@ -38,6 +46,12 @@ class IntegracionExterna(models.Model):
         ('CONFIGURACION', 'En Configuración'),
     ]
     
+    # Rutas relativas a endpoint_base_url
+    RUTA_ESTADO = ''  # responde 2xx si el sistema está disponible
+    RUTA_PACIENTE = 'pacientes/{identificador}'
+    RUTA_AGENDA = 'agenda/cambios'
+    RUTA_EVENTOS = 'eventos'  # POST de eventos salientes en lote
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     nombre_sistema = models.CharField(
         max_length=100,
@@ -62,6 +76,11 @@ class IntegracionExterna(models.Model):
     token_acceso_encrypted = models.TextField(
         help_text="Token de acceso encriptado para seguridad"
     )
+    secreto_webhook = models.CharField(
+        max_length=128,
+        blank=True,
+        help_text="Secreto HMAC-SHA256 de los webhooks entrantes y de la firma de los eventos salientes. Vacío = webhooks deshabilitados"
+    )
     
     # Estado y sincronización
     ultima_sincronizacion = models.DateTimeField(
@@ -88,6 +107,46 @@ class IntegracionExterna(models.Model):
         help_text="Intervalo de sincronización en segundos"
     )
     
+    # Sincronización incremental de agenda (integraciones/agenda.py)
+    agenda_activa = models.BooleanField(
+        default=False,
+        help_text="Importar la agenda del sistema externo como atenciones"
+    )
+    mapeo_agenda = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Mapeo de los registros de agenda externos a campos de Atención (mismo formato que configuracion_mapeo)"
+    )
+    cursor_agenda = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Cursor de cambios del sistema externo (última página aplicada)"
+    )
+    ultima_sincronizacion_agenda = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Inicio de la última sincronización de agenda completa"
+    )
+    
+    # Publicación de cambios de estado (integraciones/publicador.py)
+    publicar_eventos = models.BooleanField(
+        default=False,
+        help_text="Enviar al sistema externo los cambios de estado de atenciones, rutas clínicas y boxes"
+    )
+    eventos_publicados = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Tipos de agregado a publicar (ej: [\"ATENCION\", \"BOX\"]). Vacío = todos"
+    )
+    
+    # Retención de LogSincronizacion por estado (días); sobreescribe
+    # settings.RETENCION_LOGS_DIAS para esta integración. null = conservar siempre
+    retencion_logs = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Días de retención de logs por estado (ej: {\"ERROR\": 180, \"EXITOSA\": 3})"
+    )
+    
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
@@ -115,53 +174,35 @@ class IntegracionExterna(models.Model):
     def __str__(self):
         return f"{self.nombre_sistema} ({self.get_estado_conexion_display()})"
     
+    def clean(self):
+        super().clean()
+        errores = {}
+        for campo in ('configuracion_mapeo', 'mapeo_agenda'):
+            try:
+                MapeadorCompilado(getattr(self, campo))
+            except ErrorMapeo as error:
+                errores[campo] = str(error)
+        tipos = dict(EventoSaliente.TIPO_AGREGADO_CHOICES)
+        if not isinstance(self.eventos_publicados, list) or any(t not in tipos for t in self.eventos_publicados):
+            errores['eventos_publicados'] = f"Debe ser una lista con valores de: {', '.join(tipos)}"
+        if errores:
+            raise ValidationError(errores)
+    
     def sincronizar_datos(self):
         """
-        Ejecuta la sincronización de datos con el sistema externo.
+        Ejecuta la sincronización de datos con el sistema externo (con
+        reintentos) y registra el resultado. El worker de
+        integraciones/worker.py hace lo mismo para todas, concurrentemente.
         """
-        try:
-            # Aquí iría la lógica específica de sincronización
-            # Por ahora, simulamos una sincronización exitosa
-            
-            if self.validar_conexion():
-                self.ultima_sincronizacion = timezone.now()
-                self.estado_conexion = 'ACTIVA'
-                self.save()
-                
-                # Crear log de sincronización exitosa
-                LogSincronizacion.objects.create(
-                    integracion=self,
-                    estado='EXITOSA',
-                    mensaje='Sincronización completada correctamente'
-                )
-                return True
-            else:
-                self.estado_conexion = 'ERROR'
-                self.save()
-                return False
-                
-        except Exception as e:
-            self.estado_conexion = 'ERROR'
-            self.save()
-            
-            # Crear log de error
-            LogSincronizacion.objects.create(
-                integracion=self,
-                estado='ERROR',
-                mensaje=f'Error en sincronización: {str(e)}'
-            )
-            return False
+        from .sincronizacion import sincronizar
+        return sincronizar(self).exito
     
     def validar_conexion(self):
         """
         Valida que la conexión con el sistema externo esté funcionando.
         """
-        try:
-            # Aquí iría la lógica de validación específica
-            # Por ejemplo, hacer un ping al endpoint
-            return True  # Simulado por ahora
-        except:
-            return False
+        from .sincronizacion import verificar_conexion
+        return verificar_conexion(self)
     
     def procesar_webhook(self, datos_webhook):
         """
@@ -200,23 +241,23 @@ class IntegracionExterna(models.Model):
         return isinstance(datos, dict)
     
     def _mapear_datos(self, datos_originales):
-        """Mapea los datos según la configuración de mapeo"""
-        if not self.configuracion_mapeo:
-            return datos_originales
-        
-        datos_mapeados = {}
-        for campo_local, campo_externo in self.configuracion_mapeo.items():
-            if campo_externo in datos_originales:
-                datos_mapeados[campo_local] = datos_originales[campo_externo]
-        
-        return datos_mapeados
+        """Mapea los datos según la configuración de mapeo (ver integraciones/mapeo.py)"""
+        return mapeador_de(self)(datos_originales)
     
     def obtener_datos_paciente(self, identificador_externo):
         """
-        Obtiene datos de un paciente desde el sistema externo.
+        Obtiene datos de un paciente desde el sistema externo, ya mapeados.
+        None si el sistema no lo conoce.
         """
-        # Implementación específica según el sistema
-        pass
+        from .sincronizacion import solicitar
+        
+        ruta = self.RUTA_PACIENTE.format(identificador=quote(str(identificador_externo), safe=''))
+        respuesta = con_reintentos(lambda: solicitar(self, 'GET', ruta))
+        if respuesta.estado == 404:
+            return None
+        if respuesta.estado >= 400:
+            raise ErrorHttp(f'HTTP {respuesta.estado}', estado=respuesta.estado, tiempo_ms=respuesta.tiempo_ms)
+        return self._mapear_datos(respuesta.json() or {})
     
     def obtener_disponibilidad_box(self, box_externo_id):
         """
@@ -225,12 +266,60 @@ class IntegracionExterna(models.Model):
         # Implementación específica según el sistema
         pass
     
-    def sincronizar_agenda(self, fecha_desde, fecha_hasta):
+    def sincronizar_agenda(self, fecha_desde=None, fecha_hasta=None):
         """
-        Sincroniza la agenda desde el sistema externo.
+        Sincroniza la agenda desde el sistema externo: solo los cambios desde
+        la última sincronización (ver integraciones/agenda.py). Con fechas,
+        se limita a esa ventana sin mover la marca de agua.
         """
-        # Implementación específica según el sistema
-        pass
+        from .agenda import sincronizar_agenda
+        return sincronizar_agenda(self, fecha_desde, fecha_hasta)
+
+class IdentificadorExterno(models.Model):
+    """
+    Correspondencia entre el id de un registro en el sistema externo y el
+    registro local (atenciones importadas, y pacientes, médicos y boxes
+    cuando el sistema externo no usa RUT, username o número de box).
+    """
+    
+    TIPO_CHOICES = [
+        ('ATENCION', 'Atención'),
+        ('PACIENTE', 'Paciente'),
+        ('MEDICO', 'Médico'),
+        ('BOX', 'Box'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    integracion = models.ForeignKey(
+        IntegracionExterna,
+        on_delete=models.CASCADE,
+        related_name='identificadores_externos'
+    )
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    id_externo = models.CharField(max_length=100)
+    id_local = models.CharField(
+        max_length=64,
+        help_text="Clave primaria local (UUID o entero, como texto)"
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'identificadores_externos'
+        verbose_name = 'Identificador Externo'
+        verbose_name_plural = 'Identificadores Externos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['integracion', 'tipo', 'id_externo'],
+                name='identificador_externo_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['tipo', 'id_local']),
+        ]
+    
+    def __str__(self):
+        return f"{self.integracion_id} {self.tipo} {self.id_externo} -> {self.id_local}"
+
 
 class LogSincronizacion(models.Model):
     """
@@ -281,12 +370,197 @@ class LogSincronizacion(models.Model):
         ordering = ['-timestamp']
         indexes = [
             models.Index(fields=['integracion', '-timestamp']),
-            models.Index(fields=['estado']),
+            # Depuración por estado y antigüedad (integraciones/retencion.py)
+            models.Index(fields=['estado', 'timestamp']),
         ]
     
     def __str__(self):
         return f"{self.integracion.nombre_sistema} - {self.estado} ({self.timestamp})"
 
+
+class ResumenLogSincronizacion(models.Model):
+    """
+    Resumen por hora (UTC), integración y estado de LogSincronizacion.
+    Se calcula antes de depurar los logs crudos y se conserva después.
+    """
+    
+    id = models.BigAutoField(primary_key=True)
+    integracion = models.ForeignKey(
+        IntegracionExterna,
+        on_delete=models.CASCADE,
+        related_name='resumenes_logs'
+    )
+    hora = models.DateTimeField(help_text="Inicio de la hora resumida (UTC)")
+    estado = models.CharField(
+        max_length=20,
+        choices=LogSincronizacion.ESTADO_CHOICES
+    )
+    
+    # Métricas
+    total = models.PositiveIntegerField()
+    con_tiempo_respuesta = models.PositiveIntegerField(
+        default=0,
+        help_text="Logs de la hora que registraron tiempo_respuesta_ms"
+    )
+    tiempo_respuesta_promedio_ms = models.FloatField(null=True, blank=True)
+    tiempo_respuesta_p95_ms = models.PositiveIntegerField(null=True, blank=True)
+    tiempo_respuesta_max_ms = models.PositiveIntegerField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'resumenes_logs_sincronizacion'
+        verbose_name = 'Resumen de Logs de Sincronización'
+        verbose_name_plural = 'Resúmenes de Logs de Sincronización'
+        ordering = ['-hora']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['integracion', 'hora', 'estado'],
+                name='resumen_log_integracion_hora_estado_unico'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['hora']),
+        ]
+    
+    def __str__(self):
+        return f"{self.integracion.nombre_sistema} - {self.estado} {self.hora:%Y-%m-%d %H:00} ({self.total})"
+
+class EventoWebhook(models.Model):
+    """
+    Cola persistente de webhooks entrantes. El endpoint solo encola y
+    responde; integraciones/cola_webhooks.py los procesa en lotes.
+    """
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('PROCESANDO', 'Procesando'),
+        ('PROCESADO', 'Procesado'),
+        ('ERROR', 'Error (sin más reintentos)'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    integracion = models.ForeignKey(
+        IntegracionExterna,
+        on_delete=models.CASCADE,
+        related_name='eventos_webhook'
+    )
+    clave_idempotencia = models.CharField(
+        max_length=200,
+        help_text="Idempotency-Key, id del evento o hash del contenido"
+    )
+    tipo_evento = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    
+    estado = models.CharField(
+        max_length=15,
+        choices=ESTADO_CHOICES,
+        default='PENDIENTE'
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    recibido_en = models.DateTimeField(auto_now_add=True)
+    # Pendiente: desde cuándo se puede tomar (reintentos con espera).
+    # Procesando: hasta cuándo es del worker que lo tomó; vencido, se retoma
+    disponible_en = models.DateTimeField(default=timezone.now)
+    procesado_en = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'eventos_webhook'
+        verbose_name = 'Evento de Webhook'
+        verbose_name_plural = 'Eventos de Webhook'
+        ordering = ['id']
+        constraints = [
+            # Deduplicación: un reenvío del mismo evento no se encola de nuevo
+            models.UniqueConstraint(
+                fields=['integracion', 'clave_idempotencia'],
+                name='evento_webhook_idempotencia_unica'
+            ),
+        ]
+        indexes = [
+            # Cola: pendientes y en proceso por orden de disponibilidad
+            models.Index(
+                fields=['disponible_en', 'id'],
+                name='evento_webhook_cola_idx',
+                condition=models.Q(estado__in=['PENDIENTE', 'PROCESANDO'])
+            ),
+            models.Index(fields=['estado', 'procesado_en']),
+        ]
+    
+    def __str__(self):
+        return f"{self.integracion_id} - {self.tipo_evento or 'evento'} ({self.estado})"
+
+
+class EventoSaliente(models.Model):
+    """
+    Outbox de eventos hacia una integración: se escribe junto con el cambio
+    que lo origina e integraciones/publicador.py lo entrega después, en
+    lotes y en orden por agregado. MUERTO = agotó sus reintentos (dead letter);
+    bloquea a los siguientes de su agregado hasta que se reencola o se descarta.
+    """
+    
+    TIPO_AGREGADO_CHOICES = [
+        ('ATENCION', 'Atención'),
+        ('RUTA_CLINICA', 'Ruta Clínica'),
+        ('BOX', 'Box'),
+    ]
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente'),
+        ('ENVIANDO', 'Enviando'),
+        ('ENVIADO', 'Enviado'),
+        ('MUERTO', 'Sin más reintentos'),
+        ('DESCARTADO', 'Descartado'),
+    ]
+    
+    id = models.BigAutoField(primary_key=True)
+    integracion = models.ForeignKey(
+        IntegracionExterna,
+        on_delete=models.CASCADE,
+        related_name='eventos_salientes'
+    )
+    tipo_agregado = models.CharField(max_length=15, choices=TIPO_AGREGADO_CHOICES)
+    id_agregado = models.CharField(max_length=64)
+    tipo_evento = models.CharField(max_length=100)
+    payload = models.JSONField()
+    
+    estado = models.CharField(
+        max_length=10,
+        choices=ESTADO_CHOICES,
+        default='PENDIENTE'
+    )
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    
+    creado_en = models.DateTimeField(auto_now_add=True)
+    # Pendiente: desde cuándo se puede enviar (reintentos con espera).
+    # Enviando: hasta cuándo es del despachador que lo tomó; vencido, se retoma
+    disponible_en = models.DateTimeField(default=timezone.now)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'eventos_salientes'
+        verbose_name = 'Evento Saliente'
+        verbose_name_plural = 'Eventos Salientes'
+        ordering = ['id']
+        indexes = [
+            # Cola por integración, en orden de creación
+            models.Index(
+                fields=['integracion', 'id'],
+                name='evento_saliente_cola_idx',
+                condition=models.Q(estado__in=['PENDIENTE', 'ENVIANDO'])
+            ),
+            # Eventos previos del mismo agregado que bloquean a los siguientes (tomar_lote)
+            models.Index(
+                fields=['integracion', 'tipo_agregado', 'id_agregado', 'id'],
+                name='evento_saliente_agregado_idx',
+                condition=models.Q(estado__in=['PENDIENTE', 'ENVIANDO', 'MUERTO'])
+            ),
+            models.Index(fields=['estado', 'enviado_en']),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo_evento} {self.id_agregado} → {self.integracion.nombre_sistema} ({self.estado})"
+
 class ConfiguracionSistema(models.Model):
     """
     Modelo para configuraciones globales del sistema Nexalud.
@@ -373,9 +647,6 @@ class ConfiguracionSistema(models.Model):
     def obtener_configuracion(cls, clave, valor_defecto=None):
         """
         Método de conveniencia para obtener una configuración.
+        Se sirve desde la cache por proceso de config/configuracion.py.
         """
-        try:
-            config = cls.objects.get(clave=clave, activo=True)
-            return config.obtener_valor_tipado()
-        except cls.DoesNotExist:
-            return valor_defecto
+        return configuracion.valor(clave, valor_defecto)
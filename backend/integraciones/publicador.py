@@ -0,0 +1,381 @@
+"""
+Publicación de cambios de estado hacia los sistemas externos (outbox).
+
+Las transiciones de Atencion, RutaClinica y Box se escriben como
+EventoSaliente, un registro por integración suscrita (publicar_eventos y
+eventos_publicados), desde las señales de integraciones/signals.py o con
+publicar() desde el código que escribe en lote. El evento queda en la misma
+transacción que el cambio cuando la hay (vistas, importación de agenda);
+nunca se envía nada desde el request.
+
+publicar_eventos.py drena el outbox por integración: POST a RUTA_EVENTOS con
+hasta PUBLICACION_TAMANO_LOTE eventos en orden, firmados con HMAC si la
+integración tiene secreto_webhook, y con configuracion_mapeo aplicada al
+revés. Un envío fallido vuelve a la cola con espera creciente; después de
+PUBLICACION_MAX_INTENTOS queda MUERTO (dead letter, se reencola o se
+descarta desde el admin). Mientras un agregado tenga un evento en vuelo,
+esperando reintento o MUERTO, sus eventos siguientes no salen: el orden por
+agregado se mantiene aunque corran varios despachadores, y un evento
+reencolado no llega después de los que lo siguen.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, prefetch_related_objects
+from django.utils import timezone
+
+from atenciones.models import Atencion
+from boxes.models import Box
+from rutas_clinicas.models import RutaClinica
+
+from .cliente_http import ErrorHttp
+from .mapeo import mapeador_inverso_de
+from .models import EventoSaliente, IntegracionExterna, LogSincronizacion
+from .sincronizacion import solicitar
+
+logger = logging.getLogger(__name__)
+
+# Integraciones suscritas por tipo de agregado. Se consulta en cada save()
+# de los modelos publicados, así que se guarda por proceso (sin ir a la base
+# ni al cache compartido); guardar una integración lo invalida en este
+# proceso y los demás lo releen a los CACHE_SUSCRIPTORES segundos
+CACHE_SUSCRIPTORES = 60  # segundos
+
+_suscriptores = {'tabla': None, 'leido_en': None}
+
+# Tiempo que un despachador tiene un lote tomado antes de que otro pueda retomarlo
+ARRIENDO = timedelta(minutes=5)
+
+CABECERA_FIRMA = 'X-Nexalud-Firma'
+
+ESTADOS_EN_COLA = ['PENDIENTE', 'ENVIANDO']
+# Estados en los que un evento retiene a los siguientes de su agregado
+ESTADOS_BLOQUEANTES = ['PENDIENTE', 'ENVIANDO', 'MUERTO']
+
+
+# ============================================
+# AGREGADOS PUBLICADOS
+# ============================================
+
+def _iso(valor):
+    return valor.isoformat() if valor else None
+
+
+def _datos_atencion(atencion):
+    return {
+        'id': str(atencion.pk),
+        'estado': atencion.estado,
+        'tipo_atencion': atencion.tipo_atencion,
+        'fecha_hora_inicio': _iso(atencion.fecha_hora_inicio),
+        'fin_reserva': _iso(atencion.fin_reserva),
+        'inicio_cronometro': _iso(atencion.inicio_cronometro),
+        'fin_cronometro': _iso(atencion.fin_cronometro),
+        'rut': atencion.paciente.rut,
+        'medico': atencion.medico.username,
+        'box': atencion.box.numero,
+    }
+
+
+def _datos_ruta(ruta):
+    return {
+        'id': str(ruta.pk),
+        'estado': ruta.estado,
+        'etapa_actual': ruta.etapa_actual,
+        'porcentaje_completado': ruta.porcentaje_completado,
+        'fecha_inicio': _iso(ruta.fecha_inicio),
+        'rut': ruta.paciente.rut,
+    }
+
+
+def _datos_box(box):
+    return {
+        'id': str(box.pk),
+        'numero': box.numero,
+        'estado': box.estado,
+        'especialidad': box.especialidad,
+    }
+
+
+@dataclass(frozen=True)
+class Agregado:
+    modelo: type
+    campos: tuple  # cuyo cambio es una transición publicable
+    relaciones: tuple  # que usa `datos`; se cargan en bloque
+    datos: object
+
+
+AGREGADOS = {
+    'ATENCION': Agregado(Atencion, ('estado',), ('paciente', 'medico', 'box'), _datos_atencion),
+    'RUTA_CLINICA': Agregado(RutaClinica, ('estado', 'etapa_actual'), ('paciente',), _datos_ruta),
+    'BOX': Agregado(Box, ('estado',), (), _datos_box),
+}
+
+TIPO_POR_MODELO = {agregado.modelo: tipo for tipo, agregado in AGREGADOS.items()}
+
+
+# ============================================
+# ESCRITURA EN EL OUTBOX
+# ============================================
+
+def suscriptores(tipo_agregado):
+    # pks de las integraciones activas que publican `tipo_agregado`
+    ahora = time.monotonic()
+    if _suscriptores['leido_en'] is None or ahora - _suscriptores['leido_en'] >= CACHE_SUSCRIPTORES:
+        tabla = {}
+        for pk, tipos in IntegracionExterna.objects.filter(activo=True, publicar_eventos=True).values_list(
+            'pk', 'eventos_publicados'
+        ):
+            for tipo in tipos or AGREGADOS:
+                tabla.setdefault(tipo, []).append(pk)
+        _suscriptores['tabla'] = tabla
+        _suscriptores['leido_en'] = ahora
+    return _suscriptores['tabla'].get(tipo_agregado, [])
+
+
+def olvidar_suscriptores():
+    # Fuerza una nueva lectura en el próximo save()
+    _suscriptores['leido_en'] = None
+
+
+def publicar(tipo_agregado, instancias, evento, anteriores=None, origen=None):
+    """
+    Escribe un EventoSaliente por instancia y por integración suscrita, salvo
+    `origen` (la integración de la que vino el cambio, para no devolvérselo).
+    evento: 'creacion' o 'cambio_estado'. anteriores: {pk: {campo: valor previo}}.
+    Devuelve cuántos eventos escribió.
+    """
+    destinos = [pk for pk in suscriptores(tipo_agregado) if origen is None or pk != origen.pk]
+    instancias = list(instancias)
+    if not destinos or not instancias:
+        return 0
+    agregado = AGREGADOS[tipo_agregado]
+    prefetch_related_objects(instancias, *agregado.relaciones)
+    anteriores = anteriores or {}
+    tipo_evento = f'{tipo_agregado.lower()}.{evento}'
+
+    eventos = []
+    for instancia in instancias:
+        payload = agregado.datos(instancia)
+        if instancia.pk in anteriores:
+            payload['anterior'] = anteriores[instancia.pk]
+        eventos.extend(
+            EventoSaliente(
+                integracion_id=destino,
+                tipo_agregado=tipo_agregado,
+                id_agregado=str(instancia.pk),
+                tipo_evento=tipo_evento,
+                payload=payload,
+            )
+            for destino in destinos
+        )
+    EventoSaliente.objects.bulk_create(eventos)
+    return len(eventos)
+
+
+def valores_publicados(instancia, update_fields=None):
+    """
+    Valores actuales en la base de los campos publicados de `instancia`
+    (pre_save), o None si no hay a quién publicar o el save no los toca.
+    """
+    tipo = TIPO_POR_MODELO[type(instancia)]
+    if instancia._state.adding or not suscriptores(tipo):
+        return None
+    campos = AGREGADOS[tipo].campos
+    if update_fields is not None and not set(campos) & set(update_fields):
+        return None
+    return type(instancia)._base_manager.filter(pk=instancia.pk).values(*campos).first()
+
+
+def publicar_transicion(instancia, creado, previos):
+    # post_save: evento de creación, o de cambio si cambió algún campo publicado
+    tipo = TIPO_POR_MODELO[type(instancia)]
+    if creado:
+        return publicar(tipo, [instancia], 'creacion')
+    if not previos:
+        return 0
+    cambios = {campo: valor for campo, valor in previos.items() if getattr(instancia, campo) != valor}
+    if not cambios:
+        return 0
+    return publicar(tipo, [instancia], 'cambio_estado', anteriores={instancia.pk: cambios})
+
+
+# ============================================
+# DESPACHO
+# ============================================
+
+def tomar_lote(integracion, tamano=None):
+    """
+    Toma hasta `tamano` eventos enviables de la integración, en orden. Se salta
+    todo evento con un evento anterior de su agregado que lo bloquea: tomado
+    por otro despachador, esperando reintento o MUERTO. Los agregados
+    bloqueados se excluyen en la consulta, así que nunca tapan a los demás.
+    """
+    tamano = tamano or settings.PUBLICACION_TAMANO_LOTE
+    ahora = timezone.now()
+    bloqueante = EventoSaliente.objects.filter(
+        integracion=integracion,
+        tipo_agregado=OuterRef('tipo_agregado'),
+        id_agregado=OuterRef('id_agregado'),
+        id__lt=OuterRef('id'),
+        estado__in=ESTADOS_BLOQUEANTES,
+    ).filter(Q(estado='MUERTO') | Q(disponible_en__gt=ahora))
+    with transaction.atomic():
+        ids = list(
+            EventoSaliente.objects.select_for_update()
+            .filter(integracion=integracion, estado__in=ESTADOS_EN_COLA, disponible_en__lte=ahora)
+            .exclude(Exists(bloqueante))
+            .order_by('id')
+            .values_list('id', flat=True)[:tamano]
+        )
+        if not ids:
+            return []
+        EventoSaliente.objects.filter(id__in=ids).update(
+            estado='ENVIANDO', disponible_en=ahora + ARRIENDO, intentos=F('intentos') + 1
+        )
+    return list(EventoSaliente.objects.filter(id__in=ids).order_by('id'))
+
+
+def sobre(evento, inverso):
+    # Lo que recibe el sistema externo por cada evento
+    return {
+        'id': evento.id,
+        'tipo': evento.tipo_evento,
+        'agregado': {'tipo': evento.tipo_agregado, 'id': evento.id_agregado},
+        'ocurrido_en': evento.creado_en.isoformat(),
+        'intento': evento.intentos,
+        'datos': inverso(evento.payload),
+    }
+
+
+def firma(secreto, cuerpo):
+    return 'sha256=' + hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+
+
+def _espera_reintento(intentos, reintentar_en=None):
+    # 10 s, 20 s, 40 s... hasta 1 hora; Retry-After si el sistema lo pide
+    espera = min(3600, 10 * 2 ** (intentos - 1))
+    return timedelta(seconds=max(espera, reintentar_en or 0))
+
+
+def _reprogramar(eventos, error):
+    ahora = timezone.now()
+    muertos = 0
+    for evento in eventos:
+        evento.error = str(error)[:2000]
+        if evento.intentos >= settings.PUBLICACION_MAX_INTENTOS:
+            evento.estado = 'MUERTO'
+            muertos += 1
+        else:
+            evento.estado = 'PENDIENTE'
+            evento.disponible_en = ahora + _espera_reintento(evento.intentos, getattr(error, 'reintentar_en', None))
+    EventoSaliente.objects.bulk_update(eventos, ['estado', 'disponible_en', 'error'])
+    return muertos
+
+
+def entregar(integracion, eventos, pool=None):
+    """
+    Envía un lote tomado con tomar_lote en un solo POST y registra el
+    resultado. Devuelve {'enviados': n, 'reintentos': r, 'muertos': m}.
+    """
+    inverso = mapeador_inverso_de(integracion)
+    cuerpo = json.dumps(
+        {'eventos': [sobre(evento, inverso) for evento in eventos]},
+        ensure_ascii=False, default=str
+    ).encode()
+    cabeceras = {'Content-Type': 'application/json'}
+    if integracion.secreto_webhook:
+        cabeceras[CABECERA_FIRMA] = firma(integracion.secreto_webhook, cuerpo)
+
+    try:
+        respuesta = solicitar(integracion, 'POST', integracion.RUTA_EVENTOS, pool=pool,
+                              cuerpo=cuerpo, cabeceras=cabeceras)
+        error = None
+        if respuesta.estado >= 400:
+            error = ErrorHttp(f'HTTP {respuesta.estado}', estado=respuesta.estado, tiempo_ms=respuesta.tiempo_ms)
+    except ErrorHttp as excepcion:
+        respuesta, error = None, excepcion
+
+    if error is None:
+        EventoSaliente.objects.filter(id__in=[evento.id for evento in eventos]).update(
+            estado='ENVIADO', enviado_en=timezone.now(), error=''
+        )
+        LogSincronizacion.objects.create(
+            integracion=integracion,
+            estado='EXITOSA',
+            mensaje=f'{len(eventos)} eventos publicados',
+            datos_adicionales={'eventos': len(eventos), 'tipos': dict(Counter(e.tipo_evento for e in eventos))},
+            tiempo_respuesta_ms=respuesta.tiempo_ms,
+        )
+        return {'enviados': len(eventos), 'reintentos': 0, 'muertos': 0}
+
+    muertos = _reprogramar(eventos, error)
+    logger.warning('Falla publicando eventos',
+                   extra={'integracion': integracion.nombre_sistema, 'eventos': len(eventos), 'error': str(error)})
+    LogSincronizacion.objects.create(
+        integracion=integracion,
+        estado='TIMEOUT' if getattr(error, 'timeout', False) else 'ERROR',
+        mensaje=f'Error publicando eventos: {error}',
+        datos_adicionales={'eventos': len(eventos), 'muertos': muertos, 'http_estado': error.estado},
+        tiempo_respuesta_ms=error.tiempo_ms,
+    )
+    return {'enviados': 0, 'reintentos': len(eventos) - muertos, 'muertos': muertos}
+
+
+def despachar(integracion, pool=None, tamano_lote=None, max_lotes=None):
+    # Envía lotes de la integración hasta vaciar su cola o hasta el primer fallo
+    totales = Counter(enviados=0, reintentos=0, muertos=0)
+    lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        eventos = tomar_lote(integracion, tamano_lote)
+        if not eventos:
+            break
+        resultado = entregar(integracion, eventos, pool)
+        totales.update(resultado)
+        lotes += 1
+        if not resultado['enviados']:
+            break
+    return dict(totales)
+
+
+def despachar_todas(pool=None, tamano_lote=None, max_lotes=None):
+    totales = Counter()
+    for integracion in IntegracionExterna.objects.filter(activo=True, publicar_eventos=True):
+        totales.update(despachar(integracion, pool, tamano_lote, max_lotes))
+    return dict(totales)
+
+
+def reencolar(eventos):
+    # Vuelve a la cola eventos MUERTO (acción del admin); devuelve cuántos
+    return eventos.filter(estado='MUERTO').update(
+        estado='PENDIENTE', intentos=0, disponible_en=timezone.now(), error=''
+    )
+
+
+def descartar(eventos):
+    # Abandona eventos MUERTO (acción del admin) y libera a los siguientes de su agregado
+    return eventos.filter(estado='MUERTO').update(estado='DESCARTADO')
+
+
+def depurar_eventos_salientes(dias=None, tamano_lote=2000):
+    # Borra los eventos enviados o descartados hace más de `dias`; devuelve cuántos
+    dias = settings.PUBLICACION_RETENCION_DIAS if dias is None else dias
+    limite = timezone.now() - timedelta(days=dias)
+    total = 0
+    while True:
+        ids = list(
+            EventoSaliente.objects.filter(
+                Q(estado='ENVIADO', enviado_en__lt=limite) | Q(estado='DESCARTADO', creado_en__lt=limite)
+            )
+            .order_by().values_list('pk', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return total
+        total += EventoSaliente.objects.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,204 @@
+"""
+Retención de LogSincronizacion con resúmenes por hora.
+
+Cada sincronización y cada webhook deja un log, así que la tabla crece sin
+límite. El mantenimiento (depurar_logs_sincronizacion.py, por cron) hace:
+1. resumir_logs: agrega las horas UTC cerradas que aún no tienen resumen en
+   ResumenLogSincronizacion (total, y promedio/p95/máximo de
+   tiempo_respuesta_ms por integración y estado). Los resúmenes no se borran.
+2. depurar_logs: borra los logs crudos más antiguos que su retención
+   (IntegracionExterna.retencion_logs por estado, si no
+   settings.RETENCION_LOGS_DIAS). Nunca borra una hora sin resumir.
+
+El borrado va en lotes chicos de pk, cada uno en su propia transacción
+(autocommit), para no retener locks largos sobre la tabla mientras las
+integraciones siguen escribiendo. LogSincronizacion no tiene relaciones
+entrantes ni señales: cada lote es un único DELETE ... WHERE id IN (...).
+"""
+import logging
+import time
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from dashboard.kpis import percentiles_desde_histograma
+
+from .models import IntegracionExterna, LogSincronizacion, ResumenLogSincronizacion
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 2000
+
+# Una hora se resume recién pasado este margen desde su cierre, para no
+# dejar fuera logs de transacciones que todavía no confirmaban
+MARGEN_CIERRE = timedelta(minutes=5)
+
+# Horas resumidas por transacción
+TRAMO_RESUMEN = timedelta(days=1)
+
+_UNA_HORA = timedelta(hours=1)
+
+
+def _truncar_hora(momento):
+    return momento.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def marca_resumen():
+    # Primera hora UTC sin resumir: todo log anterior ya está resumido.
+    # None si todavía no hay resúmenes
+    ultima = ResumenLogSincronizacion.objects.aggregate(ultima=Max('hora'))['ultima']
+    return ultima + _UNA_HORA if ultima else None
+
+
+# ============================================
+# RESÚMENES POR HORA
+# ============================================
+
+def _resumir_tramo(inicio, fin):
+    # Resume los logs de [inicio, fin) y devuelve cuántos resúmenes creó
+    logs = (
+        LogSincronizacion.objects
+        .filter(timestamp__gte=inicio, timestamp__lt=fin)
+        .annotate(hora=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+        .order_by()
+    )
+    grupos = logs.values('integracion_id', 'hora', 'estado').annotate(
+        total=Count('id'),
+        con_tiempo_respuesta=Count('tiempo_respuesta_ms'),
+        promedio=Avg('tiempo_respuesta_ms'),
+        maximo=Max('tiempo_respuesta_ms'),
+    )
+
+    # Histograma de tiempos por grupo para el p95 exacto
+    histogramas = {}
+    filas = (
+        logs.filter(tiempo_respuesta_ms__isnull=False)
+        .values_list('integracion_id', 'hora', 'estado', 'tiempo_respuesta_ms')
+        .annotate(conteo=Count('id'))
+    )
+    for integracion_id, hora, estado, tiempo, conteo in filas:
+        histogramas.setdefault((integracion_id, hora, estado), {})[tiempo] = conteo
+
+    resumenes = []
+    for grupo in grupos:
+        clave = (grupo['integracion_id'], grupo['hora'], grupo['estado'])
+        p95 = percentiles_desde_histograma(histogramas.get(clave, {}), percentiles=(95,))['p95']
+        resumenes.append(ResumenLogSincronizacion(
+            integracion_id=grupo['integracion_id'],
+            hora=grupo['hora'],
+            estado=grupo['estado'],
+            total=grupo['total'],
+            con_tiempo_respuesta=grupo['con_tiempo_respuesta'],
+            tiempo_respuesta_promedio_ms=grupo['promedio'],
+            tiempo_respuesta_p95_ms=p95,
+            tiempo_respuesta_max_ms=grupo['maximo'],
+        ))
+    # ignore_conflicts: dos corridas simultáneas no fallan por la restricción única
+    ResumenLogSincronizacion.objects.bulk_create(resumenes, ignore_conflicts=True)
+    return len(resumenes)
+
+
+def resumir_logs(hasta=None):
+    """
+    Resume las horas cerradas desde la marca hasta `hasta` (por defecto la
+    hora actual menos MARGEN_CIERRE). Devuelve cuántos resúmenes creó.
+    """
+    hasta = _truncar_hora(hasta or timezone.now() - MARGEN_CIERRE)
+    creados = 0
+    inicio = marca_resumen()
+    while True:
+        # Salta directo al siguiente log: los huecos sin actividad no se recorren
+        siguientes = LogSincronizacion.objects.filter(timestamp__lt=hasta)
+        if inicio is not None:
+            siguientes = siguientes.filter(timestamp__gte=inicio)
+        primero = siguientes.aggregate(primero=Min('timestamp'))['primero']
+        if primero is None:
+            break
+        inicio = _truncar_hora(primero)
+        fin = min(inicio + TRAMO_RESUMEN, hasta)
+        with transaction.atomic():
+            creados += _resumir_tramo(inicio, fin)
+        inicio = fin
+    return creados
+
+
+# ============================================
+# DEPURACIÓN DE LOGS CRUDOS
+# ============================================
+
+def _borrar_en_lotes(logs, tamano_lote, pausa):
+    total = 0
+    while True:
+        ids = list(logs.order_by().values_list('pk', flat=True)[:tamano_lote])
+        if not ids:
+            return total
+        inicio = time.monotonic()
+        borrados, _ = LogSincronizacion.objects.filter(pk__in=ids).delete()
+        total += borrados
+        logger.debug(
+            'Lote de logs depurado',
+            extra={'filas': borrados, 'total': total, 'ms': round((time.monotonic() - inicio) * 1000)}
+        )
+        if pausa:
+            time.sleep(pausa)
+
+
+def _limite(ahora, dias, marca):
+    # Borrable: anterior a la retención y ya resumido
+    return min(ahora - timedelta(days=dias), marca)
+
+
+def depurar_logs(tamano_lote=TAMANO_LOTE, pausa=0, ahora=None):
+    """
+    Borra los logs vencidos según la política de retención. Devuelve
+    {estado: borrados}. No borra nada si no hay resúmenes.
+    """
+    marca = marca_resumen()
+    borrados = {}
+    if marca is None:
+        return borrados
+    ahora = ahora or timezone.now()
+
+    # Integraciones con política propia (pocas: se leen una vez)
+    politicas = {
+        pk: retencion
+        for pk, retencion in IntegracionExterna.objects.values_list('id', 'retencion_logs')
+        if retencion
+    }
+
+    for estado, _ in LogSincronizacion.ESTADO_CHOICES:
+        total = 0
+        con_politica = [pk for pk, retencion in politicas.items() if estado in retencion]
+
+        dias = settings.RETENCION_LOGS_DIAS.get(estado)
+        if dias is not None:
+            logs = LogSincronizacion.objects.filter(
+                estado=estado, timestamp__lt=_limite(ahora, dias, marca)
+            ).exclude(integracion_id__in=con_politica)
+            total += _borrar_en_lotes(logs, tamano_lote, pausa)
+
+        for pk in con_politica:
+            dias = politicas[pk][estado]
+            if dias is None:
+                continue
+            logs = LogSincronizacion.objects.filter(
+                integracion_id=pk, estado=estado, timestamp__lt=_limite(ahora, dias, marca)
+            )
+            total += _borrar_en_lotes(logs, tamano_lote, pausa)
+
+        if total:
+            borrados[estado] = total
+            logger.info('Logs de sincronización depurados', extra={'estado': estado, 'filas': total})
+    return borrados
+
+
+def mantener_logs(tamano_lote=TAMANO_LOTE, pausa=0):
+    # Resumir y después depurar; devuelve {'resumenes': n, 'eliminados': {estado: m}}
+    return {
+        'resumenes': resumir_logs(),
+        'eliminados': depurar_logs(tamano_lote=tamano_lote, pausa=pausa),
+    }
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from atenciones.models import Atencion
+from boxes.models import Box
+from config import configuracion
+from rutas_clinicas.models import RutaClinica
+
+from .models import ConfiguracionSistema, IntegracionExterna
+from .publicador import olvidar_suscriptores, publicar_transicion, valores_publicados
+
+
+@receiver(pre_save, sender=Atencion)
+@receiver(pre_save, sender=RutaClinica)
+@receiver(pre_save, sender=Box)
+def recordar_valores_publicados(sender, instance, update_fields=None, **kwargs):
+    """
+    Guarda los valores previos de los campos publicados para detectar la
+    transición en post_save. Sin integraciones suscritas no consulta nada.
+    """
+    instance._valores_publicados = valores_publicados(instance, update_fields)
+
+
+@receiver(post_save, sender=Atencion)
+@receiver(post_save, sender=RutaClinica)
+@receiver(post_save, sender=Box)
+def publicar_cambio_de_estado(sender, instance, created, **kwargs):
+    """
+    Escribe en el outbox (EventoSaliente) la creación o el cambio de estado,
+    en la transacción del save si la hay. Lo envía publicar_eventos.py.
+    """
+    publicar_transicion(instance, created, instance.__dict__.pop('_valores_publicados', None))
+
+
+@receiver(post_save, sender=IntegracionExterna)
+@receiver(post_delete, sender=IntegracionExterna)
+def invalidar_suscriptores(sender, **kwargs):
+    olvidar_suscriptores()
+
+
+@receiver(post_save, sender=ConfiguracionSistema)
+@receiver(post_delete, sender=ConfiguracionSistema)
+def invalidar_configuracion(sender, **kwargs):
+    # Al confirmar, para que ningún proceso recargue el valor sin confirmar
+    transaction.on_commit(configuracion.invalidar)
@@ -0,0 +1,116 @@
+"""
+Sincronización de una IntegracionExterna: la petición HTTP y el registro del
+resultado por separado, para que el worker asíncrono haga la primera en un
+hilo (con sus reintentos en el event loop) y la segunda en el hilo del ORM.
+IntegracionExterna.sincronizar_datos usa la versión bloqueante.
+"""
+from dataclasses import dataclass, field
+
+from django.utils import timezone
+
+from .cliente_http import (
+    ErrorHttp, cabeceras_autenticacion, con_reintentos, pool_compartido, url_integracion
+)
+from .models import IntegracionExterna, LogSincronizacion
+
+
+@dataclass
+class ResultadoSincronizacion:
+    exito: bool
+    estado_log: str
+    mensaje: str
+    tiempo_respuesta_ms: int = None
+    datos: dict = field(default_factory=dict)
+
+
+def solicitar(integracion, metodo='GET', ruta='', pool=None, **kwargs):
+    # Petición autenticada al sistema externo; ruta relativa a endpoint_base_url
+    pool = pool or pool_compartido()
+    return pool.solicitar(
+        metodo,
+        url_integracion(integracion, ruta, kwargs.pop('parametros', None)),
+        cabeceras={**cabeceras_autenticacion(integracion), **kwargs.pop('cabeceras', {})},
+        **kwargs
+    )
+
+
+def solicitar_estado(integracion, pool=None):
+    return solicitar(integracion, 'GET', integracion.RUTA_ESTADO, pool=pool)
+
+
+def resultado_desde(respuesta=None, error=None, intentos=1):
+    # ResultadoSincronizacion a partir de la respuesta o del error final
+    datos = {'intentos': intentos}
+    if error is not None:
+        if error.estado:
+            datos['http_estado'] = error.estado
+        return ResultadoSincronizacion(
+            exito=False,
+            estado_log='TIMEOUT' if getattr(error, 'timeout', False) else 'ERROR',
+            mensaje=f'Error en sincronización: {error}',
+            tiempo_respuesta_ms=error.tiempo_ms,
+            datos=datos,
+        )
+    datos['http_estado'] = respuesta.estado
+    if respuesta.estado >= 400:
+        return ResultadoSincronizacion(
+            exito=False,
+            estado_log='ERROR',
+            mensaje=f'Error en sincronización: HTTP {respuesta.estado}',
+            tiempo_respuesta_ms=respuesta.tiempo_ms,
+            datos=datos,
+        )
+    return ResultadoSincronizacion(
+        exito=True,
+        estado_log='EXITOSA',
+        mensaje='Sincronización completada correctamente',
+        tiempo_respuesta_ms=respuesta.tiempo_ms,
+        datos=datos,
+    )
+
+
+def registrar_resultado(integracion, resultado):
+    """
+    Actualiza el estado de la integración y deja el LogSincronizacion. Con
+    update() y no save(): el worker tiene instancias de hace un rato y no debe
+    pisar cambios de configuración hechos mientras tanto en el admin.
+    """
+    cambios = {'estado_conexion': 'ACTIVA' if resultado.exito else 'ERROR'}
+    if resultado.exito:
+        cambios['ultima_sincronizacion'] = timezone.now()
+    IntegracionExterna.objects.filter(pk=integracion.pk).update(**cambios)
+    for campo, valor in cambios.items():
+        setattr(integracion, campo, valor)
+
+    LogSincronizacion.objects.create(
+        integracion=integracion,
+        estado=resultado.estado_log,
+        mensaje=resultado.mensaje,
+        datos_adicionales=resultado.datos,
+        tiempo_respuesta_ms=resultado.tiempo_respuesta_ms,
+    )
+
+
+def sincronizar(integracion, pool=None):
+    # Versión bloqueante (acción del admin): reintenta con backoff y registra
+    intentos = 0
+
+    def intento():
+        nonlocal intentos
+        intentos += 1
+        return solicitar_estado(integracion, pool)
+
+    try:
+        resultado = resultado_desde(respuesta=con_reintentos(intento), intentos=intentos)
+    except ErrorHttp as error:
+        resultado = resultado_desde(error=error, intentos=intentos)
+    registrar_resultado(integracion, resultado)
+    return resultado
+
+
+def verificar_conexion(integracion, pool=None):
+    # Un solo intento, sin registrar: ¿responde el sistema externo?
+    try:
+        return solicitar_estado(integracion, pool).estado < 400
+    except ErrorHttp:
+        return False
@@ -1,3 +1,898 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from atenciones.agenda import buscar_solapes
+from atenciones.models import Atencion
+from boxes.models import Box
+from config import configuracion
+from config.presupuesto_consultas import PresupuestoAdminMixin, rut_sintetico
+from pacientes.models import Paciente
+from rutas_clinicas.models import RutaClinica
+from users.models import User
+
+from . import cola_webhooks, publicador
+from .cliente_http import PoolConexiones
+from .mapeo import ErrorMapeo, MapeadorCompilado, MapeadorInverso, mapeador_de
+from .models import (
+    ConfiguracionSistema, EventoSaliente, EventoWebhook, IdentificadorExterno, IntegracionExterna, LogSincronizacion,
+    ResumenLogSincronizacion
+)
+from .retencion import depurar_logs, resumir_logs
+from .worker import WorkerSincronizacion
+
+
+UTC = dt_timezone.utc
+
+
+@override_settings(RETENCION_LOGS_DIAS={'EXITOSA': 7, 'ERROR': 90})
+class RetencionLogsTests(TestCase):
+
+    def setUp(self):
+        self.ahora = datetime(2025, 6, 30, 12, 30, tzinfo=UTC)
+        self.integracion = IntegracionExterna.objects.create(
+            nombre_sistema='HIS Central', tipo_sistema='HIS', endpoint_base_url='https://his.example.com'
+        )
+
+    def _log(self, integracion, estado, momento, tiempo=None):
+        log = LogSincronizacion.objects.create(
+            integracion=integracion, estado=estado, mensaje='-', tiempo_respuesta_ms=tiempo
+        )
+        # timestamp es auto_now_add
+        LogSincronizacion.objects.filter(pk=log.pk).update(timestamp=momento)
+
+    def test_resumen_por_hora_con_p95(self):
+        hora = datetime(2025, 6, 1, 10, tzinfo=UTC)
+        for i in range(1, 21):
+            self._log(self.integracion, 'EXITOSA', hora + timedelta(minutes=i), tiempo=i * 10)
+        self._log(self.integracion, 'EXITOSA', hora + timedelta(minutes=59))
+        self._log(self.integracion, 'ERROR', hora + timedelta(hours=1, minutes=5))
+        # Hora todavía abierta: no se resume
+        self._log(self.integracion, 'EXITOSA', self.ahora)
+
+        self.assertEqual(resumir_logs(hasta=self.ahora), 2)
+        resumen = ResumenLogSincronizacion.objects.get(hora=hora, estado='EXITOSA')
+        self.assertEqual(resumen.total, 21)
+        self.assertEqual(resumen.con_tiempo_respuesta, 20)
+        self.assertEqual(resumen.tiempo_respuesta_p95_ms, 190)
+        self.assertEqual(resumen.tiempo_respuesta_max_ms, 200)
+        self.assertAlmostEqual(resumen.tiempo_respuesta_promedio_ms, 105.0)
+
+        # Idempotente: la segunda corrida no repite horas
+        self.assertEqual(resumir_logs(hasta=self.ahora), 0)
+
+    def test_depuracion_por_estado_e_integracion(self):
+        otra = IntegracionExterna.objects.create(
+            nombre_sistema='Laboratorio', tipo_sistema='LIS', endpoint_base_url='https://lab.example.com',
+            retencion_logs={'EXITOSA': 30, 'ERROR': None}
+        )
+        hace_20_dias = self.ahora - timedelta(days=20)
+        hace_100_dias = self.ahora - timedelta(days=100)
+        for integracion in (self.integracion, otra):
+            self._log(integracion, 'EXITOSA', hace_20_dias)
+            self._log(integracion, 'ERROR', hace_100_dias)
+            self._log(integracion, 'TIMEOUT', hace_100_dias)
+
+        # Sin resúmenes no se borra nada
+        self.assertEqual(depurar_logs(ahora=self.ahora), {})
+
+        resumir_logs(hasta=self.ahora)
+        borrados = depurar_logs(tamano_lote=1, ahora=self.ahora)
+        self.assertEqual(borrados, {'EXITOSA': 1, 'ERROR': 1})
+        self.assertEqual(
+            set(LogSincronizacion.objects.values_list('integracion__nombre_sistema', 'estado')),
+            {('HIS Central', 'TIMEOUT'), ('Laboratorio', 'EXITOSA'),
+             ('Laboratorio', 'ERROR'), ('Laboratorio', 'TIMEOUT')}
+        )
+        # Los resúmenes sobreviven a la depuración
+        self.assertEqual(
+            sum(ResumenLogSincronizacion.objects.filter(estado='EXITOSA').values_list('total', flat=True)), 2
+        )
+
+    def test_no_borra_horas_sin_resumir(self):
+        self._log(self.integracion, 'EXITOSA', self.ahora - timedelta(days=30))
+        resumir_logs(hasta=self.ahora - timedelta(days=40))
+        self._log(self.integracion, 'EXITOSA', self.ahora - timedelta(days=50))
+        resumir_logs(hasta=self.ahora - timedelta(days=40))
+
+        depurar_logs(ahora=self.ahora)
+        # El de hace 50 días ya tenía resumen; el de hace 30 no
+        self.assertEqual(LogSincronizacion.objects.count(), 1)
+
+
+class _ManejadorStub(BaseHTTPRequestHandler):
+    # HTTP/1.1: keep-alive salvo que la respuesta diga lo contrario
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexiones += 1
+
+    def _responder(self):
+        servidor = self.server
+        largo = int(self.headers.get('Content-Length') or 0)
+        cuerpo = self.rfile.read(largo) if largo else b''
+        with servidor.lock:
+            servidor.peticiones.append((self.command, self.path, dict(self.headers), cuerpo))
+            servidor.simultaneas += 1
+            servidor.max_simultaneas = max(servidor.max_simultaneas, servidor.simultaneas)
+            estado, datos = servidor.respuestas.pop(0) if servidor.respuestas else (200, {'ok': True})
+        time.sleep(servidor.demora)
+        contenido = json.dumps(datos).encode()
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(contenido)))
+        self.end_headers()
+        self.wfile.write(contenido)
+        with servidor.lock:
+            servidor.simultaneas -= 1
+
+    do_GET = do_POST = _responder
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorStub(ThreadingHTTPServer):
+    """
+    Sistema externo local para los tests: responde en orden lo que haya en
+    `respuestas` ((estado, json); 200 si está vacía) y registra las peticiones.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _ManejadorStub)
+        self.lock = threading.Lock()
+        self.respuestas = []
+        self.peticiones = []
+        self.conexiones = 0
+        self.simultaneas = 0
+        self.max_simultaneas = 0
+        self.demora = 0
+        self._hilo = threading.Thread(target=self.serve_forever, daemon=True)
+        self._hilo.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/api/'
+
+    def detener(self):
+        self.shutdown()
+        self.server_close()
+
+
+@override_settings(INTEGRACIONES_BACKOFF_BASE=0, INTEGRACIONES_REINTENTOS=3, INTEGRACIONES_HTTP_TIMEOUT=5)
+class WorkerSincronizacionTests(TestCase):
+
+    def setUp(self):
+        self.servidor = ServidorStub()
+        self.addCleanup(self.servidor.detener)
+
+    def _integracion(self, nombre='HIS Central', **campos):
+        return IntegracionExterna.objects.create(
+            nombre_sistema=nombre, tipo_sistema='HIS', endpoint_base_url=self.servidor.url,
+            metodo_autenticacion='BEARER_TOKEN', token_acceso_encrypted='secreto', **campos
+        )
+
+    def test_pool_reutiliza_la_conexion(self):
+        pool = PoolConexiones()
+        for _ in range(3):
+            self.assertEqual(pool.solicitar('GET', self.servidor.url).estado, 200)
+        pool.cerrar()
+        self.assertEqual(self.servidor.conexiones, 1)
+        self.assertEqual(len(self.servidor.peticiones), 3)
+
+    def test_reintenta_errores_transitorios_y_registra_tiempo(self):
+        integracion = self._integracion()
+        self.servidor.respuestas = [(503, {}), (429, {}), (200, {'ok': True})]
+
+        self.assertTrue(integracion.sincronizar_datos())
+        log = integracion.logs_sincronizacion.get()
+        self.assertEqual(log.estado, 'EXITOSA')
+        self.assertEqual(log.datos_adicionales['intentos'], 3)
+        self.assertIsNotNone(log.tiempo_respuesta_ms)
+        self.assertEqual(self.servidor.peticiones[0][2]['Authorization'], 'Bearer secreto')
+        integracion.refresh_from_db()
+        self.assertEqual(integracion.estado_conexion, 'ACTIVA')
+        self.assertIsNotNone(integracion.ultima_sincronizacion)
+
+    def test_error_del_cliente_no_se_reintenta(self):
+        integracion = self._integracion()
+        self.servidor.respuestas = [(401, {})]
+
+        self.assertFalse(integracion.sincronizar_datos())
+        self.assertEqual(len(self.servidor.peticiones), 1)
+        self.assertEqual(integracion.logs_sincronizacion.get().estado, 'ERROR')
+        integracion.refresh_from_db()
+        self.assertEqual(integracion.estado_conexion, 'ERROR')
+
+    def test_concurrencia_acotada_por_el_semaforo(self):
+        for i in range(6):
+            self._integracion(f'Sistema {i}')
+        self.servidor.demora = 0.1
+
+        resultados = async_to_sync(WorkerSincronizacion(concurrencia=2).sincronizar_todas)()
+        self.assertTrue(all(resultado.exito for resultado in resultados))
+        self.assertEqual(self.servidor.max_simultaneas, 2)
+        self.assertEqual(LogSincronizacion.objects.filter(estado='EXITOSA').count(), 6)
+
+    def test_planifica_segun_intervalo(self):
+        pendiente = self._integracion('Atrasada', intervalo_sincronizacion=300)
+        self._integracion(
+            'Al día', intervalo_sincronizacion=300,
+            ultima_sincronizacion=datetime.now(dt_timezone.utc) - timedelta(seconds=30)
+        )
+        self._integracion('Inactiva', activo=False)
+
+        async def correr():
+            detener = asyncio.Event()
+            worker = WorkerSincronizacion(jitter_inicial=0)
+            tarea = asyncio.create_task(worker.ejecutar(detener))
+            await asyncio.sleep(0.5)
+            detener.set()
+            await tarea
+
+        async_to_sync(correr)()
+        self.assertEqual(
+            list(LogSincronizacion.objects.values_list('integracion', flat=True)), [pendiente.pk]
+        )
+
+
+class ColaWebhooksTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.integracion = IntegracionExterna.objects.create(
+            nombre_sistema='HIS Central', tipo_sistema='HIS', endpoint_base_url='https://his.example.com',
+            secreto_webhook='secreto-webhook', configuracion_mapeo={'rut': 'patient_rut'}
+        )
+        self.cliente = APIClient()
+        self.url = f'/api/integraciones/{self.integracion.pk}/webhook/'
+
+    def _enviar(self, datos, firma=None, **cabeceras):
+        cuerpo = json.dumps(datos).encode()
+        if firma is None:
+            firma = hmac.new(b'secreto-webhook', cuerpo, hashlib.sha256).hexdigest()
+        return self.cliente.post(
+            self.url, cuerpo, content_type='application/json',
+            headers={'X-Webhook-Firma': f'sha256={firma}', **cabeceras}
+        )
+
+    def test_encola_y_deduplica(self):
+        respuesta = self._enviar([{'id': 'e1', 'tipo': 'paciente'}, {'id': 'e2', 'tipo': 'paciente'}])
+        self.assertEqual(respuesta.status_code, 202, respuesta.content)
+        # Reenvío del emisor: mismo id de evento
+        self.assertEqual(self._enviar({'id': 'e1', 'tipo': 'paciente'}).status_code, 202)
+        # Sin id: deduplica por Idempotency-Key o por contenido
+        self._enviar({'tipo': 'box'}, **{'Idempotency-Key': 'k-1'})
+        self._enviar({'tipo': 'otro', 'valor': 1}, **{'Idempotency-Key': 'k-1'})
+        self._enviar({'tipo': 'box', 'valor': 2})
+        self._enviar({'tipo': 'box', 'valor': 2})
+
+        self.assertEqual(
+            sorted(EventoWebhook.objects.values_list('clave_idempotencia', flat=True))[:3],
+            ['e1', 'e2', 'k-1']
+        )
+        self.assertEqual(EventoWebhook.objects.count(), 4)
+        # El endpoint no procesa ni deja logs
+        self.assertFalse(LogSincronizacion.objects.exists())
+
+    def test_firma_invalida(self):
+        self.assertEqual(self._enviar({'id': 'e1'}, firma='0' * 64).status_code, 403)
+        self.assertFalse(EventoWebhook.objects.exists())
+
+    @override_settings(WEBHOOK_BACKLOG_MAXIMO=2, WEBHOOK_RETRY_AFTER=15)
+    def test_backpressure_con_retry_after(self):
+        self._enviar([{'id': 'e1'}, {'id': 'e2'}])
+        cache.clear()
+        respuesta = self._enviar({'id': 'e3'})
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta['Retry-After'], '15')
+        self.assertEqual(EventoWebhook.objects.count(), 2)
+
+    def test_drena_en_lotes_con_manejador(self):
+        recibidos = []
+        self._enviar([{'id': f'e{i}', 'tipo': 'paciente', 'patient_rut': f'{i}-K'} for i in range(5)])
+        self._enviar({'id': 'x', 'tipo': 'sin_manejador'})
+
+        with mock.patch.dict(cola_webhooks._manejadores,
+                             {'paciente': lambda integracion, eventos, datos: recibidos.append(datos)}):
+            totales = cola_webhooks.drenar(tamano_lote=4)
+
+        self.assertEqual(totales['procesados'], 6)
+        # Un llamado por tipo y lote, con los payloads ya mapeados
+        self.assertEqual(recibidos, [[{'rut': f'{i}-K'} for i in range(4)], [{'rut': '4-K'}]])
+        self.assertFalse(EventoWebhook.objects.exclude(estado='PROCESADO').exists())
+        self.assertEqual(LogSincronizacion.objects.filter(estado='WEBHOOK_PROCESADO').count(), 2)
+
+    @override_settings(WEBHOOK_MAX_INTENTOS=2)
+    def test_falla_del_manejador_reintenta_y_descarta(self):
+        self._enviar({'id': 'e1', 'tipo': 'paciente'})
+
+        def fallar(integracion, eventos, datos):
+            raise ValueError('sin conexión al dominio')
+
+        with mock.patch.dict(cola_webhooks._manejadores, {'paciente': fallar}):
+            self.assertEqual(cola_webhooks.drenar()['reintentos'], 1)
+            evento = EventoWebhook.objects.get()
+            self.assertEqual(evento.estado, 'PENDIENTE')
+            self.assertGreater(evento.disponible_en, evento.recibido_en)
+
+            EventoWebhook.objects.update(disponible_en=evento.recibido_en)
+            self.assertEqual(cola_webhooks.drenar()['fallidos'], 1)
+
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.intentos), ('ERROR', 2))
+        self.assertIn('sin conexión', evento.error)
+        self.assertIsNotNone(evento.procesado_en)
+
+    @override_settings(WEBHOOK_RETENCION_DIAS=7, WEBHOOK_RETENCION_ERRORES_DIAS=30)
+    def test_depura_procesados_y_errores_vencidos(self):
+        self._enviar([{'id': f'e{i}'} for i in range(5)])
+        ahora = timezone.now()
+        ids = list(EventoWebhook.objects.order_by('id').values_list('id', flat=True))
+        por_id = {
+            ids[0]: ('PROCESADO', ahora - timedelta(days=8)),
+            ids[1]: ('PROCESADO', ahora - timedelta(days=2)),
+            ids[2]: ('ERROR', ahora - timedelta(days=31)),
+            ids[3]: ('ERROR', ahora - timedelta(days=8)),
+        }
+        for pk, (estado, procesado_en) in por_id.items():
+            EventoWebhook.objects.filter(pk=pk).update(estado=estado, procesado_en=procesado_en)
+        # ERROR anterior a procesado_en: cuenta desde que se recibió
+        EventoWebhook.objects.filter(pk=ids[4]).update(
+            estado='ERROR', procesado_en=None, recibido_en=ahora - timedelta(days=40)
+        )
+
+        self.assertEqual(cola_webhooks.depurar_eventos(), 3)
+        self.assertEqual(set(EventoWebhook.objects.values_list('id', flat=True)), {ids[1], ids[3]})
+
+
+class MapeoTests(TestCase):
+
+    def test_rutas_anidadas_conversion_y_defectos(self):
+        mapeador = MapeadorCompilado({
+            'rut': {'origen': 'paciente.documento.numero', 'tipo': 'rut'},
+            'fecha_nacimiento': {'origen': 'paciente.nacimiento', 'tipo': 'fecha', 'formato': '%d/%m/%Y'},
+            'urgencia': {'origen': 'prioridad', 'tipo': 'enum', 'valores': {'1': 'ALTA', '2': 'MEDIA'},
+                         'por_defecto': 'MEDIA'},
+            'peso': {'origen': 'signos.peso', 'tipo': 'decimal'},
+            'alergias': 'alergias[].codigo',
+            'telefono': 'paciente.telefonos.0',
+            'ausente': 'no.existe',
+        })
+        self.assertEqual(
+            mapeador({
+                'paciente': {'documento': {'numero': '213769324'}, 'nacimiento': '05/03/1990',
+                             'telefonos': ['+56911111111']},
+                'signos': {'peso': 70.5},
+                'alergias': [{'codigo': 'PEN'}, {'codigo': 'LAT'}, {'otro': 1}],
+            }),
+            {'rut': '21.376.932-4', 'fecha_nacimiento': date(1990, 3, 5), 'urgencia': 'MEDIA',
+             'peso': Decimal('70.5'), 'alergias': ['PEN', 'LAT'], 'telefono': '+56911111111'}
+        )
+        with self.assertRaises(ErrorMapeo):
+            mapeador({'paciente': {'documento': {'numero': '21376932-0'}}})
+
+    def test_fan_out_y_lote(self):
+        mapeador = MapeadorCompilado({
+            '_registros': 'agenda.citas[]',
+            'id_externo': {'origen': 'id', 'tipo': 'texto'},
+            'inicio': {'origen': 'inicio', 'tipo': 'fechahora'},
+            'centro': '^.centro',
+        })
+        payloads = [
+            {'centro': 'C1', 'agenda': {'citas': [{'id': 1, 'inicio': '2025-06-01T10:00:00-04:00'},
+                                                  {'id': 2, 'inicio': '2025-06-01T11:00:00-04:00'}]}},
+            {'centro': 'C2', 'agenda': {'citas': [{'id': 3, 'inicio': 'mañana'}]}},
+            {'centro': 'C3'},
+        ]
+        errores = []
+        resultados = mapeador.mapear_lote(payloads, errores)
+        self.assertEqual([r['id_externo'] for r in resultados[0]], ['1', '2'])
+        self.assertEqual(resultados[0][0]['centro'], 'C1')
+        self.assertEqual(resultados[0][0]['inicio'], datetime(2025, 6, 1, 14, tzinfo=dt_timezone.utc))
+        self.assertIsNone(resultados[1])
+        self.assertEqual(resultados[2], [])
+        self.assertEqual(len(errores), 1)
+        self.assertEqual(errores[0][0], 1)
+
+    def test_cache_por_fecha_actualizacion(self):
+        integracion = IntegracionExterna.objects.create(
+            nombre_sistema='HIS Central', tipo_sistema='HIS', endpoint_base_url='https://his.example.com',
+            configuracion_mapeo={'rut': 'patient_rut'}
+        )
+        mapeador = mapeador_de(integracion)
+        self.assertIs(mapeador_de(IntegracionExterna.objects.get(pk=integracion.pk)), mapeador)
+        self.assertEqual(integracion._mapear_datos({'patient_rut': '1-9', 'x': 1}), {'rut': '1-9'})
+
+        integracion.configuracion_mapeo = {'rut': 'rut'}
+        integracion.save()
+        self.assertIsNot(mapeador_de(integracion), mapeador)
+        self.assertEqual(integracion._mapear_datos({'rut': '1-9'}), {'rut': '1-9'})
+
+    def test_configuracion_invalida_no_valida(self):
+        integracion = IntegracionExterna(
+            nombre_sistema='HIS', tipo_sistema='HIS', endpoint_base_url='https://his.example.com',
+            token_acceso_encrypted='t', configuracion_mapeo={'rut': {'origen': 'rut', 'tipo': 'color'}}
+        )
+        with self.assertRaises(ValidationError) as contexto:
+            integracion.full_clean()
+        self.assertIn('configuracion_mapeo', contexto.exception.message_dict)
+
+
+@override_settings(INTEGRACIONES_BACKOFF_BASE=0, INTEGRACIONES_REINTENTOS=2, INTEGRACIONES_HTTP_TIMEOUT=5)
+class AgendaIncrementalTests(TestCase):
+
+    def setUp(self):
+        self.servidor = ServidorStub()
+        self.addCleanup(self.servidor.detener)
+        self.integracion = IntegracionExterna.objects.create(
+            nombre_sistema='Agenda HIS', tipo_sistema='HIS', endpoint_base_url=self.servidor.url,
+            token_acceso_encrypted='secreto', agenda_activa=True,
+            mapeo_agenda={
+                '_registros': 'cambios',
+                'id_externo': 'id',
+                'fecha_hora_inicio': {'origen': 'inicio', 'tipo': 'fechahora'},
+                'duracion_planificada': 'minutos',
+                'paciente': 'rut',
+                'medico': 'profesional',
+                'box': 'sala',
+                'eliminado': {'origen': 'borrado', 'tipo': 'booleano'},
+            }
+        )
+        self.medico = User.objects.create_user(
+            'medico_agenda', 'medico_agenda@nexalud.medico.com', 'clave', rol='MEDICO',
+            especialidad='MEDICINA_GENERAL'
+        )
+        self.box = Box.objects.create(numero='SALA-1', nombre='Sala 1')
+        self.rut = rut_sintetico(1)
+        self.paciente = Paciente.objects.create(
+            rut=self.rut, nombre='Ana', apellido_paterno='Agenda', fecha_nacimiento=date(1990, 1, 1),
+            telefono='+56912345678', peso=60, altura=160,
+        )
+        self.manana = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+
+    def _cambio(self, id_externo, minutos=30, hora=0, **extra):
+        return {
+            'id': id_externo, 'inicio': (self.manana + timedelta(hours=hora)).isoformat(), 'minutos': minutos,
+            'rut': self.rut.replace('.', ''), 'profesional': 'medico_agenda', 'sala': 'SALA-1', **extra
+        }
+
+    def _pagina(self, cambios, cursor, hay_mas=False):
+        return (200, {'registros': [{'cambios': cambios}], 'cursor': cursor, 'hay_mas': hay_mas})
+
+    def _parametros(self, indice):
+        return parse_qs(urlsplit(self.servidor.peticiones[indice][1]).query)
+
+    def test_primera_corrida_pagina_crea_en_bloque_y_guarda_cursor(self):
+        self.servidor.respuestas = [
+            self._pagina([self._cambio('A1')], 'c1', hay_mas=True),
+            self._pagina([self._cambio('A2', hora=1)], 'c2'),
+        ]
+        resultado = self.integracion.sincronizar_agenda()
+
+        self.assertEqual((resultado['creadas'], resultado['paginas'], resultado['rutas_creadas']), (2, 2, 1))
+        self.assertEqual(Atencion.objects.filter(paciente=self.paciente).count(), 2)
+        self.assertEqual(IdentificadorExterno.objects.filter(tipo='ATENCION').count(), 2)
+        self.assertNotIn('cursor', self._parametros(0))
+        self.assertEqual(self._parametros(1)['cursor'], ['c1'])
+
+        # Ruta automática y paciente activo, como con las señales
+        ruta = RutaClinica.objects.get(paciente=self.paciente)
+        self.assertEqual((ruta.estado, ruta.etapa_actual), ('EN_PROGRESO', 'CONSULTA_MEDICA'))
+        self.paciente.refresh_from_db()
+        self.assertEqual(self.paciente.estado_actual, 'ACTIVO')
+
+        self.integracion.refresh_from_db()
+        self.assertEqual(self.integracion.cursor_agenda, 'c2')
+        self.assertIsNotNone(self.integracion.ultima_sincronizacion_agenda)
+        log = self.integracion.logs_sincronizacion.get()
+        self.assertEqual(log.estado, 'EXITOSA')
+        self.assertEqual(log.datos_adicionales['creadas'], 2)
+
+    def test_corrida_incremental_actualiza_cancela_y_omite(self):
+        self.servidor.respuestas = [self._pagina([self._cambio('A1'), self._cambio('A2', hora=1)], 'c1')]
+        self.integracion.sincronizar_agenda()
+
+        self.servidor.respuestas = [self._pagina([
+            self._cambio('A1', minutos=45),
+            {'id': 'A2', 'borrado': True},
+            self._cambio('A3', hora=2, sala='NO-EXISTE'),
+            {'id': 'A4', 'minutos': 20},
+        ], 'c2')]
+        resultado = self.integracion.sincronizar_agenda()
+
+        self.assertEqual(self._parametros(1)['cursor'], ['c1'])
+        self.assertEqual(
+            [resultado[m] for m in ('creadas', 'actualizadas', 'canceladas', 'sin_referencia', 'invalidos')],
+            [0, 1, 1, 1, 1]
+        )
+        locales = dict(IdentificadorExterno.objects.values_list('id_externo', 'id_local'))
+        a1 = Atencion.objects.get(pk=locales['A1'])
+        self.assertEqual(a1.duracion_planificada, 45)
+        self.assertEqual(a1.fin_reserva, a1.fecha_hora_inicio + timedelta(minutes=45))
+        self.assertEqual(Atencion.objects.get(pk=locales['A2']).estado, 'CANCELADA')
+        self.assertEqual(self.integracion.logs_sincronizacion.latest('timestamp').estado, 'ADVERTENCIA')
+
+        # Repetir el mismo cambio no escribe nada; una atención ya iniciada
+        # en el centro no se toca
+        Atencion.objects.filter(pk=locales['A1']).update(estado='EN_CURSO')
+        self.servidor.respuestas = [self._pagina([self._cambio('A1', minutos=45), self._cambio('A1', minutos=50)], 'c3')]
+        resultado = self.integracion.sincronizar_agenda()
+        self.assertEqual((resultado['actualizadas'], resultado['bloqueadas']), (0, 1))
+        self.assertEqual(Atencion.objects.get(pk=locales['A1']).duracion_planificada, 45)
+
+    def test_solapes_con_la_agenda_o_en_la_pagina_no_se_importan(self):
+        local = Atencion.objects.create(
+            paciente=self.paciente, medico=self.medico, box=self.box,
+            fecha_hora_inicio=timezone.make_aware(self.manana), duracion_planificada=30,
+        )
+
+        def a_las(minutos):
+            return (self.manana + timedelta(minutes=minutos)).isoformat()
+
+        self.servidor.respuestas = [self._pagina([
+            self._cambio('A1', inicio=a_las(15)),   # cruza la reserva local 09:00-09:30
+            self._cambio('A2', inicio=a_las(30)),   # contigua: [09:30, 10:00)
+            self._cambio('A3', inicio=a_las(45)),   # cruza a A2, de la misma página
+            self._cambio('A4', inicio=a_las(60)),
+        ], 'c1')]
+        resultado = self.integracion.sincronizar_agenda()
+
+        self.assertEqual((resultado['creadas'], resultado['conflictos']), (2, 2))
+        self.assertEqual(
+            set(IdentificadorExterno.objects.filter(tipo='ATENCION').values_list('id_externo', flat=True)),
+            {'A2', 'A4'},
+        )
+        self.assertEqual(buscar_solapes(list(Atencion.objects.all())), [])
+
+        # Mover una importada encima de la local también se rechaza y no se escribe
+        self.servidor.respuestas = [self._pagina([self._cambio('A2', inicio=a_las(0))], 'c2')]
+        resultado = self.integracion.sincronizar_agenda()
+        self.assertEqual((resultado['actualizadas'], resultado['conflictos']), (0, 1))
+        a2 = Atencion.objects.get(pk=IdentificadorExterno.objects.get(id_externo='A2').id_local)
+        self.assertEqual(a2.fecha_hora_inicio, local.fecha_hora_inicio + timedelta(minutes=30))
+
+    def test_intercambio_o_reemplazo_en_la_misma_pagina_no_es_conflicto(self):
+        def a_las(minutos):
+            return (self.manana + timedelta(minutes=minutos)).isoformat()
+
+        def inicio_de(id_externo):
+            id_local = IdentificadorExterno.objects.get(id_externo=id_externo).id_local
+            return Atencion.objects.get(pk=id_local).fecha_hora_inicio
+
+        self.servidor.respuestas = [
+            self._pagina([self._cambio('A1', inicio=a_las(0)), self._cambio('A2', inicio=a_las(30))], 'c1'),
+            # A1 y A2 intercambian sus horas: cada una cruza la fila vieja de la otra
+            self._pagina([self._cambio('A1', inicio=a_las(30)), self._cambio('A2', inicio=a_las(0))], 'c2'),
+            # Se cancela A1 y A3 toma su lugar
+            self._pagina([self._cambio('A1', inicio=a_las(30), borrado=True), self._cambio('A3', inicio=a_las(30))], 'c3'),
+        ]
+        self.integracion.sincronizar_agenda()
+        resultado = self.integracion.sincronizar_agenda()
+        self.assertEqual((resultado['actualizadas'], resultado['conflictos']), (2, 0))
+        self.assertEqual(inicio_de('A1') - inicio_de('A2'), timedelta(minutes=30))
+
+        resultado = self.integracion.sincronizar_agenda()
+        self.assertEqual((resultado['creadas'], resultado['canceladas'], resultado['conflictos']), (1, 1, 0))
+        self.assertEqual(inicio_de('A3'), inicio_de('A1'))
+        self.assertEqual(buscar_solapes(list(Atencion.objects.all())), [])
+
+    def test_ventana_explicita_no_mueve_la_marca(self):
+        self.integracion.cursor_agenda = 'c9'
+        self.integracion.save()
+        self.servidor.respuestas = [self._pagina([self._cambio('A1')], 'otro')]
+
+        resultado = self.integracion.sincronizar_agenda(fecha_desde=date(2026, 1, 1), fecha_hasta=date(2026, 1, 31))
+
+        self.assertEqual(resultado['creadas'], 1)
+        parametros = self._parametros(0)
+        self.assertNotIn('cursor', parametros)
+        self.assertEqual(parametros['fecha_desde'], ['2026-01-01'])
+        self.integracion.refresh_from_db()
+        self.assertEqual(self.integracion.cursor_agenda, 'c9')
+        self.assertIsNone(self.integracion.ultima_sincronizacion_agenda)
+
+    def test_publica_lo_importado_solo_a_las_demas_integraciones(self):
+        self.addCleanup(publicador.olvidar_suscriptores)
+        self.integracion.publicar_eventos = True
+        self.integracion.save()
+        otra = IntegracionExterna.objects.create(
+            nombre_sistema='LIS', tipo_sistema='LIS', endpoint_base_url=self.servidor.url,
+            token_acceso_encrypted='t', publicar_eventos=True, eventos_publicados=['ATENCION', 'RUTA_CLINICA']
+        )
+        self.servidor.respuestas = [self._pagina([self._cambio('A1')], 'c1')]
+        self.integracion.sincronizar_agenda()
+
+        self.assertFalse(self.integracion.eventos_salientes.exists())
+        self.assertEqual(
+            sorted(otra.eventos_salientes.values_list('tipo_evento', flat=True)),
+            ['atencion.creacion', 'ruta_clinica.creacion']
+        )
+
+    def test_error_del_sistema_externo_se_registra(self):
+        self.servidor.respuestas = [(404, {})]
+        resultado = self.integracion.sincronizar_agenda()
+
+        self.assertIn('error', resultado)
+        self.assertEqual(self.integracion.logs_sincronizacion.get().estado, 'ERROR')
+        self.integracion.refresh_from_db()
+        self.assertIsNone(self.integracion.ultima_sincronizacion_agenda)
+
+
+@override_settings(PUBLICACION_MAX_INTENTOS=2)
+class PublicadorEventosTests(TestCase):
+
+    def setUp(self):
+        publicador.olvidar_suscriptores()
+        self.addCleanup(publicador.olvidar_suscriptores)
+        self.servidor = ServidorStub()
+        self.addCleanup(self.servidor.detener)
+        self.box = Box.objects.create(numero='BX-1', nombre='Box 1')
+        self.otro_box = Box.objects.create(numero='BX-2', nombre='Box 2')
+        self.integracion = IntegracionExterna.objects.create(
+            nombre_sistema='EMR', tipo_sistema='EMR', endpoint_base_url=self.servidor.url,
+            token_acceso_encrypted='t', secreto_webhook='s3cr3t', publicar_eventos=True,
+            configuracion_mapeo={
+                'numero': 'recurso.codigo',
+                'estado': {'origen': 'status', 'tipo': 'enum', 'valores': {'free': 'DISPONIBLE', 'busy': 'OCUPADO'}},
+            }
+        )
+        self.pool = PoolConexiones()
+        self.addCleanup(self.pool.cerrar)
+
+    def _enviados(self, indice=-1):
+        return [evento['id'] for evento in json.loads(self.servidor.peticiones[indice][3])['eventos']]
+
+    def test_sin_suscriptores_no_agrega_consultas(self):
+        IntegracionExterna.objects.filter(pk=self.integracion.pk).update(publicar_eventos=False)
+        publicador.olvidar_suscriptores()
+        publicador.suscriptores('BOX')
+        self.box.estado = 'MANTENIMIENTO'
+        with self.assertNumQueries(1):
+            self.box.save()
+        self.assertFalse(EventoSaliente.objects.exists())
+
+    def test_transicion_va_al_outbox_y_se_entrega_con_mapeo_inverso(self):
+        self.box.ocupar()
+        self.box.save()  # sin cambio de estado: no publica
+        self.box.liberar()
+        eventos = list(self.integracion.eventos_salientes.all())
+        self.assertEqual([e.tipo_evento for e in eventos], ['box.cambio_estado'] * 2)
+        self.assertEqual(eventos[0].payload['anterior'], {'estado': 'DISPONIBLE'})
+
+        resultado = publicador.despachar(self.integracion, self.pool)
+
+        self.assertEqual(resultado['enviados'], 2)
+        metodo, ruta, cabeceras, cuerpo = self.servidor.peticiones[0]
+        self.assertEqual((metodo, ruta), ('POST', '/api/eventos'))
+        self.assertEqual(cabeceras['X-Nexalud-Firma'], publicador.firma('s3cr3t', cuerpo))
+        primero = json.loads(cuerpo)['eventos'][0]
+        self.assertEqual(primero['id'], eventos[0].id)
+        self.assertEqual(primero['datos']['status'], 'busy')
+        self.assertEqual(primero['datos']['recurso'], {'codigo': 'BX-1'})
+        self.assertNotIn('estado', primero['datos'])
+        self.assertEqual(set(self.integracion.eventos_salientes.values_list('estado', flat=True)), {'ENVIADO'})
+        self.assertEqual(self.integracion.logs_sincronizacion.get().estado, 'EXITOSA')
+
+    def test_reintentos_orden_por_agregado_y_dead_letter(self):
+        self.box.ocupar()
+        primero = self.integracion.eventos_salientes.get()
+        self.servidor.respuestas = [(503, {})]
+        self.assertEqual(publicador.despachar(self.integracion, self.pool)['reintentos'], 1)
+
+        # El siguiente evento del mismo box espera al que está en reintento;
+        # el de otro box sale igual
+        self.box.liberar()
+        self.otro_box.ocupar()
+        segundo, tercero = self.integracion.eventos_salientes.exclude(pk=primero.pk).order_by('id')
+        publicador.despachar(self.integracion, self.pool)
+        self.assertEqual(self._enviados(), [tercero.id])
+
+        # Vencida la espera salen juntos y en orden; el que agota sus intentos
+        # pasa a dead letter y sigue bloqueando a los siguientes de su box
+        EventoSaliente.objects.filter(pk=primero.pk).update(disponible_en=datetime.now(dt_timezone.utc))
+        self.servidor.respuestas = [(400, {})]
+        resultado = publicador.despachar(self.integracion, self.pool)
+        self.assertEqual(self._enviados(), [primero.id, segundo.id])
+        self.assertEqual((resultado['muertos'], resultado['reintentos']), (1, 1))
+        primero.refresh_from_db()
+        self.assertEqual(primero.estado, 'MUERTO')
+
+        EventoSaliente.objects.filter(pk=segundo.pk).update(disponible_en=datetime.now(dt_timezone.utc))
+        peticiones = len(self.servidor.peticiones)
+        self.assertEqual(publicador.despachar(self.integracion, self.pool)['enviados'], 0)
+        self.assertEqual(len(self.servidor.peticiones), peticiones)
+
+        # Reencolado, sale antes que el que lo seguía
+        self.assertEqual(publicador.reencolar(EventoSaliente.objects.all()), 1)
+        primero.refresh_from_db()
+        self.assertEqual((primero.estado, primero.intentos), ('PENDIENTE', 0))
+        publicador.despachar(self.integracion, self.pool)
+        self.assertEqual(self._enviados(), [primero.id, segundo.id])
+
+    def test_descartar_libera_al_agregado(self):
+        self.box.ocupar()
+        self.box.liberar()
+        primero, segundo = self.integracion.eventos_salientes.order_by('id')
+        EventoSaliente.objects.filter(pk=primero.pk).update(estado='MUERTO')
+        self.assertEqual(publicador.tomar_lote(self.integracion), [])
+
+        self.assertEqual(publicador.descartar(EventoSaliente.objects.all()), 1)
+        self.assertEqual(publicador.tomar_lote(self.integracion), [segundo])
+
+    def test_agregados_en_espera_no_tapan_la_cola(self):
+        # Más eventos bloqueados al frente que cualquier ventana de lectura
+        for _ in range(6):
+            self.box.ocupar()
+            self.box.liberar()
+        EventoSaliente.objects.update(disponible_en=datetime.now(dt_timezone.utc) + timedelta(hours=1))
+        self.otro_box.ocupar()
+        ultimo = self.integracion.eventos_salientes.latest('id')
+
+        self.assertEqual(publicador.tomar_lote(self.integracion, tamano=2), [ultimo])
+
+    def test_mapeo_inverso_deshace_enum_y_rutas(self):
+        inverso = MapeadorInverso({
+            'rut': 'paciente.documento',
+            'etapa': {'origen': 'fase', 'tipo': 'enum', 'valores': {'1': 'CONSULTA_MEDICA'}},
+            'nacimiento': {'origen': 'fn', 'tipo': 'fecha', 'formato': '%d/%m/%Y'},
+            'alergias': 'alergias[].codigo',
+        })
+        self.assertEqual(
+            inverso({'rut': '1-9', 'etapa': 'CONSULTA_MEDICA', 'nacimiento': '1990-02-01', 'alergias': ['X'], 'id': 7}),
+            {'paciente': {'documento': '1-9'}, 'fase': '1', 'fn': '01/02/1990', 'alergias': ['X'], 'id': 7}
+        )
+
+
+class ConfiguracionSistemaTests(TestCase):
+
+    def setUp(self):
+        configuracion.olvidar_configuracion()
+        self.addCleanup(configuracion.olvidar_configuracion)
+
+    def _configurar(self, clave, valor, tipo_dato):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ConfiguracionSistema.objects.update_or_create(
+                clave=clave, defaults={'valor': valor, 'tipo_dato': tipo_dato, 'descripcion': clave}
+            )[0]
+
+    def test_lecturas_tipadas_sin_consultas_e_invalidacion_al_guardar(self):
+        self._configurar('atenciones.minutos_espera_atraso', '8', 'INTEGER')
+        self._configurar('rutas.margen_tolerancia.ALTA', '0.5', 'FLOAT')
+        self._configurar('rutas.duracion_estimada.OPERACION', 'muchos', 'INTEGER')
+        self._configurar('integraciones.destinos', '{"lab": [1, 2]}', 'JSON')
+
+        with self.assertNumQueries(1), self.assertLogs('config.configuracion', 'WARNING') as registros:
+            self.assertEqual(Atencion.minutos_espera_atraso(), 8)
+        # El valor inválido viaja en campos del registro, no interpolado en el mensaje
+        self.assertEqual(
+            [(r.getMessage(), r.clave, r.valor) for r in registros.records],
+            [('Configuración con valor inválido', 'rutas.duracion_estimada.OPERACION', 'muchos')]
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(RutaClinica.margen_tolerancia_de('ALTA'), 0.5)
+            # Valor no convertible: se usa la constante del modelo
+            self.assertEqual(RutaClinica.duracion_estimada_de('OPERACION'), 2880)
+            self.assertEqual(RutaClinica.duracion_estimada_de('ALTA'), 2880)
+            self.assertEqual(ConfiguracionSistema.obtener_configuracion('integraciones.destinos'), {'lab': [1, 2]})
+            self.assertEqual(ConfiguracionSistema.obtener_configuracion('no.existe', 'x'), 'x')
+
+        self._configurar('atenciones.minutos_espera_atraso', '2', 'INTEGER')
+        self.assertEqual(Atencion.minutos_espera_atraso(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ConfiguracionSistema.objects.filter(clave='atenciones.minutos_espera_atraso').delete()
+        self.assertEqual(Atencion.minutos_espera_atraso(), Atencion.MINUTOS_ESPERA_ATRASO)
+
+    def test_otro_proceso_recarga_al_ver_la_nueva_version(self):
+        self.assertEqual(Atencion.minutos_espera_atraso(), 5)
+        ahora = time.monotonic()
+
+        # Guardado en otro proceso: aquí solo cambia la versión compartida
+        ConfiguracionSistema.objects.create(
+            clave='atenciones.minutos_espera_atraso', valor='10', tipo_dato='INTEGER', descripcion='espera'
+        )
+        cache.set(configuracion.CLAVE_VERSION, 'otra', timeout=None)
+
+        with mock.patch('config.configuracion.time.monotonic', return_value=ahora + 1):
+            self.assertEqual(Atencion.minutos_espera_atraso(), 5)
+        with mock.patch('config.configuracion.time.monotonic',
+                        return_value=ahora + configuracion.INTERVALO_VERIFICACION + 1):
+            self.assertEqual(Atencion.minutos_espera_atraso(), 10)
+
+    def test_umbral_configurado_en_atraso_y_retrasos_de_ruta(self):
+        medico = User.objects.create_user(
+            'medico_config', 'medico_config@nexalud.medico.com', 'clave', rol='MEDICO',
+            especialidad='MEDICINA_GENERAL'
+        )
+        paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Ana', apellido_paterno='Soto', fecha_nacimiento=date(1990, 1, 1)
+        )
+        atencion = Atencion.objects.create(
+            paciente=paciente, medico=medico, box=Box.objects.create(numero='CFG-1', nombre='Box'),
+            fecha_hora_inicio=datetime.now(UTC) + timedelta(hours=1), duracion_planificada=30,
+            atraso_reportado=True, fecha_reporte_atraso=datetime.now(UTC) - timedelta(minutes=7),
+        )
+        self.assertTrue(atencion.verificar_tiempo_atraso())
+        self._configurar('atenciones.minutos_espera_atraso', '10', 'INTEGER')
+        self.assertFalse(atencion.verificar_tiempo_atraso())
+
+        ruta = RutaClinica.objects.create(paciente=paciente, etapas_seleccionadas=['CONSULTA_MEDICA'])
+        ruta.iniciar_ruta(usuario=medico)
+        ruta.timestamps_etapas['CONSULTA_MEDICA']['fecha_inicio'] = (
+            datetime.now(UTC) - timedelta(minutes=120)
+        ).isoformat()
+        self.assertFalse(ruta.detectar_retrasos())
+        self._configurar('rutas.duracion_estimada.CONSULTA_MEDICA', '60', 'INTEGER')
+        self._configurar('rutas.margen_tolerancia.CONSULTA_MEDICA', '0.1', 'FLOAT')
+        self.assertTrue(ruta.detectar_retrasos())
+
+
+class IntegracionesAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # Changelists del admin de integraciones: último log anotado, sin consultas por fila
+    app_label = 'integraciones'
+    presupuestos_admin = {
+        IntegracionExterna: 5,
+        LogSincronizacion: 8,
+        ResumenLogSincronizacion: 8,
+        EventoWebhook: 7,
+        EventoSaliente: 6,
+        IdentificadorExterno: 6,
+        ConfiguracionSistema: 5,
+    }
+
+    def poblar(self, escenario):
+        # Una integración por unidad del escenario, con filas en cada tabla relacionada
+        desde = IntegracionExterna.objects.count() + 1
+        indices = range(desde, escenario.unidades + 1)
+        integraciones = IntegracionExterna.objects.bulk_create([
+            IntegracionExterna(nombre_sistema=f'Sistema {i}', tipo_sistema='HIS',
+                               endpoint_base_url=f'https://his{i}.example.com')
+            for i in indices
+        ])
+        hora = escenario.ahora.replace(minute=0, second=0, microsecond=0)
+        LogSincronizacion.objects.bulk_create([
+            LogSincronizacion(integracion=integracion, estado=estado, mensaje='-')
+            for integracion in integraciones for estado in ('EXITOSA', 'ERROR')
+        ])
+        ResumenLogSincronizacion.objects.bulk_create([
+            ResumenLogSincronizacion(integracion=integracion, hora=hora, estado='EXITOSA', total=1)
+            for integracion in integraciones
+        ])
+        EventoWebhook.objects.bulk_create([
+            EventoWebhook(integracion=integracion, clave_idempotencia=str(i), payload={})
+            for i, integracion in zip(indices, integraciones)
+        ])
+        EventoSaliente.objects.bulk_create([
+            EventoSaliente(integracion=integracion, tipo_agregado='BOX', id_agregado=str(i),
+                           tipo_evento='box.actualizado', payload={})
+            for i, integracion in zip(indices, integraciones)
+        ])
+        IdentificadorExterno.objects.bulk_create([
+            IdentificadorExterno(integracion=integracion, tipo='PACIENTE', id_externo=str(i), id_local=str(i))
+            for i, integracion in zip(indices, integraciones)
+        ])
+        ConfiguracionSistema.objects.bulk_create([
+            ConfiguracionSistema(clave=f'carga.clave_{i}', valor=str(i), tipo_dato='INTEGER',
+                                 descripcion='-', usuario_modificacion=escenario.admin)
+            for i in indices
+        ])
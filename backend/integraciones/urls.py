@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    # Webhooks entrantes de sistemas externos (firmados, sin token de usuario)
+    path('<uuid:integracion_id>/webhook/',
+         views.recibir_webhook,
+         name='integracion-webhook'),
+]
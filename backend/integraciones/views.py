@@ -1 +1,76 @@
-from django.shortcuts import render
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from .cola_webhooks import backlog, encolar, firma_valida
+from .models import IntegracionExterna
+
+
+# ============================================
+# WEBHOOKS ENTRANTES
+# ============================================
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def recibir_webhook(request, integracion_id):
+    """
+    Recibe uno o varios eventos (objeto o lista) de un sistema externo y los
+    encola; se procesan aparte (procesar_webhooks.py). La petición se
+    autentica con la firma X-Webhook-Firma (HMAC-SHA256 del cuerpo con el
+    secreto_webhook de la integración).
+    """
+    integracion = (
+        IntegracionExterna.objects
+        .filter(pk=integracion_id, activo=True)
+        .values('id', 'secreto_webhook')
+        .first()
+    )
+    if integracion is None:
+        return Response(
+            {'success': False, 'mensaje': 'Integración no encontrada'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    cuerpo = request.body
+    if not firma_valida(integracion['secreto_webhook'], cuerpo, request.headers.get('X-Webhook-Firma')):
+        return Response(
+            {'success': False, 'mensaje': 'Firma inválida'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    if backlog() >= settings.WEBHOOK_BACKLOG_MAXIMO:
+        return Response(
+            {'success': False, 'mensaje': 'Cola de webhooks llena, reintente más tarde'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(settings.WEBHOOK_RETRY_AFTER)}
+        )
+
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError:
+        return Response(
+            {'success': False, 'mensaje': 'El cuerpo debe ser JSON'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    eventos = datos if isinstance(datos, list) else [datos]
+    if not eventos or not all(isinstance(evento, dict) for evento in eventos):
+        return Response(
+            {'success': False, 'mensaje': 'Se espera un objeto o una lista de objetos'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(eventos) > settings.WEBHOOK_MAX_EVENTOS:
+        return Response(
+            {'success': False, 'mensaje': f'Máximo {settings.WEBHOOK_MAX_EVENTOS} eventos por petición'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+    recibidos = encolar(integracion['id'], eventos, request.headers.get('Idempotency-Key'))
+    return Response(
+        {'success': True, 'mensaje': 'Eventos encolados', 'recibidos': recibidos},
+        status=status.HTTP_202_ACCEPTED
+    )
@@ -0,0 +1,180 @@
+"""
+Worker asíncrono de sincronización de integraciones (worker_integraciones.py).
+
+Cada integración activa se sincroniza cada `intervalo_sincronizacion`
+segundos, contados desde el fin de su sincronización anterior. Varias corren
+a la vez, hasta settings.INTEGRACIONES_CONCURRENCIA (semáforo), compartiendo
+un pool de conexiones keep-alive.
+
+- La petición HTTP es bloqueante (http.client) y corre en un hilo con
+  asyncio.to_thread; las esperas de backoff son asyncio.sleep y no ocupan
+  hilos ni cupos del pool.
+- El ORM se usa solo a través de sync_to_async (hilo del ORM).
+- La lista de integraciones se relee cada `recarga` segundos: altas, bajas y
+  cambios de intervalo se toman sin reiniciar el worker.
+"""
+import asyncio
+import logging
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .cliente_http import ErrorHttp, ErrorTransitorio, PoolConexiones, espera_reintento
+from .models import IntegracionExterna
+from .sincronizacion import registrar_resultado, resultado_desde, solicitar_estado
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre relecturas de la lista de integraciones activas
+RECARGA = 60
+
+# Al arrancar, las integraciones atrasadas se reparten en esta ventana
+# (segundos) en vez de salir todas en el mismo instante
+JITTER_INICIAL = 5
+
+
+def _cargar_activas():
+    # En un proceso largo, descartar conexiones caídas o vencidas antes de usar
+    # el ORM (no dentro de una transacción abierta, p. ej. en los tests)
+    if not connection.in_atomic_block:
+        close_old_connections()
+    return list(IntegracionExterna.objects.filter(activo=True))
+
+
+class WorkerSincronizacion:
+
+    def __init__(self, concurrencia=None, pool=None, intentos=None, recarga=RECARGA,
+                 jitter_inicial=JITTER_INICIAL):
+        self.concurrencia = concurrencia or settings.INTEGRACIONES_CONCURRENCIA
+        self.pool = pool or PoolConexiones(max_por_host=self.concurrencia)
+        self.intentos = intentos or settings.INTEGRACIONES_REINTENTOS
+        self.recarga = recarga
+        self.jitter_inicial = jitter_inicial
+        self._semaforo = None
+        self._integraciones = {}
+        self._proxima = {}  # pk -> time.monotonic() de la próxima sincronización
+        self._en_curso = {}  # pk -> asyncio.Task
+        self._despertar = None  # asyncio.Event: algo cambió, replanificar
+
+    # --------------------------------------------
+    # Una sincronización
+    # --------------------------------------------
+
+    async def _solicitar(self, integracion):
+        # Petición con reintentos; devuelve el ResultadoSincronizacion final
+        for intento in range(self.intentos):
+            try:
+                respuesta = await asyncio.to_thread(solicitar_estado, integracion, self.pool)
+                return resultado_desde(respuesta=respuesta, intentos=intento + 1)
+            except ErrorTransitorio as error:
+                if intento == self.intentos - 1:
+                    return resultado_desde(error=error, intentos=intento + 1)
+                espera = espera_reintento(error, intento)
+                logger.info(
+                    'Reintento de sincronización',
+                    extra={'integracion': integracion.nombre_sistema, 'intento': intento + 1,
+                           'espera_s': round(espera, 2), 'error': str(error)}
+                )
+                await asyncio.sleep(espera)
+            except ErrorHttp as error:
+                return resultado_desde(error=error, intentos=intento + 1)
+
+    async def sincronizar(self, integracion):
+        async with self._semaforo:
+            resultado = await self._solicitar(integracion)
+        await sync_to_async(registrar_resultado)(integracion, resultado)
+        logger.info(
+            'Integración sincronizada',
+            extra={'integracion': integracion.nombre_sistema, 'estado': resultado.estado_log,
+                   'ms': resultado.tiempo_respuesta_ms}
+        )
+        return resultado
+
+    async def sincronizar_todas(self):
+        # Una pasada concurrente por todas las activas (--una-vez)
+        self._semaforo = asyncio.Semaphore(self.concurrencia)
+        integraciones = await sync_to_async(_cargar_activas)()
+        try:
+            return await asyncio.gather(*(self.sincronizar(i) for i in integraciones))
+        finally:
+            self.pool.cerrar()
+
+    # --------------------------------------------
+    # Planificación
+    # --------------------------------------------
+
+    def _primera_espera(self, integracion):
+        # Lo que falta para cumplir el intervalo desde la última sincronización
+        espera = 0.0
+        if integracion.ultima_sincronizacion:
+            transcurrido = (timezone.now() - integracion.ultima_sincronizacion).total_seconds()
+            espera = max(0.0, integracion.intervalo_sincronizacion - transcurrido)
+        return espera + random.uniform(0, self.jitter_inicial)
+
+    def _actualizar(self, integraciones):
+        ahora = time.monotonic()
+        activas = {integracion.pk: integracion for integracion in integraciones}
+        for pk in list(self._proxima):
+            if pk not in activas:
+                del self._proxima[pk]
+        for pk, integracion in activas.items():
+            if pk not in self._proxima:
+                self._proxima[pk] = ahora + self._primera_espera(integracion)
+        self._integraciones = activas
+
+    def _terminada(self, pk, tarea):
+        self._en_curso.pop(pk, None)
+        if not tarea.cancelled() and tarea.exception() is not None:
+            logger.error('Falla inesperada sincronizando', exc_info=tarea.exception(),
+                         extra={'integracion_id': str(pk)})
+        integracion = self._integraciones.get(pk)
+        if integracion is not None and pk in self._proxima:
+            self._proxima[pk] = time.monotonic() + integracion.intervalo_sincronizacion
+        self._despertar.set()
+
+    def _lanzar_pendientes(self):
+        ahora = time.monotonic()
+        for pk, cuando in self._proxima.items():
+            if cuando <= ahora and pk not in self._en_curso:
+                tarea = asyncio.create_task(self.sincronizar(self._integraciones[pk]))
+                tarea.add_done_callback(lambda t, pk=pk: self._terminada(pk, t))
+                self._en_curso[pk] = tarea
+
+    async def _avisar(self, detener):
+        await detener.wait()
+        self._despertar.set()
+
+    async def ejecutar(self, detener=None):
+        """
+        Bucle principal; termina cuando se activa `detener` (asyncio.Event),
+        esperando las sincronizaciones en curso.
+        """
+        detener = detener or asyncio.Event()
+        self._semaforo = asyncio.Semaphore(self.concurrencia)
+        self._despertar = asyncio.Event()
+        aviso_detener = asyncio.create_task(self._avisar(detener))
+        proxima_recarga = 0.0
+        try:
+            while not detener.is_set():
+                if time.monotonic() >= proxima_recarga:
+                    self._actualizar(await sync_to_async(_cargar_activas)())
+                    proxima_recarga = time.monotonic() + self.recarga
+
+                self._lanzar_pendientes()
+
+                esperando = [cuando for pk, cuando in self._proxima.items() if pk not in self._en_curso]
+                despertar = min(esperando + [proxima_recarga])
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=max(0.0, despertar - time.monotonic()) + 0.01)
+                except asyncio.TimeoutError:
+                    pass
+                self._despertar.clear()
+        finally:
+            aviso_detener.cancel()
+            if self._en_curso:
+                await asyncio.gather(*self._en_curso.values(), return_exceptions=True)
+            self.pool.cerrar()
@@ -2,8 +2,8 @@ import queue
 import json
 import time
 import random
-from datetime import datetime, timezone
-from locust import HttpUser, task, between, TaskSet
+from datetime import datetime, timedelta, timezone
+from locust import HttpUser, task, between, constant, events, TaskSet
 
 # ==========================================
 # ⚙️ CONFIGURACIÓN DE REALISMO
@@ -12,6 +12,40 @@ DURACION_MINIMA = 120   # 2 minutos reales
 DURACION_MAXIMA = 300   # 5 minutos reales
 # ==========================================
 
+# Ejecución headless con reporte de SLOs (falla con exit code 1 si hay regresión):
+#   locust -f locustfile.py --headless -u 80 -r 8 -t 10m --host http://127.0.0.1:8000 --csv reporte
+# Se pueden elegir roles puntuales: locust -f locustfile.py ... MedicoUser RecepcionUser
+
+# ==========================================
+# 🎯 SLOs POR ENDPOINT (milisegundos)
+# ==========================================
+# Los nombres coinciden con el "name" de cada request. Los endpoints sin SLO
+# declarado usan SLO_POR_DEFECTO.
+SLO_POR_DEFECTO = {'p95': 800, 'p99': 1500}
+SLOS = {
+    # Médico (polling cada 3s en Medicoconsultas.jsx)
+    'GET /api/medico/atenciones/cronometro/': {'p95': 50, 'p99': 120},
+    'GET /api/medico/atenciones/actual/': {'p95': 150, 'p99': 300},
+    'GET /api/medico/atenciones/hoy/': {'p95': 300, 'p99': 600},
+    'GET /api/boxes/sincronizar_estados/': {'p95': 400, 'p99': 800},
+    'Iniciar Consulta': {'p95': 300, 'p99': 600},
+    'Finalizar Consulta': {'p95': 400, 'p99': 800},
+    # Secretaría
+    'GET /api/pacientes/?q=[termino]': {'p95': 250, 'p99': 500},
+    'POST /api/atenciones/': {'p95': 500, 'p99': 1000},
+    'POST /api/rutas-clinicas/[id]/avanzar/': {'p95': 400, 'p99': 800},
+    # Recepción (EstadoBoxes.jsx)
+    'GET /api/boxes/': {'p95': 300, 'p99': 600},
+    'GET /api/atenciones/con_atraso_reportado/': {'p95': 300, 'p99': 600},
+    'POST /api/boxes/liberar_ocupaciones_manuales/': {'p95': 300, 'p99': 600},
+    # Administración (Dashboard.jsx / NexaThink.jsx)
+    'GET /api/dashboard/tiempo-real/': {'p95': 800, 'p99': 1500},
+    'GET /api/dashboard/nexathink-insights/': {'p95': 2000, 'p99': 4000},
+}
+# Tasa máxima de errores por endpoint y mínimo de requests para evaluar percentiles
+MAX_TASA_ERRORES = 0.01
+MIN_REQUESTS_SLO = 20
+
 TOKENS = {}
 try:
     with open('tokens.json', 'r') as f:
@@ -25,14 +59,32 @@ for user in TOKENS.keys():
     if user.startswith("medico_"):
         DOCTOR_QUEUE.put(user)
 
+# Secretarías y recepción comparten las cuentas de secretaría; si no hay, usan admin
+CUENTAS_SECRETARIA = [u for u in TOKENS if u.startswith("secretaria_")] or [u for u in TOKENS if u == 'admin']
+CUENTAS_ADMIN = [u for u in TOKENS if u == 'admin']
+
+
+def headers_de(username):
+    return {'Authorization': f'Token {TOKENS.get(username)}'}
+
+
+def _json_o_vacio(res):
+    # Cuerpo JSON de la respuesta, o {} si no lo es (páginas de error HTML, cuerpo vacío)
+    try:
+        return res.json()
+    except ValueError:
+        return {}
+
+
 class MedicoTasks(TaskSet):
     def on_start(self):
         self.username = None
         self.consultas_activas = {} # Memoria local del médico
+        self.etag = None
+        self.ultimo_cronometro = {}
         try:
             self.username = DOCTOR_QUEUE.get(block=False)
-            token = TOKENS.get(self.username)
-            self.headers = {'Authorization': f'Token {token}'}
+            self.headers = headers_de(self.username)
             print(f"✅ {self.username} conectado.")
         except queue.Empty:
             self.user.stop()
@@ -41,9 +93,26 @@ class MedicoTasks(TaskSet):
     def trabajar(self):
         if not self.username: return
 
-        with self.client.get("/api/medico/atenciones/actual/", headers=self.headers, catch_response=True) as res:
-            if not res.ok: return
-            data = res.json()
+        # Mismo ciclo que el polling de Medicoconsultas.jsx: sincronizar boxes, cronómetro (ETag) + hoy
+        self.client.get("/api/boxes/sincronizar_estados/", headers=self.headers,
+                        name="GET /api/boxes/sincronizar_estados/")
+        self.client.get("/api/medico/atenciones/hoy/", headers=self.headers,
+                        name="GET /api/medico/atenciones/hoy/")
+
+        cabeceras = dict(self.headers, **({'If-None-Match': self.etag} if self.etag else {}))
+        with self.client.get("/api/medico/atenciones/cronometro/", headers=cabeceras, catch_response=True,
+                             name="GET /api/medico/atenciones/cronometro/") as res:
+            if res.status_code == 304:
+                res.success()
+                data = self.ultimo_cronometro
+            elif res.ok:
+                self.etag = res.headers.get('ETag')
+                data = self.ultimo_cronometro = res.json()
+                # La atención completa solo se recarga cuando el cronómetro cambió
+                self.client.get("/api/medico/atenciones/actual/", headers=self.headers,
+                                name="GET /api/medico/atenciones/actual/")
+            else:
+                return
             tipo = data.get('tipo')
             atencion = data.get('atencion')
 
@@ -64,14 +133,14 @@ class MedicoTasks(TaskSet):
             elif tipo == 'en_curso' and atencion:
                 aid = atencion['id']
                 datos_locales = self.consultas_activas.get(aid)
-                
+
                 # Si no tenemos datos locales (ej. reinicio), asumimos que empezó hace poco
                 if not datos_locales:
                     self.consultas_activas[aid] = {'inicio': time.time(), 'meta': DURACION_MINIMA}
                     return
 
                 tiempo_real = time.time() - datos_locales['inicio']
-                
+
                 if tiempo_real >= datos_locales['meta']:
                     self.client.post(
                         f"/api/medico/atenciones/{aid}/finalizar/",
@@ -85,6 +154,220 @@ class MedicoTasks(TaskSet):
     def on_stop(self):
         if self.username: DOCTOR_QUEUE.put(self.username)
 
-class WebsiteUser(HttpUser):
+class MedicoUser(HttpUser):
+    # Medicoconsultas.jsx hace polling cada 3 segundos
+    weight = 10
     tasks = [MedicoTasks]
-    wait_time = between(5, 15)
\ No newline at end of file
+    wait_time = constant(3)
+
+
+class PollingUser(HttpUser):
+    """
+    Usuario que replica varios setInterval del frontend a la vez.
+    Cada subclase declara SONDEOS = [(intervalo_segundos, nombre_metodo), ...];
+    el usuario duerme hasta el próximo sondeo vencido y ejecuta todos los que toquen.
+    """
+    abstract = True
+    SONDEOS = []
+    cuentas = []
+
+    def on_start(self):
+        if not self.cuentas:
+            print(f"⚠️ Sin cuentas para {self.__class__.__name__}")
+            self.stop()
+            return
+        self.username = random.choice(self.cuentas)
+        self.headers = headers_de(self.username)
+        ahora = time.time()
+        # Al montar el componente se ejecutan todas las cargas iniciales
+        self.proximos = {metodo: ahora for _, metodo in self.SONDEOS}
+
+    def wait_time(self):
+        if not getattr(self, 'proximos', None):
+            return 1
+        return max(0, min(self.proximos.values()) - time.time())
+
+    @task
+    def sondear(self):
+        ahora = time.time()
+        for intervalo, metodo in self.SONDEOS:
+            if self.proximos[metodo] <= ahora:
+                getattr(self, metodo)()
+                self.proximos[metodo] = ahora + intervalo
+
+
+class RecepcionUser(PollingUser):
+    # Pantalla EstadoBoxes.jsx de recepción
+    weight = 2
+    SONDEOS = [
+        (15, 'cargar_datos'),
+        (30, 'sincronizar_estados'),
+        (60, 'liberar_ocupaciones_manuales'),
+    ]
+    cuentas = CUENTAS_SECRETARIA
+
+    def cargar_datos(self):
+        self.client.get("/api/boxes/", headers=self.headers, name="GET /api/boxes/")
+        self.client.get("/api/atenciones/con_atraso_reportado/", headers=self.headers,
+                        name="GET /api/atenciones/con_atraso_reportado/")
+
+    def sincronizar_estados(self):
+        self.client.get("/api/boxes/sincronizar_estados/", headers=self.headers,
+                        name="GET /api/boxes/sincronizar_estados/")
+
+    def liberar_ocupaciones_manuales(self):
+        self.client.post("/api/boxes/liberar_ocupaciones_manuales/", headers=self.headers,
+                         name="POST /api/boxes/liberar_ocupaciones_manuales/")
+
+
+class AdminUser(PollingUser):
+    # Dashboard.jsx (tiempo real + insights cada 10s) y NexaThink.jsx (cada 60s)
+    weight = 1
+    SONDEOS = [
+        (10, 'actualizar_dashboard'),
+        (60, 'cargar_nexathink'),
+    ]
+    cuentas = CUENTAS_ADMIN
+
+    def on_start(self):
+        super().on_start()
+        if getattr(self, 'headers', None):
+            self.client.get("/api/dashboard/metricas/", headers=self.headers,
+                            name="GET /api/dashboard/metricas/")
+
+    def actualizar_dashboard(self):
+        self.client.get("/api/dashboard/tiempo-real/", headers=self.headers,
+                        name="GET /api/dashboard/tiempo-real/")
+        self.client.get("/api/dashboard/nexathink-insights/", headers=self.headers,
+                        name="GET /api/dashboard/nexathink-insights/")
+
+    def cargar_nexathink(self):
+        self.client.get("/api/dashboard/nexathink-insights/", headers=self.headers,
+                        name="GET /api/dashboard/nexathink-insights/")
+
+
+class SecretariaUser(PollingUser):
+    # Home.jsx (cada 30s) y DetallePaciente.jsx (cada 30s) más acciones manuales
+    weight = 3
+    SONDEOS = [
+        (30, 'cargar_home'),
+        (30, 'cargar_detalle_paciente'),
+        (20, 'buscar_paciente'),
+        (45, 'crear_atencion'),
+        (60, 'avanzar_ruta'),
+    ]
+    cuentas = CUENTAS_SECRETARIA
+
+    def on_start(self):
+        super().on_start()
+        self.pacientes = []
+        self.boxes = []
+        self.medicos = []
+
+    def cargar_home(self):
+        res = self.client.get("/api/pacientes/", params={'activo': 'true'}, headers=self.headers,
+                              name="GET /api/pacientes/?activo=true")
+        if res.ok:
+            self.pacientes = res.json()
+        res = self.client.get("/api/boxes/", params={'activo': 'true'}, headers=self.headers,
+                              name="GET /api/boxes/")
+        if res.ok:
+            self.boxes = res.json()
+
+    def cargar_detalle_paciente(self):
+        if not self.pacientes:
+            return
+        paciente = random.choice(self.pacientes)
+        self.client.get(f"/api/pacientes/{paciente['id']}/", headers=self.headers,
+                        name="GET /api/pacientes/[id]/")
+        self.client.get(f"/api/pacientes/{paciente['id']}/rutas_clinicas/", headers=self.headers,
+                        name="GET /api/pacientes/[id]/rutas_clinicas/")
+
+    def buscar_paciente(self):
+        termino = random.choice(self.pacientes)['apellido_paterno'][:4] if self.pacientes else 'a'
+        self.client.get("/api/pacientes/", params={'q': termino}, headers=self.headers,
+                        name="GET /api/pacientes/?q=[termino]")
+
+    def crear_atencion(self):
+        if not self.medicos:
+            res = self.client.get("/api/atenciones/hoy/", headers=self.headers,
+                                  name="GET /api/atenciones/hoy/")
+            if res.ok:
+                self.medicos = list({a['medico'] for a in res.json().get('atenciones', []) if a.get('medico')})
+        if not (self.pacientes and self.boxes and self.medicos):
+            return
+
+        inicio = datetime.now(timezone.utc) + timedelta(minutes=random.randint(30, 8 * 60))
+        with self.client.post("/api/atenciones/", json={
+            'paciente': random.choice(self.pacientes)['id'],
+            'medico': random.choice(self.medicos),
+            'box': random.choice(self.boxes)['id'],
+            'fecha_hora_inicio': inicio.isoformat(),
+            'duracion_planificada': random.choice([15, 20, 30, 45]),
+            'tipo_atencion': 'CONSULTA_GENERAL',
+        }, headers=self.headers, catch_response=True, name="POST /api/atenciones/") as r:
+            # Médico, box y hora son al azar: un solape (400 con 'conflictos') es un
+            # resultado de negocio, no un error. Otros 400 siguen contando como falla.
+            if r.status_code == 400 and 'conflictos' in _json_o_vacio(r):
+                r.success()
+
+    def avanzar_ruta(self):
+        res = self.client.get("/api/rutas-clinicas/", params={'estado': 'EN_PROGRESO'}, headers=self.headers,
+                              name="GET /api/rutas-clinicas/?estado=EN_PROGRESO")
+        if not res.ok or not res.json():
+            return
+        ruta = random.choice(res.json())
+        with self.client.post(f"/api/rutas-clinicas/{ruta['id']}/avanzar/",
+                              json={'observaciones': 'Avance desde carga'},
+                              headers=self.headers, catch_response=True,
+                              name="POST /api/rutas-clinicas/[id]/avanzar/") as r:
+            # Una ruta en su última etapa responde 400: es un resultado de negocio, no un error
+            if r.status_code == 400:
+                r.success()
+
+
+# ==========================================
+# 📊 REPORTE DE SLOs
+# ==========================================
+
+def evaluar_slos(stats):
+    # Retorna (filas_reporte, violaciones) comparando p95/p99 y errores contra los SLOs
+    filas = []
+    violaciones = []
+    for (nombre, metodo), entrada in sorted(stats.entries.items()):
+        if entrada.num_requests == 0:
+            continue
+        slo = SLOS.get(nombre, SLO_POR_DEFECTO)
+        p95 = entrada.get_response_time_percentile(0.95)
+        p99 = entrada.get_response_time_percentile(0.99)
+        tasa_errores = entrada.num_failures / entrada.num_requests
+        estado = 'OK'
+        if entrada.num_requests >= MIN_REQUESTS_SLO:
+            if p95 > slo['p95'] or p99 > slo['p99']:
+                estado = 'LATENCIA'
+            if tasa_errores > MAX_TASA_ERRORES:
+                estado = 'ERRORES'
+        else:
+            estado = 'POCAS MUESTRAS'
+        if estado in ('LATENCIA', 'ERRORES'):
+            violaciones.append(nombre)
+        filas.append((nombre, entrada.num_requests, tasa_errores, p95, slo['p95'], p99, slo['p99'], estado))
+    return filas, violaciones
+
+
+@events.quitting.add_listener
+def reportar_slos(environment, **kwargs):
+    filas, violaciones = evaluar_slos(environment.stats)
+
+    print("\n============================================")
+    print("📊 REPORTE DE SLOs POR ENDPOINT")
+    print("============================================")
+    print(f"{'Endpoint':<50} {'Req':>7} {'Err%':>6} {'p95':>7} {'SLO':>6} {'p99':>7} {'SLO':>6}  Estado")
+    for nombre, num, tasa, p95, slo95, p99, slo99, estado in filas:
+        print(f"{nombre[:50]:<50} {num:>7} {tasa * 100:>5.1f}% {p95:>7.0f} {slo95:>6} {p99:>7.0f} {slo99:>6}  {estado}")
+
+    if violaciones:
+        print(f"\n❌ {len(violaciones)} endpoint(s) fuera de SLO: {', '.join(violaciones)}")
+        environment.process_exit_code = 1
+    else:
+        print("\n✅ Todos los endpoints dentro de SLO")
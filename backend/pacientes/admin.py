@@ -1,10 +1,13 @@
 from django.contrib import admin
+from django.db.models import Q
 from django.utils.html import format_html
-from .models import Paciente
+
+from config.autocompletar import BusquedaIndexadaMixin
+from .models import Paciente, SugerenciaFusion
 
 
 @admin.register(Paciente)
-class PacienteAdmin(admin.ModelAdmin):
+class PacienteAdmin(BusquedaIndexadaMixin, admin.ModelAdmin):
     list_display = [
         'rut_display',
         'nombre_completo_display',
@@ -39,6 +42,8 @@ class PacienteAdmin(admin.ModelAdmin):
         'telefono',
         'identificador_hash'
     ]
+    # Autocompletar de Atencion/RutaClinica (ver config/autocompletar.py)
+    campos_prefijo = ['rut', 'apellido_paterno', 'apellido_materno', 'nombre']
     
     readonly_fields = [
         'id',
@@ -134,6 +139,12 @@ class PacienteAdmin(admin.ModelAdmin):
         }),
     )
     
+    def busqueda_exacta(self, palabra):
+        # Un RUT completo, con o sin formato, se busca por su hash (índice único)
+        if Paciente.validar_rut(palabra):
+            return Q(identificador_hash=Paciente.generar_hash_rut(palabra))
+        return None
+    
     # ============================================
     # MÉTODOS DISPLAY
     # ============================================
@@ -377,4 +388,52 @@ class PacienteAdmin(admin.ModelAdmin):
             request,
             f'RUTs válidos: {validos} | RUTs inválidos: {invalidos}'
         )
-    validar_ruts.short_description = "Validar RUTs"
\ No newline at end of file
+    validar_ruts.short_description = "Validar RUTs"
+
+
+@admin.register(SugerenciaFusion)
+class SugerenciaFusionAdmin(admin.ModelAdmin):
+    # Pares de posibles duplicados de detectar_duplicados.py (ver pacientes/duplicados.py)
+    list_display = [
+        'paciente_a',
+        'paciente_b',
+        'puntaje_display',
+        'motivos_display',
+        'estado',
+        'revisado_por',
+        'creado_en',
+    ]
+    list_filter = ['estado', 'creado_en']
+    search_fields = [
+        'paciente_a__rut', 'paciente_a__apellido_paterno',
+        'paciente_b__rut', 'paciente_b__apellido_paterno',
+    ]
+    list_select_related = ['paciente_a', 'paciente_b', 'revisado_por']
+    raw_id_fields = ['paciente_a', 'paciente_b']
+    readonly_fields = ['puntaje', 'motivos', 'creado_en', 'revisado_por']
+    actions = ['confirmar_duplicados', 'descartar_sugerencias']
+    
+    def puntaje_display(self, obj):
+        """Puntaje con color según la certeza"""
+        color = 'red' if obj.puntaje >= 0.95 else 'orange'
+        return format_html(
+            '<span style="color: {}; font-weight: bold;">{}</span>',
+            color,
+            f'{obj.puntaje:.2f}'
+        )
+    puntaje_display.short_description = "Puntaje"
+    puntaje_display.admin_order_field = 'puntaje'
+    
+    def motivos_display(self, obj):
+        return ', '.join(obj.motivos)
+    motivos_display.short_description = "Motivos"
+    
+    def confirmar_duplicados(self, request, queryset):
+        updated = queryset.update(estado='CONFIRMADA', revisado_por=request.user)
+        self.message_user(request, f'{updated} sugerencias confirmadas como duplicados.')
+    confirmar_duplicados.short_description = "Confirmar duplicado"
+    
+    def descartar_sugerencias(self, request, queryset):
+        updated = queryset.update(estado='DESCARTADA', revisado_por=request.user)
+        self.message_user(request, f'{updated} sugerencias descartadas.')
+    descartar_sugerencias.short_description = "Descartar (personas distintas)"
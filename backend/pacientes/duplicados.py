@@ -0,0 +1,387 @@
+"""
+Detección de pacientes duplicados (RUT ausente o mal digitado en las
+importaciones desde sistemas externos).
+
+Comparar todos contra todos es O(n²). En su lugar cada paciente recibe
+claves de bloqueo (ClaveBloquePaciente, indexadas por tipo y clave):
+
+    APELLIDO_NACIMIENTO  apellido paterno fonético + fecha de nacimiento
+    NOMBRE_NACIMIENTO    primer nombre fonético + fecha de nacimiento
+    NOMBRE_APELLIDOS     primer nombre + ambos apellidos fonéticos
+    RUT_INICIO           primera mitad del RUT + inicial fonética del apellido
+    RUT_FINAL            segunda mitad del RUT + inicial fonética del apellido
+
+y solo se comparan los pacientes de un mismo bloque. Un RUT con un dígito
+mal digitado conserva una de sus mitades; un apellido mal escrito conserva
+el nombre y la fecha; una fecha mal digitada conserva el nombre completo. Los bloques de más de BLOQUE_MAXIMO pacientes no
+discriminan y se omiten.
+
+Los rasgos de cada paciente (trigramas del nombre, fecha, cuerpo del RUT) se
+calculan una vez por corrida y el puntaje de un par son operaciones de
+conjuntos, sin recorrer los textos. Los pares sobre el umbral
+('pacientes.umbral_duplicado' en ConfiguracionSistema, UMBRAL_DUPLICADO por
+defecto) quedan como SugerenciaFusion para revisión; una sugerencia
+descartada no vuelve a aparecer como pendiente.
+
+detectar_duplicados.py corre el proceso: por defecto solo reindexa los
+pacientes modificados desde la corrida anterior y compara los bloques que
+los contienen; --completo reconstruye el índice entero.
+"""
+import logging
+import re
+import unicodedata
+from collections import Counter, namedtuple
+from datetime import date
+from functools import lru_cache, reduce
+from itertools import groupby
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from config import configuracion
+
+from .models import ClaveBloquePaciente, Paciente, SugerenciaFusion
+
+logger = logging.getLogger(__name__)
+
+UMBRAL_DUPLICADO = 0.85
+BLOQUE_MAXIMO = 200  # pacientes; un bloque mayor no discrimina
+LOTE = 5000  # pacientes por transacción al indexar y por consulta de rasgos
+
+PESOS = {'nombre': 0.5, 'fecha': 0.25, 'rut': 0.25}
+
+CAMPOS = ['id', 'rut', 'nombre', 'apellido_paterno', 'apellido_materno', 'fecha_nacimiento']
+
+Rasgos = namedtuple('Rasgos', 'id trigramas fecha rut')
+
+
+# ============================================
+# NORMALIZACIÓN
+# ============================================
+
+_REGLAS_FONETICAS = [
+    (re.compile(r'CH'), 'X'),
+    (re.compile(r'LL'), 'Y'),
+    (re.compile(r'QU'), 'K'),
+    (re.compile(r'GU(?=[EI])'), 'G'),
+    (re.compile(r'C(?=[EI])'), 'S'),
+    (re.compile(r'G(?=[EI])'), 'J'),
+    (re.compile(r'C'), 'K'),
+    (re.compile(r'Z'), 'S'),
+    (re.compile(r'[VW]'), 'B'),
+    (re.compile(r'H'), ''),
+    (re.compile(r'Y(?=[^AEIOU]|$)'), 'I'),
+]
+
+
+def normalizar(texto):
+    # Mayúsculas sin tildes ni signos, palabras separadas por un espacio
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).upper()
+    return ' '.join(re.sub(r'[^A-Z ]', ' ', texto).split())
+
+
+# Nombres y apellidos se repiten mucho: cada palabra se fonetiza una vez por proceso
+@lru_cache(maxsize=100_000)
+def fonetizar(palabra):
+    # Unifica las grafías que suenan igual en español (Z/S, V/B, CE/SE, H muda...)
+    for patron, reemplazo in _REGLAS_FONETICAS:
+        palabra = patron.sub(reemplazo, palabra)
+    return palabra
+
+
+@lru_cache(maxsize=100_000)
+def clave_fonetica(texto, largo=6):
+    # Código fonético para el español: GONZÁLEZ, GONZALES y GONSALEZ → GNSLS
+    palabra = fonetizar(normalizar(texto).split(' ')[0])
+    if not palabra:
+        return ''
+    esqueleto = palabra[0] + re.sub(r'[AEIOU]', '', palabra[1:])
+    return re.sub(r'(.)\1+', r'\1', esqueleto)[:largo]
+
+
+def cuerpo_rut(rut):
+    # Dígitos del RUT sin dígito verificador ('' si no hay)
+    rut = (rut or '').upper().replace('.', '').replace(' ', '')
+    if not rut:
+        return ''
+    cuerpo = rut.split('-')[0] if '-' in rut else rut[:-1]
+    return re.sub(r'\D', '', cuerpo)
+
+
+def _como_fecha(valor):
+    if not valor or isinstance(valor, date):
+        return valor or None
+    try:
+        return date.fromisoformat(str(valor)[:10])
+    except ValueError:
+        return None
+
+
+def claves_bloque(rut, nombre, apellido_paterno, apellido_materno, fecha_nacimiento):
+    # [(tipo, clave)] de un paciente; se omiten las que no tienen sus datos
+    claves = []
+    fecha = _como_fecha(fecha_nacimiento)
+    apellido = clave_fonetica(apellido_paterno)
+    primer_nombre = clave_fonetica(nombre)
+    if fecha and apellido:
+        claves.append(('APELLIDO_NACIMIENTO', f'{apellido}|{fecha.isoformat()}'))
+    if fecha and primer_nombre:
+        claves.append(('NOMBRE_NACIMIENTO', f'{primer_nombre}|{fecha.isoformat()}'))
+    if primer_nombre and apellido:
+        claves.append(('NOMBRE_APELLIDOS', f'{primer_nombre}|{apellido}|{clave_fonetica(apellido_materno)}'))
+    cuerpo = cuerpo_rut(rut)
+    if len(cuerpo) >= 6:
+        mitad = len(cuerpo) // 2
+        inicial = apellido[:1]
+        claves.append(('RUT_INICIO', f'{len(cuerpo)}|{cuerpo[:mitad]}|{inicial}'))
+        claves.append(('RUT_FINAL', f'{len(cuerpo)}|{cuerpo[mitad:]}|{inicial}'))
+    return claves
+
+
+def rasgos(pk, rut, nombre, apellido_paterno, apellido_materno, fecha_nacimiento):
+    # Todo lo que usa puntuar(), calculado una vez por paciente
+    # Palabras fonetizadas y ordenadas: GONZÁLEZ/GONZALES y el orden de los nombres no restan
+    nombre_completo = normalizar(f'{nombre or ""} {apellido_paterno or ""} {apellido_materno or ""}')
+    palabras = sorted(fonetizar(palabra) for palabra in nombre_completo.split())
+    texto = f" {' '.join(palabras)} "
+    trigramas = frozenset(texto[i:i + 3] for i in range(len(texto) - 2))
+    return Rasgos(pk, trigramas, _como_fecha(fecha_nacimiento), cuerpo_rut(rut))
+
+
+# ============================================
+# PUNTAJE
+# ============================================
+
+def _similitud_fecha(a, b):
+    if a == b:
+        return 1.0
+    # Día y mes invertidos, o un solo componente distinto (error de digitación)
+    if (a.year, a.month, a.day) == (b.year, b.day, b.month):
+        return 0.6
+    iguales = (a.year == b.year) + (a.month == b.month) + (a.day == b.day)
+    return 0.6 if iguales == 2 else 0.0
+
+
+def _similitud_rut(a, b):
+    if a == b:
+        return 1.0
+    if len(a) == len(b):
+        distintos = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(distintos) == 1:
+            return 0.8
+        # Dos dígitos vecinos intercambiados
+        if len(distintos) == 2 and distintos[1] == distintos[0] + 1 \
+                and a[distintos[0]] == b[distintos[1]] and a[distintos[1]] == b[distintos[0]]:
+            return 0.8
+    return 0.0
+
+
+def puntuar(a, b):
+    # (puntaje entre 0 y 1, motivos) de dos Rasgos. Los datos que falten en
+    # alguno de los dos no cuentan a favor ni en contra.
+    if not a.trigramas or not b.trigramas:
+        return 0.0, []
+    comunes = len(a.trigramas & b.trigramas)
+    nombre = comunes / (len(a.trigramas) + len(b.trigramas) - comunes)
+    total, pesos = PESOS['nombre'] * nombre, PESOS['nombre']
+    motivos = [f'nombre {nombre:.2f}']
+    if a.fecha and b.fecha:
+        fecha = _similitud_fecha(a.fecha, b.fecha)
+        total += PESOS['fecha'] * fecha
+        pesos += PESOS['fecha']
+        if fecha == 1.0:
+            motivos.append('misma fecha de nacimiento')
+        elif fecha:
+            motivos.append('fecha de nacimiento con un error de digitación')
+    if a.rut and b.rut:
+        rut = _similitud_rut(a.rut, b.rut)
+        total += PESOS['rut'] * rut
+        pesos += PESOS['rut']
+        if rut == 1.0:
+            motivos.append('mismo RUT')
+        elif rut:
+            motivos.append('RUT con un dígito distinto')
+    return total / pesos, motivos
+
+
+def umbral():
+    return configuracion.flotante('pacientes.umbral_duplicado', UMBRAL_DUPLICADO)
+
+
+def _par(a, b):
+    # Orden canónico del par para la restricción única de SugerenciaFusion
+    return (a, b) if str(a) < str(b) else (b, a)
+
+
+def puntuar_bloque(miembros, minimo):
+    # {(id_a, id_b): (puntaje, motivos)} de los pares del bloque sobre `minimo`
+    pares = {}
+    for i, a in enumerate(miembros):
+        largo_a = len(a.trigramas)
+        for b in miembros[i + 1:]:
+            # Cota de Jaccard por tamaños: si ni con el nombre idéntico llega, no se calcula
+            largo_b = len(b.trigramas)
+            if largo_a and largo_b and min(largo_a, largo_b) / max(largo_a, largo_b) * PESOS['nombre'] \
+                    + (1 - PESOS['nombre']) < minimo:
+                continue
+            puntaje, motivos = puntuar(a, b)
+            if puntaje >= minimo:
+                pares[_par(a.id, b.id)] = (round(puntaje, 4), motivos)
+    return pares
+
+
+# ============================================
+# ÍNDICE DE CLAVES
+# ============================================
+
+def indexar(pacientes, generado_en):
+    # Recalcula las claves de `pacientes` (queryset) por lotes; retorna los ids indexados
+    indexados = []
+    lote = []
+    for fila in pacientes.values_list(*CAMPOS).iterator(chunk_size=LOTE):
+        lote.append(fila)
+        if len(lote) >= LOTE:
+            indexados += _indexar_lote(lote, generado_en)
+            lote = []
+    if lote:
+        indexados += _indexar_lote(lote, generado_en)
+    return indexados
+
+
+def _indexar_lote(filas, generado_en):
+    ids = [fila[0] for fila in filas]
+    claves = [
+        ClaveBloquePaciente(paciente_id=pk, tipo=tipo, clave=clave, generado_en=generado_en)
+        for pk, *datos in filas
+        for tipo, clave in claves_bloque(*datos)
+    ]
+    with transaction.atomic():
+        ClaveBloquePaciente.objects.filter(paciente_id__in=ids).delete()
+        ClaveBloquePaciente.objects.bulk_create(claves, batch_size=LOTE)
+    return ids
+
+
+# ============================================
+# DETECCIÓN
+# ============================================
+
+def _bloques(claves):
+    # Itera las claves (queryset) como listas de ids de paciente por bloque
+    filas = claves.order_by('tipo', 'clave').values_list('tipo', 'clave', 'paciente_id')
+    for _, grupo in groupby(filas.iterator(chunk_size=LOTE), key=lambda fila: fila[:2]):
+        yield [fila[2] for fila in grupo]
+
+
+def _bloques_de(ids):
+    # Bloques que contienen alguno de `ids` (modo incremental), cada uno una vez
+    tipos = {}
+    for inicio in range(0, len(ids), LOTE):
+        for tipo, clave in ClaveBloquePaciente.objects.filter(
+            paciente_id__in=ids[inicio:inicio + LOTE]
+        ).values_list('tipo', 'clave'):
+            tipos.setdefault(tipo, set()).add(clave)
+    for tipo, claves in tipos.items():
+        claves = sorted(claves)
+        for desde in range(0, len(claves), 500):
+            yield from _bloques(ClaveBloquePaciente.objects.filter(tipo=tipo, clave__in=claves[desde:desde + 500]))
+
+
+def _puntuar_bloques(bloques, pendientes, minimo, metricas):
+    # Carga los rasgos de todos los pacientes de `bloques` en una consulta y los compara
+    ids = {pk for bloque in bloques for pk in bloque}
+    por_id = {
+        fila[0]: rasgos(*fila)
+        for fila in Paciente.objects.filter(id__in=ids).values_list(*CAMPOS)
+    }
+    for bloque in bloques:
+        miembros = [por_id[pk] for pk in bloque if pk in por_id]
+        metricas['comparaciones'] += len(miembros) * (len(miembros) - 1) // 2
+        for par, resultado in puntuar_bloque(miembros, minimo).items():
+            if resultado[0] > pendientes.get(par, (0,))[0]:
+                pendientes[par] = resultado
+
+
+def _guardar_sugerencias(pendientes):
+    # Los pares ya revisados conservan su estado; solo se refrescan puntaje y motivos
+    SugerenciaFusion.objects.bulk_create(
+        [
+            SugerenciaFusion(paciente_a_id=a, paciente_b_id=b, puntaje=puntaje, motivos=motivos)
+            for (a, b), (puntaje, motivos) in pendientes.items()
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['paciente_a', 'paciente_b'],
+        update_fields=['puntaje', 'motivos'],
+    )
+
+
+def detectar_duplicados(completo=False):
+    """
+    Reindexa y compara los bloques. Sin `completo` solo trata los pacientes
+    modificados desde la corrida anterior (la primera vez, todos). Retorna
+    las métricas de la corrida.
+    """
+    inicio = timezone.now()
+    metricas = Counter()
+    ultima = None if completo else ClaveBloquePaciente.objects.aggregate(ultima=Max('generado_en'))['ultima']
+    if ultima is None:
+        ClaveBloquePaciente.objects.all().delete()
+        ids = indexar(Paciente.objects.all(), inicio)
+        bloques = _bloques(ClaveBloquePaciente.objects.all())
+    else:
+        ids = indexar(Paciente.objects.filter(fecha_actualizacion__gte=ultima), inicio)
+        bloques = _bloques_de(ids)
+    metricas['indexados'] = len(ids)
+
+    minimo = umbral()
+    pendientes = {}
+    tanda, en_tanda = [], 0
+    for bloque in bloques:
+        if len(bloque) < 2:
+            continue
+        if len(bloque) > BLOQUE_MAXIMO:
+            metricas['bloques_omitidos'] += 1
+            continue
+        metricas['bloques'] += 1
+        tanda.append(bloque)
+        en_tanda += len(bloque)
+        if en_tanda >= LOTE:
+            _puntuar_bloques(tanda, pendientes, minimo, metricas)
+            tanda, en_tanda = [], 0
+    if tanda:
+        _puntuar_bloques(tanda, pendientes, minimo, metricas)
+
+    _guardar_sugerencias(pendientes)
+    metricas['sugerencias'] = len(pendientes)
+    logger.info('Detección de duplicados terminada', extra=dict(metricas))
+    return dict(metricas)
+
+
+def candidatos(datos, limite=10):
+    """
+    Pacientes existentes que probablemente son el de `datos` (dict con rut,
+    nombre, apellido_paterno, apellido_materno y fecha_nacimiento, p. ej. lo
+    que retorna IntegracionExterna.obtener_datos_paciente), para revisar antes
+    de crear uno nuevo. Usa el índice de claves de la última corrida.
+    """
+    claves = claves_bloque(*(datos.get(campo) for campo in CAMPOS[1:]))
+    coincidencias = Q(pk__in=[])
+    if claves:
+        filtro = reduce(or_, (Q(tipo=tipo, clave=clave) for tipo, clave in claves))
+        coincidencias |= Q(id__in=ClaveBloquePaciente.objects.filter(filtro).values('paciente_id'))
+    rut = datos.get('rut')
+    if rut and Paciente.validar_rut(rut):
+        # Con o sin formato: se busca por el hash (índice único), como PacienteAdmin.busqueda_exacta
+        coincidencias |= Q(identificador_hash=Paciente.generar_hash_rut(rut))
+    entrante = rasgos(None, *(datos.get(campo) for campo in CAMPOS[1:]))
+    minimo = umbral()
+    resultado = []
+    for paciente in Paciente.objects.filter(coincidencias)[:BLOQUE_MAXIMO * 4]:
+        puntaje, motivos = puntuar(entrante, rasgos(*(getattr(paciente, campo) for campo in CAMPOS)))
+        if puntaje >= minimo:
+            resultado.append({'paciente': paciente, 'puntaje': round(puntaje, 4), 'motivos': motivos})
+    resultado.sort(key=lambda candidato: -candidato['puntaje'])
+    return resultado[:limite]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveBloquePaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('APELLIDO_NACIMIENTO', 'Apellido fonético + fecha de nacimiento'), ('NOMBRE_NACIMIENTO', 'Nombre fonético + fecha de nacimiento'), ('NOMBRE_APELLIDOS', 'Nombre + apellidos fonéticos'), ('RUT_INICIO', 'Primera mitad del RUT + inicial fonética'), ('RUT_FINAL', 'Segunda mitad del RUT + inicial fonética')], max_length=20)),
+                ('clave', models.CharField(max_length=64)),
+                ('generado_en', models.DateTimeField()),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claves_bloque', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Clave de Bloqueo',
+                'verbose_name_plural': 'Claves de Bloqueo',
+                'db_table': 'pacientes_claves_bloque',
+                'indexes': [models.Index(fields=['tipo', 'clave'], name='clave_bloque_idx'), models.Index(fields=['generado_en'], name='clave_bloque_generado_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SugerenciaFusion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('puntaje', models.FloatField(help_text='Similitud entre 0 y 1')),
+                ('motivos', models.JSONField(blank=True, default=list)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente de revisión'), ('CONFIRMADA', 'Duplicado confirmado'), ('DESCARTADA', 'Descartada (personas distintas)')], default='PENDIENTE', max_length=12)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('paciente_a', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pacientes.paciente')),
+                ('paciente_b', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pacientes.paciente')),
+                ('revisado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Sugerencia de Fusión',
+                'verbose_name_plural': 'Sugerencias de Fusión',
+                'db_table': 'pacientes_sugerencias_fusion',
+                'ordering': ['-puntaje'],
+                'indexes': [models.Index(fields=['estado', '-puntaje'], name='sugerencia_fusion_estado_idx')],
+                'constraints': [models.UniqueConstraint(fields=('paciente_a', 'paciente_b'), name='sugerencia_fusion_par_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-19 07:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0002_duplicados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['apellido_materno'], name='pacientes_apellid_493e05_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['nombre'], name='pacientes_nombre_bedd9a_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+# Reemplaza los índices varchar_pattern_ops creados con SQL en 0004_indices_patron
+# por los declarados en Meta.indexes, que sí conoce el estado de migraciones
+INDICES_SQL = {
+    'pacientes_apellido_paterno_like': 'apellido_paterno',
+    'pacientes_apellido_materno_like': 'apellido_materno',
+    'pacientes_nombre_like': 'nombre',
+}
+
+
+def eliminar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in INDICES_SQL:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+def restaurar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columna in INDICES_SQL.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON pacientes ({columna} varchar_pattern_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0004_indices_patron'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_indices_sql, restaurar_indices_sql),
+        migrations.RemoveIndex(
+            model_name='paciente',
+            name='pacientes_apellid_12f11c_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paciente',
+            name='pacientes_apellid_493e05_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paciente',
+            name='pacientes_nombre_bedd9a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['apellido_paterno', 'apellido_materno'], name='pacientes_apellidos_patron_idx', opclasses=['varchar_pattern_ops', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['apellido_materno'], name='pacientes_materno_patron_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['nombre'], name='pacientes_nombre_patron_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
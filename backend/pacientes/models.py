@@ -1,3 +1,4 @@
+import logging
 import uuid
 import re
 import hashlib
@@ -7,6 +8,8 @@ from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator, EmailValidator
 from datetime import date
 
+logger = logging.getLogger(__name__)
+
 
 class Paciente(models.Model):
     # Modelo completo para gestionar pacientes en el sistema Nexalud.
@@ -371,7 +374,15 @@ class Paciente(models.Model):
             models.Index(fields=['etapa_actual']), 
             models.Index(fields=['fecha_ingreso']),
             models.Index(fields=['nivel_urgencia']),
-            models.Index(fields=['apellido_paterno', 'apellido_materno']),
+            # Autocompletar del admin por prefijo (ver config/autocompletar.py).
+            # varchar_pattern_ops sirve LIKE 'Pér%' en PostgreSQL con cualquier
+            # collation; las demás bases ignoran opclasses
+            models.Index(
+                fields=['apellido_paterno', 'apellido_materno'], name='pacientes_apellidos_patron_idx',
+                opclasses=['varchar_pattern_ops', 'varchar_pattern_ops'],
+            ),
+            models.Index(fields=['apellido_materno'], name='pacientes_materno_patron_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['nombre'], name='pacientes_nombre_patron_idx', opclasses=['varchar_pattern_ops']),
         ]
     
     def __str__(self):
@@ -504,7 +515,7 @@ class Paciente(models.Model):
         try:
             super().save(*args, **kwargs)
         except Exception as e:
-            print(f"Error al guardar paciente: {e}")
+            logger.exception('Error al guardar paciente %s', self.id)
             raise
     
     # ============================================
@@ -706,4 +717,69 @@ class Paciente(models.Model):
     
     def obtener_nombre_display(self):
         """Método para compatibilidad con código anterior"""
-        return self.nombre_completo
\ No newline at end of file
+        return self.nombre_completo
+
+class ClaveBloquePaciente(models.Model):
+    # Claves de bloqueo para la detección de duplicados (ver pacientes/duplicados.py).
+    # Solo se comparan entre sí los pacientes que comparten alguna clave.
+    
+    TIPO_CHOICES = [
+        ('APELLIDO_NACIMIENTO', 'Apellido fonético + fecha de nacimiento'),
+        ('NOMBRE_NACIMIENTO', 'Nombre fonético + fecha de nacimiento'),
+        ('NOMBRE_APELLIDOS', 'Nombre + apellidos fonéticos'),
+        ('RUT_INICIO', 'Primera mitad del RUT + inicial fonética'),
+        ('RUT_FINAL', 'Segunda mitad del RUT + inicial fonética'),
+    ]
+    
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='claves_bloque')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    clave = models.CharField(max_length=64)
+    generado_en = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'pacientes_claves_bloque'
+        verbose_name = 'Clave de Bloqueo'
+        verbose_name_plural = 'Claves de Bloqueo'
+        indexes = [
+            models.Index(fields=['tipo', 'clave'], name='clave_bloque_idx'),
+            models.Index(fields=['generado_en'], name='clave_bloque_generado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.tipo}: {self.clave}"
+
+
+class SugerenciaFusion(models.Model):
+    # Par de pacientes que probablemente son la misma persona. paciente_a es
+    # siempre el de menor id para que cada par exista una sola vez.
+    
+    ESTADO_CHOICES = [
+        ('PENDIENTE', 'Pendiente de revisión'),
+        ('CONFIRMADA', 'Duplicado confirmado'),
+        ('DESCARTADA', 'Descartada (personas distintas)'),
+    ]
+    
+    paciente_a = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='+')
+    paciente_b = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='+')
+    puntaje = models.FloatField(help_text="Similitud entre 0 y 1")
+    motivos = models.JSONField(default=list, blank=True)
+    estado = models.CharField(max_length=12, choices=ESTADO_CHOICES, default='PENDIENTE')
+    creado_en = models.DateTimeField(auto_now_add=True)
+    revisado_por = models.ForeignKey(
+        'users.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    
+    class Meta:
+        db_table = 'pacientes_sugerencias_fusion'
+        verbose_name = 'Sugerencia de Fusión'
+        verbose_name_plural = 'Sugerencias de Fusión'
+        ordering = ['-puntaje']
+        constraints = [
+            models.UniqueConstraint(fields=['paciente_a', 'paciente_b'], name='sugerencia_fusion_par_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', '-puntaje'], name='sugerencia_fusion_estado_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.paciente_a_id} ~ {self.paciente_b_id} ({self.puntaje:.2f})"
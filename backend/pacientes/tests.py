@@ -1,2 +1,228 @@
-from django.test import TestCase
+from datetime import date
 
+from django.contrib import admin
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, TestCase
+from django.urls import resolve
+
+from config.autocompletar import filtro_prefijo
+from config.planes_consulta import PlanesConsultaMixin
+from config.presupuesto_consultas import PresupuestoAdminMixin, PresupuestoConsultasMixin, peticion, rut_sintetico
+from .duplicados import candidatos, clave_fonetica, detectar_duplicados
+from .models import ClaveBloquePaciente, Paciente, SugerenciaFusion
+from users.models import User
+from .viewsets import PacienteViewSet
+
+
+def _datos_paciente(escenario):
+    return {
+        'rut': rut_sintetico(999_999),
+        'nombre': 'Nuevo',
+        'apellido_paterno': 'Paciente',
+        'fecha_nacimiento': '1990-03-15',
+        'genero': 'F',
+        'telefono': '+56987654321',
+        'direccion_region': 'RM',
+    }
+
+
+class PacienteViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/pacientes/
+    viewset = PacienteViewSet
+    basename = 'paciente'
+    objetivo_por_defecto = 'paciente'
+    presupuestos = {
+        ('list', 'get'): peticion(1),
+        ('create', 'post'): peticion(3, datos=_datos_paciente),
+        ('retrieve', 'get'): peticion(1),
+        ('update', 'put'): peticion(3, datos=_datos_paciente),
+        ('partial_update', 'patch'): peticion(2, datos=lambda e: {'nombre': 'Editado'}),
+        ('destroy', 'delete'): peticion(None),
+        ('activos', 'get'): peticion(1),
+        ('en_espera', 'get'): peticion(1),
+        ('con_alergias', 'get'): peticion(2),
+        ('por_tipo_sangre', 'get'): peticion(36),
+        ('por_seguro', 'get'): peticion(52),
+        ('por_region', 'get'): peticion(64),
+        ('estadisticas_completas', 'get'): peticion(58),
+        ('validar_rut', 'post'): peticion(1, datos=lambda e: {'rut': e.paciente.rut}),
+        ('buscar_por_rut', 'post'): peticion(1, datos=lambda e: {'rut': e.paciente.rut}),
+        ('posibles_duplicados', 'post'): peticion(1, datos=lambda e: {
+            'rut': e.paciente.rut, 'nombre': 'Paciente', 'apellido_paterno': 'Foco', 'fecha_nacimiento': '1985-05-20'
+        }),
+        ('duplicados', 'get'): peticion(2),
+        ('cambiar_estado', 'post'): peticion(2, datos=lambda e: {'estado_actual': 'ACTIVO'}),
+        ('datos_medicos', 'get'): peticion(1),
+        ('datos_contacto', 'get'): peticion(1),
+        ('seguro_medico', 'get'): peticion(1),
+        ('calcular_imc', 'get'): peticion(1),
+        ('rutas_clinicas', 'get'): peticion(2),
+        ('atenciones', 'get'): peticion(2),
+    }
+
+
+class DeteccionDuplicadosTests(TestCase):
+
+    def _paciente(self, rut, nombre, apellido_paterno, apellido_materno, fecha_nacimiento):
+        return Paciente.objects.create(
+            rut=rut, nombre=nombre, apellido_paterno=apellido_paterno,
+            apellido_materno=apellido_materno, fecha_nacimiento=fecha_nacimiento,
+        )
+
+    def test_clave_fonetica_agrupa_variantes(self):
+        self.assertEqual(clave_fonetica('González'), clave_fonetica('Gonzales'))
+        self.assertEqual(clave_fonetica('Jiménez'), clave_fonetica('Gimenez'))
+        self.assertEqual(clave_fonetica('Valenzuela'), clave_fonetica('Balensuela'))
+        self.assertNotEqual(clave_fonetica('Soto'), clave_fonetica('Silva'))
+
+    def test_sugiere_duplicados_por_bloque_e_incremental(self):
+        original = self._paciente('12.345.678-5', 'Juan Pablo', 'González', 'Soto', date(1990, 5, 1))
+        # RUT con un dígito mal digitado y apellido escrito distinto
+        copia = self._paciente('12.345.679-3', 'Juan Pablo', 'Gonzales', 'Soto', date(1990, 5, 1))
+        # Mismo apellido y fecha, otra persona
+        self._paciente('9.876.543-3', 'María José', 'González', 'Rojas', date(1990, 5, 1))
+        self._paciente('15.555.555-5', 'Pedro', 'Muñoz', 'Díaz', date(1975, 1, 20))
+
+        resultado = detectar_duplicados()
+        self.assertEqual(resultado['indexados'], 4)
+        self.assertEqual(resultado['sugerencias'], 1)
+        sugerencia = SugerenciaFusion.objects.get()
+        self.assertEqual({sugerencia.paciente_a_id, sugerencia.paciente_b_id}, {original.id, copia.id})
+        self.assertIn('RUT con un dígito distinto', sugerencia.motivos)
+
+        # Una sugerencia descartada no vuelve a quedar pendiente
+        SugerenciaFusion.objects.update(estado='DESCARTADA')
+
+        # La siguiente corrida solo indexa lo nuevo y compara sus bloques
+        importado = self._paciente('', 'PEDRO', 'MUNOZ', 'DIAZ', date(1975, 1, 20))
+        resultado = detectar_duplicados()
+        self.assertEqual(resultado['indexados'], 1)
+        self.assertEqual(resultado['sugerencias'], 1)
+        self.assertEqual(
+            list(SugerenciaFusion.objects.order_by('estado').values_list('estado', flat=True)),
+            ['DESCARTADA', 'PENDIENTE'],
+        )
+        self.assertTrue(ClaveBloquePaciente.objects.filter(paciente=importado).exists())
+
+        resultado = detectar_duplicados(completo=True)
+        self.assertEqual((resultado['indexados'], resultado['sugerencias']), (5, 2))
+        self.assertEqual(SugerenciaFusion.objects.filter(estado='DESCARTADA').count(), 1)
+
+    def test_candidatos_para_datos_importados(self):
+        existente = self._paciente('21.376.932-4', 'Ana', 'Pérez', 'Lagos', date(1988, 11, 3))
+        self._paciente('8.765.432-1', 'Ana', 'Pérez', 'Lagos', date(1960, 2, 14))
+        detectar_duplicados()
+
+        # Sin RUT, sin tildes y con día y mes invertidos
+        encontrados = candidatos({
+            'nombre': 'ana', 'apellido_paterno': 'PEREZ', 'apellido_materno': 'lagos',
+            'fecha_nacimiento': '1988-03-11',
+        })
+        self.assertEqual([c['paciente'] for c in encontrados], [existente])
+        self.assertEqual(candidatos({'nombre': 'Luis', 'apellido_paterno': 'Tapia', 'fecha_nacimiento': '1988-11-03'}), [])
+
+        # RUT sin puntos, como llega de una importación, y apellidos en otro orden:
+        # ninguna clave de bloque calza, solo el RUT exacto lo encuentra
+        encontrados = candidatos({
+            'rut': '21376932-4', 'nombre': 'Ana', 'apellido_paterno': 'Lagos', 'apellido_materno': 'Pérez',
+        })
+        self.assertEqual([c['paciente'] for c in encontrados], [existente])
+        self.assertIn('mismo RUT', encontrados[0]['motivos'])
+
+
+class PacientesAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # Changelists del admin de pacientes
+    app_label = 'pacientes'
+    presupuestos_admin = {
+        Paciente: 5,
+        SugerenciaFusion: 5,
+    }
+
+    def poblar(self, escenario):
+        pacientes = list(Paciente.objects.order_by('rut'))
+        SugerenciaFusion.objects.bulk_create([
+            SugerenciaFusion(paciente_a=a, paciente_b=b, puntaje=0.9, motivos=['nombre'])
+            for a, b in zip(pacientes[::2], pacientes[1::2])
+        ], ignore_conflicts=True)
+
+
+class AutocompletarPacientesTests(PlanesConsultaMixin, TestCase):
+    # Búsqueda del autocompletar de Atencion/RutaClinica (config/autocompletar.py)
+
+    def setUp(self):
+        self.perez = Paciente.objects.create(
+            rut='21.376.932-4', nombre='Ana', apellido_paterno='Pérez', apellido_materno='Lagos',
+            fecha_nacimiento=date(1988, 11, 3),
+        )
+        self.soto = Paciente.objects.create(
+            rut='12.345.678-5', nombre='Juan', apellido_paterno='Soto', apellido_materno='Pérez',
+            fecha_nacimiento=date(1990, 5, 1),
+        )
+        self.admin = User.objects.create_superuser('admin_auto', 'admin_auto@nexalud.admin.com', 'clave-auto')
+        self.medico = User.objects.create_user(
+            'dr_lagos', 'dr_lagos@nexalud.medico.com', 'clave-auto', last_name='Lagos',
+            rol='MEDICO', especialidad='MEDICINA_GENERAL'
+        )
+        self.client.force_login(self.admin)
+
+    def _buscar(self, termino, campo='paciente'):
+        respuesta = self.client.get('/admin/autocomplete/', {
+            'term': termino, 'app_label': 'atenciones', 'model_name': 'atencion', 'field_name': campo,
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        return {resultado['id'] for resultado in respuesta.json()['results']}
+
+    def test_busca_por_prefijo_y_rut_completo(self):
+        self.assertEqual(self._buscar('pér'), {str(self.perez.pk), str(self.soto.pk)})
+        self.assertEqual(self._buscar('pérez ana'), {str(self.perez.pk)})
+        self.assertEqual(self._buscar('SOTO'), {str(self.soto.pk)})
+        # Solo prefijos: el contenido intermedio no se busca
+        self.assertEqual(self._buscar('érez'), set())
+        # RUT completo con o sin formato
+        self.assertEqual(self._buscar('123456785'), {str(self.soto.pk)})
+        self.assertEqual(self._buscar('21.376'), {str(self.perez.pk)})
+
+    def test_apellidos_terminados_en_z(self):
+        # El último carácter del prefijo es el que se incrementa en el rango de
+        # SQLite; en PostgreSQL ese rango falla con collations lingüísticas
+        gonzalez = Paciente.objects.create(
+            rut=rut_sintetico(3), nombre='Luz', apellido_paterno='González', apellido_materno='Díaz',
+            fecha_nacimiento=date(1975, 2, 14),
+        )
+        self.assertEqual(self._buscar('pérez'), {str(self.perez.pk), str(self.soto.pk)})
+        self.assertEqual(self._buscar('GONZÁLEZ'), {str(gonzalez.pk)})
+        self.assertEqual(self._buscar('gonzález díaz luz'), {str(gonzalez.pk)})
+        self.assertEqual(self._buscar('díaz'), {str(gonzalez.pk)})
+
+    def test_filtro_prefijo_segun_la_base(self):
+        self.assertEqual(
+            filtro_prefijo('apellido_paterno', 'Pérez', 'postgresql'), Q(apellido_paterno__startswith='Pérez')
+        )
+        self.assertEqual(
+            filtro_prefijo('apellido_paterno', 'Pérez', 'sqlite'),
+            Q(apellido_paterno__gte='Pérez', apellido_paterno__lt='Pére{')
+        )
+
+    def test_medico_solo_usuarios_medicos(self):
+        self.assertEqual(self._buscar('', campo='medico'), {str(self.medico.pk)})
+        self.assertEqual(self._buscar('lag', campo='medico'), {str(self.medico.pk)})
+
+    def test_busqueda_usa_indices(self):
+        # Filtro del autocompletar sin ORDER BY, como en el COUNT del paginador: una
+        # búsqueda por rango en el índice de cada campo (MULTI-INDEX OR / BitmapOr)
+        request = RequestFactory().get('/admin/autocomplete/')
+        request.resolver_match = resolve('/admin/autocomplete/')
+        queryset, _ = admin.site._registry[Paciente].get_search_results(
+            request, Paciente.objects.all(), 'pérez'
+        )
+        if connection.vendor == 'postgresql':
+            # LIKE 'Pér%': el rut unique usa el índice _like que crea Django
+            with connection.schema_editor() as editor:
+                indice_rut = editor._create_index_name('pacientes', ['rut'], suffix='_like')
+        else:
+            indice_rut = 'pacientes_rut_1a1723_idx'
+        indices = (indice_rut, 'pacientes_apellidos_patron_idx',
+                   'pacientes_materno_patron_idx', 'pacientes_nombre_patron_idx')
+        for indice in indices:
+            self.assertUsaIndice(queryset.order_by(), indice)
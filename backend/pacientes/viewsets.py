@@ -3,7 +3,9 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Avg, Count
-from .models import Paciente
+from config.replicas import LecturaReplicaMixin
+from .duplicados import candidatos
+from .models import Paciente, SugerenciaFusion
 from .serializers import (
     PacienteSerializer,
     PacienteListSerializer,
@@ -17,7 +19,7 @@ from .serializers import (
 )
 
 
-class PacienteViewSet(viewsets.ModelViewSet):
+class PacienteViewSet(LecturaReplicaMixin, viewsets.ModelViewSet):
     """
     ViewSet completo para gestionar pacientes con toda su información.
     
@@ -44,9 +46,12 @@ class PacienteViewSet(viewsets.ModelViewSet):
     - GET /api/pacientes/por_region/ - Agrupa por región
     - POST /api/pacientes/validar_rut/ - Valida un RUT chileno
     - POST /api/pacientes/buscar_por_rut/ - Busca paciente por RUT
+    - POST /api/pacientes/posibles_duplicados/ - Candidatos a duplicado de unos datos
+    - GET /api/pacientes/{id}/duplicados/ - Sugerencias de fusión del paciente
     """
     queryset = Paciente.objects.all()
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas_completas']  # GET en la réplica de lectura
     
     def get_serializer_class(self):
         """Retorna el serializer apropiado según la acción"""
@@ -479,6 +484,63 @@ class PacienteViewSet(viewsets.ModelViewSet):
                 'mensaje': f'No se encontró ningún paciente con el RUT {rut}'
             })
     
+    @action(detail=False, methods=['post'])
+    def posibles_duplicados(self, request):
+        """
+        Pacientes existentes que probablemente son el de los datos recibidos
+        (RUT ausente o mal digitado), para revisar antes de crear uno nuevo.
+        
+        POST /api/pacientes/posibles_duplicados/
+        Body: {"rut": "...", "nombre": "...", "apellido_paterno": "...",
+               "apellido_materno": "...", "fecha_nacimiento": "AAAA-MM-DD"}
+        """
+        if not (request.data.get('nombre') or request.data.get('apellido_paterno')):
+            return Response({
+                'error': 'Debe proporcionar al menos nombre o apellido paterno.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        encontrados = candidatos(request.data)
+        return Response({
+            'total': len(encontrados),
+            'candidatos': [
+                {
+                    'puntaje': candidato['puntaje'],
+                    'motivos': candidato['motivos'],
+                    'paciente': PacienteListSerializer(candidato['paciente']).data,
+                }
+                for candidato in encontrados
+            ]
+        })
+    
+    @action(detail=True, methods=['get'])
+    def duplicados(self, request, pk=None):
+        """
+        Sugerencias de fusión pendientes en que participa el paciente.
+        
+        GET /api/pacientes/{id}/duplicados/
+        """
+        paciente = self.get_object()
+        sugerencias = SugerenciaFusion.objects.filter(
+            Q(paciente_a=paciente) | Q(paciente_b=paciente),
+            estado='PENDIENTE'
+        ).select_related('paciente_a', 'paciente_b')
+        
+        return Response({
+            'paciente_id': str(paciente.id),
+            'total': len(sugerencias),
+            'sugerencias': [
+                {
+                    'id': sugerencia.id,
+                    'puntaje': sugerencia.puntaje,
+                    'motivos': sugerencia.motivos,
+                    'paciente': PacienteListSerializer(
+                        sugerencia.paciente_b if sugerencia.paciente_a_id == paciente.id else sugerencia.paciente_a
+                    ).data,
+                }
+                for sugerencia in sugerencias
+            ]
+        })
+    
     # ============================================
     # MÉTODOS AUXILIARES
     # ============================================
@@ -569,22 +631,24 @@ class PacienteViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def rutas_clinicas(self, request, pk=None):
-        """Obtiene las rutas clínicas del paciente"""
+        """Obtiene las rutas clínicas del paciente, incluidas las archivadas"""
         paciente = self.get_object()
-        rutas = paciente.rutas_clinicas.all()
         
+        from rutas_clinicas.models import RutaClinicaHistorica
         from rutas_clinicas.serializers import RutaClinicaListSerializer
+        rutas = RutaClinicaHistorica.objects.filter(paciente=paciente).select_related('paciente')
         serializer = RutaClinicaListSerializer(rutas, many=True)
         
         return Response(serializer.data)
     
     @action(detail=True, methods=['get'])
     def atenciones(self, request, pk=None):
-        """Obtiene las atenciones del paciente"""
+        """Obtiene las atenciones del paciente, incluidas las archivadas"""
         paciente = self.get_object()
-        atenciones = paciente.atenciones.all()
         
+        from atenciones.models import AtencionHistorica
         from atenciones.serializers import AtencionListSerializer
+        atenciones = AtencionHistorica.objects.filter(paciente=paciente).select_related('paciente', 'medico', 'box')
         serializer = AtencionListSerializer(atenciones, many=True)
         
         return Response(serializer.data)
\ No newline at end of file
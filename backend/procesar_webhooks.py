@@ -0,0 +1,42 @@
+import os
+import argparse
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import close_old_connections
+from integraciones.cola_webhooks import TAMANO_LOTE, depurar_eventos, drenar
+
+# Segundos entre revisiones de la cola cuando está vacía
+ESPERA_COLA_VACIA = 1
+# Cada cuánto se borran los eventos ya procesados (segundos)
+INTERVALO_DEPURACION = 3600
+
+
+# Proceso de larga duración; se pueden correr varios en paralelo (cada lote
+# se toma con un arriendo, ningún evento se procesa dos veces a la vez)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Procesa la cola de webhooks entrantes en lotes')
+    parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Vacía la cola una vez y termina (cron)')
+    args = parser.parse_args()
+
+    if args.una_vez:
+        totales = drenar(tamano_lote=args.tamano_lote)
+        print(f"📨 Webhooks procesados: {totales.get('procesados', 0)} "
+              f"(inválidos: {totales.get('invalidos', 0)}, reintentos: {totales.get('reintentos', 0)}, "
+              f"fallidos: {totales.get('fallidos', 0)})")
+        print(f"🗑️  Eventos antiguos eliminados: {depurar_eventos()}")
+    else:
+        proxima_depuracion = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() >= proxima_depuracion:
+                depurar_eventos()
+                proxima_depuracion = time.monotonic() + INTERVALO_DEPURACION
+            if not drenar(tamano_lote=args.tamano_lote, max_lotes=50):
+                time.sleep(ESPERA_COLA_VACIA)
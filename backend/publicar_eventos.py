@@ -0,0 +1,44 @@
+import os
+import argparse
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.db import close_old_connections
+from integraciones.cliente_http import PoolConexiones
+from integraciones.publicador import depurar_eventos_salientes, despachar_todas
+
+# Segundos entre revisiones del outbox cuando no hay nada que enviar
+ESPERA_COLA_VACIA = 1
+# Cada cuánto se borran los eventos ya enviados (segundos)
+INTERVALO_DEPURACION = 3600
+
+
+# Proceso de larga duración; se pueden correr varios en paralelo (cada lote
+# se toma con un arriendo y el orden por agregado se respeta igual)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Envía los eventos salientes (outbox) a las integraciones')
+    parser.add_argument('--tamano-lote', type=int, default=None)
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Vacía el outbox una vez y termina (cron)')
+    args = parser.parse_args()
+
+    pool = PoolConexiones()
+    if args.una_vez:
+        totales = despachar_todas(pool, tamano_lote=args.tamano_lote)
+        print(f"📤 Eventos enviados: {totales.get('enviados', 0)} "
+              f"(reintentos: {totales.get('reintentos', 0)}, sin más reintentos: {totales.get('muertos', 0)})")
+        print(f"🗑️  Eventos antiguos eliminados: {depurar_eventos_salientes()}")
+        pool.cerrar()
+    else:
+        proxima_depuracion = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() >= proxima_depuracion:
+                depurar_eventos_salientes()
+                proxima_depuracion = time.monotonic() + INTERVALO_DEPURACION
+            if not despachar_todas(pool, tamano_lote=args.tamano_lote, max_lotes=50).get('enviados'):
+                time.sleep(ESPERA_COLA_VACIA)
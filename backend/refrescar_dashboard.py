@@ -0,0 +1,52 @@
+import os
+import argparse
+import logging
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import close_old_connections
+from config.replicas import lectura_en_replica
+from dashboard.instantanea import refrescar
+
+# Bajo 'dashboard': usa el manejador JSON de settings.LOGGING
+logger = logging.getLogger('dashboard.refrescar_dashboard')
+
+
+def refrescar_una_vez():
+    # Solo lectura para calcular: usa la réplica si está configurada y al día
+    with lectura_en_replica():
+        return refrescar()
+
+
+# Proceso de larga duración (systemd, supervisor o un contenedor aparte); con
+# --una-vez sirve para cron. Mantiene al día la instantánea que leen
+# /api/dashboard/metricas/ y el dashboard del admin (dashboard/instantanea.py)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recalcula la instantánea de métricas del dashboard')
+    parser.add_argument('--intervalo', type=int, default=settings.DASHBOARD_INTERVALO_REFRESCO,
+                        help=f'Segundos entre recálculos (por defecto {settings.DASHBOARD_INTERVALO_REFRESCO})')
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Recalcula una vez y termina (cron)')
+    args = parser.parse_args()
+
+    if args.una_vez:
+        instantanea = refrescar_una_vez()
+        print(f"📊 Instantánea del dashboard recalculada en {instantanea.duracion_ms} ms")
+    else:
+        while True:
+            # Cierra también la conexión que dejó inutilizable una falla anterior
+            close_old_connections()
+            inicio = time.monotonic()
+            try:
+                refrescar_una_vez()
+            except Exception:
+                # Una caída de la base o de la réplica no detiene el proceso: se
+                # reintenta en el próximo intervalo y mientras tanto los lectores
+                # recalculan la instantánea vencida por su cuenta
+                logger.exception('Falla recalculando la instantánea del dashboard')
+            time.sleep(max(0, args.intervalo - (time.monotonic() - inicio)))
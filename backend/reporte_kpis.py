@@ -1,67 +1,90 @@
 import os
+import argparse
+from datetime import date
+
 import django
-from django.db.models import Avg, Count, F
 from django.utils import timezone
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from atenciones.models import Atencion
 from boxes.models import Box
-from rutas_clinicas.models import RutaClinica
+from config.replicas import lectura_en_replica
+from dashboard.kpis import calcular_kpis, AGRUPACIONES
+
+OBJETIVO_ESPERA_MINUTOS = 15
+
+
+def formatear(valor):
+    return f"{valor:.1f}" if isinstance(valor, float) else ('-' if valor is None else str(valor))
+
+
+def imprimir_grupos(grupos):
+    print(f"    {'Grupo':<32} {'Total':>7} {'Compl%':>7} {'Esp p50':>8} {'p90':>6} {'p99':>6} {'Dur p50':>8} {'p90':>6} {'p99':>6}")
+    for g in grupos:
+        espera, duracion = g['espera_minutos'], g['duracion_minutos']
+        print(
+            f"    {g['etiqueta'][:32]:<32} {g['total']:>7} {g['tasa_completitud']:>6.1f}% "
+            f"{formatear(espera['p50']):>8} {formatear(espera['p90']):>6} {formatear(espera['p99']):>6} "
+            f"{formatear(duracion['p50']):>8} {formatear(duracion['p90']):>6} {formatear(duracion['p99']):>6}"
+        )
+
 
-def generar_reporte():
+def generar_reporte(desde=None, hasta=None, agrupar_por=None):
     print("\n============================================")
     print(f"📊 REPORTE DE KPIs NEXALUD - {timezone.now().strftime('%d/%m/%Y %H:%M')}")
     print("============================================\n")
 
+    # Todo el cálculo ocurre en la base (ver dashboard/kpis.py)
+    reporte = calcular_kpis(desde=desde, hasta=hasta)
+    total = reporte['grupos'][0]
+    espera = total['espera_minutos']
+    duracion = total['duracion_minutos']
+    print(f"    Periodo: {reporte['desde']} → {reporte['hasta']}\n")
+
     # 1. VOLUMEN DE ATENCIÓN
-    total_atenciones = Atencion.objects.count()
-    completadas = Atencion.objects.filter(estado='COMPLETADA').count()
-    tasa_completitud = (completadas / total_atenciones * 100) if total_atenciones > 0 else 0
-    
     print(f"1️⃣  VOLUMEN DE OPERACIÓN")
-    print(f"    • Total Citas Agendadas: {total_atenciones}")
-    print(f"    • Citas Completadas con Éxito: {completadas}")
-    print(f"    • Tasa de Cumplimiento: {tasa_completitud:.1f}%")
+    print(f"    • Total Citas Agendadas: {total['total']}")
+    print(f"    • Citas Completadas con Éxito: {total['completadas']}")
+    print(f"    • No Presentados / Canceladas: {total['no_presentados']} / {total['canceladas']}")
+    print(f"    • Tasa de Cumplimiento: {total['tasa_completitud']:.1f}%")
 
     # 2. TIEMPOS DE ESPERA (KPI CRÍTICO)
-    # Calculamos diferencia entre Hora Programada y Hora Real de Inicio
-    atenciones_con_tiempos = Atencion.objects.filter(
-        estado='COMPLETADA', 
-        inicio_cronometro__isnull=False
-    ).annotate(
-        espera=F('inicio_cronometro') - F('fecha_hora_inicio')
-    )
-    
-    if atenciones_con_tiempos.exists():
-        promedio_espera = sum([a.espera.total_seconds() for a in atenciones_con_tiempos], 0) / atenciones_con_tiempos.count()
-        promedio_minutos = promedio_espera / 60
-    else:
-        promedio_minutos = 0
-
     print(f"\n2️⃣  TIEMPOS DE ESPERA (KPI Proyecto)")
-    print(f"    • Tiempo Promedio de Espera Real: {promedio_minutos:.1f} minutos")
-    if promedio_minutos < 15:
-        print("      ✅ OBJETIVO CUMPLIDO (< 15 min)")
+    print(f"    • Tiempo Promedio de Espera Real: {formatear(espera['promedio'])} minutos")
+    print(f"    • Percentiles: p50 {formatear(espera['p50'])} | p90 {formatear(espera['p90'])} | p99 {formatear(espera['p99'])} min")
+    if espera['p90'] is None or espera['p90'] < OBJETIVO_ESPERA_MINUTOS:
+        print(f"      ✅ OBJETIVO CUMPLIDO (p90 < {OBJETIVO_ESPERA_MINUTOS} min)")
     else:
         print("      ⚠️ ALERTA: Espera elevada")
 
     # 3. DURACIÓN DE ATENCIÓN
-    duracion_promedio = Atencion.objects.filter(estado='COMPLETADA').aggregate(Avg('duracion_real'))['duracion_real__avg'] or 0
-    
     print(f"\n3️⃣  EFICIENCIA MÉDICA")
-    print(f"    • Duración Promedio de Consulta: {duracion_promedio:.1f} minutos")
+    print(f"    • Duración Promedio de Consulta: {formatear(duracion['promedio'])} minutos")
+    print(f"    • Percentiles: p50 {formatear(duracion['p50'])} | p90 {formatear(duracion['p90'])} | p99 {formatear(duracion['p99'])} min")
 
     # 4. USO DE BOXES
     boxes_total = Box.objects.count()
     boxes_ocupados = Box.objects.filter(estado='OCUPADO').count()
     ocupacion_actual = (boxes_ocupados / boxes_total * 100) if boxes_total > 0 else 0
-    
+
     print(f"\n4️⃣  INFRAESTRUCTURA (Tiempo Real)")
     print(f"    • Ocupación Actual de Boxes: {ocupacion_actual:.1f}% ({boxes_ocupados}/{boxes_total})")
 
+    # 5. DESGLOSE OPCIONAL
+    if agrupar_por:
+        print(f"\n5️⃣  DESGLOSE POR {agrupar_por.upper()}")
+        imprimir_grupos(calcular_kpis(desde=desde, hasta=hasta, agrupar_por=agrupar_por)['grupos'])
+
     print("\n============================================")
 
+
 if __name__ == '__main__':
-    generar_reporte()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Reporte de KPIs de atenciones')
+    parser.add_argument('--desde', type=date.fromisoformat, help='YYYY-MM-DD (por defecto, últimos 30 días)')
+    parser.add_argument('--hasta', type=date.fromisoformat, help='YYYY-MM-DD (por defecto, hoy)')
+    parser.add_argument('--agrupar-por', choices=list(AGRUPACIONES))
+    args = parser.parse_args()
+    # Exportación de solo lectura: usa la réplica si está configurada y al día
+    with lectura_en_replica():
+        generar_reporte(desde=args.desde, hasta=args.hasta, agrupar_por=args.agrupar_por)
@@ -1,6 +1,8 @@
 from django.contrib import admin
+from django.db import transaction
 from django.utils.html import format_html
 from django.utils import timezone
+from integraciones.publicador import publicar
 from .models import RutaClinica
 from .RutaClinicaAdminForm import RutaClinicaAdminForm
 
@@ -30,6 +32,7 @@ class RutaClinicaAdmin(admin.ModelAdmin):
         'id',
         'paciente__identificador_hash'
     ]
+    list_select_related = ['paciente']
     readonly_fields = [
         'porcentaje_completado',
         'fecha_actualizacion',
@@ -42,6 +45,7 @@ class RutaClinicaAdmin(admin.ModelAdmin):
         
     ]
     date_hierarchy = 'fecha_inicio'
+    autocomplete_fields = ['paciente']  # búsqueda por AJAX en vez de listar todos los pacientes
     
     fieldsets = (
         ('Información General', {
@@ -230,11 +234,24 @@ class RutaClinicaAdmin(admin.ModelAdmin):
     reanudar_rutas.short_description = "Reanudar rutas"
     
     def completar_rutas(self, request, queryset):
-        updated = queryset.update(
-            estado='COMPLETADA',
-            fecha_fin_real=timezone.now(),
-            porcentaje_completado=100.0
-        )
+        # update() no pasa por post_save: los eventos salientes
+        # (integraciones/publicador.py) van a mano, en la misma transacción
+        with transaction.atomic():
+            rutas = list(queryset.select_for_update())
+            anteriores = {
+                ruta.pk: {'estado': ruta.estado, 'etapa_actual': ruta.etapa_actual}
+                for ruta in rutas if ruta.estado != 'COMPLETADA'
+            }
+            ahora = timezone.now()
+            updated = queryset.update(
+                estado='COMPLETADA',
+                fecha_fin_real=ahora,
+                porcentaje_completado=100.0
+            )
+            cambiadas = [ruta for ruta in rutas if ruta.pk in anteriores]
+            for ruta in cambiadas:
+                ruta.estado, ruta.fecha_fin_real, ruta.porcentaje_completado = 'COMPLETADA', ahora, 100.0
+            publicar('RUTA_CLINICA', cambiadas, 'cambio_estado', anteriores=anteriores)
         self.message_user(request, f'{updated} rutas marcadas como completadas.')
     completar_rutas.short_description = "Marcar como completadas"
     
@@ -1,5 +1,9 @@
+import logging
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class RutasClinicasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -11,6 +15,11 @@ class RutasClinicasConfig(AppConfig):
         Aquí importamos los signals para que se registren.
         """
         import rutas_clinicas.signals
-        print("Signals de la API registrados correctamente")
+        logger.debug('Signals de rutas_clinicas registrados')
+        
+        # Vista rutas_clinicas_historico (caliente + archivo), ver config/archivo.py
+        from config.archivo import registrar_vista_historica
+        from .models import RutaClinica, RutaClinicaArchivada, RutaClinicaHistorica
+        registrar_vista_historica(self, RutaClinicaHistorica, RutaClinica, RutaClinicaArchivada)
 
 
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0001_initial'),
+        ('rutas_clinicas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rutaclinica',
+            index=models.Index(fields=['paciente', 'estado'], name='rutas_paciente_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:52
+
+import datetime
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pacientes', '0001_initial'),
+        ('rutas_clinicas', '0002_indice_ruta_activa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RutaClinicaHistorica',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('etapas_seleccionadas', models.JSONField(blank=True, default=list, help_text='Lista de etapas en orden')),
+                ('etapa_actual', models.CharField(blank=True, choices=[('CONSULTA_MEDICA', 'Consulta Médica'), ('PROCESO_EXAMEN', 'Proceso del Examen'), ('REVISION_EXAMEN', 'Revisión del Examen'), ('HOSPITALIZACION', 'Hospitalización'), ('OPERACION', 'Operación'), ('ALTA', 'Alta Médica')], max_length=30, null=True)),
+                ('indice_etapa_actual', models.PositiveIntegerField(default=0)),
+                ('etapas_completadas', models.JSONField(default=list)),
+                ('timestamps_etapas', models.JSONField(default=dict, help_text='Timestamps y detalles de cada etapa')),
+                ('fecha_inicio', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fecha_estimada_fin', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin_real', models.DateTimeField(blank=True, null=True)),
+                ('porcentaje_completado', models.FloatField(default=0.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('estado', models.CharField(choices=[('INICIADA', 'Iniciada'), ('EN_PROGRESO', 'En Progreso'), ('PAUSADA', 'Pausada'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada')], default='INICIADA', max_length=15)),
+                ('esta_pausado', models.BooleanField(default=False)),
+                ('motivo_pausa', models.TextField(blank=True)),
+                ('tiempo_pausado_acumulado', models.DurationField(default=datetime.timedelta(0), help_text='Tiempo total que la ruta ha estado en PAUSA')),
+                ('metadatos_adicionales', models.JSONField(blank=True, default=dict)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+                ('historial_cambios', models.JSONField(default=list, help_text='Registro de todos los cambios de etapa')),
+            ],
+            options={
+                'verbose_name': 'Ruta Clínica (histórico)',
+                'verbose_name_plural': 'Rutas Clínicas (histórico)',
+                'db_table': 'rutas_clinicas_historico',
+                'ordering': ['-fecha_inicio'],
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RutaClinicaArchivada',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('etapas_seleccionadas', models.JSONField(blank=True, default=list, help_text='Lista de etapas en orden')),
+                ('etapa_actual', models.CharField(blank=True, choices=[('CONSULTA_MEDICA', 'Consulta Médica'), ('PROCESO_EXAMEN', 'Proceso del Examen'), ('REVISION_EXAMEN', 'Revisión del Examen'), ('HOSPITALIZACION', 'Hospitalización'), ('OPERACION', 'Operación'), ('ALTA', 'Alta Médica')], max_length=30, null=True)),
+                ('indice_etapa_actual', models.PositiveIntegerField(default=0)),
+                ('etapas_completadas', models.JSONField(default=list)),
+                ('timestamps_etapas', models.JSONField(default=dict, help_text='Timestamps y detalles de cada etapa')),
+                ('fecha_inicio', models.DateTimeField(default=django.utils.timezone.now)),
+                ('fecha_estimada_fin', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin_real', models.DateTimeField(blank=True, null=True)),
+                ('porcentaje_completado', models.FloatField(default=0.0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(100.0)])),
+                ('estado', models.CharField(choices=[('INICIADA', 'Iniciada'), ('EN_PROGRESO', 'En Progreso'), ('PAUSADA', 'Pausada'), ('COMPLETADA', 'Completada'), ('CANCELADA', 'Cancelada')], default='INICIADA', max_length=15)),
+                ('esta_pausado', models.BooleanField(default=False)),
+                ('motivo_pausa', models.TextField(blank=True)),
+                ('tiempo_pausado_acumulado', models.DurationField(default=datetime.timedelta(0), help_text='Tiempo total que la ruta ha estado en PAUSA')),
+                ('metadatos_adicionales', models.JSONField(blank=True, default=dict)),
+                ('historial_cambios', models.JSONField(default=list, help_text='Registro de todos los cambios de etapa')),
+                ('fecha_actualizacion', models.DateTimeField()),
+                ('fecha_archivado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rutas_clinicas_archivadas', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Ruta Clínica archivada',
+                'verbose_name_plural': 'Rutas Clínicas archivadas',
+                'db_table': 'rutas_clinicas_archivo',
+                'ordering': ['-fecha_inicio'],
+                'indexes': [models.Index(fields=['paciente', 'fecha_inicio'], name='rutas_clini_pacient_baea52_idx'), models.Index(fields=['fecha_fin_real'], name='rutas_clini_fecha_f_a50f6b_idx'), models.Index(fields=['fecha_inicio'], name='rutas_clini_fecha_i_f17c7a_idx')],
+            },
+        ),
+    ]
@@ -1,13 +1,21 @@
+import logging
 import uuid
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from config import configuracion
 from pacientes.models import Paciente
 
+logger = logging.getLogger(__name__)
 
-class RutaClinica(models.Model):
+
+class RutaClinicaBase(models.Model):
     """
-    Modelo para gestionar rutas clínicas de pacientes con duraciones realistas.
+    Campos y comportamiento de una ruta clínica, compartidos por la tabla
+    caliente (RutaClinica), el archivo (RutaClinicaArchivada) y la vista
+    histórica (RutaClinicaHistorica). La relación y el Meta concreto van en
+    cada subclase.
     """
     
     ESTADO_CHOICES = [
@@ -17,6 +25,9 @@ class RutaClinica(models.Model):
         ('COMPLETADA', 'Completada'),
         ('CANCELADA', 'Cancelada'),
     ]
+    ESTADOS_ACTIVOS = ['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+    # Finalizadas: pasado el horizonte de archivo salen de la tabla caliente
+    ESTADOS_FINALIZADOS = ['COMPLETADA', 'CANCELADA']
     
     ETAPAS_CHOICES = [
         ('CONSULTA_MEDICA', 'Consulta Médica'),
@@ -47,12 +58,18 @@ class RutaClinica(models.Model):
         'ALTA': 0.20,                  # 20% = ~10 horas extra
     }
     
+    @classmethod
+    def duracion_estimada_de(cls, etapa):
+        # Minutos estimados de la etapa; se ajustan en caliente con la
+        # ConfiguracionSistema 'rutas.duracion_estimada.<ETAPA>' (ver config/configuracion.py)
+        return configuracion.entero(f'rutas.duracion_estimada.{etapa}', cls.DURACIONES_ESTIMADAS.get(etapa, 1440))
+    
+    @classmethod
+    def margen_tolerancia_de(cls, etapa):
+        # Margen sobre la duración estimada; 'rutas.margen_tolerancia.<ETAPA>' lo ajusta
+        return configuracion.flotante(f'rutas.margen_tolerancia.{etapa}', cls.MARGEN_TOLERANCIA.get(etapa, 0.20))
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    paciente = models.ForeignKey(
-        Paciente, 
-        on_delete=models.CASCADE,
-        related_name='rutas_clinicas'
-    )
     
     # Etapas y progreso
     etapas_seleccionadas = models.JSONField(
@@ -105,16 +122,8 @@ class RutaClinica(models.Model):
     )
     
     class Meta:
-        db_table = 'rutas_clinicas'
-        verbose_name = 'Ruta Clínica'
-        verbose_name_plural = 'Rutas Clínicas'
+        abstract = True
         ordering = ['-fecha_inicio']
-        indexes = [
-            models.Index(fields=['paciente']),
-            models.Index(fields=['estado']),
-            models.Index(fields=['fecha_inicio']),
-            models.Index(fields=['etapa_actual']),
-        ]
     
     def __str__(self):
         return f"Ruta {self.paciente} - {self.porcentaje_completado:.1f}% - {self.get_etapa_actual_display() or 'No iniciada'}"
@@ -186,10 +195,10 @@ class RutaClinica(models.Model):
                 duracion_actual = (ahora - inicio).total_seconds() / 60
                 
                 # Obtener duración estimada para esta etapa
-                duracion_estimada = self.DURACIONES_ESTIMADAS.get(etapa_key, 1440)  # Default 1 día
+                duracion_estimada = self.duracion_estimada_de(etapa_key)
                 
                 # Obtener margen de tolerancia
-                margen = self.MARGEN_TOLERANCIA.get(etapa_key, 0.20)  # Default 20%
+                margen = self.margen_tolerancia_de(etapa_key)
                 
                 # Calcular duración máxima permitida (estimada + margen)
                 duracion_maxima = duracion_estimada * (1 + margen)
@@ -216,7 +225,7 @@ class RutaClinica(models.Model):
             
             except Exception as e:
                 # Si hay algún error al procesar, continuar con la siguiente etapa
-                print(f"Error al detectar retraso en etapa {etapa_key}: {e}")
+                logger.warning('Error al detectar retraso en etapa %s de ruta %s: %s', etapa_key, self.id, e)
                 continue
         
         return retrasos
@@ -228,6 +237,18 @@ class RutaClinica(models.Model):
     def iniciar_ruta(self, usuario=None, etapa_inicial=None):
         
         # Inicia la ruta respetando el flujo lineal
+        self.preparar_inicio(usuario, etapa_inicial)
+        
+        # Sincronizar con paciente
+        self._sincronizar_etapa_paciente()
+        
+        self.save()
+        return True
+    
+    def preparar_inicio(self, usuario=None, etapa_inicial=None):
+        
+        # Deja la ruta iniciada en memoria, sin guardarla ni tocar al paciente
+        # (rutas creadas en lote: ver atenciones/signals.py)
         
         # Usar todas las etapas en orden si no hay seleccionadas
         todas_etapas = [key for key, _ in self.ETAPAS_CHOICES]
@@ -279,7 +300,7 @@ class RutaClinica(models.Model):
                 'fecha_inicio': ahora.isoformat(),
                 'fecha_fin': ahora.isoformat(),
                 'duracion_real': 0,
-                'duracion_estimada': self.DURACIONES_ESTIMADAS.get(etapa_previa, 1440),
+                'duracion_estimada': self.duracion_estimada_de(etapa_previa),
                 'observaciones': 'Etapa marcada como completada al iniciar la ruta',
                 'usuario_inicio': 'Sistema',
                 'auto_completada': True,
@@ -290,7 +311,7 @@ class RutaClinica(models.Model):
             'fecha_inicio': ahora.isoformat(),
             'fecha_fin': None,
             'duracion_real': None,
-            'duracion_estimada': self.DURACIONES_ESTIMADAS.get(self.etapa_actual, 1440),
+            'duracion_estimada': self.duracion_estimada_de(self.etapa_actual),
             'observaciones': '',
             'usuario_inicio': str(usuario) if usuario else 'Sistema',
         }
@@ -298,17 +319,11 @@ class RutaClinica(models.Model):
         # Registrar en historial
         self._agregar_al_historial('INICIO_RUTA', self.etapa_actual, usuario)
         
-        # Sincronizar con paciente
-        self._sincronizar_etapa_paciente()
-        
         # Calcular fecha estimada de fin
         self._calcular_fecha_estimada_fin()
         
         # Calcular progreso
         self.calcular_progreso()
-        
-        self.save()
-        return True
     
     def avanzar_etapa(self, observaciones="", usuario=None):
         # Avanza linealmente sin saltos
@@ -380,7 +395,7 @@ class RutaClinica(models.Model):
                 'fecha_inicio': ahora.isoformat(),
                 'fecha_fin': None,
                 'duracion_real': None,
-                'duracion_estimada': self.DURACIONES_ESTIMADAS.get(self.etapa_actual, 1440),
+                'duracion_estimada': self.duracion_estimada_de(self.etapa_actual),
                 'observaciones': '',
                 'usuario_inicio': str(usuario) if usuario else 'Sistema',
             }
@@ -433,7 +448,7 @@ class RutaClinica(models.Model):
                 'fecha_inicio': timezone.now().isoformat(),
                 'fecha_fin': None,
                 'duracion_real': None,
-                'duracion_estimada': self.DURACIONES_ESTIMADAS.get(self.etapa_actual, 1440),
+                'duracion_estimada': self.duracion_estimada_de(self.etapa_actual),
                 'observaciones': 'Reactivado desde estado completado',
                 'usuario_inicio': str(usuario) if usuario else 'Sistema',
             }
@@ -462,7 +477,7 @@ class RutaClinica(models.Model):
                 'fecha_inicio': timezone.now().isoformat(),
                 'fecha_fin': None,
                 'duracion_real': None,
-                'duracion_estimada': self.DURACIONES_ESTIMADAS.get(self.etapa_actual, 1440),
+                'duracion_estimada': self.duracion_estimada_de(self.etapa_actual),
                 'observaciones': f'Retroceso desde {etapa_anterior}',
                 'usuario_inicio': str(usuario) if usuario else 'Sistema',
             }
@@ -489,11 +504,8 @@ class RutaClinica(models.Model):
     
     def pausar_ruta(self, motivo='', usuario=None):
         # Pausa la ruta y actualiza estado del paciente
-        print(f" DEBUG pausar_ruta - Estado actual: {self.estado}")
-        print(f" DEBUG pausar_ruta - Motivo: {motivo}")
-        
         if self.estado not in ['EN_PROGRESO', 'INICIADA']:
-            print(f" No se puede pausar - Estado: {self.estado}")
+            logger.debug('No se puede pausar ruta %s en estado %s', self.id, self.estado)
             return False
         
         self.estado = 'PAUSADA'
@@ -509,16 +521,13 @@ class RutaClinica(models.Model):
         })
         
         self.save()
-        print(f" Ruta pausada correctamente - Estado: {self.estado}")
+        logger.debug('Ruta %s pausada', self.id, extra={'motivo': motivo})
         return True
     
     def reanudar_ruta(self, usuario=None):
         # Reanuda la ruta y actualiza estado del paciente
-        print(f" DEBUG reanudar_ruta - Estado actual: {self.estado}")
-        print(f" DEBUG reanudar_ruta - Esta pausado: {self.esta_pausado}")
-        
         if self.estado != 'PAUSADA':
-            print(f" No se puede reanudar - Estado: {self.estado}")
+            logger.debug('No se puede reanudar ruta %s en estado %s', self.id, self.estado)
             return False
         
         self.estado = 'EN_PROGRESO'
@@ -532,7 +541,7 @@ class RutaClinica(models.Model):
         self._agregar_al_historial('REANUDAR', self.etapa_actual, usuario)
         
         self.save()
-        print(f" Ruta reanudada correctamente - Estado: {self.estado}")
+        logger.debug('Ruta %s reanudada', self.id)
         return True
         
     # ============================================
@@ -603,9 +612,9 @@ class RutaClinica(models.Model):
                     duracion_actual = (timezone.now() - inicio).total_seconds() / 60
                     duracion_estimada = etapa_data.get(
                         'duracion_estimada',
-                        self.DURACIONES_ESTIMADAS.get(etapa_key, 1440)
+                        self.duracion_estimada_de(etapa_key)
                     )
-                    margen = self.MARGEN_TOLERANCIA.get(etapa_key, 0.20)
+                    margen = self.margen_tolerancia_de(etapa_key)
                     duracion_maxima = duracion_estimada * (1 + margen)
                     retrasada = duracion_actual > duracion_maxima
                 except Exception:
@@ -623,7 +632,7 @@ class RutaClinica(models.Model):
                 'duracion_real': etapa_data.get('duracion_real'),
                 'duracion_estimada': etapa_data.get(
                     'duracion_estimada',
-                    self.DURACIONES_ESTIMADAS.get(etapa_key, 1440)
+                    self.duracion_estimada_de(etapa_key)
                 ),
                 'observaciones': etapa_data.get('observaciones', ''),
                 'es_actual': es_actual,
@@ -676,8 +685,88 @@ class RutaClinica(models.Model):
         # Calcular solo para las etapas restantes
         etapas_restantes = self.etapas_seleccionadas[self.indice_etapa_actual:]
         duracion_total = sum(
-            self.DURACIONES_ESTIMADAS.get(etapa, 1440)
+            self.duracion_estimada_de(etapa)
             for etapa in etapas_restantes
         )
         
-        self.fecha_estimada_fin = timezone.now() + timezone.timedelta(minutes=duracion_total)
\ No newline at end of file
+        self.fecha_estimada_fin = timezone.now() + timezone.timedelta(minutes=duracion_total)
+
+
+class RutaClinicaQuerySet(models.QuerySet):
+    
+    def archivables(self, limite):
+        # Finalizadas antes de `limite` (las canceladas sin fecha_fin_real, por
+        # su última actualización): las mueve config/archivo.py
+        return self.filter(estado__in=RutaClinica.ESTADOS_FINALIZADOS).filter(
+            Q(fecha_fin_real__lt=limite) | Q(fecha_fin_real__isnull=True, fecha_actualizacion__lt=limite)
+        )
+
+
+class RutaClinica(RutaClinicaBase):
+    """
+    Modelo para gestionar rutas clínicas de pacientes con duraciones realistas.
+    """
+    paciente = models.ForeignKey(
+        Paciente, 
+        on_delete=models.CASCADE,
+        related_name='rutas_clinicas'
+    )
+    
+    class Meta:
+        db_table = 'rutas_clinicas'
+        verbose_name = 'Ruta Clínica'
+        verbose_name_plural = 'Rutas Clínicas'
+        ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['paciente']),
+            models.Index(fields=['estado']),
+            models.Index(fields=['fecha_inicio']),
+            models.Index(fields=['etapa_actual']),
+            # ¿El paciente tiene ruta activa? (cada serializer de atención lo consulta).
+            # Compuesto y no parcial: SQLite no empareja un IN con parámetros contra
+            # la condición de un índice parcial
+            models.Index(fields=['paciente', 'estado'], name='rutas_paciente_estado_idx'),
+        ]
+    
+    objects = RutaClinicaQuerySet.as_manager()
+
+
+class RutaClinicaArchivada(RutaClinicaBase):
+    """
+    Rutas finalizadas movidas fuera de la tabla caliente (config/archivo.py).
+    Conservan id y columnas; fecha_actualizacion se copia tal cual.
+    """
+    paciente = models.ForeignKey(
+        Paciente,
+        on_delete=models.CASCADE,
+        related_name='rutas_clinicas_archivadas'
+    )
+    fecha_actualizacion = models.DateTimeField()
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'rutas_clinicas_archivo'
+        verbose_name = 'Ruta Clínica archivada'
+        verbose_name_plural = 'Rutas Clínicas archivadas'
+        ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['paciente', 'fecha_inicio']),
+            models.Index(fields=['fecha_fin_real']),
+            models.Index(fields=['fecha_inicio']),
+        ]
+
+
+class RutaClinicaHistorica(RutaClinicaBase):
+    """
+    Solo lectura: vista rutas_clinicas UNION ALL rutas_clinicas_archivo,
+    recreada por config/archivo.py después de cada migrate. Para analítica e
+    historial del paciente.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.DO_NOTHING, related_name='+', db_constraint=False)
+    
+    class Meta:
+        managed = False
+        db_table = 'rutas_clinicas_historico'
+        verbose_name = 'Ruta Clínica (histórico)'
+        verbose_name_plural = 'Rutas Clínicas (histórico)'
+        ordering = ['-fecha_inicio']
@@ -1,7 +1,11 @@
+import logging
+
 from rest_framework import serializers
 from .models import RutaClinica
 from pacientes.serializers import PacienteListSerializer
 
+logger = logging.getLogger(__name__)
+
 
 def minutos_a_formato_legible(minutos):
     
@@ -95,7 +99,7 @@ class RutaClinicaCreateSerializer(serializers.ModelSerializer):
         # Valida que el paciente no tenga ya una ruta activa
         rutas_activas = RutaClinica.objects.filter(
             paciente=value,
-            estado__in=['INICIADA', 'EN_PROGRESO', 'PAUSADA']
+            estado__in=RutaClinica.ESTADOS_ACTIVOS
         )
         
         if rutas_activas.exists():
@@ -202,9 +206,9 @@ class RutaClinicaSerializer(serializers.ModelSerializer):
             {
                 'key': key,
                 'label': label,
-                'duracion_estimada_minutos': RutaClinica.DURACIONES_ESTIMADAS.get(key, 1440),
+                'duracion_estimada_minutos': RutaClinica.duracion_estimada_de(key),
                 'duracion_estimada_legible': minutos_a_formato_legible(
-                    RutaClinica.DURACIONES_ESTIMADAS.get(key, 1440)
+                    RutaClinica.duracion_estimada_de(key)
                 ),
             }
             for key, label in RutaClinica.ETAPAS_CHOICES
@@ -285,7 +289,7 @@ class RutaClinicaSerializer(serializers.ModelSerializer):
         siguiente = obj.obtener_etapa_siguiente()
         if siguiente:
             label = dict(RutaClinica.ETAPAS_CHOICES).get(siguiente, siguiente)
-            duracion_minutos = RutaClinica.DURACIONES_ESTIMADAS.get(siguiente, 1440)
+            duracion_minutos = RutaClinica.duracion_estimada_de(siguiente)
             return {
                 'key': siguiente,
                 'label': label,
@@ -335,7 +339,7 @@ class RutaClinicaSerializer(serializers.ModelSerializer):
 
             return retrasos_formateados
         except Exception as e:
-            print(f"Error al detectar retrasos: {e}")
+            logger.warning('Error al detectar retrasos de ruta %s: %s', obj.id, e)
             return []
 
     def get_puede_avanzar(self, obj):
@@ -1,7 +1,11 @@
+import logging
+
 from django.db.models.signals import pre_delete, post_save
 from django.dispatch import receiver
 from .models import RutaClinica
 
+logger = logging.getLogger(__name__)
+
 @receiver(pre_delete, sender=RutaClinica)
 def limpiar_etapa_paciente_al_eliminar_ruta(sender, instance, **kwargs):
     
@@ -19,7 +23,7 @@ def limpiar_etapa_paciente_al_eliminar_ruta(sender, instance, **kwargs):
     # Verificar si hay otras rutas activas para este paciente
     otras_rutas_activas = RutaClinica.objects.filter(
         paciente=instance.paciente,
-        estado__in=['PENDIENTE', 'EN_PROGRESO', 'PAUSADA']
+        estado__in=RutaClinica.ESTADOS_ACTIVOS
     ).exclude(id=instance.id).exists()
     
     # Solo limpiar si esta es la última ruta activa
@@ -27,7 +31,7 @@ def limpiar_etapa_paciente_al_eliminar_ruta(sender, instance, **kwargs):
         instance.paciente.etapa_actual = None
         instance.paciente.save(update_fields=['etapa_actual'])
         
-        print(f" Limpiado etapa_actual del paciente {instance.paciente.id} al eliminar ruta clínica {instance.id}")
+        logger.debug('Limpiada etapa_actual del paciente %s al eliminar ruta %s', instance.paciente_id, instance.id)
 
 
 @receiver(post_save, sender=RutaClinica)
@@ -44,4 +48,4 @@ def verificar_consistencia_etapa(sender, instance, created, **kwargs):
             instance.paciente.etapa_actual = instance.etapa_actual
             instance.paciente.save(update_fields=['etapa_actual'])
             
-            print(f" Sincronizado etapa_actual del paciente {instance.paciente.id} con ruta clínica {instance.id}")
+            logger.debug('Sincronizada etapa_actual del paciente %s con ruta %s', instance.paciente_id, instance.id)
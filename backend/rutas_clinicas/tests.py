@@ -1,3 +1,123 @@
+from datetime import date
+
 from django.test import TestCase
+from django.urls import reverse
+
+from config.planes_consulta import PlanesConsultaMixin
+from config.presupuesto_consultas import PresupuestoAdminMixin, PresupuestoConsultasMixin, peticion, rut_sintetico
+from integraciones import publicador
+from integraciones.models import EventoSaliente, IntegracionExterna
+from pacientes.models import Paciente
+from users.models import User
+from .models import RutaClinica
+from .viewsets import RutaClinicaViewSet
+
+
+def _ruta_foco_completada(escenario):
+    # Libera al paciente foco de su ruta activa para poder crear otra
+    RutaClinica.objects.filter(pk=escenario.ruta.pk).update(estado='COMPLETADA')
+
+
+def _datos_ruta(escenario):
+    return {
+        'paciente': str(escenario.paciente.pk),
+        'etapas_seleccionadas': ['CONSULTA_MEDICA', 'PROCESO_EXAMEN', 'ALTA'],
+    }
+
+
+def _ruta_pausada(escenario):
+    escenario.ruta.pausar_ruta('Pausa de prueba')
+
+
+def _ruta_en_segunda_etapa(escenario):
+    escenario.ruta.avanzar_etapa()
+
+
+def _ruta_sin_iniciar(escenario):
+    RutaClinica.objects.filter(pk=escenario.ruta.pk).update(
+        estado='INICIADA', etapa_actual=None, indice_etapa_actual=0,
+        etapas_completadas=[], timestamps_etapas={}
+    )
+
+
+class RutaClinicaViewSetPresupuestoConsultasTests(PresupuestoConsultasMixin, TestCase):
+    # Presupuesto de consultas por ruta de /api/rutas-clinicas/
+    viewset = RutaClinicaViewSet
+    basename = 'ruta-clinica'
+    objetivo_por_defecto = 'ruta'
+    presupuestos = {
+        ('list', 'get'): peticion(1),
+        ('create', 'post'): peticion(6, preparar=_ruta_foco_completada, datos=_datos_ruta),
+        ('retrieve', 'get'): peticion(1),
+        ('update', 'put'): peticion(3, datos=lambda e: {
+            'paciente_id': str(e.paciente.pk),
+            'etapas_seleccionadas': e.ruta.etapas_seleccionadas,
+        }),
+        ('partial_update', 'patch'): peticion(2, datos=lambda e: {'metadatos_adicionales': {'origen': 'test'}}),
+        ('destroy', 'delete'): peticion(4),
+        ('iniciar', 'post'): peticion(6, preparar=_ruta_sin_iniciar),
+        ('avanzar', 'post'): peticion(6, datos=lambda e: {'observaciones': 'Avance'}),
+        ('retroceder', 'post'): peticion(6, preparar=_ruta_en_segunda_etapa, datos=lambda e: {'motivo': 'Corrección'}),
+        ('pausar', 'post'): peticion(5, datos=lambda e: {'motivo': 'Pausa'}),
+        ('reanudar', 'post'): peticion(5, preparar=_ruta_pausada),
+        ('timeline', 'get'): peticion(1),
+        ('historial', 'get'): peticion(1),
+        ('validar_estado', 'get'): peticion(1),
+        ('estadisticas', 'get'): peticion(7),
+        ('cancelar', 'post'): peticion(3, datos=lambda e: {'motivo': 'Cancelación'}),
+    }
+
+
+class RutaClinicaPlanesConsultaTests(PlanesConsultaMixin, TestCase):
+    paciente_id = '00000000-0000-0000-0000-000000000001'
+
+    def test_ruta_activa_del_paciente(self):
+        # Lo consulta cada serializer de atención (paciente_tiene_ruta, ruta_clinica_id)
+        activas = RutaClinica.objects.filter(
+            paciente_id=self.paciente_id,
+            estado__in=RutaClinica.ESTADOS_ACTIVOS,
+        )
+        self.assertUsaIndice(activas, 'rutas_paciente_estado_idx')
+        self.assertUsaIndice(activas.order_by(), 'rutas_paciente_estado_idx')
+
+
+class RutasClinicasAdminPresupuestoTests(PresupuestoAdminMixin, TestCase):
+    # Changelist del admin de rutas clínicas
+    app_label = 'rutas_clinicas'
+    presupuestos_admin = {
+        RutaClinica: 8,
+    }
+    formularios_admin = [RutaClinica]
+
+
+class CompletarRutasAdminTests(TestCase):
+    # La acción masiva del admin publica el cambio como lo haría un save()
 
+    def test_completar_rutas_publica_el_cambio(self):
+        paciente = Paciente.objects.create(
+            rut=rut_sintetico(1), nombre='Ana', apellido_paterno='Soto', fecha_nacimiento=date(1980, 1, 1),
+        )
+        en_curso = RutaClinica.objects.create(paciente=paciente, etapas_seleccionadas=['CONSULTA_MEDICA'])
+        completada = RutaClinica.objects.create(paciente=paciente, etapas_seleccionadas=['CONSULTA_MEDICA'])
+        RutaClinica.objects.filter(pk=completada.pk).update(estado='COMPLETADA')
+        en_curso.refresh_from_db()
+        publicador.olvidar_suscriptores()
+        self.addCleanup(publicador.olvidar_suscriptores)
+        integracion = IntegracionExterna.objects.create(
+            nombre_sistema='EMR', tipo_sistema='EMR', endpoint_base_url='http://emr.invalid',
+            token_acceso_encrypted='t', publicar_eventos=True,
+        )
+        self.client.force_login(User.objects.create_superuser(
+            'admin_rutas', 'admin_rutas@nexalud.admin.com', 'clave-rutas'
+        ))
 
+        respuesta = self.client.post(reverse('admin:rutas_clinicas_rutaclinica_changelist'), {
+            'action': 'completar_rutas', '_selected_action': [en_curso.pk, completada.pk],
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(RutaClinica.objects.filter(estado='COMPLETADA').count(), 2)
+        # Solo la ruta que cambió de estado genera evento, con su estado anterior
+        evento = EventoSaliente.objects.get(integracion=integracion)
+        self.assertEqual((evento.tipo_evento, evento.id_agregado), ('ruta_clinica.cambio_estado', str(en_curso.pk)))
+        self.assertEqual(evento.payload['anterior'], {'estado': en_curso.estado, 'etapa_actual': en_curso.etapa_actual})
+        self.assertEqual((evento.payload['estado'], evento.payload['porcentaje_completado']), ('COMPLETADA', 100.0))
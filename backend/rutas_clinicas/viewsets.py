@@ -1,10 +1,15 @@
+import logging
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Q, Count, Avg
 from django.utils import timezone
-from .models import RutaClinica
+from config.replicas import LecturaReplicaMixin
+from .models import RutaClinica, RutaClinicaHistorica
+
+logger = logging.getLogger(__name__)
 from .serializers import (
     RutaClinicaSerializer,
     RutaClinicaListSerializer,
@@ -14,12 +19,13 @@ from .serializers import (
 )
 
 
-class RutaClinicaViewSet(viewsets.ModelViewSet):
+class RutaClinicaViewSet(LecturaReplicaMixin, viewsets.ModelViewSet):
     
     # ViewSet corregido para gestionar rutas clínicas con flujo lineal
     
     queryset = RutaClinica.objects.all()
     permission_classes = [IsAuthenticated]
+    acciones_replica = ['estadisticas']  # GET en la réplica de lectura
     
     def get_serializer_class(self):
         if self.action == 'list':
@@ -33,9 +39,10 @@ class RutaClinicaViewSet(viewsets.ModelViewSet):
         return RutaClinicaSerializer
     
     def get_queryset(self):
-        queryset = RutaClinica.objects.select_related('paciente')
-        
-        # Filtros
+        return self._filtrar(RutaClinica.objects.select_related('paciente'))
+    
+    def _filtrar(self, queryset):
+        # Filtros de query params; sirve también para RutaClinicaHistorica
         estado = self.request.query_params.get('estado')
         paciente_id = self.request.query_params.get('paciente')
         etapa_actual = self.request.query_params.get('etapa')
@@ -226,10 +233,7 @@ class RutaClinicaViewSet(viewsets.ModelViewSet):
         # Obtener el motivo directamente del request.data
         motivo = request.data.get('motivo', 'Sin motivo especificado')
         
-        # Log para debug
-        print(f" DEBUG Pausar - Datos recibidos: {request.data}")
-        print(f" DEBUG Pausar - Motivo: {motivo}")
-        print(f" DEBUG Pausar - Estado actual: {ruta.estado}")
+        logger.debug('Pausar ruta %s (estado %s)', ruta.id, ruta.estado, extra={'motivo': motivo})
         
         if ruta.pausar_ruta(motivo=motivo, usuario=usuario):
             ruta.refresh_from_db()
@@ -262,10 +266,7 @@ class RutaClinicaViewSet(viewsets.ModelViewSet):
         # Observaciones opcionales
         observaciones = request.data.get('observaciones', '')
         
-        # Log para debug
-        print(f"🔍 DEBUG Reanudar - Estado actual: {ruta.estado}")
-        print(f"🔍 DEBUG Reanudar - Esta pausado: {ruta.esta_pausado}")
-        print(f"🔍 DEBUG Reanudar - Observaciones: {observaciones}")
+        logger.debug('Reanudar ruta %s (estado %s)', ruta.id, ruta.estado, extra={'observaciones': observaciones})
         
         if ruta.reanudar_ruta(usuario=usuario):
             ruta.refresh_from_db()
@@ -480,8 +481,8 @@ class RutaClinicaViewSet(viewsets.ModelViewSet):
     # Métodos existentes se mantienen...
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
-        # Estadísticas generales de rutas clínicas
-        queryset = self.get_queryset()
+        # Estadísticas generales de rutas clínicas, incluidas las archivadas
+        queryset = self._filtrar(RutaClinicaHistorica.objects.all())
         
         total = queryset.count()
         iniciadas = queryset.filter(estado='INICIADA').count()
@@ -0,0 +1,43 @@
+import os
+import argparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.utils.dateparse import parse_date
+from integraciones.models import IntegracionExterna
+
+
+def _fecha(valor):
+    fecha = parse_date(valor)
+    if fecha is None:
+        raise argparse.ArgumentTypeError(f'Fecha inválida (AAAA-MM-DD): {valor}')
+    return fecha
+
+
+# Pensado para cron (p. ej. cada 5 minutos): cada corrida trae solo los cambios
+# desde la anterior. Con --desde/--hasta re-sincroniza esa ventana completa
+# (reparación) sin mover la marca de agua de las integraciones.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sincroniza la agenda de las integraciones externas')
+    parser.add_argument('--integracion', help='nombre_sistema de una sola integración')
+    parser.add_argument('--desde', type=_fecha, help='Inicio de la ventana (AAAA-MM-DD)')
+    parser.add_argument('--hasta', type=_fecha, help='Fin de la ventana (AAAA-MM-DD)')
+    args = parser.parse_args()
+
+    integraciones = IntegracionExterna.objects.filter(activo=True, agenda_activa=True)
+    if args.integracion:
+        integraciones = integraciones.filter(nombre_sistema=args.integracion)
+
+    for integracion in integraciones:
+        resultado = integracion.sincronizar_agenda(args.desde, args.hasta)
+        if 'error' in resultado:
+            print(f"❌ {integracion.nombre_sistema}: {resultado['error']}")
+            continue
+        print(f"📅 {integracion.nombre_sistema}: {resultado['recibidos']} cambios en {resultado['paginas']} páginas "
+              f"→ {resultado['creadas']} nuevas, {resultado['actualizadas']} actualizadas, "
+              f"{resultado['canceladas']} canceladas, {resultado['sin_cambios']} sin cambios "
+              f"(omitidas: {resultado['invalidos'] + resultado['sin_referencia'] + resultado['conflictos']}; "
+              f"rutas creadas: {resultado['rutas_creadas']})")
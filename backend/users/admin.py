@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django import forms
+
+from config.autocompletar import BusquedaIndexadaMixin
 from .models import User
 
 class CustomUserCreationForm(forms.ModelForm):
@@ -99,12 +101,13 @@ class CustomUserCreationForm(forms.ModelForm):
         
         return user
 
-class CustomUserAdmin(BaseUserAdmin):
+class CustomUserAdmin(BusquedaIndexadaMixin, BaseUserAdmin):
     add_form = CustomUserCreationForm
     
     list_display = ('username', 'email', 'rol', 'get_especialidad_medico', 'first_name', 'last_name', 'is_staff', 'is_active')
     list_filter = ('rol', 'especialidad', 'is_staff', 'is_superuser', 'is_active')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'rut')
+    campos_prefijo = ('username', 'rut', 'first_name', 'last_name')  # autocompletar (ver config/autocompletar.py)
     ordering = ('username',)
     
     def get_especialidad_medico(self, obj):
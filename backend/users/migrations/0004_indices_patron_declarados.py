@@ -0,0 +1,55 @@
+# Generated by Django 5.2.6 on 2026-10-19 08:59
+
+from django.db import migrations, models
+
+
+# Reemplaza los índices varchar_pattern_ops creados con SQL en 0003_indices_patron
+# por los declarados en Meta.indexes, que sí conoce el estado de migraciones
+INDICES_SQL = {
+    'users_user_first_name_like': 'first_name',
+    'users_user_last_name_like': 'last_name',
+}
+
+
+def eliminar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre in INDICES_SQL:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+def restaurar_indices_sql(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columna in INDICES_SQL.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {nombre} ON users_user ({columna} varchar_pattern_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_indices_patron'),
+    ]
+
+    operations = [
+        migrations.RunPython(eliminar_indices_sql, restaurar_indices_sql),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_user_first_n_0186c7_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_user_last_na_4e2935_idx',
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name'], name='users_first_name_patron_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['last_name'], name='users_last_name_patron_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -54,6 +54,11 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
+        indexes = [
+            # Autocompletar de médicos en el admin por prefijo (ver config/autocompletar.py)
+            models.Index(fields=['first_name'], name='users_first_name_patron_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['last_name'], name='users_last_name_patron_idx', opclasses=['varchar_pattern_ops']),
+        ]
     
     def _get_rol_from_email(self):
         # Determinar el rol basado en el dominio del email
@@ -36,9 +36,6 @@ class UserSerializer(serializers.ModelSerializer):
             data['especialidad'] = None
             data['especialidad_display'] = None
         
-        #Imprimir los datos serializados
-        print(f"Datos serializados para {instance.username}: {data}")
-        
         return data
     
     def validate(self, data):
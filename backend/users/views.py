@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
@@ -5,6 +7,8 @@ from rest_framework import status
 from django.contrib.auth import authenticate
 from .serializers import UserSerializer
 
+logger = logging.getLogger(__name__)
+
 class CustomAuthToken(ObtainAuthToken):
     
     # Vista personalizada para autenticación que acepta tanto username como email
@@ -39,14 +43,10 @@ class CustomAuthToken(ObtainAuthToken):
             # Serializar información del usuario
             user_data = UserSerializer(user).data
             
-            print(f"\n=== LOGIN DEBUG ===")
-            print(f"Usuario: {user.username}")
-            print(f"Email: {user.email}")
-            print(f"Rol: {user.rol}")
-            print(f"Rol Display: {user.get_rol_display()}")
-            print(f"Is Superuser: {user.is_superuser}")
-            print(f"Data enviada: {user_data}")
-            print(f"==================\n")
+            logger.info(
+                'Login de %s', user.username,
+                extra={'rol': user.rol, 'superusuario': user.is_superuser}
+            )
             
             return Response({
                 'token': token.key,
@@ -0,0 +1,38 @@
+import os
+import argparse
+import asyncio
+import signal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+django.setup()
+
+from django.conf import settings
+from integraciones.worker import WorkerSincronizacion
+
+
+async def principal(args):
+    worker = WorkerSincronizacion(concurrencia=args.concurrencia)
+    if args.una_vez:
+        resultados = await worker.sincronizar_todas()
+        exitosas = sum(1 for resultado in resultados if resultado.exito)
+        print(f"🔄 {exitosas} sincronizaciones exitosas, {len(resultados) - exitosas} con error")
+        return
+
+    # SIGTERM/SIGINT: termina las sincronizaciones en curso y sale
+    detener = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for senal in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(senal, detener.set)
+    await worker.ejecutar(detener)
+
+
+# Proceso de larga duración (systemd, supervisor o un contenedor aparte)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sincroniza las integraciones externas activas según su intervalo')
+    parser.add_argument('--concurrencia', type=int, default=settings.INTEGRACIONES_CONCURRENCIA,
+                        help=f'Sincronizaciones simultáneas (por defecto {settings.INTEGRACIONES_CONCURRENCIA})')
+    parser.add_argument('--una-vez', action='store_true',
+                        help='Sincroniza todas las activas una vez y termina (cron)')
+    asyncio.run(principal(parser.parse_args()))
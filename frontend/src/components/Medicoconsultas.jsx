@@ -69,6 +69,7 @@ const MedicoConsultas = () => {
   const intervalRefActualizacion = useRef(null);
   const intervalRefCronometro = useRef(null);
   const isMountedRef = useRef(true);
+  const etagCronometroRef = useRef(null);
   // ==================== FUNCIÓN AUXILIAR PARA OBTENER NOMBRE DEL PACIENTE ====================
   const obtenerNombrePaciente = (atencion) => {
     if (!atencion) return 'Sin paciente';
@@ -148,6 +149,18 @@ const MedicoConsultas = () => {
       }
     }
   }, []);
+  // Consulta liviana: indica si la atención actual cambió desde el último polling
+  const hayCambiosCronometro = useCallback(async () => {
+    try {
+      const response = await medicoAtencionesService.getCronometro(etagCronometroRef.current);
+      if (response.status === 304) return false;
+      etagCronometroRef.current = response.headers.etag || null;
+      return true;
+    } catch (error) {
+      console.error('❌ Error al consultar cronómetro:', error);
+      return true;
+    }
+  }, []);
   const cargarAtencionesHoy = useCallback(async () => {
     if (!isMountedRef.current) return;
     try {
@@ -214,9 +227,9 @@ const MedicoConsultas = () => {
       console.log('🔄 [POLLING] Actualizando datos automáticamente...');
       // Sincronizar boxes primero (esto actualiza estados)
       await sincronizarBoxes();
-      // Luego cargar datos actualizados
+      // Luego cargar datos actualizados (la atención completa solo si el cronómetro cambió)
       await Promise.all([
-        cargarAtencionActual(),
+        hayCambiosCronometro().then((cambio) => cambio && cargarAtencionActual()),
         cargarAtencionesHoy()
       ]);
     }, 3000); // ✅ Cada 3 segundos para respuesta más rápida
@@ -228,7 +241,7 @@ const MedicoConsultas = () => {
         intervalRefActualizacion.current = null;
       }
     };
-  }, [cargarAtencionActual, cargarAtencionesHoy, sincronizarBoxes]);
+  }, [cargarAtencionActual, cargarAtencionesHoy, sincronizarBoxes, hayCambiosCronometro]);
   // Efecto para cronómetro local
   useEffect(() => {
     // Limpiar intervalo previo
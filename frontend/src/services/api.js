@@ -155,6 +155,11 @@ export const atencionesService = {
   getAll: (params = {}) => api.get('/atenciones/', { params }),
   getById: (id) => api.get(`/atenciones/${id}/`),
   create: (data) => api.post('/atenciones/', data),
+  // Todas o ninguna: si alguna se solapa con la agenda, no se crea el lote
+  crearLote: (atenciones) => api.post('/atenciones/crear_lote/', atenciones),
+  // Asignación de boxes del día: vista previa (GET) y aplicar con la versión aceptada (POST)
+  optimizarBoxes: (fecha) => api.get('/atenciones/optimizar_boxes/', { params: { fecha } }),
+  aplicarOptimizacionBoxes: (fecha, version) => api.post('/atenciones/optimizar_boxes/', { fecha, version }),
   iniciarCronometro: (id) => api.post(`/atenciones/${id}/iniciar_cronometro/`),
   finalizarCronometro: (id) => api.post(`/atenciones/${id}/finalizar_cronometro/`),
   cancelar: (id, motivo) => api.post(`/atenciones/${id}/cancelar/`, { motivo }),
@@ -167,6 +172,8 @@ export const atencionesService = {
   getEstadisticas: (params = {}) => api.get('/atenciones/estadisticas/', { params }),
   getMetricas: (id) => api.get(`/atenciones/${id}/metricas/`),
   getConAtrasoReportado: () => api.get('/atenciones/con_atraso_reportado/'),
+  // params: { especialidad, duracion, desde?, hasta?, medico?, limite? }
+  buscarHuecos: (params) => api.get('/atenciones/huecos_disponibles/', { params }),
 };
 
 // ============================================
@@ -243,6 +250,12 @@ export const medicoAtencionesService = {
   // Obtener atención actual (en curso o próxima)
   getActual: () => api.get('/medico/atenciones/actual/'),
   
+  // Cronómetro compacto: responde 304 si el ETag enviado sigue vigente
+  getCronometro: (etag = null) => api.get('/medico/atenciones/cronometro/', {
+    headers: etag ? { 'If-None-Match': etag } : {},
+    validateStatus: (status) => status === 200 || status === 304,
+  }),
+  
   // Iniciar una atención
   iniciar: (id) => api.post(`/medico/atenciones/${id}/iniciar/`),
   